@@ -2,6 +2,9 @@
 """
 S16 Cross-Check Example
 Использует существующие интерфейсы проекта для сверки участников между S16 группами
+
+Для сверки нескольких групп за один запуск (референсный ростер выгружается
+один раз): python src/cli.py crosscheck --targets ID1,ID2,...
 """
 
 import asyncio
@@ -40,11 +43,11 @@ async def s16_crosscheck(target_group_id: int, target_group_name: str = None, ou
         
         # 2. Получаем участников (используем существующий API)
         print("📥 Получение участников целевой группы...")
-        target_participants = await manager.get_participants(target_group_id, limit=300)
+        target_participants = await manager.get_participants(target_group_id, limit=None)
         print(f"✅ Получено {len(target_participants)} участников")
         
         print(f"📥 Получение участников {space_name}...")
-        space_participants = await manager.get_participants(space_id, limit=500)
+        space_participants = await manager.get_participants(space_id, limit=None)
         print(f"✅ Получено {len(space_participants)} участников")
         print()
         
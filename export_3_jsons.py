@@ -4,19 +4,47 @@
 ИСПОЛЬЗУЕТ S16-leads анти-спам защиту
 """
 
+import argparse
 import asyncio
-import json
 import os
+from concurrent.futures import Future
 from datetime import datetime
-from typing import Dict, List, Set
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 from src.infra.tele_client import get_client
-from src.infra.limiter import get_rate_limiter, smart_pause
-from src.core.group_manager import GroupManager
+from src.infra.limiter import get_rate_limiter, get_single_flight, smart_pause
+from src.core.group_manager import FallbackGroupManager, GroupManager, open_export_manager
+from src.core.export_diff import sorted_members, write_record_array
+from src.core.external_dedup import ExternalAggregator, get_memory_budget_mb
+from src.core.pipeline import (
+    PARTICIPANT_COLUMNS, Batch, get_process_stage, normalize_members, pack_records, unpack_batch
+)
+from src.core.columnar import parquet_available, write_membership, write_parquet
+from src.infra.codecs import CODEC_SUFFIXES, available_codecs, with_codec_suffix
+from src.core.export_delta import (
+    DEFAULT_FULL_EVERY, DELTA_PREFIX, FULL_PREFIX, carry_over_failed_groups, compute_delta,
+    delta_summary, is_empty_delta, load_latest_state, should_write_full,
+    write_changes, write_manifest
+)
+from src.core.planner import build_plan, collect_estimates, format_plan, load_latency_history
+from src.core.roster_store import RosterStore
+from src.infra.metrics import get_metrics
+from src.infra.takeout import get_takeout_limiter
+from src.infra.tracing import enable_tracing, span
+from src.infra.writer import get_writer, write_json
 import logging
 
 logger = logging.getLogger(__name__)
 
+EXPORT_ROOT = "data/export"
+
+# Колоночные форматы group_members: (функция записи, расширение)
+EDGE_WRITERS = {
+    "columnar": (write_membership, ".s16m"),
+    "parquet": (write_parquet, ".parquet"),
+}
+
 # Ваш список групп
 GROUP_IDS = [
     -1002188344480,  # s16 space
@@ -34,8 +62,243 @@ GROUP_IDS = [
     -1001926931511,  # New Year on Madeira
 ]
 
-async def export_to_3_jsons():
-    """Экспорт в 3 JSON файла с анти-спам защитой"""
+def aggregate_participants(aggregator: ExternalAggregator, group_id: int, members: Batch):
+    """Добавляет участников группы и связи в aggregator (выполняется в потоке записи)"""
+    with span('aggregate', cat='aggregate', participants=len(members)):
+        for member in unpack_batch(members):
+            # Добавляем уникального участника (дубли между группами отбрасываются при слиянии)
+            aggregator.add_member(member)
+            
+            # Добавляем связь группа-участник
+            aggregator.add_edge(group_id, member['user_id'])
+
+
+async def collect_group(manager: GroupManager, group_id: int, groups: List[Dict],
+                        aggregator: ExternalAggregator,
+                        pending: Optional[List[Tuple[int, Future]]] = None) -> bool:
+    """
+    Собирает одну группу: информация + участники
+    
+    Участники и связи копятся в aggregator: в памяти до бюджета, дальше -
+    отсортированными прогонами на диске. Агрегация (и выгрузка прогонов на
+    диск) идет в потоке записи: пока она работает, собирается следующая
+    группа. Если передан pending, туда добавляется (group_id, future)
+    агрегации - ее нужно дождаться перед сохранением.
+    
+    Returns:
+        True если участники получены
+    """
+    # Получаем информацию о группе
+    group_info = await manager.get_group_info(group_id)
+    if not group_info:
+        print(f"   ❌ Не удалось получить информацию о группе")
+        return False
+        
+    print(f"   📝 {group_info['title']} ({group_info.get('participants_count', '?')} участников)")
+    
+    # Добавляем в groups (используем исходный group_id, а не тот что из API)
+    groups.append({
+        "group_id": group_id,  # Используем исходный ID из списка
+        "title": group_info['title']
+    })
+    
+    # Получаем участников
+    participants = await manager.get_participants(group_id, limit=None)
+    if not participants:
+        print(f"   ⚠️ Не удалось получить участников")
+        return False
+    
+    # Нормализация и дедупликация - в пуле процессов
+    members = await get_process_stage().run(normalize_members,
+                                            pack_records(participants, PARTICIPANT_COLUMNS))
+    
+    # aggregator меняется только в потоке записи - операции идут по очереди
+    writer = get_writer()
+    if pending is None:
+        await writer.run(aggregate_participants, aggregator, group_id, members)
+    else:
+        pending.append((group_id, await writer.submit_async(aggregate_participants, aggregator,
+                                                            group_id, members)))
+    
+    print(f"   ✅ Обработано {len(participants)} участников")
+    return True
+
+
+def write_records(path: str, key: str, records: Iterable[Dict]) -> int:
+    """Сохраняет массив записей по одной на строку (для потокового diff)"""
+    with span(os.path.basename(path), cat='serialize'):
+        return write_record_array(path, key, records)
+
+
+def write_full_snapshot(output_dir: str, groups: List[Dict], members: Iterable[Dict],
+                        edges: Iterable[Tuple[int, int]], edge_format: str = "json",
+                        compress: Optional[str] = None) -> Tuple[int, int]:
+    """
+    Сохраняет полный снимок: groups.json, members.json, group_members.json
+    
+    members должны идти по возрастанию user_id, edges - по (group_id, user_id),
+    чтобы два экспорта можно было сравнить потоковым merge-join (команда diff).
+    Записи пишутся потоком, списки целиком не строятся.
+    
+    Args:
+        edge_format: Формат связей: json, columnar (group_members.s16m) или parquet
+        compress: Сжатие JSON файлов: gzip, zstd или None
+    
+    Returns:
+        (количество участников, количество связей)
+    """
+    # 1. groups.json
+    groups_file = with_codec_suffix(f"{output_dir}/groups.json", compress)
+    groups_data = {
+        "groups": groups
+    }
+    with span(os.path.basename(groups_file), cat='serialize'):
+        write_json(groups_file, groups_data)
+    print(f"✅ {groups_file} - {len(groups)} групп")
+    
+    # 2. members.json  
+    members_file = with_codec_suffix(f"{output_dir}/members.json", compress)
+    member_count = write_records(members_file, "members", members)
+    print(f"✅ {members_file} - {member_count} уникальных участников")
+    
+    # 3. group_members.json / .s16m / .parquet
+    if edge_format == "json":
+        group_members_file = with_codec_suffix(f"{output_dir}/group_members.json", compress)
+        edge_count = write_records(group_members_file, "group_members",
+                                   ({"group_id": g, "user_id": u} for g, u in edges))
+    else:
+        writer, suffix = EDGE_WRITERS[edge_format]
+        group_members_file = f"{output_dir}/group_members{suffix}"
+        with span(os.path.basename(group_members_file), cat='serialize'):
+            edge_count = writer(group_members_file, edges)
+    size_kb = os.path.getsize(group_members_file) / 1024
+    print(f"✅ {group_members_file} - {edge_count} связей ({size_kb:.1f} KB)")
+    return member_count, edge_count
+
+
+def _same_groups(old: List[Dict], new: List[Dict]) -> bool:
+    """Совпадает ли список групп (порядок не важен: несобранные дописываются в конец)"""
+    key = lambda group: group['group_id']
+    return sorted(old, key=key) == sorted(new, key=key)
+
+
+def save_export(groups: List[Dict], aggregator: ExternalAggregator, failed_groups: List[int],
+                delta: bool, full_every: int, edge_format: str,
+                compress: Optional[str]) -> Tuple[Optional[str], int, int]:
+    """
+    ЭТАП 2: полный снимок и/или changes.json
+    
+    Полный снимок пишется потоком из aggregator. Режим delta сравнивает
+    состояние в памяти, поэтому участники и связи материализуются.
+    
+    Если с прошлого экспорта ничего не изменилось и полный снимок не нужен,
+    каталог не создается: пустая дельта только удлинила бы цепочку.
+    
+    Returns:
+        (каталог экспорта или None без изменений, количество участников, количество связей)
+    """
+    # Предыдущее состояние (последний полный снимок + дельты) для режима delta
+    previous = load_latest_state(EXPORT_ROOT) if delta else None
+    write_full = should_write_full(previous, full_every) if delta else True
+    
+    if delta:
+        all_members = {m['user_id']: m for m in aggregator.iter_members()}
+        edges = set(aggregator.iter_edges())
+        if previous is not None:
+            carry_over_failed_groups(previous, failed_groups, groups, all_members, edges)
+        members_stream = sorted_members(all_members.values())
+        edges_stream = sorted(edges)
+        member_count, edge_count = len(all_members), len(edges)
+    else:
+        members_stream = aggregator.iter_members()
+        edges_stream = aggregator.iter_edges()
+    
+    changes = None
+    if previous is not None:
+        changes = compute_delta(previous, groups, all_members, edges)
+        if not write_full and is_empty_delta(changes) and _same_groups(previous.groups, groups):
+            print(f"✅ Изменений нет с {previous.source}: дельта не записана "
+                  f"(цепочка {previous.chain_length}/{full_every})")
+            return None, member_count, edge_count
+    
+    # Создаем директорию
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    prefix = FULL_PREFIX if write_full else DELTA_PREFIX
+    output_dir = f"{EXPORT_ROOT}/{prefix}{timestamp}"
+    os.makedirs(output_dir, exist_ok=True)
+    
+    # changes.json относительно предыдущего состояния
+    if changes is not None:
+        with span('changes.json', cat='serialize'):
+            changes_file = write_changes(Path(output_dir), changes, base=previous.source, codec=compress)
+        summary = delta_summary(changes)
+        print(f"✅ {changes_file} (база: {previous.source})")
+        print(f"   • Вступили: {summary['joins']}, вышли: {summary['leaves']}")
+        print(f"   • Новых участников: {summary['members_added']}, удалено: {summary['members_removed']}")
+        print(f"   • Изменений профиля: {summary['profile_changes']}")
+    
+    if write_full:
+        member_count, edge_count = write_full_snapshot(
+            output_dir, groups, members_stream, edges_stream, edge_format, compress
+        )
+        if delta:
+            write_manifest(Path(output_dir), 'full', base=previous.source if previous else None)
+    else:
+        write_manifest(Path(output_dir), 'delta', base=previous.source,
+                       chain_length=previous.chain_length + 1)
+        print(f"📦 Дельта {previous.chain_length + 1}/{full_every} "
+              f"(полный снимок после {full_every} дельт)")
+    
+    if aggregator.spilled:
+        dedup = aggregator.get_stats()
+        print(f"💽 Выгрузка на диск: {dedup['spills']} прогонов, {dedup['spilled_mb']} MB "
+              f"(бюджет памяти {dedup['memory_budget_mb']:.0f} MB)")
+    
+    return output_dir, member_count, edge_count
+
+
+async def plan_export(budget_minutes: Optional[float] = None, memory_budget_mb: Optional[float] = None,
+                      use_roster: bool = False, trace_files: Iterable[str] = ()):
+    """
+    Оценка экспорта без выгрузки участников: RPC, время, память, порядок групп
+    
+    Использует participants_count (get_group_info) или ростеры и историю
+    задержек из metrics.prom прошлых экспортов.
+    """
+    print(f"🧮 План экспорта {len(GROUP_IDS)} групп (участники не выгружаются)")
+    print("")
+    
+    client = get_client()
+    await client.start()
+    
+    history = load_latency_history(EXPORT_ROOT, trace_files=trace_files, registry=get_metrics())
+    estimates = await collect_estimates(GroupManager(client), GROUP_IDS, history,
+                                        store=RosterStore(), use_roster=use_roster)
+    budget = memory_budget_mb if memory_budget_mb is not None else get_memory_budget_mb()
+    plan = build_plan(estimates, get_rate_limiter(), history,
+                      budget_minutes=budget_minutes, memory_budget_mb=budget)
+    print(format_plan(plan))
+    
+    await client.disconnect()
+    return plan
+
+
+async def export_to_3_jsons(delta: bool = False, full_every: int = DEFAULT_FULL_EVERY,
+                            edge_format: str = "json", compress: Optional[str] = None,
+                            memory_budget_mb: Optional[float] = None, takeout: bool = False):
+    """
+    Экспорт в 3 JSON файла с анти-спам защитой
+    
+    Args:
+        delta: Писать только изменения относительно предыдущего экспорта (changes.json)
+        full_every: В режиме delta - полный снимок после стольких дельт подряд
+        edge_format: Формат group_members: json, columnar или parquet
+        compress: Потоковое сжатие JSON файлов: gzip, zstd или None
+        memory_budget_mb: Бюджет памяти для участников и связей, сверх него -
+            выгрузка на диск (None - EXPORT_MEMORY_BUDGET_MB)
+        takeout: Собирать данные через takeout сессию (при отказе Telegram -
+            обычной сессией)
+    """
     
     print("🚀 Экспорт в 3 JSON файла с анти-спам защитой...")
     print(f"📊 Групп к обработке: {len(GROUP_IDS)}")
@@ -46,115 +309,70 @@ async def export_to_3_jsons():
     await client.start()
     
     rate_limiter = get_rate_limiter()
-    manager = GroupManager(client)
     
     # Подготовка данных
     groups = []           # для groups.json
-    all_members = {}      # для дедупликации members
-    group_members = []    # для group_members.json
+    failed_groups = []    # группы, которые не удалось собрать
+    # members и group_members: дедупликация с выгрузкой на диск сверх бюджета
+    aggregator = ExternalAggregator(memory_budget_mb, tmp_dir=f"{EXPORT_ROOT}/.tmp")
+    aggregations = []     # (group_id, future) агрегаций в потоке записи
     
     # ЭТАП 1: Собираем группы и участников
     print("=" * 50)
     print("ЭТАП 1: СБОР ДАННЫХ")
     print("=" * 50)
     
-    for i, group_id in enumerate(GROUP_IDS, 1):
-        try:
-            print(f"📊 {i:2d}/{len(GROUP_IDS)} Обработка группы {group_id}...")
-            
-            # Получаем информацию о группе
-            group_info = await manager.get_group_info(group_id)
-            if not group_info:
-                print(f"   ❌ Не удалось получить информацию о группе")
-                continue
-                
-            print(f"   📝 {group_info['title']} ({group_info.get('participants_count', '?')} участников)")
-            
-            # Добавляем в groups (используем исходный group_id, а не тот что из API)
-            groups.append({
-                "group_id": group_id,  # Используем исходный ID из списка
-                "title": group_info['title']
-            })
-            
-            # Получаем участников
-            participants = await manager.get_participants(group_id, limit=None)
-            if not participants:
-                print(f"   ⚠️ Не удалось получить участников")
-                continue
+    async with open_export_manager(client, takeout) as manager:
+        takeout_manager = manager if isinstance(manager, FallbackGroupManager) else None
+        if takeout_manager:
+            print("📦 Сбор через takeout сессию")
+        elif takeout:
+            print("⚠️ Takeout недоступен, сбор обычной сессией")
+        
+        for i, group_id in enumerate(GROUP_IDS, 1):
+            try:
+                print(f"📊 {i:2d}/{len(GROUP_IDS)} Обработка группы {group_id}...")
             
-            # Обрабатываем участников
-            for participant in participants:
-                user_id = participant['id']
+                with span('group', cat='group', group=group_id):
+                    if not await collect_group(manager, group_id, groups, aggregator, aggregations):
+                        failed_groups.append(group_id)
+                        continue
                 
-                # Добавляем уникального участника
-                if user_id not in all_members:
-                    all_members[user_id] = {
-                        "user_id": user_id,
-                        "username": participant.get('username'),
-                        "first_name": participant.get('first_name'),
-                        "last_name": participant.get('last_name'),
-                        "is_premium": participant.get('is_premium', False),
-                        "is_verified": participant.get('is_verified', False)
-                    }
+                    # Пауза между группами только при нехватке токенов или после FLOOD_WAIT
+                    if i < len(GROUP_IDS):
+                        paused = await smart_pause("export", i, limiter=manager.limiter)
+                        if paused:
+                            print(f"   ⏳ Пауза {paused:.1f}с для анти-спам защиты...")
                 
-                # Добавляем связь группа-участник
-                group_members.append({
-                    "group_id": group_id,
-                    "user_id": user_id
-                })
-            
-            print(f"   ✅ Обработано {len(participants)} участников")
-            
-            # Smart pause каждые 3 группы
-            if i % 3 == 0 and i < len(GROUP_IDS):
-                await smart_pause("export", i)
-                print(f"   ⏳ Пауза для анти-спам защиты...")
-                
-        except Exception as e:
-            logger.error(f"Ошибка при обработке группы {group_id}: {e}")
-            continue
+            except Exception as e:
+                logger.error(f"Ошибка при обработке группы {group_id}: {e}")
+                failed_groups.append(group_id)
+                continue
         
-        print("")
+            print("")
     
     # ЭТАП 2: Сохранение JSON файлов
     print("=" * 50)
     print("ЭТАП 2: СОХРАНЕНИЕ JSON ФАЙЛОВ")
     print("=" * 50)
     
-    # Создаем директорию
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_dir = f"data/export/s16_export_{timestamp}"
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # Конвертируем members в список
-    members = list(all_members.values())
-    
-    # 1. groups.json
-    groups_file = f"{output_dir}/groups.json"
-    groups_data = {
-        "groups": groups
-    }
-    with open(groups_file, 'w', encoding='utf-8') as f:
-        json.dump(groups_data, f, ensure_ascii=False, indent=2)
-    print(f"✅ {groups_file} - {len(groups)} групп")
-    
-    # 2. members.json  
-    members_file = f"{output_dir}/members.json"
-    members_data = {
-        "members": members
-    }
-    with open(members_file, 'w', encoding='utf-8') as f:
-        json.dump(members_data, f, ensure_ascii=False, indent=2)
-    print(f"✅ {members_file} - {len(members)} уникальных участников")
-    
-    # 3. group_members.json
-    group_members_file = f"{output_dir}/group_members.json"
-    group_members_data = {
-        "group_members": group_members
-    }
-    with open(group_members_file, 'w', encoding='utf-8') as f:
-        json.dump(group_members_data, f, ensure_ascii=False, indent=2)
-    print(f"✅ {group_members_file} - {len(group_members)} связей")
+    try:
+        # Дожидаемся агрегации всех групп: упавшая считается несобранной
+        for group_id, future in aggregations:
+            try:
+                await asyncio.wrap_future(future)
+            except Exception as e:
+                logger.error(f"Ошибка агрегации группы {group_id}: {e}")
+                failed_groups.append(group_id)
+        
+        output_dir, member_count, edge_count = await get_writer().run(
+            save_export, groups, aggregator, failed_groups, delta, full_every, edge_format, compress
+        )
+    finally:
+        # При прерывании агрегация могла остаться в очереди записи; ждем ее в
+        # отдельном потоке - event loop в это время обслуживает соединение
+        await asyncio.to_thread(get_writer().flush)
+        aggregator.close()
     
     # ФИНАЛЬНАЯ СТАТИСТИКА
     print("\n" + "=" * 50)
@@ -164,24 +382,91 @@ async def export_to_3_jsons():
     stats = rate_limiter.get_stats()
     print(f"🛡️ Анти-спам статистика:")
     print(f"   • API вызовов: {stats['api_calls']}")
-    print(f"   • FLOOD_WAIT ошибок: {stats['flood_waits']}")
-    print(f"   • Текущий RPS: {stats['current_rps']}")
+    print(f"   • FLOOD_WAIT ошибок: {stats['flood_waits']} ({stats['flood_wait_seconds']}s ожидания)")
+    for method, flood in sorted(stats['flood_by_method'].items(), key=lambda item: -item[1]['seconds']):
+        print(f"     - {method}: {flood['count']} раз, {flood['seconds']}s")
+    print(f"   • Текущий RPS: {stats['current_rps']} (фактический: {stats['effective_rps']})")
+    if takeout_manager:
+        takeout_stats = get_takeout_limiter().get_stats()
+        print(f"   • Через takeout: {takeout_stats['api_calls']} вызовов, "
+              f"FLOOD_WAIT {takeout_stats['flood_waits']} ({takeout_stats['flood_wait_seconds']}s)"
+              + ("" if takeout_manager.uses_takeout else ", takeout прерван - дальше обычная сессия"))
+    coalescing = get_single_flight().get_stats()
+    print(f"   • Объединено запросов: {coalescing['coalesced']}/{coalescing['requests']} "
+          f"({coalescing['hit_rate']:.0%})")
+    
+    method_stats = get_metrics().get_method_stats()
+    if method_stats:
+        print(f"⏱️ Время по методам (ожидание токена / Telegram / FLOOD_WAIT сон):")
+        for method, m in sorted(method_stats.items(), key=lambda item: -item[1]['rpc_time_s']):
+            print(f"   • {method}: {m['calls']} вызовов, "
+                  f"{m['queue_wait_s']:.1f}s / {m['rpc_time_s']:.1f}s / {m['flood_sleep_s']:.1f}s")
+    if output_dir:
+        get_metrics().dump(f"{output_dir}/metrics.prom")
     
     print(f"\n📊 Результаты:")
     print(f"   • Групп обработано: {len(groups)}")
-    print(f"   • Уникальных участников: {len(members)}")
-    print(f"   • Связей группа-участник: {len(group_members)}")
-    print(f"   • Директория: {output_dir}")
+    print(f"   • Уникальных участников: {member_count}")
+    print(f"   • Связей группа-участник: {edge_count}")
+    print(f"   • Директория: {output_dir or 'не создана (изменений нет)'}")
     
     await client.disconnect()
     return True
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Экспорт S16 групп в 3 JSON файла')
+    parser.add_argument('--trace', help='Файл трассировки (JSONL), отчет: python src/cli.py trace-report --input FILE')
+    parser.add_argument('--delta', action='store_true',
+                        help='Записать только изменения относительно предыдущего экспорта (changes.json)')
+    parser.add_argument('--full-every', type=int, default=DEFAULT_FULL_EVERY,
+                        help=f'В режиме --delta: полный снимок после N дельт (по умолчанию {DEFAULT_FULL_EVERY})')
+    parser.add_argument('--format', choices=['json', 'columnar', 'parquet'], default='json',
+                        help='Формат group_members: json, columnar (group_members.s16m, mmap) '
+                             'или parquet (нужен pyarrow)')
+    parser.add_argument('--memory-budget-mb', type=float, default=None,
+                        help=f'Бюджет памяти для дедупликации, сверх него - выгрузка на диск '
+                             f'(по умолчанию EXPORT_MEMORY_BUDGET_MB или {get_memory_budget_mb()})')
+    parser.add_argument('--compress', choices=sorted(CODEC_SUFFIXES),
+                        help='Потоковое сжатие JSON файлов (gzip; zstd - если установлен zstandard)')
+    parser.add_argument('--plan', action='store_true',
+                        help='Только оценить RPC, время и память по метаданным групп, без экспорта')
+    parser.add_argument('--budget-minutes', type=float,
+                        help='В режиме --plan: бюджет времени, группы сверх него откладываются')
+    parser.add_argument('--use-roster', action='store_true',
+                        help='В режиме --plan: число участников из data/rosters без запросов')
+    parser.add_argument('--history-traces',
+                        help='В режиме --plan: трассировки прошлых запусков (--trace) через запятую - '
+                             'история задержек для оценки времени')
+    parser.add_argument('--takeout', action='store_true',
+                        help='Собирать через takeout сессию Telegram (мягче лимиты, свой TAKEOUT_RPS); '
+                             'если Telegram отложит takeout - обычной сессией')
+    args = parser.parse_args()
+    
+    if args.plan:
+        asyncio.run(plan_export(budget_minutes=args.budget_minutes, memory_budget_mb=args.memory_budget_mb,
+                                use_roster=args.use_roster,
+                                trace_files=[t.strip() for t in (args.history_traces or '').split(',') if t.strip()]))
+        raise SystemExit(0)
+    
+    if args.format == 'parquet' and not parquet_available():
+        print("❌ Для --format parquet установите pyarrow: pip install pyarrow")
+        raise SystemExit(1)
+    
+    if args.compress and args.compress not in available_codecs():
+        print(f"❌ Для --compress {args.compress} установите zstandard: pip install zstandard")
+        raise SystemExit(1)
+    
+    if args.trace:
+        enable_tracing(args.trace)
+    
     print("📋 Экспорт 13 S16 групп в 3 JSON файла")
     print("🛡️ Использует анти-спам защиту S16-leads")
     print("")
     
-    success = asyncio.run(export_to_3_jsons())
+    success = asyncio.run(export_to_3_jsons(delta=args.delta, full_every=args.full_every,
+                                            edge_format=args.format, compress=args.compress,
+                                            memory_budget_mb=args.memory_budget_mb,
+                                            takeout=args.takeout))
     if success:
         print("\n🎯 Все готово! Три JSON файла созданы.")
     else:
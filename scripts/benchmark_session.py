@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк хранилища сессии на обходе участников
+==============================================
+
+Офлайн: страницы ChannelParticipants по 200 пользователей (как отдает
+GetParticipantsRequest) подаются в session.process_entities - так же, как это
+делает Telethon на каждом ответе - для SQLiteSession и WriteBehindSession.
+Сессии создаются во временном каталоге, Telegram не нужен.
+
+Запуск:
+    python scripts/benchmark_session.py --users 100000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from telethon.sessions import SQLiteSession
+from telethon.tl import types
+
+from src.infra.session_store import WriteBehindSession
+
+PAGE_SIZE = 200
+SAVE_EVERY_PAGES = 50  # Telethon сохраняет сессию и на обновлениях/переподключениях
+
+
+def make_page(start: int, size: int) -> types.channels.ChannelParticipants:
+    users = [
+        types.User(id=user_id, access_hash=user_id * 7919, first_name=f"User {user_id}",
+                   username=f"user{user_id}")
+        for user_id in range(start, start + size)
+    ]
+    participants = [types.ChannelParticipant(user_id=u.id, date=None) for u in users]
+    return types.channels.ChannelParticipants(count=size, participants=participants,
+                                              chats=[], users=users)
+
+
+def run(session, pages) -> float:
+    started = time.perf_counter()
+    for number, page in enumerate(pages, 1):
+        session.process_entities(page)
+        # Обход сразу использует сущности (get_input_entity по id)
+        session.get_input_entity(page.users[-1].id)
+        if number % SAVE_EVERY_PAGES == 0:
+            session.save()
+    walk = time.perf_counter() - started
+    session.close()
+    return walk
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLiteSession vs WriteBehindSession на обходе участников")
+    parser.add_argument('--users', type=int, default=50000, help='Пользователей в обходе')
+    args = parser.parse_args()
+
+    pages = [make_page(start, min(PAGE_SIZE, args.users - start + 1))
+             for start in range(1, args.users + 1, PAGE_SIZE)]
+
+    print(f"🧪 Обход {args.users} участников, {len(pages)} страниц по {PAGE_SIZE}")
+    with tempfile.TemporaryDirectory() as tmp:
+        sessions = [
+            ("sqlite", SQLiteSession(os.path.join(tmp, "sqlite"))),
+            ("write-behind", WriteBehindSession(os.path.join(tmp, "wb"))),
+            ("write-behind, без участников",
+             WriteBehindSession(os.path.join(tmp, "wb_np"), persist_participants=False)),
+        ]
+        baseline = None
+        for name, session in sessions:
+            walk = run(session, pages)
+            size = os.path.getsize(session.filename) / 1024
+            rate = args.users / walk if walk else float('inf')
+            baseline = baseline or rate
+            print(f"  {name:30} {rate:12,.0f} users/s  x{rate / baseline:5.1f}  сессия {size:8,.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,37 +6,156 @@ CLI интерфейс для работы с группами Telegram
 import asyncio
 import argparse
 import json
+from datetime import datetime
 from pathlib import Path
 from src.infra.tele_client import get_client
-from src.core.group_manager import GroupManager
+from src.core.group_manager import (
+    PARTICIPANT_FILTERS, ROLE_FILTERS, FallbackGroupManager, GroupManager, open_export_manager
+)
+from src.core.export_diff import UnsortedExportError, diff_exports, summarize
+from src.core.membership_tracker import MembershipTracker
+from src.core.activity import get_activity_store
+from src.core.crosscheck import (
+    CrossChecker, DEFAULT_CONCURRENCY, ReferenceRosterError, load_reference_file, save_report
+)
+from src.core.crosscheck import format_report as format_crosscheck_report
+from src.core.jobs import JOB_HANDLERS, Worker
+from src.core.message_export import MESSAGE_FORMATS, MessageExporter
+from src.core.membership_filter import (
+    DEFAULT_FP_RATE, FilterGroupMismatchError, build_filter, default_filter_path, load_filter, screen
+)
+from src.core.planner import collect_estimates, build_plan, format_plan, load_latency_history, save_plan
+from src.core.roster_store import RosterStore
+from src.core.s16_config import get_s16_config
+from src.infra.codecs import CODEC_SUFFIXES, open_text, strip_codec_suffix, with_codec_suffix
+from src.core.external_dedup import get_memory_budget_mb
+from src.infra.daemon import DaemonServer, connect_daemon
+from src.infra.job_queue import DEFAULT_MAX_ATTEMPTS, FINAL_STATUSES, get_job_queue
+from src.infra.limiter import get_rate_limiter
+from src.infra.metrics import dump_metrics_from_env, get_metrics, start_metrics_from_env
+from src.infra.tracing import build_report, enable_tracing, format_report, load_spans, span, to_chrome_trace
+from src.infra.writer import get_writer, write_json
+
+# Команды, которым не нужен позиционный аргумент group
+GROUPLESS_COMMANDS = {'track', 'trace-report', 'diff', 'crosscheck', 'plan',
+                      'submit', 'status', 'cancel', 'worker', 'daemon', 'membership', 'build-filter',
+                      'export-messages', 'activity'}
+
+# Команды, которые работают с локальными файлами и не подключаются к Telegram
+OFFLINE_COMMANDS = {'trace-report', 'diff', 'submit', 'status', 'cancel', 'activity'}
+
+# Команды, которым нужен собственный клиент (не через демон)
+DIRECT_COMMANDS = {'track', 'daemon'}
 
 async def main():
     parser = argparse.ArgumentParser(description='S16-Leads: Работа с группами Telegram')
-    parser.add_argument('command', choices=['info', 'participants', 'search', 'export', 'creation-date'], 
+    parser.add_argument('command', choices=['info', 'participants', 'search', 'export', 'creation-date',
+                                            'track', 'trace-report', 'diff', 'crosscheck', 'plan',
+                                            'submit', 'status', 'cancel', 'worker', 'daemon',
+                                            'membership', 'build-filter', 'export-messages',
+                                            'activity'], 
                        help='Команда для выполнения')
-    parser.add_argument('group', help='Username группы (без @) или ID группы')
+    parser.add_argument('group', nargs='?',
+                       help='Username группы (без @) или ID группы (для track - список ID через запятую; '
+                            'для submit - тип задачи; для status и cancel - ID задачи)')
     parser.add_argument('--limit', type=int, default=100, 
                        help='Максимальное количество участников (по умолчанию: 100)')
-    parser.add_argument('--query', help='Поисковый запрос (для команды search)')
-    parser.add_argument('--output', help='Файл для экспорта (для команды export)')
-    parser.add_argument('--format', choices=['json', 'csv'], default='json',
-                       help='Формат вывода (по умолчанию: json)')
+    parser.add_argument('--query', help='Поисковый запрос (для команды search; для participants - '
+                                        'подстрока имени, q серверного фильтра)')
+    parser.add_argument('--filter', choices=sorted(PARTICIPANT_FILTERS),
+                       help='Для participants: серверный фильтр Telegram (выгружаются только подходящие)')
+    parser.add_argument('--role', choices=sorted(ROLE_FILTERS),
+                       help='Для participants: только участники с ролью (фильтр выбирается автоматически)')
+    parser.add_argument('--contacts', action='store_true',
+                       help='Для participants: только контакты аккаунта')
+    parser.add_argument('--output', help='Файл для экспорта (для команды export; для diff - изменения в NDJSON; '
+                                         'для crosscheck и plan - отчет JSON; для build-filter - файл .s16b)')
+    parser.add_argument('--format', choices=['json', 'csv', *MESSAGE_FORMATS], default='json',
+                       help='Формат вывода (по умолчанию: json; для export-messages - ndjson или parquet)')
+    parser.add_argument('--compress', choices=sorted(CODEC_SUFFIXES),
+                       help='Сжатие файла экспорта (по умолчанию - по расширению: .gz, .zst)')
+    parser.add_argument('--reconcile-interval', type=float, default=3600.0,
+                       help='Период сверки ростеров в секундах (для команды track)')
+    parser.add_argument('--metrics-file',
+                       help='Файл для метрик API вызовов в формате Prometheus (по умолчанию METRICS_FILE)')
+    parser.add_argument('--trace',
+                       help='Записывать трассировку этапов в файл (JSONL)')
+    parser.add_argument('--input',
+                       help='Входной файл (для команды trace-report - файл трассировки; '
+                            'для plan - трассировки прошлых запусков через запятую)')
+    parser.add_argument('--targets',
+                       help='ID целевых групп через запятую (для команд crosscheck и plan)')
+    parser.add_argument('--reference-file',
+                       help='Референсный ростер из файла: экспорт .json/.csv или каталог export_3_jsons '
+                            '(для crosscheck, build-filter и activity)')
+    parser.add_argument('--use-roster', action='store_true',
+                       help='Взять ростер из data/rosters, если он есть (для crosscheck и build-filter - '
+                            'референсный, для plan - число участников без запросов)')
+    parser.add_argument('--budget-minutes', type=float,
+                       help='Бюджет времени выгрузки в минутах (для команды plan)')
+    parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                       help=f'Сколько раз пытаться выполнить задачу (для submit, по умолчанию {DEFAULT_MAX_ATTEMPTS})')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                       help=f'Сколько групп выгружать одновременно (для crosscheck и export-messages; для export --harvest - '
+                            f'поисковых запросов, по умолчанию {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--harvest', action='store_true',
+                       help='Для export: собрать всех участников большой группы перебором поисковых префиксов '
+                            '(обычный обход обрывается на ~10 тыс.); --limit не используется')
+    parser.add_argument('--max-pages', type=int,
+                       help='Для export-messages: страниц по 100 сообщений на группу за запуск '
+                            '(остальное - в следующий запуск)')
+    parser.add_argument('--takeout', action='store_true',
+                       help='Для export и export-messages: выгрузка через takeout сессию Telegram (мягче лимиты, свой TAKEOUT_RPS); '
+                            'всегда напрямую, без демона')
+    parser.add_argument('--users',
+                       help='ID пользователей через запятую (для membership; группа по умолчанию - s16 space)')
+    parser.add_argument('--filter-file',
+                       help='Для activity: участники s16 space из фильтра Блума; для membership: сначала проверить по фильтру Блума (build-filter), '
+                            'в Telegram - только возможных участников')
+    parser.add_argument('--fp-rate', type=float, default=DEFAULT_FP_RATE,
+                       help=f'Для build-filter: доля ложных срабатываний (по умолчанию {DEFAULT_FP_RATE})')
+    parser.add_argument('--no-daemon', action='store_true',
+                       help='Подключиться к Telegram напрямую, даже если запущен демон (python src/cli.py daemon)')
+    parser.add_argument('--old', help='Каталог старого экспорта (для команды diff)')
+    parser.add_argument('--new', help='Каталог нового экспорта (для команды diff)')
     
     args = parser.parse_args()
     
+    if args.command not in GROUPLESS_COMMANDS and not args.group:
+        print(f"❌ Для команды {args.command} необходимо указать группу")
+        return
+    
+    if args.command in OFFLINE_COMMANDS:
+        await handle_offline(args)
+        return
+    
+    if args.trace:
+        enable_tracing(args.trace)
+    start_metrics_from_env()
+    
     try:
-        # Получаем клиент
-        client = get_client()
-        await client.start()
+        # Если запущен демон - вызовы идут через его подключенный клиент и лимитер
+        client = None
+        group_manager = None
+        # Takeout открывается на своем клиенте - демон для него не подходит
+        if args.command not in DIRECT_COMMANDS and not args.no_daemon and not args.takeout:
+            group_manager = await connect_daemon()
         
-        # Создаем менеджер групп
-        group_manager = GroupManager(client)
+        if group_manager is None:
+            # Получаем клиент
+            client = get_client()
+            await client.start()
+            
+            # Создаем менеджер групп
+            group_manager = GroupManager(client)
         
         if args.command == 'info':
             await handle_info(group_manager, args.group)
             
         elif args.command == 'participants':
-            await handle_participants(group_manager, args.group, args.limit, args.format)
+            await handle_participants(group_manager, args.group, args.limit, args.format,
+                                      filter=args.filter, query=args.query, role=args.role,
+                                      contacts=args.contacts)
             
         elif args.command == 'search':
             if not args.query:
@@ -48,17 +167,69 @@ async def main():
             if not args.output:
                 print("❌ Для команды export необходимо указать --output")
                 return
-            await handle_export(group_manager, args.group, args.output, args.limit)
+            if args.takeout:
+                async with open_export_manager(client, takeout=True) as export_manager:
+                    if isinstance(export_manager, FallbackGroupManager):
+                        print("📦 Выгрузка через takeout сессию")
+                    else:
+                        print("⚠️ Takeout недоступен, выгрузка обычной сессией")
+                    await handle_export(export_manager, args.group, args.output, args.limit, args.compress,
+                                        harvest=args.harvest, concurrency=args.concurrency)
+            else:
+                await handle_export(group_manager, args.group, args.output, args.limit, args.compress,
+                                    harvest=args.harvest, concurrency=args.concurrency)
+            
+        elif args.command == 'export-messages':
+            if args.takeout:
+                async with open_export_manager(client, takeout=True) as export_manager:
+                    if isinstance(export_manager, FallbackGroupManager):
+                        print("📦 Выгрузка через takeout сессию")
+                    else:
+                        print("⚠️ Takeout недоступен, выгрузка обычной сессией")
+                    await handle_export_messages(export_manager, args.targets or args.group, args.output,
+                                                 args.format, args.compress, args.concurrency, args.max_pages)
+            else:
+                await handle_export_messages(group_manager, args.targets or args.group, args.output,
+                                             args.format, args.compress, args.concurrency, args.max_pages)
             
         elif args.command == 'creation-date':
             await handle_creation_date(group_manager, args.group)
+            
+        elif args.command == 'track':
+            await handle_track(client, group_manager, args.group, args.reconcile_interval)
+            
+        elif args.command == 'crosscheck':
+            await handle_crosscheck(group_manager, args.targets or args.group, args.reference_file,
+                                    args.use_roster, args.concurrency, args.output)
+            
+        elif args.command == 'membership':
+            await handle_membership(group_manager, args.group, args.users, args.filter_file)
+            
+        elif args.command == 'build-filter':
+            await handle_build_filter(group_manager, args.group, args.output, args.reference_file,
+                                      args.use_roster, args.fp_rate)
+            
+        elif args.command == 'plan':
+            await handle_plan(group_manager, args.targets or args.group, args.input,
+                              args.use_roster, args.budget_minutes, args.output)
+            
+        elif args.command == 'worker':
+            await handle_worker(group_manager)
+            
+        elif args.command == 'daemon':
+            await handle_daemon(group_manager)
         
-        await client.disconnect()
+        if client is not None:
+            await client.disconnect()
+        else:
+            await group_manager.close()
         
     except KeyboardInterrupt:
         print("\n⚠️ Операция прервана пользователем")
     except Exception as e:
         print(f"❌ Ошибка: {e}")
+    finally:
+        dump_metrics_from_env(args.metrics_file)
 
 async def handle_info(group_manager: GroupManager, group: str):
     """Обработка команды info"""
@@ -74,11 +245,25 @@ async def handle_info(group_manager: GroupManager, group: str):
     else:
         print(f"❌ Группа {group} не найдена")
 
-async def handle_participants(group_manager: GroupManager, group: str, limit: int, format: str):
+async def handle_participants(group_manager: GroupManager, group: str, limit: int, format: str,
+                              filter: str = None, query: str = None, role: str = None,
+                              contacts: bool = False):
     """Обработка команды participants"""
     print(f"👥 Получение участников группы: {group} (лимит: {limit})")
     
-    participants = await group_manager.get_participants(group, limit)
+    if filter:
+        # Явный серверный фильтр
+        print(f"🔎 Фильтр: {filter}" + (f" (q='{query}')" if query else ""))
+        participants = await group_manager.get_participants(group, limit, filter=filter, query=query or '')
+    elif role or contacts or query:
+        # Условия - самый узкий подходящий фильтр выбирает plan_participants_filter
+        result = await group_manager.find_participants(group, role=role, query=query or '',
+                                                       contacts_only=contacts, limit=limit)
+        plan = result['plan']
+        print(f"🔎 Фильтр: {plan['filter']}" + (f" (q='{plan['query']}')" if plan['query'] else ""))
+        participants = result['participants']
+    else:
+        participants = await group_manager.get_participants(group, limit)
     
     if participants:
         print(f"✅ Получено {len(participants)} участников")
@@ -113,22 +298,26 @@ async def handle_search(group_manager: GroupManager, group: str, query: str, lim
     else:
         print("❌ Участники не найдены")
 
-async def handle_export(group_manager: GroupManager, group: str, output: str, limit: int):
+async def handle_export(group_manager: GroupManager, group: str, output: str, limit: int,
+                        compress: str = None, harvest: bool = False, concurrency: int = DEFAULT_CONCURRENCY):
     """Обработка команды export"""
+    output = with_codec_suffix(output, compress)
     print(f"📤 Экспорт участников группы {group} в файл: {output}")
     
     # Создаем директорию для экспорта если нужно
     output_path = Path(output)
     output_path.parent.mkdir(parents=True, exist_ok=True)
     
-    if output_path.suffix.lower() == '.csv':
+    if harvest:
+        success = await handle_harvest_export(group_manager, group, output, concurrency)
+    elif strip_codec_suffix(output).lower().endswith('.csv'):
         success = await group_manager.export_participants_to_csv(group, output, limit)
     else:
         # JSON экспорт
         participants = await group_manager.get_participants(group, limit)
         if participants:
-            with open(output, 'w', encoding='utf-8') as f:
-                json.dump(participants, f, ensure_ascii=False, indent=2)
+            with span('write_json', cat='serialize', group=group):
+                await get_writer().run(write_json, output, sorted(participants, key=lambda p: p['id']))
             print(f"✅ Экспортировано {len(participants)} участников в {output}")
             success = True
         else:
@@ -137,6 +326,68 @@ async def handle_export(group_manager: GroupManager, group: str, output: str, li
     if not success:
         print("❌ Ошибка при экспорте")
 
+async def handle_harvest_export(group_manager: GroupManager, group: str, output: str,
+                                concurrency: int) -> bool:
+    """export --harvest: полный сбор участников с отчетом о полноте"""
+    if strip_codec_suffix(output).lower().endswith('.csv'):
+        print("❌ export --harvest пишет только JSON")
+        return False
+    
+    result = await group_manager.harvest_participants(group, concurrency=concurrency)
+    participants = result['participants']
+    coverage = result['coverage']
+    if not participants:
+        return False
+    
+    # Участники уже отсортированы по id
+    with span('write_json', cat='serialize', group=group):
+        await get_writer().run(write_json, output, participants)
+    
+    print(f"✅ Экспортировано {len(participants)} участников в {output}")
+    total = coverage['participants_count'] or '?'
+    share = f" ({coverage['coverage']:.1%})" if coverage['coverage'] is not None else ""
+    print(f"📊 Найдено {coverage['found']} из {total}{share}: обычный обход {coverage['plain_walk']}, "
+          f"поисковых запросов {coverage['queries']}")
+    if coverage['saturated_prefixes']:
+        print(f"   Уточненные префиксы: {len(coverage['saturated_prefixes'])}")
+    if coverage['failed_queries']:
+        print(f"⚠️  Не выполнены запросы: {', '.join(coverage['failed_queries'])}")
+    return True
+
+async def handle_export_messages(group_manager: GroupManager, groups: str, output: str = None,
+                                 format: str = 'json', compress: str = None,
+                                 concurrency: int = DEFAULT_CONCURRENCY, max_pages: int = None):
+    """Обработка команды export-messages: история сообщений с продолжением с места остановки"""
+    if format == 'csv':
+        print("❌ export-messages пишет ndjson или parquet")
+        return
+    format = 'parquet' if format == 'parquet' else 'ndjson'
+    targets = _split_groups(groups) if groups else get_s16_config().get_tracked_group_ids()
+    
+    # Каждая страница сразу обновляет агрегаты активности (команда activity)
+    exporter = MessageExporter(group_manager, output_dir=output or 'data/messages', format=format,
+                               codec=compress, concurrency=concurrency, max_pages=max_pages,
+                               on_page=get_activity_store().process_page)
+    print(f"💬 Экспорт сообщений {len(targets)} групп в {exporter.output_dir} ({format}, "
+          f"одновременно: {exporter.concurrency})")
+    
+    report = await exporter.run(targets)
+    for result in report['groups']:
+        if result['status'] == 'not_found':
+            print(f"❌ {result['group']}: группа не найдена")
+            continue
+        if 'checkpoint' not in result:
+            print(f"❌ {result['group']}: {result.get('error', 'ошибка')}")
+            continue
+        checkpoint = result['checkpoint']
+        history = "история выгружена" if checkpoint['history_complete'] else f"история до id {checkpoint['min_id']}"
+        icon = {'ok': '✅', 'partial': '⏸️ ', 'failed': '⚠️ '}[result['status']]
+        print(f"{icon} {result['title']}: новых {result['new']}, из истории {result['backfill']} "
+              f"(всего {checkpoint['exported']}, {history})")
+    print(f"💾 Записано сообщений: {report['messages']}")
+    if report['failed']:
+        print(f"⚠️  Не выгружены: {', '.join(map(str, report['failed']))} - продолжатся при следующем запуске")
+
 async def handle_creation_date(group_manager: GroupManager, group: str):
     """Обработка команды creation-date"""
     print(f"📅 Получение даты создания группы {group}...")
@@ -173,5 +424,381 @@ async def handle_creation_date(group_manager: GroupManager, group: str):
     else:
         print("❌ Не удалось получить дату создания группы")
 
+async def handle_track(client, group_manager: GroupManager, groups: str, reconcile_interval: float):
+    """Обработка команды track (работает до Ctrl+C)"""
+    if groups:
+        group_ids = [int(g.strip()) for g in groups.split(',') if g.strip()]
+    else:
+        group_ids = get_s16_config().get_tracked_group_ids()
+    
+    print(f"👁️ Отслеживание состава {len(group_ids)} групп (сверка раз в {reconcile_interval:.0f}s)")
+    
+    tracker = MembershipTracker(client, group_ids, manager=group_manager,
+                                reconcile_interval=reconcile_interval)
+    try:
+        await tracker.run()
+    finally:
+        stats = tracker.stats
+        print(f"✅ Событий: {stats['events']}, join: {stats['joins']}, leave: {stats['leaves']}, "
+              f"полных выгрузок: {stats['full_fetches']}")
+
+async def handle_crosscheck(group_manager: GroupManager, targets: str, reference_file: str = None,
+                            use_roster: bool = False, concurrency: int = DEFAULT_CONCURRENCY,
+                            output: str = None):
+    """Обработка команды crosscheck: сверка многих групп с s16 space за один запуск"""
+    config = get_s16_config()
+    if targets:
+        target_ids = [int(t.strip()) for t in targets.split(',') if t.strip()]
+    else:
+        target_ids = config.get_tracked_group_ids()
+    
+    checker = CrossChecker(group_manager, config.get_space_group_id(), config.get_space_group_name(),
+                           store=RosterStore(), concurrency=concurrency)
+    print(f"🔍 Сверка {len(target_ids)} групп с {checker.reference_name} "
+          f"(одновременно: {checker.concurrency})")
+    
+    try:
+        report = await checker.run(target_ids, reference_file=reference_file, use_roster=use_roster)
+    except ReferenceRosterError as e:
+        print(f"❌ {e}")
+        return
+    print()
+    print(format_crosscheck_report(report))
+    
+    if output:
+        await get_writer().run(save_report, report, output)
+        print(f"\n💾 Отчет сохранен: {output}")
+
+async def handle_membership(group_manager: GroupManager, group: str, users: str, filter_file: str = None):
+    """Обработка команды membership: состоят ли пользователи в группе"""
+    if not users:
+        print("❌ Для команды membership необходимо указать --users")
+        return
+    user_ids = [int(u) for u in _split_groups(users)]
+    if not group:
+        group = get_s16_config().get_space_group_id()
+    print(f"👥 Проверка {len(user_ids)} пользователей в группе {group}")
+    
+    screened_out = []
+    if filter_file:
+        membership = load_filter(filter_file)
+        if membership.group_id:
+            info = await group_manager.get_group_info(group)
+            if not info:
+                print("❌ Группа не найдена")
+                return
+            try:
+                membership.check_group(info['id'])
+            except FilterGroupMismatchError as e:
+                print(f"❌ {e}")
+                return
+        screened = screen(membership, user_ids)
+        screened_out = screened['non_members']
+        user_ids = screened['members']
+        built_at = membership.built_at_iso()
+        print(f"🧪 Фильтр от {built_at} ({_format_age(membership.age_seconds())} назад): "
+              f"{len(screened_out)} не состояли в группе на {built_at}, "
+              f"{len(user_ids)} проверяются в Telegram")
+    
+    if user_ids:
+        result = await group_manager.check_membership(group, user_ids)
+        if result is None:
+            print("❌ Группа не найдена")
+            return
+    else:
+        result = {'members': [], 'non_members': [], 'unknown': [], 'cost': None}
+    result['non_members'] = screened_out + result['non_members']
+    
+    cost = result['cost']
+    if cost:
+        print(f"🧮 Способ: {cost['strategy']} ({cost['reason']})")
+    print(f"✅ Состоят: {len(result['members'])}")
+    for user_id in result['members']:
+        print(f"   • {user_id}")
+    print(f"➖ Не состоят: {len(result['non_members'])}"
+          + (f" (из них {len(screened_out)} - по фильтру от {built_at})" if screened_out else ""))
+    for user_id in result['non_members']:
+        print(f"   • {user_id}")
+    if result['unknown']:
+        print(f"⚠️  Не удалось проверить (пользователь неизвестен сессии): {', '.join(map(str, result['unknown']))}")
+
+async def handle_build_filter(group_manager: GroupManager, group: str = None, output: str = None,
+                              reference_file: str = None, use_roster: bool = False,
+                              fp_rate: float = DEFAULT_FP_RATE):
+    """Обработка команды build-filter: фильтр Блума участников референсной группы"""
+    config = get_s16_config()
+    group_id = _split_groups(group)[0] if group else config.get_space_group_id()
+    name = config.get_space_group_name() if group_id == config.get_space_group_id() else str(group_id)
+    
+    checker = CrossChecker(group_manager, group_id, name, store=RosterStore())
+    member_ids = await checker.load_reference(reference_file, use_roster)
+    if not member_ids:
+        print(f"❌ Не удалось получить участников {name}")
+        return
+    
+    membership = build_filter(member_ids, group_id=group_id if isinstance(group_id, int) else 0,
+                              fp_rate=fp_rate)
+    path = membership.save(output or default_filter_path(group_id))
+    info = membership.info()
+    print(f"✅ Фильтр {name}: {info['items']} участников, {info['size_bytes']} байт, "
+          f"ложные срабатывания ~{info['expected_fp_rate']:.3%}")
+    print(f"   Источник: {checker.reference_source}, версия: {info['built_at']}")
+    print(f"💾 {path}")
+
+async def handle_plan(group_manager: GroupManager, targets: str, trace_files: str = None,
+                      use_roster: bool = False, budget_minutes: float = None, output: str = None):
+    """Обработка команды plan: оценка RPC, времени и памяти без выгрузки участников"""
+    if targets:
+        group_ids = [int(t.strip()) for t in targets.split(',') if t.strip()]
+    else:
+        group_ids = get_s16_config().get_tracked_group_ids()
+    
+    history = load_latency_history(
+        trace_files=[t.strip() for t in trace_files.split(',') if t.strip()] if trace_files else (),
+        registry=get_metrics()
+    )
+    print(f"🧮 Оценка {len(group_ids)} групп по метаданным...")
+    estimates = await collect_estimates(group_manager, group_ids, history,
+                                        store=RosterStore(), use_roster=use_roster)
+    plan = build_plan(estimates, get_rate_limiter(), history, budget_minutes=budget_minutes,
+                      memory_budget_mb=get_memory_budget_mb())
+    print()
+    print(format_plan(plan))
+    
+    if output:
+        save_plan(plan, output)
+        print(f"\n💾 План сохранен: {output}")
+
+def _split_groups(value: str) -> list:
+    """Список групп из строки через запятую (ID - числами, username - строками)"""
+    groups = []
+    for item in (v.strip() for v in value.split(',')):
+        if item:
+            groups.append(int(item) if item.lstrip('-').isdigit() else item)
+    return groups
+
+def handle_submit(kind: str, targets: str, output: str = None, limit: int = None,
+                  compress: str = None, reference_file: str = None, use_roster: bool = False,
+                  max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+    """Обработка команды submit: постановка задачи в очередь воркера"""
+    if kind not in JOB_HANDLERS:
+        print(f"❌ Неизвестный тип задачи: {kind} (доступны: {', '.join(sorted(JOB_HANDLERS))})")
+        return None
+    
+    groups = _split_groups(targets) if targets else []
+    if kind == 'export':
+        if len(groups) != 1 or not output:
+            print("❌ Для задачи export укажите одну группу в --targets и --output")
+            return None
+        params = {'group': groups[0], 'output': output, 'limit': limit, 'compress': compress}
+    elif kind == 'crosscheck':
+        params = {'targets': groups or get_s16_config().get_tracked_group_ids(), 'output': output,
+                  'reference_file': reference_file, 'use_roster': use_roster}
+    else:
+        if not groups:
+            print(f"❌ Для задачи {kind} укажите группы в --targets")
+            return None
+        params = {'groups': groups}
+    
+    job_id = get_job_queue().submit(kind, params, max_attempts=max_attempts)
+    print(f"📥 Задача #{job_id} ({kind}) поставлена в очередь. Выполнит: python src/cli.py worker")
+    return job_id
+
+def _format_age(seconds: float) -> str:
+    minutes, hours, days = int(seconds // 60), int(seconds // 3600), int(seconds // 86400)
+    if days:
+        return f"{days} д"
+    return f"{hours} ч" if hours else f"{minutes} мин"
+
+def _format_time(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S') if timestamp else '-'
+
+def handle_status(job_id: str = None):
+    """Обработка команды status: задачи очереди или одна задача"""
+    queue = get_job_queue()
+    if job_id:
+        job = queue.get(int(job_id))
+        if job is None:
+            print(f"❌ Задача #{job_id} не найдена")
+            return
+        print(f"📋 Задача #{job['id']} ({job['kind']}): {job['status']}"
+              f"{' (запрошена отмена)' if job['cancel_requested'] else ''}")
+        print(f"   • Попыток: {job['attempts']}/{job['max_attempts']}")
+        print(f"   • Создана: {_format_time(job['created_at'])}, обновлена: {_format_time(job['updated_at'])}")
+        print(f"   • Параметры: {json.dumps(job['params'], ensure_ascii=False)}")
+        if job['status'] not in FINAL_STATUSES and job['run_after'] > job['updated_at']:
+            print(f"   • Следующая попытка: {_format_time(job['run_after'])}")
+        if job['error']:
+            print(f"   • Ошибка: {job['error']}")
+        if job['result'] is not None:
+            print(f"   • Результат: {json.dumps(job['result'], ensure_ascii=False)[:500]}")
+        return
+    
+    jobs = queue.list()
+    if not jobs:
+        print("📭 Очередь пуста")
+        return
+    counts = queue.counts()
+    print("📋 Задачи: " + ", ".join(f"{status} {n}" for status, n in sorted(counts.items())))
+    for job in jobs:
+        print(f"   #{job['id']:<5} {job['kind']:<14} {job['status']:<10} "
+              f"{job['attempts']}/{job['max_attempts']}  {_format_time(job['updated_at'])}")
+
+def handle_cancel(job_id: str):
+    """Обработка команды cancel"""
+    status = get_job_queue().cancel(int(job_id))
+    if status is None:
+        print(f"❌ Задача #{job_id} не найдена")
+    elif status == 'running':
+        print(f"⏹️ Отмена задачи #{job_id} запрошена, воркер остановит ее на ближайшем чекпоинте")
+    else:
+        print(f"⏹️ Задача #{job_id}: {status}")
+
+async def handle_worker(group_manager: GroupManager):
+    """Обработка команды worker: выполнение задач очереди (работает до Ctrl+C)"""
+    worker = Worker(group_manager)
+    print(f"👷 Воркер {worker.worker_id} запущен, очередь: {worker.queue.db_path}")
+    try:
+        await worker.run()
+    finally:
+        stats = worker.stats
+        print(f"✅ Выполнено: {stats['done']}, повторов: {stats['retried']}, "
+              f"ошибок: {stats['failed']}, отменено: {stats['cancelled']}")
+
+async def handle_daemon(group_manager: GroupManager):
+    """Обработка команды daemon: операции GroupManager через Unix сокет (работает до Ctrl+C)"""
+    server = DaemonServer(group_manager)
+    await server.start()
+    print(f"🔌 Демон запущен: {server.socket_path} (PID {server.status()['pid']})")
+    print("   Команды cli.py будут использовать этот клиент автоматически")
+    try:
+        await server.serve_forever()
+    finally:
+        print(f"✅ Демон остановлен, обработано запросов: {server.requests}")
+
+async def handle_offline(args):
+    """Обработка команд, не требующих подключения к Telegram"""
+    if args.command == 'trace-report':
+        if not args.input:
+            print("❌ Для команды trace-report необходимо указать --input")
+            return
+        handle_trace_report(args.input, args.output)
+    
+    elif args.command == 'diff':
+        if not args.old or not args.new:
+            print("❌ Для команды diff необходимо указать --old и --new")
+            return
+        handle_diff(args.old, args.new, args.output)
+    
+    elif args.command == 'submit':
+        if not args.group:
+            print(f"❌ Для команды submit укажите тип задачи: {', '.join(sorted(JOB_HANDLERS))}")
+            return
+        handle_submit(args.group, args.targets, args.output, args.limit, args.compress,
+                      args.reference_file, args.use_roster, args.max_attempts)
+    
+    elif args.command == 'status':
+        handle_status(args.group)
+    
+    elif args.command == 'cancel':
+        if not args.group:
+            print("❌ Для команды cancel необходимо указать ID задачи")
+            return
+        handle_cancel(args.group)
+    
+    elif args.command == 'activity':
+        handle_activity(args.targets or args.group, args.limit, args.filter_file, args.reference_file,
+                        args.output)
+
+def _load_space_members(filter_file: str = None, reference_file: str = None):
+    """
+    Участники s16 space из локальных данных (без Telegram)
+
+    Порядок: фильтр Блума, файл ростера, ростер data/rosters, фильтр по умолчанию.
+
+    Returns:
+        (объект с проверкой `in`, описание источника) или (None, None)
+    """
+    space_id = get_s16_config().get_space_group_id()
+    if filter_file:
+        return load_filter(filter_file), f"фильтр {filter_file}"
+    if reference_file:
+        return load_reference_file(reference_file, space_id), f"файл {reference_file}"
+    store = RosterStore()
+    if store.has(space_id):
+        return store.load(space_id).member_ids(), "ростер data/rosters"
+    if Path(default_filter_path(space_id)).exists():
+        return load_filter(default_filter_path(space_id)), f"фильтр {default_filter_path(space_id)}"
+    return None, None
+
+def handle_activity(groups: str = None, limit: int = 100, filter_file: str = None, reference_file: str = None,
+                    output: str = None):
+    """Обработка команды activity: самые активные не-участники s16 space по накопленным агрегатам"""
+    members, source = _load_space_members(filter_file, reference_file)
+    if members is None:
+        print("❌ Нет локального ростера s16 space: укажите --filter-file или --reference-file, "
+              "либо соберите ростер (track, crosscheck) или фильтр (build-filter)")
+        return
+    
+    store = get_activity_store()
+    stats = store.get_stats()
+    group_ids = [int(g) for g in _split_groups(groups)] if groups else None
+    top = store.top_users(limit, exclude=lambda user_id: user_id in members, group_ids=group_ids)
+    print(f"📈 Активность: {stats['messages']} сообщений в {stats['groups']} группах; "
+          f"участники s16 space: {source}")
+    if not top:
+        print("❌ Нет данных - выгрузите сообщения командой export-messages")
+        return
+    
+    print(f"🔥 Самые активные не-участники s16 space ({len(top)}):")
+    for i, user in enumerate(top, 1):
+        print(f"{i:3d}. {user['user_id']} - сообщений: {user['messages']}, групп: {user['groups']}, "
+              f"активных дней: {user['active_days']}, последнее: {user['last_active'][:10]}")
+    
+    if output:
+        with open_text(output, 'w') as f:
+            json.dump(top, f, ensure_ascii=False, indent=2)
+        print(f"💾 {output}")
+
+def handle_trace_report(trace_file: str, chrome_output: str = None):
+    """Обработка команды trace-report: разбивка времени по группам и этапам"""
+    spans = load_spans(trace_file)
+    if not spans:
+        print(f"❌ В файле {trace_file} нет спанов")
+        return
+    
+    print(format_report(build_report(spans)))
+    
+    if chrome_output:
+        with open(chrome_output, 'w', encoding='utf-8') as f:
+            json.dump(to_chrome_trace(spans), f)
+        print(f"\n💾 Chrome trace: {chrome_output} (открыть в chrome://tracing или ui.perfetto.dev)")
+
+def handle_diff(old_dir: str, new_dir: str, output: str = None):
+    """Обработка команды diff: потоковое сравнение двух каталогов экспорта"""
+    print(f"🔍 Сравнение экспортов:\n   {old_dir}\n   {new_dir}")
+    
+    try:
+        if output:
+            with open_text(output, 'w') as f:
+                counts = summarize(
+                    diff_exports(old_dir, new_dir),
+                    sink=lambda event: f.write(json.dumps(event, ensure_ascii=False) + '\n')
+                )
+        else:
+            counts = summarize(diff_exports(old_dir, new_dir))
+    except UnsortedExportError as e:
+        print(f"❌ {e}")
+        return
+    except FileNotFoundError as e:
+        print(f"❌ Файл не найден: {e.filename}")
+        return
+    
+    print(f"👤 Участники: +{counts['member_added']} / -{counts['member_removed']} / "
+          f"изменено {counts['member_changed']}")
+    print(f"🔗 Связи: вступили {counts['join']}, вышли {counts['leave']}")
+    if output:
+        print(f"💾 Изменения (NDJSON): {output}")
+
 if __name__ == "__main__":
     asyncio.run(main())
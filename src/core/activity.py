@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Активность пользователей по истории сообщений
+=============================================
+
+Агрегаты по паре (группа, пользователь) - число сообщений, первое и последнее
+сообщение, число активных дней - обновляются инкрементально по каждой новой
+странице MessageExporter (on_page=store.process_page). История повторно не
+сканируется: запросы к агрегатам работают только с базой.
+
+База SQLite (data/analytics/activity.db или ACTIVITY_DB):
+
+    user_activity(group_id, user_id, messages, first_ts, last_ts, active_days)
+    activity_days(group_id, user_id, day)      - активные дни (UTC, дни от 1970-01-01)
+    activity_coverage(group_id, min_id, max_id, messages)
+
+activity_coverage - диапазон id сообщений, уже учтенных в агрегатах группы.
+MessageExporter выгружает группу непрерывно (новые после max_id, история до
+min_id), поэтому сообщения внутри диапазона - повтор страницы после сбоя, и
+они не учитываются второй раз.
+
+Учитываются сообщения пользователей (sender_id > 0), не служебные.
+"""
+
+import logging
+import os
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ACTIVITY_DB = "data/analytics/activity.db"
+
+SECONDS_PER_DAY = 86400
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_activity (
+    group_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    messages INTEGER NOT NULL,
+    first_ts INTEGER NOT NULL,
+    last_ts INTEGER NOT NULL,
+    active_days INTEGER NOT NULL,
+    PRIMARY KEY (group_id, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS activity_days (
+    group_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    PRIMARY KEY (group_id, user_id, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS activity_coverage (
+    group_id INTEGER PRIMARY KEY,
+    min_id INTEGER NOT NULL,
+    max_id INTEGER NOT NULL,
+    messages INTEGER NOT NULL
+);
+"""
+
+
+def _timestamp(value: str) -> int:
+    date = datetime.fromisoformat(value)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return int(date.timestamp())
+
+
+def _iso(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+
+class ActivityStore:
+    """Агрегаты активности (группа, пользователь) в SQLite"""
+
+    def __init__(self, db_path: str = DEFAULT_ACTIVITY_DB):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Автокоммит, транзакции - явно через BEGIN. process_page вызывается из
+        # потока записи экспорта (по одной странице), запросы - из основного
+        self._conn = sqlite3.connect(str(self.db_path), isolation_level=None, timeout=30.0,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def coverage(self, group_id: int) -> Optional[Dict[str, int]]:
+        """Учтенный диапазон сообщений группы (None - группа еще не учитывалась)"""
+        row = self._conn.execute(
+            "SELECT min_id, max_id, messages FROM activity_coverage WHERE group_id = ?", (group_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'min_id': row[0], 'max_id': row[1], 'messages': row[2]}
+
+    def process_page(self, group_id: int, records: List[Dict[str, Any]]) -> int:
+        """
+        Учитывает страницу сообщений группы (записи message_to_record)
+
+        Returns:
+            Сколько сообщений пользователей добавлено в агрегаты
+        """
+        if not records:
+            return 0
+        covered = self.coverage(group_id)
+        fresh = [
+            r for r in records
+            if covered is None or r['id'] > covered['max_id'] or r['id'] < covered['min_id']
+        ]
+        if not fresh:
+            return 0
+
+        # Агрегаты страницы в памяти, в базу - одной транзакцией
+        counts: Dict[int, List[int]] = {}
+        days = set()
+        for record in fresh:
+            user_id = record.get('sender_id')
+            if not user_id or user_id < 0 or record.get('service') or not record.get('date'):
+                continue
+            ts = _timestamp(record['date'])
+            stats = counts.get(user_id)
+            if stats is None:
+                counts[user_id] = [1, ts, ts]
+            else:
+                stats[0] += 1
+                stats[1] = min(stats[1], ts)
+                stats[2] = max(stats[2], ts)
+            days.add((group_id, user_id, ts // SECONDS_PER_DAY))
+
+        ids = [r['id'] for r in fresh]
+        counted = sum(stats[0] for stats in counts.values())
+        self._conn.execute("BEGIN")
+        try:
+            self._conn.executemany(
+                "INSERT INTO user_activity (group_id, user_id, messages, first_ts, last_ts, active_days) "
+                "VALUES (?, ?, ?, ?, ?, 0) "
+                "ON CONFLICT (group_id, user_id) DO UPDATE SET "
+                "messages = messages + excluded.messages, "
+                "first_ts = MIN(first_ts, excluded.first_ts), last_ts = MAX(last_ts, excluded.last_ts)",
+                [(group_id, user_id, n, first, last) for user_id, (n, first, last) in counts.items()]
+            )
+            self._conn.executemany("INSERT OR IGNORE INTO activity_days VALUES (?, ?, ?)", sorted(days))
+            self._conn.executemany(
+                "UPDATE user_activity SET active_days = "
+                "(SELECT COUNT(*) FROM activity_days d WHERE d.group_id = ? AND d.user_id = ?) "
+                "WHERE group_id = ? AND user_id = ?",
+                [(group_id, user_id, group_id, user_id) for user_id in counts]
+            )
+            self._conn.execute(
+                "INSERT INTO activity_coverage (group_id, min_id, max_id, messages) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (group_id) DO UPDATE SET min_id = MIN(min_id, excluded.min_id), "
+                "max_id = MAX(max_id, excluded.max_id), messages = messages + excluded.messages",
+                (group_id, min(ids), max(ids), counted)
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return counted
+
+    def user_activity(self, user_id: int) -> List[Dict[str, Any]]:
+        """Активность пользователя по группам (самые активные первыми)"""
+        rows = self._conn.execute(
+            "SELECT group_id, messages, first_ts, last_ts, active_days FROM user_activity "
+            "WHERE user_id = ? ORDER BY messages DESC", (user_id,)
+        ).fetchall()
+        return [
+            {'group_id': g, 'messages': n, 'first_active': _iso(first), 'last_active': _iso(last),
+             'active_days': active_days}
+            for g, n, first, last, active_days in rows
+        ]
+
+    def top_users(self, limit: int = 100, exclude: Optional[Callable[[int], bool]] = None,
+                  group_ids: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+        """
+        Самые активные пользователи по всем (или выбранным) группам
+
+        Args:
+            limit: Сколько пользователей вернуть
+            exclude: Пропустить пользователя (например, участника s16 space)
+            group_ids: Только эти группы (None - все)
+
+        Returns:
+            [{'user_id', 'messages', 'groups', 'active_days', 'first_active', 'last_active'}, ...]
+            по убыванию числа сообщений
+        """
+        where, params = "", []
+        if group_ids is not None:
+            group_ids = list(group_ids)
+            where = f"WHERE group_id IN ({','.join('?' * len(group_ids))})"
+            params = group_ids
+        cursor = self._conn.execute(
+            "SELECT user_id, SUM(messages) AS total, COUNT(*), SUM(active_days), MIN(first_ts), MAX(last_ts) "
+            f"FROM user_activity {where} GROUP BY user_id ORDER BY total DESC, user_id", params
+        )
+        top = []
+        # Курсор читается построчно, пока не наберется limit подходящих
+        for user_id, messages, groups, active_days, first, last in cursor:
+            if exclude is not None and exclude(user_id):
+                continue
+            top.append({'user_id': user_id, 'messages': messages, 'groups': groups,
+                        'active_days': active_days, 'first_active': _iso(first), 'last_active': _iso(last)})
+            if len(top) >= limit:
+                break
+        cursor.close()
+        return top
+
+    def get_stats(self) -> Dict[str, int]:
+        groups, messages = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(messages), 0) FROM activity_coverage"
+        ).fetchone()
+        pairs = self._conn.execute("SELECT COUNT(*) FROM user_activity").fetchone()[0]
+        return {'groups': groups, 'messages': messages, 'user_groups': pairs}
+
+
+# Глобальный экземпляр хранилища активности
+_activity_store: Optional[ActivityStore] = None
+
+def get_activity_store() -> ActivityStore:
+    """Получить глобальный экземпляр хранилища активности (Singleton pattern)"""
+    global _activity_store
+    if _activity_store is None:
+        _activity_store = ActivityStore(os.getenv("ACTIVITY_DB", DEFAULT_ACTIVITY_DB))
+    return _activity_store
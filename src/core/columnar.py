@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Колоночный формат связей группа-участник
+========================================
+
+Файл group_members.s16m - отсортированные массивы int64 с индексом по группам.
+Все числа little-endian, все смещения кратны 8 байтам.
+
+    Заголовок (32 байта):
+        magic        8s   b"S16MEMB\\x00"
+        version      u32  FORMAT_VERSION
+        group_count  u32
+        edge_count   u64
+        reserved     u64  0
+
+    Индекс (group_count записей по 24 байта, отсортирован по group_id):
+        group_id     i64
+        offset       i64  номер первого user_id группы в массиве данных
+        count        i64  количество участников группы
+
+    Данные (edge_count * 8 байт):
+        user_id      i64  по возрастанию внутри каждой группы
+
+Чтение через mmap без копирования: members(group_id) возвращает memoryview
+(формат 'q') прямо на страницы файла, проверка членства - бинарный поиск.
+8 байт на связь против ~60 байт в group_members.json.
+
+Если установлен pyarrow, те же связи можно записать в Parquet
+(write_parquet / read_parquet_edges).
+
+Файлы s16m не сжимаются: mmap требует несжатых данных, а формат и так
+компактен.
+"""
+
+import bisect
+import mmap
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from src.infra.codecs import find_existing
+
+MAGIC = b"S16MEMB\x00"
+FORMAT_VERSION = 1
+COLUMNAR_SUFFIX = ".s16m"
+PARQUET_SUFFIX = ".parquet"
+
+_HEADER = struct.Struct("<8sIIQQ")
+_INDEX_ENTRY = struct.Struct("<qqq")
+
+# memoryview.cast('q') использует порядок байт машины
+_NATIVE_LITTLE_ENDIAN = sys.byteorder == "little"
+
+Edge = Tuple[int, int]
+
+
+class ColumnarFormatError(ValueError):
+    """Файл не в формате s16m или неподдерживаемая версия"""
+
+
+def group_edges(edges: Iterable[Edge]) -> Dict[int, array]:
+    """Группирует связи по group_id в отсортированные массивы user_id без дублей"""
+    grouped: Dict[int, array] = {}
+    for group_id, user_id in edges:
+        column = grouped.get(group_id)
+        if column is None:
+            column = grouped[group_id] = array("q")
+        column.append(user_id)
+    for group_id, column in grouped.items():
+        grouped[group_id] = array("q", sorted(set(column)))
+    return grouped
+
+
+def write_membership(path: str, edges: Iterable[Edge]) -> int:
+    """
+    Записывает связи (group_id, user_id) в файл s16m
+
+    Returns:
+        Количество записанных связей
+    """
+    grouped = group_edges(edges)
+    group_ids = sorted(grouped)
+    edge_count = sum(len(grouped[g]) for g in group_ids)
+
+    target = Path(path)
+    tmp_path = target.with_name(target.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(group_ids), edge_count, 0))
+        offset = 0
+        for group_id in group_ids:
+            count = len(grouped[group_id])
+            f.write(_INDEX_ENTRY.pack(group_id, offset, count))
+            offset += count
+        for group_id in group_ids:
+            column = grouped[group_id]
+            if not _NATIVE_LITTLE_ENDIAN:
+                column = array("q", column)
+                column.byteswap()
+            column.tofile(f)
+    tmp_path.replace(target)
+    return edge_count
+
+
+class MembershipFile:
+    """
+    Чтение файла s16m через mmap
+
+    Пример:
+        with MembershipFile("group_members.s16m") as memberships:
+            users = memberships.members(-1002188344480)   # memoryview, без копирования
+            memberships.contains(-1002188344480, 123)
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        if self.path.stat().st_size < _HEADER.size:
+            raise ColumnarFormatError(f"{path}: файл слишком короткий")
+        self._file = open(self.path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._data = None
+
+        magic, version, group_count, edge_count, _ = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ColumnarFormatError(f"{path}: неверная сигнатура {magic!r}")
+        if version != FORMAT_VERSION:
+            self.close()
+            raise ColumnarFormatError(f"{path}: неподдерживаемая версия {version}")
+
+        self.edge_count = edge_count
+        self._index: Dict[int, Tuple[int, int]] = {}
+        position = _HEADER.size
+        for _ in range(group_count):
+            group_id, offset, count = _INDEX_ENTRY.unpack_from(self._mmap, position)
+            self._index[group_id] = (offset, count)
+            position += _INDEX_ENTRY.size
+
+        data = memoryview(self._mmap)[position:position + edge_count * 8]
+        if _NATIVE_LITTLE_ENDIAN:
+            self._data = data.cast("q")
+        else:
+            # На big-endian машинах нулевое копирование невозможно
+            swapped = array("q", data.tobytes())
+            swapped.byteswap()
+            data.release()
+            self._data = memoryview(swapped)
+
+    def group_ids(self) -> List[int]:
+        """Группы в файле (по возрастанию)"""
+        return sorted(self._index)
+
+    def members(self, group_id: int) -> memoryview:
+        """Отсортированные user_id группы (пустой memoryview, если группы нет)"""
+        offset, count = self._index.get(group_id, (0, 0))
+        return self._data[offset:offset + count]
+
+    def contains(self, group_id: int, user_id: int) -> bool:
+        """Состоит ли пользователь в группе (бинарный поиск)"""
+        column = self.members(group_id)
+        position = bisect.bisect_left(column, user_id)
+        return position < len(column) and column[position] == user_id
+
+    def iter_edges(self) -> Iterator[Edge]:
+        """Связи в порядке (group_id, user_id)"""
+        for group_id in self.group_ids():
+            for user_id in self.members(group_id):
+                yield group_id, user_id
+
+    def as_dict(self) -> Dict[int, memoryview]:
+        """Все группы: {group_id: memoryview user_id} без копирования данных"""
+        return {group_id: self.members(group_id) for group_id in self.group_ids()}
+
+    def close(self):
+        """
+        Освобождает mmap
+
+        Если снаружи еще живы memoryview из members()/as_dict(), mmap
+        закроется сборщиком мусора после их освобождения.
+        """
+        data = getattr(self, "_data", None)
+        if data is not None:
+            data.release()
+            self._data = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+        self._file.close()
+
+    def __len__(self) -> int:
+        return self.edge_count
+
+    def __enter__(self) -> "MembershipFile":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def read_membership_edges(path: str) -> List[Edge]:
+    """Все связи из файла s16m списком (копия, файл закрывается)"""
+    with MembershipFile(path) as memberships:
+        return list(memberships.iter_edges())
+
+
+# ----------------------------------------------------------------------
+# Parquet (опционально, нужен pyarrow)
+# ----------------------------------------------------------------------
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Для формата parquet установите pyarrow: pip install pyarrow") from None
+    return pyarrow, pyarrow.parquet
+
+
+def parquet_available() -> bool:
+    """Установлен ли pyarrow"""
+    try:
+        _import_pyarrow()
+    except ImportError:
+        return False
+    return True
+
+
+def write_parquet(path: str, edges: Iterable[Edge]) -> int:
+    """
+    Записывает связи в Parquet (колонки group_id, user_id; отсортировано)
+
+    Returns:
+        Количество записанных связей
+    """
+    pa, pq = _import_pyarrow()
+    grouped = group_edges(edges)
+    group_column = array("q")
+    user_column = array("q")
+    for group_id in sorted(grouped):
+        column = grouped[group_id]
+        group_column.extend([group_id] * len(column))
+        user_column.extend(column)
+
+    table = pa.table({
+        "group_id": pa.array(group_column, type=pa.int64()),
+        "user_id": pa.array(user_column, type=pa.int64()),
+    })
+    pq.write_table(table, path, compression="zstd")
+    return len(user_column)
+
+
+def read_parquet_edges(path: str) -> List[Edge]:
+    """Связи из Parquet файла в порядке (group_id, user_id)"""
+    _, pq = _import_pyarrow()
+    table = pq.read_table(path, columns=["group_id", "user_id"])
+    return list(zip(table.column("group_id").to_pylist(), table.column("user_id").to_pylist()))
+
+
+def read_edges(path: str) -> List[Edge]:
+    """Связи из колоночного файла по расширению (.s16m или .parquet)"""
+    if str(path).endswith(PARQUET_SUFFIX):
+        return read_parquet_edges(path)
+    return read_membership_edges(path)
+
+
+def find_edges_file(export_dir: str) -> Path:
+    """
+    Файл связей в каталоге экспорта: group_members.json (.gz/.zst), .s16m или .parquet
+
+    Raises:
+        FileNotFoundError: если ни одного нет
+    """
+    root = Path(export_dir)
+    for suffix in (".json", COLUMNAR_SUFFIX, PARQUET_SUFFIX):
+        candidate = find_existing(root / f"group_members{suffix}")
+        if candidate is not None:
+            return candidate
+    raise FileNotFoundError(2, "group_members.* not found", str(root / "group_members.json"))
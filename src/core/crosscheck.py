@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Сверка нескольких групп с референсной группой (s16 space)
+
+Референсный ростер получается один раз за запуск и без ограничения limit:
+- из файла (экспорт cli/export_3_jsons: .json, .csv, каталог экспорта, .s16m,
+  в том числе сжатые .gz / .zst)
+- из локального ростера RosterStore (поддерживается командой track)
+- из Telegram: get_participants(limit=None), результат сохраняется в RosterStore
+
+Целевые группы обрабатываются параллельно (не больше concurrency
+одновременно), все вызовы идут через GroupManager и общий rate limiter.
+Результат - один сводный отчет: по каждой группе новые, уже состоящие в
+референсной группе и пересечение с другими целевыми группами.
+"""
+
+import asyncio
+import csv
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from src.core.columnar import MembershipFile, find_edges_file
+from src.core.export_diff import iter_json_array
+from src.core.group_manager import GroupManager
+from src.core.pipeline import (
+    PARTICIPANT_COLUMNS, ProcessStage, get_process_stage, pack_ids, pack_records, split_by_reference,
+    unpack_batch
+)
+from src.core.roster_store import RosterStore
+from src.infra.codecs import open_text, strip_codec_suffix
+from src.infra.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Сколько целевых групп выгружать одновременно
+DEFAULT_CONCURRENCY = 3
+
+
+class ReferenceRosterError(RuntimeError):
+    """Референсный ростер не получен: сверка с пустым ростером объявила бы всех новыми"""
+
+
+def load_reference_file(path: str, reference_id: int) -> Set[int]:
+    """
+    ID участников референсной группы из файла
+
+    Поддерживаются:
+    - каталог экспорта export_3_jsons.py (связи группы reference_id)
+    - group_members.s16m
+    - .csv (колонка id) - вывод cli export
+    - .json: список участников (cli export) или {"members": [...]}
+    """
+    source = Path(path)
+    if source.is_dir():
+        edges_file = find_edges_file(str(source))
+        if not strip_codec_suffix(edges_file).endswith('.json'):
+            path = str(edges_file)
+        else:
+            return {
+                edge['user_id'] for edge in iter_json_array(str(edges_file), 'group_members')
+                if edge['group_id'] == reference_id
+            }
+
+    name = strip_codec_suffix(path).lower()
+    if name.endswith('.s16m'):
+        with MembershipFile(path) as memberships:
+            return set(memberships.members(reference_id))
+
+    if name.endswith('.csv'):
+        with open_text(path, newline='') as f:
+            return {int(row['id']) for row in csv.DictReader(f)}
+
+    with open_text(path) as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('members', [])
+    return {int(item.get('id', item.get('user_id'))) for item in data}
+
+
+class CrossChecker:
+    """Сверка многих целевых групп с одной референсной"""
+
+    def __init__(self, manager: GroupManager, reference_id: int,
+                 reference_name: Optional[str] = None,
+                 store: Optional[RosterStore] = None,
+                 concurrency: int = DEFAULT_CONCURRENCY,
+                 stage: Optional[ProcessStage] = None):
+        """
+        Args:
+            manager: GroupManager (все вызовы через rate limiter)
+            reference_id: ID референсной группы
+            reference_name: Название для отчета
+            store: Хранилище ростеров (None - не использовать)
+            concurrency: Сколько целевых групп выгружать одновременно
+            stage: Пул для сверки больших групп (None - get_process_stage())
+        """
+        self.manager = manager
+        self.reference_id = reference_id
+        self.reference_name = reference_name or str(reference_id)
+        self.store = store
+        self.concurrency = max(1, concurrency)
+        self.reference_ids: Optional[Set[int]] = None
+        self.reference_source: Optional[str] = None
+        self.stage = stage or get_process_stage()
+        self._reference_array = None
+
+    async def load_reference(self, reference_file: Optional[str] = None,
+                             use_roster: bool = False) -> Set[int]:
+        """
+        Загружает референсный ростер (один раз за запуск)
+
+        Args:
+            reference_file: Файл или каталог экспорта
+            use_roster: Взять ростер из RosterStore, если он есть
+        """
+        if self.reference_ids is not None:
+            return self.reference_ids
+
+        with span('load_reference', cat='crosscheck', group=self.reference_id) as s:
+            if reference_file:
+                self.reference_ids = load_reference_file(reference_file, self.reference_id)
+                self.reference_source = f"file:{reference_file}"
+            elif use_roster and self.store is not None and self.store.has(self.reference_id):
+                roster = self.store.load(self.reference_id)
+                self.reference_ids = roster.member_ids()
+                self.reference_source = f"roster:{roster.synced_at or roster.updated_at}"
+            else:
+                info = await self.manager.get_group_info(self.reference_id)
+                participants = await self.manager.get_participants(self.reference_id, limit=None)
+                # get_participants возвращает [] и при ошибке выгрузки
+                if not info or (not participants and info.get('participants_count') != 0):
+                    raise ReferenceRosterError(
+                        f"не удалось получить участников референсной группы {self.reference_name}"
+                    )
+                self.reference_ids = {p['id'] for p in participants}
+                self.reference_source = "telegram"
+                if self.store is not None and participants:
+                    # Следующие запуски (и track) смогут взять ростер локально
+                    roster = self.store.load(self.reference_id)
+                    roster.replace(participants, info.get('participants_count') if info else None)
+                    self.store.save(roster)
+            s.set(count=len(self.reference_ids), source=self.reference_source)
+
+        logger.info(f"Референсный ростер {self.reference_name}: {len(self.reference_ids)} "
+                    f"участников ({self.reference_source})")
+        return self.reference_ids
+
+    async def check_target(self, target_id: int) -> Dict[str, Any]:
+        """Сверка одной целевой группы (референсный ростер должен быть загружен)"""
+        with span('crosscheck_target', cat='crosscheck', group=target_id):
+            info = await self.manager.get_group_info(target_id)
+            participants = await self.manager.get_participants(target_id, limit=None)
+
+        # Пересечение - в пуле процессов, пока выгружаются другие группы
+        if self._reference_array is None:
+            self._reference_array = pack_ids(self.reference_ids or ())
+        existing, new = await self.stage.run(split_by_reference,
+                                             pack_records(participants, PARTICIPANT_COLUMNS),
+                                             self._reference_array)
+        existing, new = unpack_batch(existing), unpack_batch(new)
+        total = len(participants)
+        expected = info.get('participants_count') if info else None
+
+        return {
+            'target_id': target_id,
+            'target_group': info.get('title') if info else str(target_id),
+            'total_target': total,
+            'expected_total': expected,
+            'complete': expected is None or total >= expected,
+            'existing_count': len(existing),
+            'new_count': len(new),
+            'existing_percentage': len(existing) / total * 100 if total else 0.0,
+            'new_percentage': len(new) / total * 100 if total else 0.0,
+            'existing_members': existing,
+            'new_members': new,
+        }
+
+    async def run(self, target_ids: Iterable[int], reference_file: Optional[str] = None,
+                  use_roster: bool = False) -> Dict[str, Any]:
+        """
+        Сверка всех целевых групп
+
+        Returns:
+            Сводный отчет: reference, targets (по группам), summary
+        """
+        targets = [t for t in dict.fromkeys(target_ids) if t != self.reference_id]
+        await self.load_reference(reference_file, use_roster)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def guarded(target_id: int) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    return await self.check_target(target_id)
+                except Exception as e:
+                    logger.error(f"Ошибка сверки группы {target_id}: {e}")
+                    return {'target_id': target_id, 'target_group': str(target_id), 'error': str(e)}
+
+        results = await asyncio.gather(*(guarded(t) for t in targets))
+        return build_report(self.reference_id, self.reference_name, self.reference_ids or set(),
+                            self.reference_source, results)
+
+
+def build_report(reference_id: int, reference_name: str, reference_ids: Set[int],
+                 reference_source: Optional[str], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Сводный отчет с пересечениями между целевыми группами
+
+    overlap_count группы - сколько ее участников состоит хотя бы в одной
+    другой целевой группе; overlap - попарные пересечения.
+    """
+    ok = [r for r in results if 'error' not in r]
+    members_by_target = {
+        r['target_id']: {m['id'] for m in r['existing_members'] + r['new_members']} for r in ok
+    }
+
+    # В скольких целевых группах состоит каждый пользователь
+    seen_in: Dict[int, int] = {}
+    for ids in members_by_target.values():
+        for user_id in ids:
+            seen_in[user_id] = seen_in.get(user_id, 0) + 1
+
+    for r in ok:
+        ids = members_by_target[r['target_id']]
+        r['overlap_count'] = sum(1 for user_id in ids if seen_in[user_id] > 1)
+        r['overlap'] = {
+            str(other): len(ids & other_ids)
+            for other, other_ids in members_by_target.items()
+            if other != r['target_id'] and ids & other_ids
+        }
+
+    all_target_ids = set(seen_in)
+    return {
+        'generated_at': datetime.now().isoformat(),
+        'reference': {
+            'id': reference_id,
+            'name': reference_name,
+            'total': len(reference_ids),
+            'source': reference_source,
+        },
+        'targets': results,
+        'summary': {
+            'targets': len(results),
+            'failed': len(results) - len(ok),
+            'unique_members': len(all_target_ids),
+            'existing_unique': len(all_target_ids & reference_ids),
+            'new_unique': len(all_target_ids - reference_ids),
+        },
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Текстовый отчет для консоли"""
+    reference = report['reference']
+    summary = report['summary']
+    lines = [
+        f"🎯 Референсная группа: {reference['name']} ({reference['total']} участников, {reference['source']})",
+        "",
+        f"{'Группа':<32} {'Всего':>7} {'Уже в':>7} {'Новых':>7} {'Пересеч.':>9}",
+    ]
+    for r in report['targets']:
+        title = str(r['target_group'])[:32]
+        if 'error' in r:
+            lines.append(f"{title:<32} ❌ {r['error']}")
+            continue
+        incomplete = ' ⚠️' if not r['complete'] else ''
+        lines.append(f"{title:<32} {r['total_target']:>7} {r['existing_count']:>7} "
+                     f"{r['new_count']:>7} {r['overlap_count']:>9}{incomplete}")
+    lines += [
+        "",
+        f"👥 Уникальных участников в целевых группах: {summary['unique_members']}",
+        f"✅ Уже в {reference['name']}: {summary['existing_unique']}",
+        f"🆕 Новых: {summary['new_unique']}",
+    ]
+    if summary['failed']:
+        lines.append(f"❌ Групп с ошибками: {summary['failed']}")
+    if any(not r.get('complete', True) for r in report['targets']):
+        lines.append("⚠️ - выгружено меньше участников, чем participants_count (скрытые участники)")
+    return '\n'.join(lines)
+
+
+def save_report(report: Dict[str, Any], path: str):
+    """Сохраняет отчет в JSON (.gz / .zst - со сжатием)"""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open_text(path, 'w') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Дельта-экспорт между запусками export_3_jsons.py
+
+Каталоги экспорта в data/export:
+- s16_export_<ts>/ - полный снимок (groups.json, members.json, group_members.json
+                     или колоночный group_members.s16m / .parquet; JSON файлы
+                     могут быть сжаты: .json.gz / .json.zst)
+- s16_delta_<ts>/  - только изменения относительно предыдущего состояния (changes.json)
+
+В каждом новом каталоге лежит manifest.json с типом ("full"/"delta") и
+ссылкой на базу. Каталоги без manifest.json (старые экспорты) считаются
+полными снимками. Текущее состояние = последний полный снимок + все дельты
+после него по порядку. Полный снимок периодически пишется заново (точка
+компакции), чтобы цепочка дельт не росла бесконечно.
+
+Формат changes.json (компактный JSON):
+    {
+      "base": "s16_export_20250801_120000",
+      "groups": [...],                      # актуальный groups.json целиком (он маленький)
+      "joins": [[group_id, user_id], ...],
+      "leaves": [[group_id, user_id], ...],
+      "members_added": [{member}, ...],
+      "members_removed": [user_id, ...],
+      "profile_changes": [{"user_id": 1, "changes": {"username": ["old", "new"]}}, ...]
+    }
+"""
+
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from src.core.columnar import find_edges_file, read_edges
+from src.infra.codecs import find_existing, open_text, strip_codec_suffix, with_codec_suffix
+
+logger = logging.getLogger(__name__)
+
+FULL_PREFIX = "s16_export_"
+DELTA_PREFIX = "s16_delta_"
+MANIFEST_FILE = "manifest.json"
+CHANGES_FILE = "changes.json"
+
+# Полный снимок пишется после стольких дельт подряд
+DEFAULT_FULL_EVERY = 10
+
+# Поля профиля, изменения которых попадают в дельту
+PROFILE_FIELDS = ('username', 'first_name', 'last_name', 'is_premium', 'is_verified')
+
+Edge = Tuple[int, int]
+
+
+class ExportState:
+    """Состояние экспорта: группы, уникальные участники и связи группа-участник"""
+
+    def __init__(self, groups: Optional[List[Dict[str, Any]]] = None,
+                 members: Optional[Dict[int, Dict[str, Any]]] = None,
+                 edges: Optional[Set[Edge]] = None,
+                 source: Optional[str] = None,
+                 chain_length: int = 0):
+        """
+        Args:
+            groups: Содержимое groups.json
+            members: Участники по user_id
+            edges: Множество (group_id, user_id)
+            source: Имя каталога, из которого получено состояние
+            chain_length: Количество дельт после последнего полного снимка
+        """
+        self.groups = groups or []
+        self.members = members or {}
+        self.edges = edges or set()
+        self.source = source
+        self.chain_length = chain_length
+
+
+def _read_json(path: Path) -> Any:
+    """Читает JSON файл экспорта (в том числе сжатый .gz / .zst)"""
+    found = find_existing(path)
+    if found is None:
+        raise FileNotFoundError(2, "Export file not found", str(path))
+    with open_text(found) as f:
+        return json.load(f)
+
+
+def read_manifest(export_dir: Path) -> Dict[str, Any]:
+    """Manifest каталога экспорта (для старых экспортов - полный снимок)"""
+    manifest_path = export_dir / MANIFEST_FILE
+    if manifest_path.exists():
+        return _read_json(manifest_path)
+    return {'type': 'full', 'base': None}
+
+
+def write_manifest(export_dir: Path, export_type: str, base: Optional[str], **extra):
+    """Записывает manifest.json каталога экспорта"""
+    manifest = {
+        'type': export_type,
+        'base': base,
+        'created_at': datetime.now().isoformat(),
+        **extra
+    }
+    with open(export_dir / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+def list_export_dirs(export_root: str) -> List[Path]:
+    """Каталоги экспорта в хронологическом порядке (по timestamp в имени)"""
+    root = Path(export_root)
+    if not root.exists():
+        return []
+
+    def timestamp(path: Path) -> str:
+        name = path.name
+        return name[len(FULL_PREFIX):] if name.startswith(FULL_PREFIX) else name[len(DELTA_PREFIX):]
+
+    dirs = [
+        p for p in root.iterdir()
+        if p.is_dir() and (p.name.startswith(FULL_PREFIX) or p.name.startswith(DELTA_PREFIX))
+    ]
+    return sorted(dirs, key=timestamp)
+
+
+def find_export_chain(export_root: str) -> Tuple[Optional[Path], List[Path]]:
+    """
+    Последний полный снимок и дельты после него
+
+    Returns:
+        (каталог снимка или None, список каталогов дельт по порядку)
+    """
+    snapshot = None
+    deltas: List[Path] = []
+    for export_dir in list_export_dirs(export_root):
+        if read_manifest(export_dir).get('type') == 'delta':
+            if snapshot is not None:
+                deltas.append(export_dir)
+        else:
+            snapshot = export_dir
+            deltas = []
+    return snapshot, deltas
+
+
+def load_snapshot(export_dir: Path) -> ExportState:
+    """Загружает полный снимок"""
+    groups = _read_json(export_dir / 'groups.json').get('groups', [])
+    members = {m['user_id']: m for m in _read_json(export_dir / 'members.json').get('members', [])}
+    edges_file = find_edges_file(export_dir)
+    if strip_codec_suffix(edges_file).endswith('.json'):
+        edges = edges_from_records(_read_json(edges_file).get('group_members', []))
+    else:
+        edges = set(read_edges(str(edges_file)))
+    return ExportState(groups, members, edges, source=export_dir.name)
+
+
+def load_latest_state(export_root: str) -> Optional[ExportState]:
+    """
+    Текущее состояние: последний полный снимок + дельты после него
+
+    Returns:
+        ExportState или None, если экспортов еще нет
+    """
+    snapshot, deltas = find_export_chain(export_root)
+    if snapshot is None:
+        return None
+
+    state = load_snapshot(snapshot)
+    for delta_dir in deltas:
+        apply_delta(state, _read_json(delta_dir / CHANGES_FILE))
+        state.source = delta_dir.name
+    state.chain_length = len(deltas)
+    return state
+
+
+def should_write_full(previous: Optional[ExportState], full_every: int = DEFAULT_FULL_EVERY) -> bool:
+    """Нужен ли полный снимок (нет базы или цепочка дельт достигла full_every)"""
+    if previous is None:
+        return True
+    return full_every <= 1 or previous.chain_length + 1 >= full_every
+
+
+def carry_over_failed_groups(previous: ExportState, failed_group_ids: Iterable[int],
+                             groups: List[Dict[str, Any]], members: Dict[int, Dict[str, Any]],
+                             edges: Set[Edge]):
+    """
+    Переносит из предыдущего состояния группы, которые не удалось собрать
+
+    Без этого сбой одной группы (FLOOD_WAIT, нет доступа) выглядел бы в дельте
+    как выход всех ее участников. Изменяет groups, members и edges на месте.
+    """
+    failed = set(failed_group_ids)
+    if not failed:
+        return
+
+    collected = {g['group_id'] for g in groups}
+    for group in previous.groups:
+        if group['group_id'] in failed and group['group_id'] not in collected:
+            groups.append(group)
+
+    for group_id, user_id in previous.edges:
+        if group_id not in failed:
+            continue
+        edges.add((group_id, user_id))
+        if user_id not in members and user_id in previous.members:
+            members[user_id] = previous.members[user_id]
+
+
+def compute_delta(old: ExportState, new_groups: List[Dict[str, Any]],
+                  new_members: Dict[int, Dict[str, Any]], new_edges: Set[Edge]) -> Dict[str, Any]:
+    """
+    Изменения между старым состоянием и новым сбором
+
+    Returns:
+        Словарь в формате changes.json (без поля base)
+    """
+    joins = sorted(new_edges - old.edges)
+    leaves = sorted(old.edges - new_edges)
+
+    added_ids = sorted(new_members.keys() - old.members.keys())
+    removed_ids = sorted(old.members.keys() - new_members.keys())
+
+    profile_changes = []
+    for user_id in sorted(new_members.keys() & old.members.keys()):
+        before, after = old.members[user_id], new_members[user_id]
+        changes = {
+            field: [before.get(field), after.get(field)]
+            for field in PROFILE_FIELDS
+            if before.get(field) != after.get(field)
+        }
+        if changes:
+            profile_changes.append({'user_id': user_id, 'changes': changes})
+
+    return {
+        'groups': new_groups,
+        'joins': [list(edge) for edge in joins],
+        'leaves': [list(edge) for edge in leaves],
+        'members_added': [new_members[user_id] for user_id in added_ids],
+        'members_removed': removed_ids,
+        'profile_changes': profile_changes,
+    }
+
+
+def apply_delta(state: ExportState, delta: Dict[str, Any]) -> ExportState:
+    """Применяет changes.json к состоянию (на месте)"""
+    state.groups = delta.get('groups', state.groups)
+    for group_id, user_id in delta.get('joins', []):
+        state.edges.add((group_id, user_id))
+    for group_id, user_id in delta.get('leaves', []):
+        state.edges.discard((group_id, user_id))
+    for member in delta.get('members_added', []):
+        state.members[member['user_id']] = member
+    for user_id in delta.get('members_removed', []):
+        state.members.pop(user_id, None)
+    for change in delta.get('profile_changes', []):
+        member = state.members.get(change['user_id'])
+        if member is None:
+            continue
+        for field, (_, new_value) in change['changes'].items():
+            member[field] = new_value
+    return state
+
+
+def delta_summary(delta: Dict[str, Any]) -> Dict[str, int]:
+    """Количество изменений по видам"""
+    return {
+        key: len(delta.get(key, []))
+        for key in ('joins', 'leaves', 'members_added', 'members_removed', 'profile_changes')
+    }
+
+
+def is_empty_delta(delta: Dict[str, Any]) -> bool:
+    return not any(delta_summary(delta).values())
+
+
+def write_changes(export_dir: Path, delta: Dict[str, Any], base: Optional[str],
+                  codec: Optional[str] = None) -> str:
+    """
+    Записывает changes.json (компактно, без отступов)
+
+    Returns:
+        Путь к файлу (с расширением кодека, если задан codec)
+    """
+    path = with_codec_suffix(export_dir / CHANGES_FILE, codec)
+    with open_text(path, 'w') as f:
+        json.dump({'base': base, **delta}, f, ensure_ascii=False, separators=(',', ':'))
+    return path
+
+
+def edges_from_records(records: Iterable[Dict[str, Any]]) -> Set[Edge]:
+    """Связи из записей group_members.json"""
+    return {(r['group_id'], r['user_id']) for r in records}
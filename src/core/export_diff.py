@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Потоковый diff двух каталогов экспорта
+
+Файлы members.json и group_members.json читаются как потоки записей (без
+загрузки всего массива в память) и сравниваются линейным merge-join.
+Для этого экспортеры пишут записи отсортированными:
+- members.json: по user_id
+- group_members.json: по (group_id, user_id)
+по одной записи на строку (write_record_array). Колоночные файлы связей
+(group_members.s16m, .parquet) уже упорядочены по (group_id, user_id).
+
+Память не зависит от размера экспорта: в каждый момент в памяти одна запись
+с каждой стороны и буфер чтения.
+"""
+
+import json
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.core.columnar import PARQUET_SUFFIX, MembershipFile, find_edges_file, read_parquet_edges
+from src.core.export_delta import PROFILE_FIELDS
+from src.infra.codecs import find_existing, open_text, strip_codec_suffix
+
+logger = logging.getLogger(__name__)
+
+# Размер блока чтения файла (символов)
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+_WHITESPACE = ' \t\r\n'
+
+
+class UnsortedExportError(ValueError):
+    """Файл экспорта не отсортирован (старый экспорт) - merge-join невозможен"""
+
+
+def write_record_array(path: str, key: str, records: Iterable[Dict[str, Any]]) -> int:
+    """
+    Записывает {"key": [...]} по одной записи на строку
+
+    Результат - обычный JSON (читается json.load), но детерминированный и
+    удобный для построчных diff/grep. Расширение .gz / .zst включает сжатие.
+
+    Returns:
+        Количество записей
+    """
+    count = 0
+    with open_text(path, 'w') as f:
+        f.write('{"%s": [' % key)
+        for record in records:
+            f.write('\n' if count == 0 else ',\n')
+            f.write(json.dumps(record, ensure_ascii=False, sort_keys=True))
+            count += 1
+        f.write('\n]}\n')
+    return count
+
+
+def iter_json_array(path: str, key: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Any]:
+    """
+    Потоково читает элементы массива data[key] из файла {"key": [...]}
+
+    Файл читается блоками по chunk_size, элементы декодируются
+    json.JSONDecoder.raw_decode по мере поступления. Сжатые файлы
+    (.gz / .zst) распаковываются потоково.
+    """
+    decoder = json.JSONDecoder()
+    marker = f'"{key}"'
+
+    with open_text(path) as f:
+        buf = ''
+        pos = 0
+        eof = False
+
+        def refill() -> bool:
+            nonlocal buf, pos, eof
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            buf = buf[pos:] + chunk
+            pos = 0
+            return True
+
+        # Заголовок: ищем "key" и открывающую скобку массива
+        while True:
+            start = buf.find(marker)
+            bracket = buf.find('[', start + len(marker)) if start >= 0 else -1
+            if bracket >= 0:
+                pos = bracket + 1
+                break
+            if not refill():
+                raise ValueError(f"{path}: не найден массив {marker}")
+
+        while True:
+            # Пропускаем пробелы и запятые между элементами
+            while True:
+                while pos < len(buf) and (buf[pos] in _WHITESPACE or buf[pos] == ','):
+                    pos += 1
+                if pos < len(buf) or not refill():
+                    break
+            if pos >= len(buf):
+                raise ValueError(f"{path}: неожиданный конец файла в массиве {marker}")
+            if buf[pos] == ']':
+                return
+
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # Элемент не поместился в буфер - дочитываем
+                if refill():
+                    continue
+                raise
+            pos = end
+            yield item
+
+            if pos >= chunk_size:
+                buf = buf[pos:]
+                pos = 0
+
+
+def check_sorted(items: Iterable[Any], key: Callable[[Any], Any], name: str) -> Iterator[Any]:
+    """Пропускает элементы, проверяя строгое возрастание ключа"""
+    previous = None
+    for item in items:
+        current = key(item)
+        if previous is not None and current <= previous:
+            raise UnsortedExportError(
+                f"{name} не отсортирован ({previous!r} -> {current!r}); "
+                f"пересоздайте экспорт текущей версией export_3_jsons.py"
+            )
+        previous = current
+        yield item
+
+
+def merge_join(old: Iterable[Any], new: Iterable[Any],
+               key: Callable[[Any], Any]) -> Iterator[Tuple[Any, Optional[Any], Optional[Any]]]:
+    """
+    Линейный merge-join двух отсортированных потоков
+
+    Yields:
+        (ключ, элемент из old или None, элемент из new или None)
+    """
+    sentinel = object()
+    old_iter, new_iter = iter(old), iter(new)
+    a = next(old_iter, sentinel)
+    b = next(new_iter, sentinel)
+
+    while a is not sentinel or b is not sentinel:
+        if b is sentinel or (a is not sentinel and key(a) < key(b)):
+            yield key(a), a, None
+            a = next(old_iter, sentinel)
+        elif a is sentinel or key(b) < key(a):
+            yield key(b), None, b
+            b = next(new_iter, sentinel)
+        else:
+            yield key(a), a, b
+            a = next(old_iter, sentinel)
+            b = next(new_iter, sentinel)
+
+
+def _member_key(member: Dict[str, Any]) -> int:
+    return member['user_id']
+
+
+def _edge_key(edge: Dict[str, Any]) -> Tuple[int, int]:
+    return edge['group_id'], edge['user_id']
+
+
+def _sorted_stream(path: Path, key: str, sort_key: Callable, chunk_size: int) -> Iterator[Dict[str, Any]]:
+    return check_sorted(iter_json_array(str(path), key, chunk_size), sort_key, str(path))
+
+
+def diff_members(old_path: Path, new_path: Path,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """События member_added / member_removed / member_changed"""
+    for user_id, before, after in merge_join(
+            _sorted_stream(old_path, 'members', _member_key, chunk_size),
+            _sorted_stream(new_path, 'members', _member_key, chunk_size),
+            _member_key):
+        if before is None:
+            yield {'type': 'member_added', 'user_id': user_id, 'member': after}
+        elif after is None:
+            yield {'type': 'member_removed', 'user_id': user_id}
+        else:
+            changes = {
+                field: [before.get(field), after.get(field)]
+                for field in PROFILE_FIELDS
+                if before.get(field) != after.get(field)
+            }
+            if changes:
+                yield {'type': 'member_changed', 'user_id': user_id, 'changes': changes}
+
+
+def _edge_stream(path: Path, chunk_size: int) -> Iterator[Dict[str, Any]]:
+    """Связи из group_members.json, .s16m (mmap) или .parquet"""
+    if strip_codec_suffix(path).endswith('.json'):
+        yield from _sorted_stream(path, 'group_members', _edge_key, chunk_size)
+        return
+    if path.suffix == PARQUET_SUFFIX:
+        for group_id, user_id in read_parquet_edges(str(path)):
+            yield {'group_id': group_id, 'user_id': user_id}
+        return
+    with MembershipFile(str(path)) as memberships:
+        for group_id, user_id in memberships.iter_edges():
+            yield {'group_id': group_id, 'user_id': user_id}
+
+
+def diff_edges(old_path: Path, new_path: Path,
+               chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """События join / leave по связям группа-участник (файлы в любом формате экспорта)"""
+    for (group_id, user_id), before, after in merge_join(
+            _edge_stream(old_path, chunk_size),
+            _edge_stream(new_path, chunk_size),
+            _edge_key):
+        if before is None:
+            yield {'type': 'join', 'group_id': group_id, 'user_id': user_id}
+        elif after is None:
+            yield {'type': 'leave', 'group_id': group_id, 'user_id': user_id}
+
+
+def _members_file(export_dir: Path) -> Path:
+    """members.json каталога экспорта (или его сжатый вариант)"""
+    path = find_existing(export_dir / 'members.json')
+    if path is None:
+        raise FileNotFoundError(2, "members.json not found", str(export_dir / 'members.json'))
+    return path
+
+
+def diff_exports(old_dir: str, new_dir: str,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Все изменения между двумя полными снимками
+
+    Yields:
+        События member_added, member_removed, member_changed, join, leave
+    """
+    old_root, new_root = Path(old_dir), Path(new_dir)
+    yield from diff_members(_members_file(old_root), _members_file(new_root), chunk_size)
+    yield from diff_edges(find_edges_file(old_root), find_edges_file(new_root), chunk_size)
+
+
+def summarize(events: Iterable[Dict[str, Any]],
+              sink: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, int]:
+    """Считает события по типам (и передает каждое в sink, если задан)"""
+    counts: Dict[str, int] = {
+        'member_added': 0, 'member_removed': 0, 'member_changed': 0, 'join': 0, 'leave': 0
+    }
+    for event in events:
+        counts[event['type']] += 1
+        if sink is not None:
+            sink(event)
+    return counts
+
+
+def sorted_members(members: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Участники в порядке экспорта (по user_id)"""
+    return sorted(members, key=_member_key)
+
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Дедупликация и агрегация экспорта с выгрузкой на диск
+
+ExternalAggregator собирает участников (дедупликация по user_id) и связи
+группа-участник. Пока оценка занятой памяти меньше бюджета, все хранится в
+памяти. При превышении буферы сортируются и сбрасываются на диск
+("отсортированные прогоны"), а на выходе прогоны сливаются k-way merge
+(heapq.merge) с удалением дублей. Память ограничена бюджетом плюс по одной
+записи на прогон, объем экспорта - местом на диске.
+
+Форматы прогонов во временном каталоге:
+- members_NNNN.jsonl: участники по возрастанию user_id, по одному JSON на строку
+- edges_NNNN.bin: пары (group_id, user_id) int64 little-endian по возрастанию
+
+Бюджет: параметр memory_budget_mb или переменная окружения
+EXPORT_MEMORY_BUDGET_MB (по умолчанию DEFAULT_MEMORY_BUDGET_MB).
+"""
+
+import heapq
+import json
+import logging
+import os
+import shutil
+import struct
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_BUDGET_MB = 512
+
+# Оценка памяти на одну запись в буфере (dict участника / tuple связи в list)
+MEMBER_RECORD_BYTES = 600
+EDGE_RECORD_BYTES = 130
+
+# Максимум одновременно открытых прогонов: при превышении прогоны
+# предварительно сливаются в один (многопроходное слияние)
+MAX_MERGE_FAN_IN = 64
+
+_EDGE = struct.Struct("<qq")
+_EDGE_READ_BATCH = 4096
+
+Edge = Tuple[int, int]
+
+
+def get_memory_budget_mb(default: int = DEFAULT_MEMORY_BUDGET_MB) -> int:
+    """Бюджет памяти из EXPORT_MEMORY_BUDGET_MB"""
+    value = os.getenv("EXPORT_MEMORY_BUDGET_MB")
+    return int(value) if value else default
+
+
+def _dedup_sorted(items: Iterator[Any], key) -> Iterator[Any]:
+    """Пропускает повторы ключа в отсортированном потоке (остается первый)"""
+    previous = object()
+    for item in items:
+        current = key(item)
+        if current != previous:
+            previous = current
+            yield item
+
+
+class ExternalAggregator:
+    """Участники и связи экспорта с выгрузкой на диск при превышении бюджета"""
+
+    def __init__(self, memory_budget_mb: Optional[float] = None, tmp_dir: Optional[str] = None):
+        """
+        Args:
+            memory_budget_mb: Бюджет памяти буферов (None - EXPORT_MEMORY_BUDGET_MB)
+            tmp_dir: Где создавать временный каталог прогонов (None - системный)
+        """
+        budget = memory_budget_mb if memory_budget_mb is not None else get_memory_budget_mb()
+        self.memory_budget_bytes = int(budget * 1024 * 1024)
+        self._tmp_parent = tmp_dir
+        self._run_dir: Optional[Path] = None
+
+        self._members: Dict[int, Dict[str, Any]] = {}
+        self._edges: List[Edge] = []
+        self._member_runs: List[Path] = []
+        self._edge_runs: List[Path] = []
+
+        self.spills = 0
+        self.spilled_bytes = 0
+
+    # ------------------------------------------------------------------
+    # Накопление
+    # ------------------------------------------------------------------
+
+    def add_member(self, record: Dict[str, Any]):
+        """Добавляет участника (при повторе остается первая запись)"""
+        self._members.setdefault(record['user_id'], record)
+        self._maybe_spill()
+
+    def add_edge(self, group_id: int, user_id: int):
+        """Добавляет связь группа-участник"""
+        self._edges.append((group_id, user_id))
+        self._maybe_spill()
+
+    def buffered_bytes(self) -> int:
+        """Оценка памяти, занятой буферами"""
+        return len(self._members) * MEMBER_RECORD_BYTES + len(self._edges) * EDGE_RECORD_BYTES
+
+    @property
+    def spilled(self) -> bool:
+        """Были ли выгрузки на диск"""
+        return self.spills > 0
+
+    def _maybe_spill(self):
+        if self.buffered_bytes() > self.memory_budget_bytes:
+            self.spill()
+
+    def _ensure_run_dir(self) -> Path:
+        if self._run_dir is None:
+            if self._tmp_parent:
+                Path(self._tmp_parent).mkdir(parents=True, exist_ok=True)
+            self._run_dir = Path(tempfile.mkdtemp(prefix="s16_dedup_", dir=self._tmp_parent))
+        return self._run_dir
+
+    def spill(self):
+        """Сбрасывает буферы на диск отсортированными прогонами"""
+        if not self._members and not self._edges:
+            return
+        run_dir = self._ensure_run_dir()
+        index = self.spills
+
+        if self._members:
+            path = run_dir / f"members_{index:04d}.jsonl"
+            with open(path, "w", encoding="utf-8") as f:
+                for user_id in sorted(self._members):
+                    f.write(json.dumps(self._members[user_id], ensure_ascii=False, sort_keys=True))
+                    f.write("\n")
+            self._member_runs.append(path)
+            self.spilled_bytes += path.stat().st_size
+
+        if self._edges:
+            path = run_dir / f"edges_{index:04d}.bin"
+            self._edges.sort()
+            with open(path, "wb") as f:
+                previous = None
+                for edge in self._edges:
+                    if edge != previous:
+                        f.write(_EDGE.pack(*edge))
+                        previous = edge
+            self._edge_runs.append(path)
+            self.spilled_bytes += path.stat().st_size
+
+        logger.info(f"[SAFE] Export buffers spilled to disk: run {index}, "
+                    f"{len(self._members)} members, {len(self._edges)} edges")
+        self._members = {}
+        self._edges = []
+        self.spills += 1
+
+        if len(self._member_runs) >= MAX_MERGE_FAN_IN:
+            self._member_runs = [self._compact_member_runs()]
+        if len(self._edge_runs) >= MAX_MERGE_FAN_IN:
+            self._edge_runs = [self._compact_edge_runs()]
+
+    def _compact_member_runs(self) -> Path:
+        """Сливает все прогоны участников в один"""
+        path = self._run_dir / f"members_{self.spills:04d}_merged.jsonl"
+        merged = heapq.merge(*(self._read_member_run(p) for p in self._member_runs),
+                             key=lambda m: m['user_id'])
+        with open(path, "w", encoding="utf-8") as f:
+            for record in _dedup_sorted(merged, key=lambda m: m['user_id']):
+                f.write(json.dumps(record, ensure_ascii=False, sort_keys=True))
+                f.write("\n")
+        for run in self._member_runs:
+            run.unlink()
+        return path
+
+    def _compact_edge_runs(self) -> Path:
+        """Сливает все прогоны связей в один"""
+        path = self._run_dir / f"edges_{self.spills:04d}_merged.bin"
+        merged = heapq.merge(*(self._read_edge_run(p) for p in self._edge_runs))
+        with open(path, "wb") as f:
+            for edge in _dedup_sorted(merged, key=lambda e: e):
+                f.write(_EDGE.pack(*edge))
+        for run in self._edge_runs:
+            run.unlink()
+        return path
+
+    # ------------------------------------------------------------------
+    # Чтение результата
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _read_member_run(path: Path) -> Iterator[Dict[str, Any]]:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    @staticmethod
+    def _read_edge_run(path: Path) -> Iterator[Edge]:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(_EDGE.size * _EDGE_READ_BATCH)
+                if not chunk:
+                    return
+                yield from _EDGE.iter_unpack(chunk)
+
+    def iter_members(self) -> Iterator[Dict[str, Any]]:
+        """Уникальные участники по возрастанию user_id"""
+        if not self._member_runs:
+            for user_id in sorted(self._members):
+                yield self._members[user_id]
+            return
+
+        self.spill()
+        # heapq.merge при равных ключах сохраняет порядок прогонов - остается первая запись
+        merged = heapq.merge(*(self._read_member_run(p) for p in self._member_runs),
+                             key=lambda m: m['user_id'])
+        yield from _dedup_sorted(merged, key=lambda m: m['user_id'])
+
+    def iter_edges(self) -> Iterator[Edge]:
+        """Уникальные связи по возрастанию (group_id, user_id)"""
+        if not self._edge_runs:
+            yield from _dedup_sorted(iter(sorted(self._edges)), key=lambda e: e)
+            return
+
+        self.spill()
+        merged = heapq.merge(*(self._read_edge_run(p) for p in self._edge_runs))
+        yield from _dedup_sorted(merged, key=lambda e: e)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика выгрузок на диск"""
+        return {
+            'memory_budget_mb': self.memory_budget_bytes / 1024 / 1024,
+            'spills': self.spills,
+            'member_runs': len(self._member_runs),
+            'edge_runs': len(self._edge_runs),
+            'spilled_mb': round(self.spilled_bytes / 1024 / 1024, 2),
+        }
+
+    def close(self):
+        """Удаляет временные прогоны"""
+        if self._run_dir is not None:
+            shutil.rmtree(self._run_dir, ignore_errors=True)
+            self._run_dir = None
+        self._member_runs = []
+        self._edge_runs = []
+
+    def __enter__(self) -> "ExternalAggregator":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
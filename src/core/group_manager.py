@@ -1,19 +1,191 @@
 import asyncio
+import math
 import os
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import List, Optional, Dict, Any, Union
-from telethon import TelegramClient
-from telethon.tl.types import User, Channel, Chat
-from telethon.errors import ChatAdminRequiredError, FloodWaitError
-from telethon.tl.functions.channels import GetParticipantsRequest
-from telethon.tl.types import ChannelParticipantsSearch
+from typing import AsyncIterator, Callable, List, Optional, Dict, Any, Union
+from telethon import TelegramClient, utils
+from telethon.tl.types import User, Channel, Chat, MessageService
+from telethon.errors import ChatAdminRequiredError, FloodWaitError, ParticipantIdInvalidError, UserNotParticipantError
+from telethon.tl.functions.channels import GetParticipantRequest, GetParticipantsRequest
+from telethon.tl.types import (
+    ChannelParticipantBanned, ChannelParticipantLeft, ChannelParticipantsAdmins, ChannelParticipantsBanned, ChannelParticipantsBots,
+    ChannelParticipantsContacts, ChannelParticipantsKicked, ChannelParticipantsRecent,
+    ChannelParticipantsSearch
+)
 import logging
-from src.infra.limiter import safe_call, smart_pause
+from src.infra.limiter import RateLimiter, safe_call, smart_pause, get_single_flight, normalize_call_key
+from src.infra.metrics import get_metrics
+from src.infra.tracing import span
+from src.infra.codecs import open_text
+from src.infra.takeout import TAKEOUT_ERRORS, get_takeout_limiter, open_takeout
+from src.infra.writer import get_writer
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Участников за один GetParticipantsRequest в iter_participants Telethon
+PARTICIPANTS_PAGE_SIZE = 200
+
+# Сообщений за один GetHistoryRequest (максимум Telegram)
+MESSAGES_PAGE_SIZE = 100
+
+# Больше стольких участников Telegram не отдает ни обычным обходом, ни одним
+# поисковым запросом - дальше только перебор поисковых префиксов
+PARTICIPANTS_LISTING_CAP = 10000
+
+# Алфавиты поисковых префиксов harvest_participants
+HARVEST_ALPHABETS = (
+    'abcdefghijklmnopqrstuvwxyz',
+    'абвгдеёжзийклмнопрстуфхцчшщъыьэюя',
+    '0123456789',
+)
+HARVEST_MAX_DEPTH = 3
+HARVEST_CONCURRENCY = 3
+
+
+def _next_prefix_chars(prefix: str) -> str:
+    """
+    Символы для уточнения насыщенного префикса
+
+    Префикс продолжается буквами своего алфавита и цифрами: "ab" -> "abc",
+    "ab1", но не "abж" - смешанные префиксы почти ничего не находят.
+    """
+    digits = HARVEST_ALPHABETS[-1]
+    if not prefix:
+        return ''.join(HARVEST_ALPHABETS)
+    for alphabet in HARVEST_ALPHABETS[:-1]:
+        if prefix[-1] in alphabet:
+            return alphabet + digits
+    return digits
+
+# Серверные фильтры участников: имя -> (тип ChannelParticipants*, принимает ли q)
+PARTICIPANT_FILTERS = {
+    'recent': (ChannelParticipantsRecent, False),
+    'admins': (ChannelParticipantsAdmins, False),
+    'bots': (ChannelParticipantsBots, False),
+    'kicked': (ChannelParticipantsKicked, True),
+    'banned': (ChannelParticipantsBanned, True),
+    'search': (ChannelParticipantsSearch, True),
+    'contacts': (ChannelParticipantsContacts, True),
+}
+
+# Фильтр для роли участника (find_participants)
+ROLE_FILTERS = {
+    'admin': 'admins',
+    'bot': 'bots',
+    'kicked': 'kicked',
+    'banned': 'banned',
+}
+
+
+def build_participants_filter(name: str, query: str = ''):
+    """
+    Объект серверного фильтра ChannelParticipants* по имени
+
+    Raises:
+        ValueError: неизвестный фильтр или query для фильтра без q
+    """
+    if name not in PARTICIPANT_FILTERS:
+        raise ValueError(f"Unknown participants filter '{name}', expected one of {sorted(PARTICIPANT_FILTERS)}")
+    filter_type, accepts_query = PARTICIPANT_FILTERS[name]
+    if accepts_query:
+        return filter_type(q=query)
+    if query:
+        raise ValueError(f"Participants filter '{name}' does not support a search query")
+    return filter_type()
+
+
+def plan_participants_filter(role: Optional[str] = None, query: str = '',
+                             contacts_only: bool = False) -> Dict[str, Any]:
+    """
+    Выбирает самый узкий серверный фильтр для запроса участников
+
+    Telegram отдает страницы только того, что прошло серверный фильтр, поэтому
+    фильтр выбирается по убыванию избирательности: роль (админы, боты,
+    исключенные, ограниченные - обычно единицы), затем контакты, затем поиск
+    по имени, и только без условий - полный список. Условия, которые выбранный
+    фильтр не проверяет на сервере, проверяются после выгрузки.
+
+    Args:
+        role: admin, bot, kicked, banned или None
+        query: подстрока имени / username
+        contacts_only: только контакты аккаунта
+
+    Returns:
+        {'filter': имя фильтра, 'query': q для сервера,
+         'client_query': подстрока для проверки после выгрузки,
+         'client_contacts': проверять ли контакт после выгрузки}
+    """
+    if role is not None and role not in ROLE_FILTERS:
+        raise ValueError(f"Unknown participant role '{role}', expected one of {sorted(ROLE_FILTERS)}")
+
+    if role is not None:
+        name = ROLE_FILTERS[role]
+    elif contacts_only:
+        name = 'contacts'
+    elif query:
+        name = 'search'
+    else:
+        name = 'recent'
+
+    server_query = query if PARTICIPANT_FILTERS[name][1] else ''
+    return {
+        'filter': name,
+        'query': server_query,
+        'client_query': query if query and not server_query else '',
+        'client_contacts': contacts_only and name != 'contacts',
+    }
+
+
+def _matches_query(user: User, query: str) -> bool:
+    """Совпадение подстроки с именем или username (как поиск Telethon на клиенте)"""
+    query = query.casefold()
+    name = f"{user.first_name or ''} {user.last_name or ''}".casefold()
+    return query in name or query in (user.username or '').casefold()
+
+
+# Сколько проверок участия (GetParticipantRequest) выполнять одновременно
+MEMBERSHIP_PROBE_CONCURRENCY = 4
+
+
+def membership_check_cost(candidates: int, participants_count: Optional[int],
+                          can_probe: bool = True) -> Dict[str, Any]:
+    """
+    Модель стоимости check_membership: поштучные проверки или полный ростер
+
+    Проверка одного пользователя - один GetParticipantRequest; ростер -
+    ceil(participants_count / 200) страниц, но не дальше PARTICIPANTS_LISTING_CAP:
+    ростер большой группы неполон, и отсутствие в нем ничего не доказывает.
+
+    Args:
+        candidates: Сколько пользователей проверить
+        participants_count: Размер группы (None - неизвестен)
+        can_probe: Доступен ли GetParticipantRequest (только супергруппы и каналы)
+
+    Returns:
+        {'strategy': 'probe' | 'roster', 'probe_rpcs', 'roster_rpcs', 'reason'}
+    """
+    probe_rpcs = candidates
+    listed = min(participants_count, PARTICIPANTS_LISTING_CAP) if participants_count else None
+    roster_rpcs = max(1, math.ceil(listed / PARTICIPANTS_PAGE_SIZE)) if listed else None
+
+    if not can_probe:
+        strategy, reason = 'roster', 'basic group: GetParticipantRequest is not available'
+    elif roster_rpcs is None:
+        strategy, reason = 'probe', 'participants_count is unknown'
+    elif participants_count > PARTICIPANTS_LISTING_CAP:
+        strategy, reason = 'probe', f'roster is capped at {PARTICIPANTS_LISTING_CAP} participants'
+    elif probe_rpcs <= roster_rpcs:
+        strategy, reason = 'probe', f'{probe_rpcs} probes <= {roster_rpcs} roster pages'
+    else:
+        strategy, reason = 'roster', f'{roster_rpcs} roster pages < {probe_rpcs} probes'
+
+    return {'strategy': strategy, 'probe_rpcs': probe_rpcs, 'roster_rpcs': roster_rpcs, 'reason': reason}
+
+
 # Проверяем тестовое окружение
 def _is_testing_environment():
     """Определяет тестовое окружение"""
@@ -25,22 +197,69 @@ def _is_testing_environment():
         any('test' in arg.lower() for arg in sys.argv)
     )
 
-async def _safe_api_call(func, *args, **kwargs):
-    """Helper для условного использования safe_call в зависимости от окружения"""
+async def _safe_api_call(func, *args, coalesce_key=None, limiter=None, **kwargs):
+    """
+    Helper для условного использования safe_call в зависимости от окружения
+    
+    coalesce_key: ключ single-flight - одинаковые одновременные вызовы
+    (например, несколько сверок, резолвящих одну и ту же группу) разделяют
+    один запрос и один токен
+    limiter: RateLimiter вызова (None - глобальный)
+    """
     if _is_testing_environment():
         # В тестах используем прямые вызовы для совместимости с моками
         logger.debug(f"[TEST] Calling {func.__name__ if hasattr(func, '__name__') else 'function'} directly")
+        if coalesce_key is not None:
+            return await get_single_flight().run(coalesce_key, lambda: func(*args, **kwargs))
         return await func(*args, **kwargs)
     else:
         # В продакшене используем safe_call для анти-спам защиты
         logger.debug(f"[PROD] Calling {func.__name__ if hasattr(func, '__name__') else 'function'} via safe_call")
-        return await safe_call(func, operation_type="api", *args, **kwargs)
+        return await safe_call(func, operation_type="api", coalesce_key=coalesce_key, limiter=limiter, *args, **kwargs)
+
+def user_to_participant(user: User) -> Dict[str, Any]:
+    """Преобразует пользователя Telethon в словарь участника (формат экспорта)"""
+    return {
+        'id': user.id,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'phone': user.phone,
+        'is_bot': user.bot,
+        'is_verified': user.verified,
+        'is_premium': getattr(user, 'premium', False),
+        'status': str(user.status) if user.status else None
+    }
+
+def message_to_record(message, group_id: int) -> Dict[str, Any]:
+    """Преобразует сообщение Telethon в запись экспорта истории (без текста - только длина)"""
+    reply = message.reply_to
+    forward = message.fwd_from
+    forward_peer = getattr(forward, 'from_id', None) if forward else None
+    return {
+        'group_id': group_id,
+        'id': message.id,
+        'date': message.date.isoformat() if message.date else None,
+        'sender_id': message.sender_id,
+        'reply_to': getattr(reply, 'reply_to_msg_id', None),
+        'reply_top': getattr(reply, 'reply_to_top_id', None),
+        'fwd_from': utils.get_peer_id(forward_peer) if forward_peer else None,
+        'fwd_date': forward.date.isoformat() if forward and forward.date else None,
+        'text_len': len(getattr(message, 'message', None) or ''),
+        'service': isinstance(message, MessageService),
+    }
 
 class GroupManager:
     """Менеджер для работы с группами Telegram"""
     
-    def __init__(self, client: TelegramClient):
+    def __init__(self, client: TelegramClient, limiter: Optional[RateLimiter] = None):
+        """
+        Args:
+            client: TelegramClient или клиент takeout сессии
+            limiter: RateLimiter для вызовов (None - глобальный get_rate_limiter())
+        """
         self.client = client
+        self.limiter = limiter
     
     async def get_group_info(self, group_identifier: str) -> Optional[Dict[str, Any]]:
         """
@@ -56,15 +275,22 @@ class GroupManager:
             # Проверяем тип идентификатора
             if isinstance(group_identifier, int):
                 # Это числовой ID группы
-                entity = await _safe_api_call(self.client.get_entity, group_identifier)
+                entity_id = group_identifier
             elif isinstance(group_identifier, str) and (group_identifier.startswith('-') and group_identifier[1:].isdigit()):
                 # Это строковый ID группы
-                entity = await _safe_api_call(self.client.get_entity, int(group_identifier))
+                entity_id = int(group_identifier)
             else:
                 # Это username, добавляем @ если нужно
                 if not group_identifier.startswith('@'):
                     group_identifier = '@' + group_identifier
-                entity = await _safe_api_call(self.client.get_entity, group_identifier)
+                entity_id = group_identifier
+            
+            with span('resolve_entity', cat='entity'):
+                entity = await _safe_api_call(
+                    self.client.get_entity, entity_id,
+                    coalesce_key=normalize_call_key(self.client.get_entity, (entity_id,)),
+                    limiter=self.limiter
+                )
             
             if isinstance(entity, (Channel, Chat)):
                 # Получаем количество участников с дополнительной проверкой
@@ -84,7 +310,11 @@ class GroupManager:
                                 full_info = await self.client(GetFullChatRequest(entity.id))
                                 return getattr(full_info.full_chat, 'participants_count', None)
                         
-                        full_participants_count = await _safe_api_call(get_full_info)
+                        with span('get_full_info', cat='entity'):
+                            full_participants_count = await _safe_api_call(
+                                get_full_info, coalesce_key=('get_full_info', id(self.client), entity.id),
+                                limiter=self.limiter
+                            )
                         if full_participants_count is not None:
                             participants_count = full_participants_count
                     except Exception as e:
@@ -98,21 +328,33 @@ class GroupManager:
                     'type': 'channel' if isinstance(entity, Channel) else 'group'
                 }
             
+        except TAKEOUT_ERRORS:
+            # Takeout стал недействительным - решает вызывающий код (FallbackGroupManager)
+            raise
         except Exception as e:
             logger.error(f"Ошибка при получении информации о группе {group_identifier}: {e}")
             return None
     
-    async def get_participants(self, group_identifier: str, limit: int = 100) -> List[Dict[str, Any]]:
+    async def get_participants(self, group_identifier: str, limit: int = 100,
+                               filter: Optional[str] = None, query: str = '',
+                               predicate: Optional[Callable[[User], bool]] = None) -> List[Dict[str, Any]]:
         """
         Получает список участников группы
         
         Args:
             group_identifier: username группы (без @) или ID группы
             limit: максимальное количество участников для получения
+            filter: серверный фильтр из PARTICIPANT_FILTERS (None - полный список);
+                действует для супергрупп и каналов, обычная группа всегда
+                отдается целиком
+            query: q фильтров kicked, banned, search и contacts
+            predicate: проверка пользователя после выгрузки (условия, которых
+                нет в серверном фильтре)
             
         Returns:
-            Список словарей с информацией об участниках
+            Список словарей с информацией об участниках (боты - только с filter='bots')
         """
+        server_filter = build_participants_filter(filter, query) if filter else None
         participants = []
         
         try:
@@ -138,32 +380,44 @@ class GroupManager:
             # Создаем wrapper функцию для безопасного получения участников
             async def get_participants_safe():
                 users = []
-                async for user in self.client.iter_participants(group_id, limit=limit):
+                if server_filter is None:
+                    iterator = self.client.iter_participants(group_id, limit=limit)
+                else:
+                    iterator = self.client.iter_participants(group_id, limit=limit, filter=server_filter)
+                # Задержка каждой страницы - история для планировщика (planner): следующая
+                # страница запрашивается, когда закончились участники предыдущей
+                page_started = time.perf_counter()
+                async for user in iterator:
                     users.append(user)
+                    if len(users) % PARTICIPANTS_PAGE_SIZE == 0:
+                        now = time.perf_counter()
+                        get_metrics().observe("participants_page_seconds", now - page_started)
+                        page_started = now
+                if not users or len(users) % PARTICIPANTS_PAGE_SIZE:
+                    get_metrics().observe("participants_page_seconds", time.perf_counter() - page_started)
                 return users
             
-            # Вызываем через safe_call для анти-спам защиты
-            users = await _safe_api_call(get_participants_safe)
+            # Вызываем через safe_call для анти-спам защиты; одинаковые одновременные
+            # выгрузки (одна группа, один limit, один фильтр) объединяются в один проход
+            with span('iter_participants', cat='participants', limit=limit, filter=filter or '') as walk:
+                users = await _safe_api_call(
+                    get_participants_safe,
+                    coalesce_key=('iter_participants', id(self.client), group_id, limit, filter, query),
+                    limiter=self.limiter
+                )
+                walk.set(users=len(users))
             
-            for user in users:
-                if isinstance(user, User) and not user.bot:  # Исключаем ботов
-                    participant_info = {
-                        'id': user.id,
-                        'username': user.username,
-                        'first_name': user.first_name,
-                        'last_name': user.last_name,
-                        'phone': user.phone,
-                        'is_bot': user.bot,
-                        'is_verified': user.verified,
-                        'is_premium': getattr(user, 'premium', False),
-                        'status': str(user.status) if user.status else None
-                    }
-                    participants.append(participant_info)
-                    count += 1
-                    
-                    # Smart pause каждые 1000 участников для предотвращения FLOOD_WAIT
-                    if count % 1000 == 0:
-                        await smart_pause("participants", count)
+            with span('normalize_participants', cat='normalize'):
+                for user in users:
+                    # Исключаем ботов, если их не запросили фильтром
+                    if isinstance(user, User) and (not user.bot or filter == 'bots') \
+                            and (predicate is None or predicate(user)):
+                        participants.append(user_to_participant(user))
+                        count += 1
+                        
+                        # Smart pause каждые 1000 участников для предотвращения FLOOD_WAIT
+                        if count % 1000 == 0:
+                            await smart_pause("participants", count, limiter=self.limiter)
             
             logger.info(f"Получено {len(participants)} участников из группы {group_info['title']}")
             return participants
@@ -174,10 +428,143 @@ class GroupManager:
         except FloodWaitError as e:
             logger.error(f"Превышен лимит запросов. Ожидание {e.seconds} секунд")
             return []
+        except TAKEOUT_ERRORS:
+            # Takeout стал недействительным - решает вызывающий код (FallbackGroupManager)
+            raise
         except Exception as e:
             logger.error(f"Ошибка при получении участников группы {group_identifier}: {e}")
             return []
     
+    async def find_participants(self, group_identifier: Union[str, int], role: Optional[str] = None,
+                                query: str = '', contacts_only: bool = False,
+                                limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Участники по условиям через самый узкий серверный фильтр
+
+        Args:
+            group_identifier: username группы (без @) или ID группы
+            role: admin, bot, kicked, banned или None
+            query: подстрока имени / username
+            contacts_only: только контакты аккаунта
+            limit: максимум участников от сервера (None - все прошедшие фильтр)
+
+        Returns:
+            {'plan': plan_participants_filter(...), 'participants': [...]}
+        """
+        plan = plan_participants_filter(role, query, contacts_only)
+        logger.info(f"Фильтр участников группы {group_identifier}: {plan['filter']}"
+                    + (f" (q='{plan['query']}')" if plan['query'] else ""))
+
+        def matches(user: User) -> bool:
+            if plan['client_query'] and not _matches_query(user, plan['client_query']):
+                return False
+            return not plan['client_contacts'] or bool(getattr(user, 'contact', False))
+
+        participants = await self.get_participants(group_identifier, limit, filter=plan['filter'],
+                                                   query=plan['query'], predicate=matches)
+        return {'plan': plan, 'participants': participants}
+    
+    async def check_membership(self, group_identifier: Union[str, int], user_ids: List[int],
+                               strategy: str = 'auto',
+                               concurrency: int = MEMBERSHIP_PROBE_CONCURRENCY) -> Dict[str, Any]:
+        """
+        Состоят ли пользователи в группе - без полного ростера, если так дешевле
+
+        Способ выбирает membership_check_cost: для нескольких кандидатов в
+        большой группе - GetParticipantRequest на каждого (не больше
+        concurrency одновременно, через safe_call и RateLimiter), иначе -
+        один проход get_participants.
+
+        Args:
+            group_identifier: username группы (без @) или ID группы
+            user_ids: ID проверяемых пользователей
+            strategy: auto, probe или roster
+            concurrency: Сколько проверок выполнять одновременно
+
+        Returns:
+            {'members', 'non_members', 'unknown' - списки ID (unknown - Telegram
+            не знает пользователя этой сессии или проверка не удалась), 'cost' -
+            решение модели стоимости}
+            или None, если группа не найдена
+        """
+        if strategy not in ('auto', 'probe', 'roster'):
+            raise ValueError(f"Unknown membership check strategy '{strategy}'")
+        user_ids = list(dict.fromkeys(int(u) for u in user_ids))
+
+        group_info = await self.get_group_info(group_identifier)
+        if not group_info:
+            logger.error(f"Не удалось найти группу: {group_identifier}")
+            return None
+
+        cost = membership_check_cost(len(user_ids), group_info.get('participants_count'),
+                                     can_probe=group_info.get('type') == 'channel')
+        if strategy != 'auto':
+            cost = dict(cost, strategy=strategy, reason='requested')
+        logger.info(f"Проверка {len(user_ids)} пользователей в группе {group_info['title']}: "
+                    f"{cost['strategy']} ({cost['reason']})")
+
+        if cost['strategy'] == 'roster':
+            participants = await self.get_participants(group_identifier, limit=None)
+            if not participants and group_info.get('participants_count') != 0:
+                # get_participants возвращает [] и при ошибке выгрузки - ответа нет ни для кого
+                logger.warning(f"Не удалось получить участников группы {group_info['title']}: "
+                               f"членство {len(user_ids)} пользователей неизвестно")
+                return {'members': [], 'non_members': [], 'unknown': user_ids, 'cost': cost}
+            member_ids = {p['id'] for p in participants}
+            members = [u for u in user_ids if u in member_ids]
+            return {
+                'members': members,
+                'non_members': [u for u in user_ids if u not in member_ids],
+                'unknown': [],
+                'cost': cost,
+            }
+
+        if isinstance(group_identifier, int):
+            group_id = group_identifier
+        elif isinstance(group_identifier, str) and (group_identifier.startswith('-') and group_identifier[1:].isdigit()):
+            group_id = int(group_identifier)
+        else:
+            group_id = group_identifier if group_identifier.startswith('@') else '@' + group_identifier
+
+        # Сущность группы уже в кэше Telethon после get_group_info
+        channel = await self.client.get_input_entity(group_id)
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        status: Dict[int, str] = {}
+
+        async def probe(user_id: int):
+            async def get_participant():
+                return await self.client(GetParticipantRequest(channel=channel, participant=user_id))
+
+            async with semaphore:
+                try:
+                    with span('probe_membership', cat='participants', user=user_id):
+                        result = await _safe_api_call(get_participant, limiter=self.limiter)
+                except UserNotParticipantError:
+                    status[user_id] = 'non_member'
+                    return
+                except (ValueError, ParticipantIdInvalidError) as e:
+                    # Пользователь не встречался этой сессии - нет access_hash
+                    logger.debug(f"Не удалось проверить пользователя {user_id}: {e}")
+                    status[user_id] = 'unknown'
+                    return
+                except Exception as e:
+                    logger.warning(f"Ошибка проверки пользователя {user_id} в группе {group_info['title']}: {e}")
+                    status[user_id] = 'unknown'
+                    return
+            participant = result.participant
+            left = isinstance(participant, ChannelParticipantLeft) or (
+                isinstance(participant, ChannelParticipantBanned) and participant.left
+            )
+            status[user_id] = 'non_member' if left else 'member'
+
+        await asyncio.gather(*(probe(u) for u in user_ids))
+        return {
+            'members': [u for u in user_ids if status[u] == 'member'],
+            'non_members': [u for u in user_ids if status[u] == 'non_member'],
+            'unknown': [u for u in user_ids if status[u] == 'unknown'],
+            'cost': cost,
+        }
+    
     async def search_participants(self, group_identifier: str, query: str, limit: int = 50) -> List[Dict[str, Any]]:
         """
         Ищет участников в группе по запросу
@@ -215,37 +602,150 @@ class GroupManager:
                 return users
             
             # Вызываем через safe_call для анти-спам защиты
-            users = await _safe_api_call(search_participants_safe)
+            users = await _safe_api_call(search_participants_safe, limiter=self.limiter)
             
             for user in users:
                 if isinstance(user, User) and not user.bot:
-                    participant_info = {
-                        'id': user.id,
-                        'username': user.username,
-                        'first_name': user.first_name,
-                        'last_name': user.last_name,
-                        'phone': user.phone,
-                        'is_bot': user.bot,
-                        'is_verified': user.verified,
-                        'is_premium': getattr(user, 'premium', False),
-                        'status': str(user.status) if user.status else None
-                    }
-                    participants.append(participant_info)
+                    participants.append(user_to_participant(user))
             
             logger.info(f"Найдено {len(participants)} участников по запросу '{query}'")
             return participants
             
+        except TAKEOUT_ERRORS:
+            # Takeout стал недействительным - решает вызывающий код (FallbackGroupManager)
+            raise
         except Exception as e:
             logger.error(f"Ошибка при поиске участников: {e}")
             return []
     
+    async def harvest_participants(self, group_identifier: Union[str, int],
+                                   concurrency: int = HARVEST_CONCURRENCY,
+                                   saturation: int = PARTICIPANTS_LISTING_CAP,
+                                   max_depth: int = HARVEST_MAX_DEPTH) -> Dict[str, Any]:
+        """
+        Собирает участников большой группы полностью, насколько позволяет Telegram
+
+        Обычный обход iter_participants обрывается примерно на 10 тысячах. Если
+        он вернул меньше, чем participants_count, запускается перебор поисковых
+        префиксов (латиница, кириллица, цифры): префикс, выдача которого
+        упирается в saturation, уточняется следующим символом до max_depth.
+        Запросы идут параллельно (не больше concurrency) через safe_call, то есть
+        под общим RateLimiter; результаты объединяются по id.
+
+        Args:
+            group_identifier: username группы (без @) или ID группы
+            concurrency: сколько поисковых запросов выполнять одновременно
+            saturation: при стольких результатах выдача считается обрезанной
+            max_depth: максимальная длина префикса
+
+        Returns:
+            {'participants': [...], 'coverage': {...}} - участники без ботов
+            (как в get_participants) и отчет о полноте; coverage None, если
+            группа не найдена
+        """
+        group_info = await self.get_group_info(group_identifier)
+        if not group_info:
+            logger.error(f"Не удалось найти группу: {group_identifier}")
+            return {'participants': [], 'coverage': None}
+
+        if isinstance(group_identifier, int):
+            group_id = group_identifier
+        elif isinstance(group_identifier, str) and (group_identifier.startswith('-') and group_identifier[1:].isdigit()):
+            group_id = int(group_identifier)
+        else:
+            group_id = group_identifier if group_identifier.startswith('@') else '@' + group_identifier
+
+        expected = group_info.get('participants_count') or 0
+        users_by_id: Dict[int, User] = {}
+        queries = []
+        saturated = []
+        failed = []
+
+        async def walk(query: Optional[str]) -> int:
+            async def collect():
+                users = []
+                if query is None:
+                    iterator = self.client.iter_participants(group_id, limit=None)
+                else:
+                    iterator = self.client.iter_participants(group_id, search=query, limit=None)
+                async for user in iterator:
+                    users.append(user)
+                return users
+
+            with span('harvest_query', cat='participants', query=query or '') as query_span:
+                users = await _safe_api_call(
+                    collect, coalesce_key=('iter_participants', id(self.client), group_id, None, query),
+                    limiter=self.limiter
+                )
+                query_span.set(users=len(users))
+            queries.append(query or '')
+            for user in users:
+                if isinstance(user, User):
+                    users_by_id.setdefault(user.id, user)
+            return len(users)
+
+        def is_complete() -> bool:
+            return bool(expected) and len(users_by_id) >= expected
+
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        takeout_errors = []
+
+        async def sweep(prefix: str):
+            if is_complete() or takeout_errors:
+                return
+            async with semaphore:
+                try:
+                    found = await walk(prefix)
+                except TAKEOUT_ERRORS as e:
+                    takeout_errors.append(e)
+                    return
+                except Exception as e:
+                    logger.warning(f"Поиск по префиксу '{prefix}' в группе {group_info['title']} не удался: {e}")
+                    failed.append(prefix)
+                    return
+            # Уточнение - вне семафора, иначе вложенные запросы ждали бы родителя
+            if found >= saturation and len(prefix) < max_depth:
+                saturated.append(prefix)
+                await asyncio.gather(*(sweep(prefix + char) for char in _next_prefix_chars(prefix)))
+
+        logger.info(f"Сбор участников группы {group_info['title']} (в группе: {expected or 'неизвестно'})")
+        try:
+            plain_walk = await walk(None)
+        except ChatAdminRequiredError:
+            logger.error(f"Нет прав администратора для получения участников группы: {group_identifier}")
+            return {'participants': [], 'coverage': None}
+
+        if not is_complete() and (expected or plain_walk >= saturation):
+            await asyncio.gather(*(sweep(char) for char in _next_prefix_chars('')))
+            if takeout_errors:
+                raise takeout_errors[0]
+
+        participants = [
+            user_to_participant(user) for _, user in sorted(users_by_id.items()) if not user.bot
+        ]
+        coverage = {
+            'participants_count': expected or None,
+            'found': len(users_by_id),
+            'plain_walk': plain_walk,
+            'coverage': round(len(users_by_id) / expected, 4) if expected else None,
+            'queries': len(queries),
+            'saturated_prefixes': sorted(saturated),
+            'failed_queries': sorted(failed),
+            'complete': is_complete(),
+        }
+        logger.info(
+            f"Собрано {len(users_by_id)} из {expected or '?'} участников группы {group_info['title']} "
+            f"(обычный обход: {plain_walk}, запросов: {len(queries)}, ошибок: {len(failed)})"
+        )
+        return {'participants': participants, 'coverage': coverage}
+    
     async def export_participants_to_csv(self, group_identifier: str, filename: str, limit: int = 1000) -> bool:
         """
         Экспортирует список участников в CSV файл
         
         Args:
             group_identifier: username группы (без @) или ID группы
-            filename: имя файла для сохранения
+            filename: имя файла для сохранения (.csv.gz / .csv.zst - со сжатием)
             limit: максимальное количество участников
             
         Returns:
@@ -260,19 +760,27 @@ class GroupManager:
                 logger.warning("Нет участников для экспорта")
                 return False
             
-            with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-                fieldnames = ['id', 'username', 'first_name', 'last_name', 'phone', 'is_verified', 'is_premium', 'status']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                
-                writer.writeheader()
-                for participant in participants:
-                    # Очищаем данные для CSV
-                    clean_participant = {k: v for k, v in participant.items() if k in fieldnames}
-                    writer.writerow(clean_participant)
+            def write_csv():
+                with open_text(filename, 'w', newline='') as csvfile:
+                    fieldnames = ['id', 'username', 'first_name', 'last_name', 'phone', 'is_verified', 'is_premium', 'status']
+                    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+                    
+                    writer.writeheader()
+                    # Детерминированный порядок: по id
+                    for participant in sorted(participants, key=lambda p: p['id']):
+                        # Очищаем данные для CSV
+                        clean_participant = {k: v for k, v in participant.items() if k in fieldnames}
+                        writer.writerow(clean_participant)
+            
+            # Сериализация и сжатие - в потоке записи, event loop продолжает RPC
+            await get_writer().run(write_csv)
             
             logger.info(f"Экспортировано {len(participants)} участников в файл {filename}")
             return True
             
+        except TAKEOUT_ERRORS:
+            # Takeout стал недействительным - решает вызывающий код (FallbackGroupManager)
+            raise
         except Exception as e:
             logger.error(f"Ошибка при экспорте в CSV: {e}")
             return False
@@ -312,7 +820,7 @@ class GroupManager:
                 return None
             
             # Вызываем через safe_call для анти-спам защиты
-            creation_date = await _safe_api_call(get_first_message)
+            creation_date = await _safe_api_call(get_first_message, limiter=self.limiter)
             
             if creation_date:
                 logger.info(f"Получена дата создания группы {group_identifier}: {creation_date}")
@@ -321,6 +829,103 @@ class GroupManager:
                 logger.warning(f"Не удалось получить дату создания для группы {group_identifier}")
                 return None
                 
+        except TAKEOUT_ERRORS:
+            # Takeout стал недействительным - решает вызывающий код (FallbackGroupManager)
+            raise
         except Exception as e:
             logger.error(f"Ошибка при получении даты создания группы {group_identifier}: {e}")
-            return None 
\ No newline at end of file
+            return None
+
+    async def get_message_page(self, group_id: int, offset_id: int = 0, min_id: int = 0,
+                               reverse: bool = False,
+                               limit: int = MESSAGES_PAGE_SIZE) -> Optional[List[Dict[str, Any]]]:
+        """
+        Одна страница истории сообщений - один GetHistoryRequest через safe_call
+
+        Args:
+            group_id: ID группы (-100...)
+            offset_id: Сообщения старше offset_id (reverse=True - новее)
+            min_id: Только сообщения новее min_id
+            reverse: От старых к новым
+            limit: Размер страницы (не больше MESSAGES_PAGE_SIZE)
+
+        Returns:
+            Записи message_to_record в порядке выдачи; [] - сообщений больше
+            нет; None - ошибка (отличается от конца истории)
+        """
+        async def get_page():
+            return await self.client.get_messages(group_id, limit=min(limit, MESSAGES_PAGE_SIZE),
+                                                  offset_id=offset_id, min_id=min_id, reverse=reverse)
+
+        try:
+            with span('message_page', cat='messages', offset_id=offset_id, min_id=min_id) as page_span:
+                messages = await _safe_api_call(get_page, limiter=self.limiter)
+                page_span.set(messages=len(messages))
+            return [message_to_record(m, group_id) for m in messages]
+        except TAKEOUT_ERRORS:
+            # Takeout стал недействительным - решает вызывающий код (FallbackGroupManager)
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка при получении сообщений группы {group_id}: {e}")
+            return None
+
+
+class FallbackGroupManager:
+    """
+    GroupManager поверх takeout сессии с откатом на обычную сессию
+
+    Вызовы идут через takeout клиент и его RateLimiter. Если takeout стал
+    недействительным (TAKEOUT_ERRORS), вызов повторяется через обычную сессию
+    с глобальным лимитером, и дальше используется только она.
+    """
+
+    def __init__(self, takeout_manager: GroupManager, fallback_manager: GroupManager):
+        self.takeout_manager = takeout_manager
+        self.fallback_manager = fallback_manager
+        self.uses_takeout = True
+
+    @property
+    def active(self) -> GroupManager:
+        return self.takeout_manager if self.uses_takeout else self.fallback_manager
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.active, name)
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            if self.uses_takeout:
+                try:
+                    return await getattr(self.takeout_manager, name)(*args, **kwargs)
+                except TAKEOUT_ERRORS as e:
+                    if self.uses_takeout:
+                        logger.warning(f"[SAFE] Takeout failed in {name} ({type(e).__name__}), "
+                                       f"falling back to the normal session")
+                        self.uses_takeout = False
+            return await getattr(self.fallback_manager, name)(*args, **kwargs)
+
+        return call
+
+
+@asynccontextmanager
+async def open_export_manager(client: TelegramClient, takeout: bool = False) -> AsyncIterator[Any]:
+    """
+    Менеджер групп для массовой выгрузки
+
+    Args:
+        client: Подключенный TelegramClient
+        takeout: Выгружать через takeout сессию (мягче лимиты, свой RateLimiter)
+
+    Yields:
+        FallbackGroupManager, если takeout открылся, иначе GroupManager обычной сессии
+    """
+    if not takeout:
+        yield GroupManager(client)
+        return
+
+    async with open_takeout(client) as session:
+        if session is None:
+            yield GroupManager(client)
+        else:
+            yield FallbackGroupManager(GroupManager(session, limiter=get_takeout_limiter()),
+                                       GroupManager(client))
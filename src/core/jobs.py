@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Обработчики задач очереди и воркер
+
+Воркер забирает задачи из JobQueue (src/infra/job_queue.py) и выполняет их
+по одной через один GroupManager, то есть под одним RateLimiter процесса:
+сколько бы задач ни стояло в очереди, аккаунт расходует один бюджет RPC.
+
+Типы задач (JOB_HANDLERS):
+- export: участники одной группы в .json/.csv (как команда export)
+- crosscheck: сверка целевых групп с s16 space, чекпоинт после каждой группы
+  (полные результаты - в файлах каталога задачи)
+- creation-date: даты создания групп, чекпоинт после каждой группы
+
+Обработчик сохраняет прогресс через JobContext.save(); при повторе после
+ошибки или перезапуске воркера уже сделанная часть пропускается. Повтор -
+через retry_base * 2^(попытка-1) секунд, после FLOOD_WAIT - не раньше, чем
+разрешил Telegram.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import socket
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from telethon.errors import FloodWaitError
+
+from src.core.crosscheck import CrossChecker, build_report, save_report
+from src.core.group_manager import GroupManager
+from src.core.roster_store import RosterStore
+from src.core.s16_config import get_s16_config
+from src.infra.codecs import open_text, strip_codec_suffix, with_codec_suffix
+from src.infra.job_queue import CANCELLED, DONE, QUEUED, JobQueue, get_job_queue
+from src.infra.writer import get_writer, write_json
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 5.0
+DEFAULT_RETRY_BASE = 60.0
+DEFAULT_STALE_AFTER = 600.0
+DEFAULT_HEARTBEAT_INTERVAL = 30.0
+
+
+class JobCancelled(Exception):
+    """Отмена задачи запрошена командой cancel"""
+
+
+class JobContext:
+    """Параметры и чекпоинт выполняемой задачи"""
+
+    def __init__(self, queue: JobQueue, job: Dict[str, Any]):
+        self.queue = queue
+        self.job_id = job['id']
+        self.params: Dict[str, Any] = job['params']
+        self.checkpoint: Dict[str, Any] = job['checkpoint'] or {}
+        self.attempt = job['attempts']
+
+    @property
+    def work_dir(self) -> Path:
+        """Каталог файлов задачи рядом с базой очереди (создается при первом обращении)"""
+        path = self.queue.db_path.parent / f"job_{self.job_id}"
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def save(self):
+        """Сохраняет чекпоинт и прерывает задачу, если запрошена отмена"""
+        self.queue.save_checkpoint(self.job_id, self.checkpoint)
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        if self.queue.is_cancel_requested(self.job_id):
+            raise JobCancelled(f"job #{self.job_id}")
+
+
+JobHandler = Callable[[GroupManager, JobContext], Awaitable[Dict[str, Any]]]
+
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str):
+    """Регистрирует обработчик задач типа kind"""
+    def register(func: JobHandler) -> JobHandler:
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+@job_handler('export')
+async def run_export(manager: GroupManager, ctx: JobContext) -> Dict[str, Any]:
+    """params: group, output, limit (None - все), compress"""
+    group = ctx.params['group']
+    output = with_codec_suffix(ctx.params['output'], ctx.params.get('compress'))
+    limit = ctx.params.get('limit')
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+
+    if strip_codec_suffix(output).lower().endswith('.csv'):
+        if not await manager.export_participants_to_csv(group, output, limit):
+            raise RuntimeError(f"CSV export of {group} failed")
+        return {'output': output}
+
+    participants = await manager.get_participants(group, limit)
+    if not participants:
+        raise RuntimeError(f"no participants received for {group}")
+    await get_writer().run(write_json, output, sorted(participants, key=lambda p: p['id']))
+    return {'output': output, 'count': len(participants)}
+
+
+# Поля результата сверки группы, которые попадают в чекпоинт (без списков участников)
+CROSSCHECK_SUMMARY_FIELDS = ('target_group', 'total_target', 'expected_total', 'complete',
+                             'existing_count', 'new_count')
+
+
+def load_results(results_dir: Path, target_ids: List[int]) -> List[Dict[str, Any]]:
+    """Полные результаты сверки групп из файлов задачи"""
+    results = []
+    for target_id in target_ids:
+        with open_text(results_dir / f"{target_id}.json", 'r') as f:
+            results.append(json.load(f))
+    return results
+
+
+@job_handler('crosscheck')
+async def run_crosscheck(manager: GroupManager, ctx: JobContext) -> Dict[str, Any]:
+    """
+    params: targets, reference_file, use_roster, output
+
+    Чекпоинт - готовые группы и их сводки; полные результаты (списки
+    участников) пишутся по файлу на группу в ctx.work_dir, иначе каждый
+    чекпоинт переписывал бы все предыдущие группы.
+    """
+    config = get_s16_config()
+    checker = CrossChecker(manager, config.get_space_group_id(), config.get_space_group_name(),
+                           store=RosterStore())
+    # После первой попытки референсный ростер уже сохранен в RosterStore
+    use_roster = ctx.params.get('use_roster', False) or ctx.checkpoint.get('reference_saved', False)
+    await checker.load_reference(ctx.params.get('reference_file'), use_roster)
+    ctx.checkpoint['reference_saved'] = True
+
+    summaries = ctx.checkpoint.setdefault('summaries', {})
+    targets = [t for t in dict.fromkeys(ctx.params['targets']) if t != checker.reference_id]
+    for target_id in targets:
+        if str(target_id) in summaries:
+            continue
+        result = await checker.check_target(target_id)
+        await get_writer().run(write_json, str(ctx.work_dir / f"{target_id}.json"), result, indent=None)
+        summaries[str(target_id)] = {field: result[field] for field in CROSSCHECK_SUMMARY_FIELDS}
+        ctx.save()
+
+    results = await get_writer().run(load_results, ctx.work_dir, targets)
+    report = build_report(checker.reference_id, checker.reference_name, checker.reference_ids or set(),
+                          checker.reference_source, results)
+    output = ctx.params.get('output')
+    if output:
+        await get_writer().run(save_report, report, output)
+        await get_writer().run(shutil.rmtree, ctx.work_dir, ignore_errors=True)
+    return dict(report['summary'], output=output or str(ctx.work_dir))
+
+
+@job_handler('creation-date')
+async def run_creation_date(manager: GroupManager, ctx: JobContext) -> Dict[str, Any]:
+    """params: groups; чекпоинт - найденные даты"""
+    dates = ctx.checkpoint.setdefault('dates', {})
+    failed = []
+    for group in ctx.params['groups']:
+        if str(group) in dates:
+            continue
+        creation_date = await manager.get_group_creation_date(group)
+        if creation_date is None:
+            failed.append(group)
+            continue
+        dates[str(group)] = creation_date.isoformat()
+        ctx.save()
+
+    if failed:
+        raise RuntimeError(f"creation date not found for {len(failed)} groups: {failed}")
+    return {'dates': dates}
+
+
+def retry_delay(error: Exception, attempt: int, retry_base: float = DEFAULT_RETRY_BASE) -> float:
+    """Задержка перед повтором: экспоненциальная, но не меньше FLOOD_WAIT"""
+    delay = retry_base * (2 ** max(0, attempt - 1))
+    if isinstance(error, FloodWaitError):
+        delay = max(delay, float(error.seconds))
+    return delay
+
+
+class Worker:
+    """Выполняет задачи очереди по одной под общим RateLimiter"""
+
+    def __init__(self, manager: GroupManager, queue: Optional[JobQueue] = None,
+                 worker_id: Optional[str] = None,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 retry_base: float = DEFAULT_RETRY_BASE,
+                 stale_after: float = DEFAULT_STALE_AFTER,
+                 heartbeat_interval: float = DEFAULT_HEARTBEAT_INTERVAL):
+        """
+        Args:
+            manager: GroupManager (все вызовы через safe_call и общий лимитер)
+            queue: Очередь (None - get_job_queue())
+            worker_id: Имя воркера в задачах (по умолчанию host:pid)
+            poll_interval: Пауза при пустой очереди
+            retry_base: Базовая задержка повтора после ошибки
+            stale_after: Через сколько секунд без heartbeat задача чужого воркера возвращается в очередь
+            heartbeat_interval: Как часто отмечать, что воркер жив
+        """
+        self.manager = manager
+        self.queue = queue or get_job_queue()
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.retry_base = retry_base
+        self.stale_after = stale_after
+        self.heartbeat_interval = heartbeat_interval
+        self.stats = {'done': 0, 'failed': 0, 'retried': 0, 'cancelled': 0}
+        self._stop = asyncio.Event()
+
+    def stop(self):
+        """Остановиться после текущей задачи"""
+        self._stop.set()
+
+    async def _heartbeat(self, job_id: int):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            self.queue.heartbeat(job_id)
+
+    async def run_job(self, job: Dict[str, Any]) -> str:
+        """
+        Выполняет одну задачу (статус running)
+
+        Returns:
+            Итоговый статус задачи
+        """
+        ctx = JobContext(self.queue, job)
+        heartbeat = asyncio.create_task(self._heartbeat(job['id']))
+        logger.info(f"[SAFE] Job #{job['id']} {job['kind']} started (attempt {job['attempts']}/{job['max_attempts']})")
+        try:
+            handler = JOB_HANDLERS.get(job['kind'])
+            if handler is None:
+                raise ValueError(f"unknown job kind '{job['kind']}'")
+            ctx.check_cancelled()
+            result = await handler(self.manager, ctx)
+            self.queue.complete(job['id'], result)
+            self.stats['done'] += 1
+            return DONE
+        except JobCancelled:
+            self.queue.mark_cancelled(job['id'])
+            self.stats['cancelled'] += 1
+            return CANCELLED
+        except Exception as e:
+            # Прогресс до ошибки сохраняется - повтор продолжит с чекпоинта
+            self.queue.save_checkpoint(job['id'], ctx.checkpoint)
+            status = self.queue.fail(job['id'], f"{type(e).__name__}: {e}",
+                                     retry_delay(e, job['attempts'], self.retry_base))
+            self.stats['retried' if status == QUEUED else 'failed'] += 1
+            return status
+        finally:
+            heartbeat.cancel()
+
+    async def run_once(self) -> Optional[str]:
+        """Берет и выполняет одну задачу. None - готовых задач нет"""
+        self.queue.requeue_stale(self.stale_after)
+        job = self.queue.claim(self.worker_id)
+        if job is None:
+            return None
+        return await self.run_job(job)
+
+    async def run(self, max_jobs: Optional[int] = None):
+        """Цикл воркера: до stop() или max_jobs выполненных задач"""
+        processed = 0
+        while not self._stop.is_set() and (max_jobs is None or processed < max_jobs):
+            status = await self.run_once()
+            if status is None:
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            processed += 1
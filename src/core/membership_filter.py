@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Фильтр Блума участников референсной группы
+==========================================
+
+Компактная замена ростера для вопроса "состоит ли пользователь в s16 space?":
+~1.8 байта на участника при доле ложных срабатываний 0.1%. Отрицательный ответ
+точен, положительный - "возможно" и при необходимости подтверждается точной
+проверкой (ростер, экспорт или GroupManager.check_membership).
+
+Файл .s16b (little-endian):
+
+    Заголовок (48 байт):
+        magic        8s   b"S16BLOOM"
+        version      u32  FORMAT_VERSION
+        hash_count   u32  k
+        bit_count    u64  m
+        item_count   u64  сколько ID добавлено
+        group_id     i64  референсная группа
+        built_at     f64  время сборки (unix) - версия фильтра
+
+    Биты (ceil(m / 8) байт): бит i - байт i // 8, разряд i % 8
+
+Позиции: двойное хеширование h1 + i * h2 (mod m) по blake2b от user_id.
+
+Пример:
+    membership = load_filter("data/filters/-1002188344480.s16b")
+    if 123456789 in membership:        # возможно состоит
+        ...
+"""
+
+import hashlib
+import math
+import struct
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from telethon.utils import resolve_id
+
+MAGIC = b"S16BLOOM"
+FORMAT_VERSION = 1
+FILTER_SUFFIX = ".s16b"
+DEFAULT_FILTER_DIR = "data/filters"
+DEFAULT_FP_RATE = 0.001
+
+_HEADER = struct.Struct("<8sIIQQqd")
+_USER_ID = struct.Struct("<q")
+
+
+class FilterFormatError(ValueError):
+    """Файл не в формате s16b или неподдерживаемая версия"""
+
+
+class FilterGroupMismatchError(ValueError):
+    """Фильтр собран для другой группы"""
+
+
+def filter_size(item_count: int, fp_rate: float = DEFAULT_FP_RATE) -> Tuple[int, int]:
+    """Оптимальные (bit_count, hash_count) для item_count элементов и доли ложных срабатываний"""
+    if not 0 < fp_rate < 1:
+        raise ValueError(f"fp_rate must be in (0, 1), got {fp_rate}")
+    n = max(1, item_count)
+    bit_count = max(8, math.ceil(-n * math.log(fp_rate) / (math.log(2) ** 2)))
+    hash_count = max(1, round(bit_count / n * math.log(2)))
+    return bit_count, hash_count
+
+
+def default_filter_path(group_id: int) -> str:
+    return str(Path(DEFAULT_FILTER_DIR) / f"{group_id}{FILTER_SUFFIX}")
+
+
+class MembershipFilter:
+    """Фильтр Блума по user_id"""
+
+    def __init__(self, bit_count: int, hash_count: int, group_id: int = 0,
+                 built_at: Optional[float] = None, bits: Optional[bytearray] = None,
+                 item_count: int = 0):
+        """
+        Args:
+            bit_count: Размер фильтра в битах (m)
+            hash_count: Количество хеш-функций (k)
+            group_id: Референсная группа
+            built_at: Время сборки (unix, None - сейчас)
+            bits: Готовые биты (при загрузке из файла)
+            item_count: Сколько ID уже в bits
+        """
+        self.bit_count = bit_count
+        self.hash_count = hash_count
+        self.group_id = group_id
+        self.built_at = built_at if built_at is not None else datetime.now().timestamp()
+        self.bits = bits if bits is not None else bytearray((bit_count + 7) // 8)
+        self.item_count = item_count
+
+    def _positions(self, user_id: int) -> List[int]:
+        digest = hashlib.blake2b(_USER_ID.pack(user_id), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        m = self.bit_count
+        return [(h1 + i * h2) % m for i in range(self.hash_count)]
+
+    def add(self, user_id: int):
+        for position in self._positions(user_id):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.item_count += 1
+
+    def __contains__(self, user_id: int) -> bool:
+        """False - точно не участник, True - возможно участник"""
+        bits = self.bits
+        for position in self._positions(user_id):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    might_contain = __contains__
+
+    def expected_fp_rate(self) -> float:
+        """Ожидаемая доля ложных срабатываний при текущем заполнении"""
+        if not self.item_count:
+            return 0.0
+        return (1 - math.exp(-self.hash_count * self.item_count / self.bit_count)) ** self.hash_count
+
+    def built_at_iso(self) -> str:
+        return datetime.fromtimestamp(self.built_at).isoformat(timespec='seconds')
+
+    def age_seconds(self, now: Optional[float] = None) -> float:
+        """Сколько секунд назад собран фильтр: отрицательный ответ точен только на этот момент"""
+        return max(0.0, (now if now is not None else datetime.now().timestamp()) - self.built_at)
+
+    def check_group(self, group_id: int):
+        """
+        Проверяет, что фильтр собран для group_id (ID с префиксом -100 или без)
+
+        Фильтр без группы (group_id 0) подходит к любой.
+
+        Raises:
+            FilterGroupMismatchError: Фильтр другой группы
+        """
+        if self.group_id and resolve_id(self.group_id)[0] != resolve_id(group_id)[0]:
+            raise FilterGroupMismatchError(
+                f"фильтр собран для группы {self.group_id}, а проверяется группа {group_id}"
+            )
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            'group_id': self.group_id,
+            'built_at': self.built_at_iso(),
+            'items': self.item_count,
+            'bits': self.bit_count,
+            'hashes': self.hash_count,
+            'size_bytes': _HEADER.size + len(self.bits),
+            'expected_fp_rate': round(self.expected_fp_rate(), 6),
+        }
+
+    def save(self, path: str) -> str:
+        """Атомарная запись в файл .s16b"""
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(target.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, self.hash_count, self.bit_count,
+                                 self.item_count, self.group_id, self.built_at))
+            f.write(self.bits)
+        tmp_path.replace(target)
+        return str(target)
+
+
+def build_filter(user_ids: Iterable[int], group_id: int = 0,
+                 fp_rate: float = DEFAULT_FP_RATE) -> MembershipFilter:
+    """Фильтр по ID участников (дубли не влияют на размер)"""
+    unique_ids = set(user_ids)
+    bit_count, hash_count = filter_size(len(unique_ids), fp_rate)
+    membership = MembershipFilter(bit_count, hash_count, group_id=group_id)
+    for user_id in unique_ids:
+        membership.add(user_id)
+    return membership
+
+
+def load_filter(path: str) -> MembershipFilter:
+    """Загружает фильтр из файла .s16b"""
+    data = Path(path).read_bytes()
+    if len(data) < _HEADER.size:
+        raise FilterFormatError(f"{path}: файл слишком короткий")
+    magic, version, hash_count, bit_count, item_count, group_id, built_at = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise FilterFormatError(f"{path}: не файл фильтра s16b")
+    if version != FORMAT_VERSION:
+        raise FilterFormatError(f"{path}: неподдерживаемая версия {version}")
+    bits = bytearray(data[_HEADER.size:])
+    if len(bits) != (bit_count + 7) // 8:
+        raise FilterFormatError(f"{path}: размер данных не совпадает с заголовком")
+    return MembershipFilter(bit_count, hash_count, group_id=group_id, built_at=built_at,
+                            bits=bits, item_count=item_count)
+
+
+def screen(membership: MembershipFilter, user_ids: Iterable[int],
+           exact: Optional[Callable[[List[int]], Set[int]]] = None) -> Dict[str, List[int]]:
+    """
+    Проверка многих пользователей: фильтр, затем точная проверка положительных
+
+    Args:
+        membership: Фильтр
+        user_ids: Проверяемые ID
+        exact: Точная проверка - получает возможных участников, возвращает
+            подтвержденных (None - без подтверждения)
+
+    Returns:
+        {'members': [...], 'non_members': [...], 'false_positives': [...]};
+        без exact в members - все возможные участники
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    maybe = [u for u in user_ids if u in membership]
+    if exact is None:
+        confirmed = set(maybe)
+    else:
+        confirmed = set(exact(maybe)) if maybe else set()
+    return {
+        'members': [u for u in maybe if u in confirmed],
+        'non_members': [u for u in user_ids if u not in confirmed],
+        'false_positives': [u for u in maybe if u not in confirmed],
+    }
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Отслеживание состава групп по событиям Telegram
+
+Вместо периодических полных выгрузок участников трекер подписывается на
+события ChatAction (join, add, leave, kick) для заданных групп и применяет
+их к локальным ростерам (RosterStore). Пропущенные события (трекер был
+выключен, Telegram не доставил update) закрываются дешевой сверкой:
+сравниваем participants_count с ожидаемым размером ростера и делаем полную
+выгрузку только при расхождении.
+
+Для тестов и отладки события можно подать через replay() - подойдет любой
+объект с атрибутами chat_id, user_ids, user_joined/user_added/user_left/user_kicked.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterable, Dict, Iterable, List, Optional, Set, Union
+
+from telethon import events
+from telethon.tl.types import User
+
+from src.core.group_manager import PARTICIPANTS_LISTING_CAP, GroupManager, user_to_participant
+from src.core.roster_store import RosterStore
+
+logger = logging.getLogger(__name__)
+
+
+def classify_chat_action(event: Any) -> Optional[str]:
+    """
+    Определяет тип события изменения состава
+
+    Returns:
+        'join', 'leave' или None для событий, не меняющих состав
+    """
+    if getattr(event, 'user_joined', False) or getattr(event, 'user_added', False):
+        return 'join'
+    if getattr(event, 'user_left', False) or getattr(event, 'user_kicked', False):
+        return 'leave'
+    return None
+
+
+def _event_user_ids(event: Any) -> List[int]:
+    """ID пользователей события (одно событие может касаться нескольких)"""
+    user_ids = getattr(event, 'user_ids', None)
+    if user_ids:
+        return list(user_ids)
+    user_id = getattr(event, 'user_id', None)
+    return [user_id] if user_id is not None else []
+
+
+def _event_users(event: Any) -> Dict[int, Dict[str, Any]]:
+    """Профили пользователей из события (без дополнительных API вызовов)"""
+    try:
+        users = getattr(event, 'users', None) or []
+    except Exception:
+        # users берет сущности из update; если их нет - обойдемся ID
+        return {}
+    return {
+        user.id: user_to_participant(user)
+        for user in users
+        if isinstance(user, User)
+    }
+
+
+class MembershipTracker:
+    """Поддерживает ростеры групп в актуальном состоянии по событиям"""
+
+    def __init__(self,
+                 client,
+                 group_ids: Iterable[int],
+                 store: Optional[RosterStore] = None,
+                 manager: Optional[GroupManager] = None,
+                 reconcile_interval: float = 3600.0,
+                 flush_interval: float = 5.0):
+        """
+        Args:
+            client: TelegramClient
+            group_ids: ID отслеживаемых групп (в формате -100...)
+            store: Хранилище ростеров
+            manager: GroupManager для сверки (по умолчанию создается из client)
+            reconcile_interval: Период сверки одной группы, секунд
+            flush_interval: Период сохранения измененных ростеров на диск, секунд
+        """
+        self.client = client
+        self.group_ids: Set[int] = {int(g) for g in group_ids}
+        self.store = store or RosterStore()
+        self.manager = manager or GroupManager(client)
+        self.reconcile_interval = reconcile_interval
+        self.flush_interval = flush_interval
+
+        self._dirty: Set[int] = set()
+        self._last_reconcile: Dict[int, float] = {}
+        self._handler_registered = False
+        self.stats = {
+            'events': 0,
+            'joins': 0,
+            'leaves': 0,
+            'ignored': 0,
+            'reconciles': 0,
+            'full_fetches': 0
+        }
+
+    # ------------------------------------------------------------------
+    # События
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Подписывается на ChatAction события отслеживаемых групп"""
+        if self._handler_registered:
+            return
+        self.client.add_event_handler(
+            self.handle_event, events.ChatAction(chats=list(self.group_ids))
+        )
+        self._handler_registered = True
+        logger.info(f"Трекер подписан на события {len(self.group_ids)} групп")
+
+    def stop(self):
+        """Отписывается от событий и сохраняет изменения"""
+        if self._handler_registered:
+            self.client.remove_event_handler(self.handle_event)
+            self._handler_registered = False
+        self.flush()
+
+    async def handle_event(self, event: Any) -> bool:
+        """
+        Применяет одно событие к ростеру
+
+        Returns:
+            True если событие изменило ростер
+        """
+        self.stats['events'] += 1
+        chat_id = getattr(event, 'chat_id', None)
+        kind = classify_chat_action(event)
+
+        if chat_id not in self.group_ids or kind is None:
+            self.stats['ignored'] += 1
+            return False
+
+        roster = self.store.load(chat_id)
+        profiles = _event_users(event)
+        user_ids = _event_user_ids(event)
+
+        # Каждое событие меняет expected_count (даже если пользователя нет в ростере)
+        for user_id in user_ids:
+            profile = profiles.get(user_id)
+            if kind == 'join':
+                is_bot = bool(profile and profile.get('is_bot'))
+                if roster.add(user_id, profile, is_bot=is_bot):
+                    self.stats['joins'] += 1
+            else:
+                if roster.remove(user_id):
+                    self.stats['leaves'] += 1
+
+        if user_ids:
+            self._dirty.add(chat_id)
+        return bool(user_ids)
+
+    async def replay(self, event_stream: Union[Iterable[Any], AsyncIterable[Any]]) -> Dict[str, int]:
+        """Применяет поток событий (симуляция или запись) и сохраняет ростеры"""
+        if hasattr(event_stream, '__aiter__'):
+            async for event in event_stream:
+                await self.handle_event(event)
+        else:
+            for event in event_stream:
+                await self.handle_event(event)
+        self.flush()
+        return dict(self.stats)
+
+    def flush(self):
+        """Сохраняет измененные ростеры на диск"""
+        for group_id in sorted(self._dirty):
+            self.store.save(self.store.load(group_id))
+        self._dirty.clear()
+
+    # ------------------------------------------------------------------
+    # Сверка
+    # ------------------------------------------------------------------
+
+    async def reconcile(self, group_id: int, force: bool = False) -> Dict[str, Any]:
+        """
+        Сверяет ростер группы с Telegram
+
+        Дешевый путь: один get_group_info и сравнение participants_count с
+        ожидаемым размером ростера. Полная выгрузка - только при расхождении,
+        при отсутствии ростера или при force=True. Для групп больше
+        PARTICIPANTS_LISTING_CAP (capped) расхождение только обновляет
+        ожидаемый размер: полный список Telegram все равно не отдаст.
+
+        Returns:
+            Словарь с результатом сверки
+        """
+        self.stats['reconciles'] += 1
+        self._last_reconcile[group_id] = time.monotonic()
+        known = self.store.has(group_id)
+        roster = self.store.load(group_id)
+
+        info = await self.manager.get_group_info(group_id)
+        if not info:
+            logger.warning(f"Сверка {group_id}: не удалось получить информацию о группе")
+            return {'group_id': group_id, 'status': 'error'}
+
+        participants_count = info.get('participants_count')
+        if not force and known and roster.capped and participants_count \
+                and participants_count > PARTICIPANTS_LISTING_CAP:
+            # Полная выгрузка все равно вернет не больше PARTICIPANTS_LISTING_CAP -
+            # не повторяем ее на каждом расхождении, только обновляем счетчик
+            if participants_count != roster.expected_count:
+                logger.info(f"Сверка {group_id}: группа больше {PARTICIPANTS_LISTING_CAP}, "
+                            f"ожидалось {roster.expected_count}, в Telegram {participants_count}")
+                roster.expected_count = participants_count
+                self.store.save(roster)
+                self._dirty.discard(group_id)
+            return {'group_id': group_id, 'status': 'capped', 'joined': 0, 'left': 0}
+
+        in_sync = (
+            not force
+            and known
+            and roster.expected_count is not None
+            and participants_count == roster.expected_count
+        )
+        if in_sync:
+            logger.debug(f"Сверка {group_id}: ростер актуален ({participants_count})")
+            return {'group_id': group_id, 'status': 'in_sync', 'joined': 0, 'left': 0}
+
+        logger.info(
+            f"Сверка {group_id}: ожидалось {roster.expected_count}, "
+            f"в Telegram {participants_count} - полная выгрузка"
+        )
+        participants = await self.manager.get_participants(group_id, limit=None)
+        if not participants and participants_count:
+            # Пустой результат при непустой группе - ошибка выгрузки, ростер не трогаем
+            return {'group_id': group_id, 'status': 'error'}
+
+        self.stats['full_fetches'] += 1
+        diff = roster.replace(participants, participants_count)
+        self.store.save(roster)
+        self._dirty.discard(group_id)
+        return {'group_id': group_id, 'status': 'resynced', **diff}
+
+    async def reconcile_due(self) -> List[Dict[str, Any]]:
+        """Сверяет группы, для которых истек reconcile_interval"""
+        now = time.monotonic()
+        results = []
+        for group_id in sorted(self.group_ids):
+            last = self._last_reconcile.get(group_id)
+            if last is None or now - last >= self.reconcile_interval:
+                results.append(await self.reconcile(group_id))
+        return results
+
+    async def run(self, stop_event: Optional[asyncio.Event] = None):
+        """
+        Основной цикл: подписка на события, периодическое сохранение и сверка
+
+        Args:
+            stop_event: Событие остановки (по умолчанию - до отключения клиента)
+        """
+        stop_event = stop_event or asyncio.Event()
+        self.start()
+        try:
+            while not stop_event.is_set():
+                await self.reconcile_due()
+                self.flush()
+                try:
+                    await asyncio.wait_for(stop_event.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.stop()
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Потоковый экспорт истории сообщений групп с продолжением
+=======================================================
+
+История выгружается страницами по 100 сообщений (один GetHistoryRequest на
+страницу через GroupManager.get_message_page, то есть через safe_call и
+RateLimiter) и сразу пишется на диск - в памяти не больше страницы (или
+одного блока Parquet). Из сообщения сохраняются только метаданные:
+message_to_record (id, дата, отправитель, ответ, пересылка, длина текста).
+
+Checkpoint группы (data/messages/checkpoints/<group_id>.json):
+
+    {"group_id": -100..., "min_id": 1200, "max_id": 98000,
+     "history_complete": false, "exported": 96800, "updated_at": "..."}
+
+Выгружено все в диапазоне [min_id, max_id]. Запуск:
+1. новые сообщения после max_id - от старых к новым (max_id растет);
+2. пока история не закончилась - сообщения до min_id, от новых к старым
+   (min_id уменьшается).
+Прерванный запуск продолжается с последней записанной страницы; повторный -
+забирает только новые сообщения. Checkpoint сохраняется только после того,
+как страница записана, поэтому при сбое между записью и сохранением
+сообщения могут повториться (ключ - group_id + id), но не потеряться.
+
+Форматы:
+- ndjson: <output_dir>/<group_id>.ndjson (дописывается; .gz / .zst - со сжатием)
+- parquet: <output_dir>/<group_id>/part-<время>-<n>.parquet блоками по
+  chunk_rows (нужен pyarrow)
+
+Группы выгружаются параллельно, не больше concurrency одновременно.
+"""
+
+import asyncio
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from telethon import utils
+from telethon.tl.types import PeerChannel, PeerChat
+
+from src.core.columnar import PARQUET_SUFFIX, _import_pyarrow
+from src.core.group_manager import MESSAGES_PAGE_SIZE
+from src.infra.codecs import open_text, with_codec_suffix
+from src.infra.limiter import smart_pause
+from src.infra.tracing import span
+from src.infra.writer import get_writer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MESSAGES_DIR = "data/messages"
+DEFAULT_CHECKPOINT_DIR = "data/messages/checkpoints"
+DEFAULT_CONCURRENCY = 3
+MESSAGE_FORMATS = ('ndjson', 'parquet')
+
+# Строк в одном файле Parquet
+DEFAULT_CHUNK_ROWS = 50000
+
+# Колонки Parquet (поля message_to_record)
+MESSAGE_COLUMNS = ('group_id', 'id', 'date', 'sender_id', 'reply_to', 'reply_top',
+                   'fwd_from', 'fwd_date', 'text_len', 'service')
+
+# Вызывается после записи каждой страницы: (group_id, записи страницы)
+PageCallback = Callable[[int, List[Dict[str, Any]]], None]
+
+
+def new_checkpoint(group_id: int) -> Dict[str, Any]:
+    return {'group_id': group_id, 'min_id': 0, 'max_id': 0, 'history_complete': False,
+            'exported': 0, 'updated_at': None}
+
+
+class MessageCheckpointStore:
+    """Checkpoint'ы экспорта сообщений (по JSON файлу на группу)"""
+
+    def __init__(self, data_dir: str = DEFAULT_CHECKPOINT_DIR):
+        self.data_dir = Path(data_dir)
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, group_id: int) -> Path:
+        return self.data_dir / f"{group_id}.json"
+
+    def load(self, group_id: int) -> Dict[str, Any]:
+        """Checkpoint группы (новый, если группа еще не выгружалась)"""
+        path = self._path(group_id)
+        if not path.exists():
+            return new_checkpoint(group_id)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return {**new_checkpoint(group_id), **json.load(f)}
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать checkpoint {path}: {e}, начинаем заново")
+            return new_checkpoint(group_id)
+
+    def save(self, checkpoint: Dict[str, Any]):
+        """Сохраняет checkpoint атомарно (через временный файл)"""
+        checkpoint['updated_at'] = datetime.now().isoformat()
+        path = self._path(checkpoint['group_id'])
+        tmp_path = path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+        tmp_path.replace(path)
+
+
+class NdjsonSink:
+    """Запись сообщений построчно в NDJSON (каждая страница записана сразу)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._file = open_text(path, 'a')
+
+    def write(self, records: List[Dict[str, Any]]) -> bool:
+        """Returns: True - записи на диске, checkpoint можно сохранять"""
+        for record in records:
+            self._file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+            self._file.write('\n')
+        self._file.flush()
+        return True
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetSink:
+    """Запись сообщений в Parquet блоками по chunk_rows строк"""
+
+    def __init__(self, directory: str, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+        self.pa, self.pq = _import_pyarrow()
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.chunk_rows = chunk_rows
+        self._prefix = f"part-{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        self._parts = 0
+        self._buffer: List[Dict[str, Any]] = []
+
+    def write(self, records: List[Dict[str, Any]]) -> bool:
+        """Returns: True - буфер записан в файл, checkpoint можно сохранять"""
+        self._buffer.extend(records)
+        if len(self._buffer) < self.chunk_rows:
+            return False
+        self._flush()
+        return True
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        table = self.pa.table({column: [r[column] for r in self._buffer] for column in MESSAGE_COLUMNS})
+        path = self.directory / f"{self._prefix}-{self._parts:04d}{PARQUET_SUFFIX}"
+        tmp_path = path.with_name(path.name + ".tmp")
+        self.pq.write_table(table, str(tmp_path), compression="zstd")
+        tmp_path.replace(path)
+        self._parts += 1
+        self._buffer = []
+
+    def close(self):
+        self._flush()
+
+
+def open_sink(output_dir: str, group_id: int, format: str = 'ndjson', codec: Optional[str] = None,
+              chunk_rows: int = DEFAULT_CHUNK_ROWS):
+    """Приемник сообщений группы в output_dir"""
+    if format == 'ndjson':
+        return NdjsonSink(with_codec_suffix(Path(output_dir) / f"{group_id}.ndjson", codec))
+    if format == 'parquet':
+        return ParquetSink(str(Path(output_dir) / str(group_id)), chunk_rows=chunk_rows)
+    raise ValueError(f"Unknown message format '{format}', expected one of {MESSAGE_FORMATS}")
+
+
+def marked_group_id(group_info: Dict[str, Any]) -> int:
+    """ID группы в формате -100... из get_group_info"""
+    peer = PeerChannel(group_info['id']) if group_info['type'] == 'channel' else PeerChat(group_info['id'])
+    return utils.get_peer_id(peer)
+
+
+class MessageExporter:
+    """Экспорт истории сообщений многих групп с checkpoint'ами"""
+
+    def __init__(self, manager, output_dir: str = DEFAULT_MESSAGES_DIR, format: str = 'ndjson',
+                 codec: Optional[str] = None, store: Optional[MessageCheckpointStore] = None,
+                 concurrency: int = DEFAULT_CONCURRENCY, page_size: int = MESSAGES_PAGE_SIZE,
+                 max_pages: Optional[int] = None, chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                 on_page: Optional[PageCallback] = None):
+        """
+        Args:
+            manager: GroupManager (или RemoteGroupManager демона)
+            output_dir: Каталог файлов сообщений
+            format: ndjson или parquet
+            codec: Сжатие NDJSON (gzip / zstd)
+            store: Checkpoint'ы (None - data/messages/checkpoints)
+            concurrency: Сколько групп выгружать одновременно
+            page_size: Сообщений на страницу (не больше 100)
+            max_pages: Страниц на группу за запуск (None - без ограничения)
+            chunk_rows: Строк в файле Parquet
+            on_page: Обработчик каждой записанной страницы (аналитика)
+        """
+        if format not in MESSAGE_FORMATS:
+            raise ValueError(f"Unknown message format '{format}', expected one of {MESSAGE_FORMATS}")
+        self.manager = manager
+        self.output_dir = output_dir
+        self.format = format
+        self.codec = codec
+        self.store = store or MessageCheckpointStore()
+        self.concurrency = max(1, concurrency)
+        self.page_size = min(page_size, MESSAGES_PAGE_SIZE)
+        self.max_pages = max_pages
+        self.chunk_rows = chunk_rows
+        self.on_page = on_page
+
+    async def export_group(self, group_identifier: Union[str, int]) -> Dict[str, Any]:
+        """
+        Выгружает новые сообщения группы и продолжает выгрузку истории
+
+        Returns:
+            {'group': ..., 'group_id', 'title', 'status': 'ok' | 'partial' | 'failed' | 'not_found',
+             'new': ..., 'backfill': ..., 'pages': ..., 'checkpoint': {...}}
+        """
+        group_info = await self.manager.get_group_info(group_identifier)
+        if not group_info:
+            logger.error(f"Не удалось найти группу: {group_identifier}")
+            return {'group': group_identifier, 'status': 'not_found'}
+
+        group_id = marked_group_id(group_info)
+        checkpoint = self.store.load(group_id)
+        result = {'group': group_identifier, 'group_id': group_id, 'title': group_info['title'],
+                  'status': 'ok', 'new': 0, 'backfill': 0, 'pages': 0}
+        logger.info(f"Экспорт сообщений группы {group_info['title']} "
+                    f"(выгружено: {checkpoint['exported']}, max_id: {checkpoint['max_id']})")
+
+        sink = open_sink(self.output_dir, group_id, self.format, self.codec, self.chunk_rows)
+        # checkpoint продвигается при получении страницы, written - только после ее записи
+        written = {'checkpoint': dict(checkpoint)}
+        with span('export_messages', cat='messages', group_id=group_id) as group_span:
+            try:
+                # 1. Новые сообщения после max_id, от старых к новым
+                if checkpoint['max_id'] or checkpoint['history_complete']:
+                    await self._walk(sink, checkpoint, result, written, reverse=True)
+                # 2. История до min_id, от новых к старым
+                if result['status'] == 'ok' and not checkpoint['history_complete']:
+                    await self._walk(sink, checkpoint, result, written, reverse=False)
+            finally:
+                saved = await get_writer().run(self._close, sink, dict(checkpoint), written)
+            group_span.set(new=result['new'], backfill=result['backfill'], pages=result['pages'])
+
+        result['checkpoint'] = saved
+        logger.info(f"Сообщения группы {group_info['title']}: новых {result['new']}, "
+                    f"из истории {result['backfill']}, статус {result['status']}")
+        return result
+
+    def _persist_page(self, sink, group_id: int, page: List[Dict[str, Any]], checkpoint: Dict[str, Any],
+                      written: Dict[str, Any]):
+        """Запись страницы, обработчик и checkpoint (в потоке записи)"""
+        committed = sink.write(page)
+        # До checkpoint: страница, повторенная после сбоя, не теряется для
+        # обработчика (ActivityStore сам пропускает уже учтенные сообщения)
+        if self.on_page is not None:
+            self.on_page(group_id, page)
+        written['checkpoint'] = checkpoint
+        if committed:
+            self.store.save(checkpoint)
+
+    def _close(self, sink, checkpoint: Dict[str, Any], written: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Закрывает файл и сохраняет checkpoint последней записанной страницы
+
+        Если запись страницы упала (или выгрузка прервана до записи полученной
+        страницы), checkpoint не продвигается дальше записанного: эти сообщения
+        выгрузятся при следующем запуске.
+        """
+        sink.close()
+        last = written['checkpoint']
+        if all(last[field] == checkpoint[field] for field in ('min_id', 'max_id', 'exported')):
+            # Записано все полученное - сохраняем и history_complete
+            last = checkpoint
+        self.store.save(last)
+        return last
+
+    async def _walk(self, sink, checkpoint: Dict[str, Any], result: Dict[str, Any],
+                    written: Dict[str, Any], reverse: bool):
+        """
+        Страницы в одну сторону до конца, ошибки или лимита страниц
+
+        Страница пишется в потоке записи, пока запрашивается следующая; перед
+        записью следующей ждем предыдущую (порядок и ошибки записи сохраняются).
+        """
+        group_id = checkpoint['group_id']
+        writer = get_writer()
+        writing = None
+        try:
+            while True:
+                if self.max_pages is not None and result['pages'] >= self.max_pages:
+                    result['status'] = 'partial'
+                    return
+
+                offset_id = checkpoint['max_id'] if reverse else checkpoint['min_id']
+                page = await self.manager.get_message_page(group_id, offset_id=offset_id,
+                                                           reverse=reverse, limit=self.page_size)
+                if page is None:
+                    result['status'] = 'failed'
+                    return
+
+                if page:
+                    if reverse:
+                        checkpoint['max_id'] = max(checkpoint['max_id'], page[-1]['id'])
+                        result['new'] += len(page)
+                    else:
+                        if not checkpoint['max_id']:
+                            checkpoint['max_id'] = page[0]['id']
+                        checkpoint['min_id'] = page[-1]['id']
+                        result['backfill'] += len(page)
+                    checkpoint['exported'] += len(page)
+                    result['pages'] += 1
+
+                    if writing is not None:
+                        await asyncio.wrap_future(writing)
+                    # Копия checkpoint: следующая страница меняет его, пока эта пишется
+                    writing = await writer.submit_async(self._persist_page, sink, group_id, page,
+                                                        dict(checkpoint), written)
+                    await smart_pause("messages", result['pages'],
+                                      limiter=getattr(self.manager, 'limiter', None))
+
+                # Неполная страница - дальше сообщений нет
+                if len(page) < self.page_size:
+                    if not reverse:
+                        checkpoint['history_complete'] = True
+                    return
+        finally:
+            if writing is not None:
+                await asyncio.wrap_future(writing)
+
+    async def run(self, group_identifiers: Iterable[Union[str, int]]) -> Dict[str, Any]:
+        """
+        Экспорт нескольких групп (не больше concurrency одновременно)
+
+        Returns:
+            {'groups': [результат export_group, ...], 'messages': всего записано,
+             'failed': [группы с ошибкой]}
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def guarded(group_identifier):
+            async with semaphore:
+                try:
+                    return await self.export_group(group_identifier)
+                except Exception as e:
+                    logger.error(f"Ошибка экспорта сообщений группы {group_identifier}: {e}")
+                    return {'group': group_identifier, 'status': 'failed', 'error': str(e)}
+
+        results = await asyncio.gather(*(guarded(g) for g in dict.fromkeys(group_identifiers)))
+        return {
+            'groups': results,
+            'messages': sum(r.get('new', 0) + r.get('backfill', 0) for r in results),
+            'failed': [r['group'] for r in results if r['status'] in ('failed', 'not_found')],
+        }
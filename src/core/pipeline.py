@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Этап обработки в пуле процессов
+===============================
+
+После выгрузки ростеров дальше идет только CPU работа: нормализация записей
+участников, дедупликация, пересечение с референсной группой. В event loop она
+задерживает следующие запросы к Telegram (и упирается в GIL в потоке записи).
+ProcessStage выполняет такие преобразования в ProcessPoolExecutor, а основной
+цикл тем временем продолжает выгрузку.
+
+Батчи передаются компактно, чтобы pickle был дешевым:
+- Batch - колонки (columns + списки значений по колонкам), а не список
+  dict: имена полей не повторяются в каждой записи;
+- множества ID - array('q') (сериализуется одним блоком байт).
+
+Преобразования - функции уровня модуля (их можно передать в процесс):
+
+    stage = get_process_stage()
+    batch = pack_records(participants, PARTICIPANT_COLUMNS)
+    members = await stage.run(normalize_members, batch)
+
+Маленькие батчи (меньше inline_below записей) выполняются сразу в текущем
+процессе: передача между процессами стоит дороже самой работы.
+
+Переменные окружения:
+- PIPELINE_WORKERS - процессов в пуле (0 - без пула, все в текущем процессе;
+  по умолчанию число ядер)
+- PIPELINE_INLINE_BELOW - порог размера батча для пула (по умолчанию 2000)
+"""
+
+import asyncio
+import atexit
+import logging
+import multiprocessing
+import os
+import weakref
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INLINE_BELOW = 2000
+
+# Поля участника GroupManager, нужные преобразованиям
+PARTICIPANT_COLUMNS = ('id', 'username', 'first_name', 'last_name', 'is_premium', 'is_verified')
+
+# Записи members.json (export_3_jsons.py)
+MEMBER_COLUMNS = ('user_id', 'username', 'first_name', 'last_name', 'is_premium', 'is_verified')
+
+# Участники в отчете сверки (crosscheck)
+MEMBER_INFO_COLUMNS = ('id', 'username', 'first_name', 'last_name', 'is_premium')
+
+
+class Batch(NamedTuple):
+    """Записи по колонкам: data[i] - значения колонки columns[i]"""
+    columns: Tuple[str, ...]
+    data: Tuple[List[Any], ...]
+
+    def __len__(self) -> int:
+        return len(self.data[0]) if self.data else 0
+
+    def column(self, name: str) -> List[Any]:
+        return self.data[self.columns.index(name)]
+
+
+def pack_records(records: Sequence[Dict[str, Any]], columns: Sequence[str]) -> Batch:
+    """Список dict -> Batch (отсутствующие поля - None)"""
+    return Batch(tuple(columns), tuple([record.get(name) for record in records] for name in columns))
+
+
+def unpack_batch(batch: Batch) -> List[Dict[str, Any]]:
+    """Batch -> список dict"""
+    return [dict(zip(batch.columns, row)) for row in zip(*batch.data)]
+
+
+def pack_ids(ids: Iterable[int]) -> array:
+    """Множество ID -> отсортированный array('q')"""
+    return array('q', sorted(ids))
+
+
+def _rows(batch: Batch, columns: Sequence[str]) -> Iterable[Tuple[Any, ...]]:
+    return zip(*(batch.column(name) for name in columns))
+
+
+def _from_rows(columns: Sequence[str], rows: List[Tuple[Any, ...]]) -> Batch:
+    if not rows:
+        return Batch(tuple(columns), tuple([] for _ in columns))
+    return Batch(tuple(columns), tuple(list(values) for values in zip(*rows)))
+
+
+def normalize_members(batch: Batch) -> Batch:
+    """
+    Участники (PARTICIPANT_COLUMNS) -> записи members.json (MEMBER_COLUMNS)
+
+    Дубли по id отбрасываются (остается первый), записи - по возрастанию user_id.
+    """
+    members: Dict[int, Tuple[Any, ...]] = {}
+    for user_id, username, first_name, last_name, is_premium, is_verified in _rows(batch, PARTICIPANT_COLUMNS):
+        if user_id not in members:
+            members[user_id] = (user_id, username, first_name, last_name,
+                                bool(is_premium), bool(is_verified))
+    return _from_rows(MEMBER_COLUMNS, [members[user_id] for user_id in sorted(members)])
+
+
+def split_by_reference(batch: Batch, reference_ids: array) -> Tuple[Batch, Batch]:
+    """
+    Участники (PARTICIPANT_COLUMNS) -> (уже в референсной группе, новые)
+
+    Оба Batch - в колонках MEMBER_INFO_COLUMNS, порядок участников сохраняется.
+    """
+    reference = set(reference_ids)
+    existing, new = [], []
+    for row in _rows(batch, MEMBER_INFO_COLUMNS):
+        row = row[:4] + (bool(row[4]),)
+        (existing if row[0] in reference else new).append(row)
+    return _from_rows(MEMBER_INFO_COLUMNS, existing), _from_rows(MEMBER_INFO_COLUMNS, new)
+
+
+class ProcessStage:
+    """Преобразования батчей в пуле процессов"""
+
+    def __init__(self, workers: Optional[int] = None, inline_below: int = DEFAULT_INLINE_BELOW):
+        """
+        Args:
+            workers: Процессов в пуле (None - число ядер, 0 - без пула)
+            inline_below: Батчи меньше этого выполняются в текущем процессе
+        """
+        self.workers = (os.cpu_count() or 1) if workers is None else max(0, workers)
+        self.inline_below = inline_below
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Семафоры по event loop: этап - глобальный, а asyncio.run в тестах и
+        # скриптах каждый раз создает новый loop
+        self._slots: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self.stats = {'inline': 0, 'pooled': 0, 'records': 0}
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        """Семафор текущего event loop (создается при первом вызове в нем)"""
+        loop = asyncio.get_running_loop()
+        slots = self._slots.get(loop)
+        if slots is None:
+            # Не больше двух батчей на процесс в работе: остальные ждут здесь, а не в памяти пула
+            slots = self._slots[loop] = asyncio.Semaphore(max(1, self.workers * 2))
+        return slots
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: у процесса есть потоки (запись, сессия), fork их не копирует корректно
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            logger.info(f"Пул обработки запущен: {self.workers} процессов")
+        return self._pool
+
+    async def run(self, func: Callable, batch: Batch, *args) -> Any:
+        """
+        Выполнить func(batch, *args) - в пуле или сразу, если батч маленький
+
+        func и аргументы должны сериализоваться pickle (функция уровня модуля).
+        """
+        self.stats['records'] += len(batch)
+        if not self.workers or len(batch) < self.inline_below:
+            self.stats['inline'] += 1
+            return func(batch, *args)
+        async with self._get_slots():
+            self.stats['pooled'] += 1
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_pool(), func, batch, *args)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats, workers=self.workers, inline_below=self.inline_below,
+                    running=self._pool is not None)
+
+
+# Глобальный этап обработки
+_process_stage: Optional[ProcessStage] = None
+
+def get_process_stage() -> ProcessStage:
+    """Получить глобальный этап обработки в пуле процессов (Singleton pattern)"""
+    global _process_stage
+    if _process_stage is None:
+        workers = os.getenv("PIPELINE_WORKERS")
+        _process_stage = ProcessStage(
+            int(workers) if workers else None,
+            int(os.getenv("PIPELINE_INLINE_BELOW", str(DEFAULT_INLINE_BELOW)))
+        )
+        atexit.register(_process_stage.close)
+    return _process_stage
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Планировщик экспорта: оценка стоимости без выгрузки участников
+
+Для каждой группы по дешевым метаданным (participants_count из
+get_group_info или сохраненный ростер) оцениваются:
+- RPC: вызовы get_group_info + один проход iter_participants (столько
+  токенов списывает RateLimiter: проход идет одним safe_call)
+- страницы: запросы Telegram по PARTICIPANTS_PAGE_SIZE участников за проход
+- время: страницы x историческая задержка страницы + вызовы get_group_info
+- память: участники и связи в буферах ExternalAggregator
+
+История задержек берется из:
+- participants_page_seconds (по замеру на страницу) / rpc_duration_seconds в
+  metrics.prom последних экспортов (export_3_jsons пишет их в каждый каталог)
+- файлов трассировки (спаны iter_participants с числом участников)
+- текущего реестра метрик процесса
+
+План: конкуренция ceil(rps x задержка страницы) (закон Литтла - столько
+проходов должно быть в полете, чтобы страницы шли со скоростью лимитера, но не
+быстрее: сам проход списывает один токен), порядок групп и группы, не
+укладывающиеся в бюджет времени. Время - по истории задержек страниц, лимитер
+ограничивает только число вызовов. Если все укладывается - сначала самые
+долгие группы (LPT, меньше общее время при параллельной выгрузке); если
+нет - сначала короткие (больше групп успеет выгрузиться).
+"""
+
+import json
+import logging
+import math
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.core.export_delta import list_export_dirs
+from src.core.external_dedup import EDGE_RECORD_BYTES, MEMBER_RECORD_BYTES
+from src.core.group_manager import PARTICIPANTS_PAGE_SIZE, GroupManager
+from src.core.roster_store import RosterStore
+from src.infra.limiter import RateLimiter
+from src.infra.metrics import METRIC_PREFIX, MetricsRegistry
+from src.infra.tracing import load_spans
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXPORT_ROOT = "data/export"
+
+# Вызовы get_group_info на группу: get_entity + GetFullChannel (худший случай)
+INFO_CALLS = 2
+INFO_METHODS = ('get_entity', 'get_full_info')
+
+# Токенов лимитера на проход iter_participants (весь проход - один safe_call)
+WALK_CALLS = 1
+
+# Задержки без истории
+DEFAULT_PAGE_LATENCY_S = 0.5
+DEFAULT_CALL_LATENCY_S = 0.2
+
+# Сколько последних экспортов читать для истории
+HISTORY_EXPORTS = 5
+
+MAX_CONCURRENCY = 8
+
+_PROM_LINE = re.compile(r'^(\w+?)_(sum|count)(\{[^}]*\})?\s+(\S+)$')
+_METHOD_LABEL = re.compile(r'method="([^"]*)"')
+
+
+class LatencyHistory:
+    """Накопитель сумм задержек: страницы участников и вызовы get_group_info"""
+
+    def __init__(self):
+        self.page_sum = 0.0
+        self.page_count = 0
+        self.call_sum = 0.0
+        self.call_count = 0
+        self.sources: List[str] = []
+
+    def add_pages(self, seconds: float, count: int):
+        self.page_sum += seconds
+        self.page_count += count
+
+    def add_calls(self, seconds: float, count: int):
+        self.call_sum += seconds
+        self.call_count += count
+
+    @property
+    def page_latency_s(self) -> float:
+        return self.page_sum / self.page_count if self.page_count else DEFAULT_PAGE_LATENCY_S
+
+    @property
+    def call_latency_s(self) -> float:
+        return self.call_sum / self.call_count if self.call_count else DEFAULT_CALL_LATENCY_S
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'page_latency_s': round(self.page_latency_s, 4),
+            'call_latency_s': round(self.call_latency_s, 4),
+            'page_samples': self.page_count,
+            'call_samples': self.call_count,
+            'sources': self.sources,
+        }
+
+
+def read_prometheus_sums(path: str) -> Dict[Tuple[str, Optional[str]], List[float]]:
+    """
+    Суммы и количества гистограмм из файла Prometheus
+
+    Returns:
+        {(имя без префикса, method или None): [sum, count]}
+    """
+    result: Dict[Tuple[str, Optional[str]], List[float]] = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            match = _PROM_LINE.match(line.strip())
+            if not match or not match.group(1).startswith(METRIC_PREFIX):
+                continue
+            name, field, labels, value = match.groups()
+            method = _METHOD_LABEL.search(labels or '')
+            entry = result.setdefault((name[len(METRIC_PREFIX):], method.group(1) if method else None), [0.0, 0.0])
+            entry[0 if field == 'sum' else 1] += float(value)
+    return result
+
+
+def _add_prometheus(history: LatencyHistory, sums: Dict[Tuple[str, Optional[str]], List[float]]):
+    for (name, method), (total, count) in sums.items():
+        if name == 'participants_page_seconds':
+            history.add_pages(total, int(count))
+        elif name == 'rpc_duration_seconds' and method in INFO_METHODS:
+            history.add_calls(total, int(count))
+
+
+def load_latency_history(export_root: str = DEFAULT_EXPORT_ROOT,
+                         trace_files: Iterable[str] = (),
+                         registry: Optional[MetricsRegistry] = None) -> LatencyHistory:
+    """
+    История задержек из метрик прошлых экспортов, трассировок и текущего процесса
+
+    Args:
+        export_root: Каталог экспортов (metrics.prom последних HISTORY_EXPORTS)
+        trace_files: Файлы трассировки (JSONL)
+        registry: Реестр метрик текущего процесса
+    """
+    history = LatencyHistory()
+
+    for export_dir in list_export_dirs(export_root)[-HISTORY_EXPORTS:]:
+        prom_file = export_dir / "metrics.prom"
+        if prom_file.exists():
+            _add_prometheus(history, read_prometheus_sums(str(prom_file)))
+            history.sources.append(str(prom_file))
+
+    for trace_file in trace_files:
+        for s in load_spans(trace_file):
+            args = s.get('args') or {}
+            if s.get('name') == 'iter_participants' and 'users' in args:
+                history.add_pages(s['dur'] / 1e6, max(1, math.ceil(args['users'] / PARTICIPANTS_PAGE_SIZE)))
+            elif s.get('cat') == 'rpc' and s.get('name') in INFO_METHODS:
+                history.add_calls(s['dur'] / 1e6, 1)
+        history.sources.append(trace_file)
+
+    if registry is not None:
+        pages = registry.get_histogram('participants_page_seconds')
+        if pages is not None and pages.count:
+            history.add_pages(pages.sum, pages.count)
+            history.sources.append('process')
+        for method in INFO_METHODS:
+            calls = registry.get_histogram('rpc_duration_seconds', method=method)
+            if calls is not None:
+                history.add_calls(calls.sum, calls.count)
+
+    return history
+
+
+def estimate_group(group_id: int, participants_count: Optional[int], history: LatencyHistory,
+                   title: Optional[str] = None, source: str = 'telegram') -> Dict[str, Any]:
+    """Оценка выгрузки одной группы"""
+    count = participants_count or 0
+    pages = max(1, math.ceil(count / PARTICIPANTS_PAGE_SIZE))
+    return {
+        'group_id': group_id,
+        'title': title or str(group_id),
+        'participants_count': participants_count,
+        'count_source': source,
+        'pages': pages,
+        'rpcs': INFO_CALLS + WALK_CALLS,
+        'latency_s': pages * history.page_latency_s + INFO_CALLS * history.call_latency_s,
+        'memory_bytes': count * (MEMBER_RECORD_BYTES + EDGE_RECORD_BYTES),
+    }
+
+
+async def collect_estimates(manager: GroupManager, group_ids: Iterable[int], history: LatencyHistory,
+                            store: Optional[RosterStore] = None,
+                            use_roster: bool = False) -> List[Dict[str, Any]]:
+    """
+    Оценки групп по метаданным (участники не выгружаются)
+
+    Args:
+        use_roster: Брать число участников из сохраненных ростеров без запросов
+    """
+    estimates = []
+    for group_id in dict.fromkeys(group_ids):
+        roster = store.load(group_id) if store is not None and store.has(group_id) else None
+        roster_count = None
+        if roster is not None:
+            roster_count = roster.expected_count if roster.expected_count is not None else len(roster.members)
+
+        if use_roster and roster_count is not None:
+            estimates.append(estimate_group(group_id, roster_count, history, source='roster'))
+            continue
+
+        info = await manager.get_group_info(group_id)
+        count = info.get('participants_count') if info else None
+        title = info.get('title') if info else None
+        if count:
+            estimates.append(estimate_group(group_id, count, history, title, source='telegram'))
+        elif roster_count is not None:
+            estimates.append(estimate_group(group_id, roster_count, history, title, source='roster'))
+        else:
+            estimates.append(estimate_group(group_id, None, history, title, source='unknown'))
+    return estimates
+
+
+def suggest_concurrency(rps: float, latency_s: float, max_concurrency: int = MAX_CONCURRENCY) -> int:
+    """Сколько выгрузок держать в полете, чтобы не простаивали токены: ceil(rps x latency)"""
+    return max(1, min(max_concurrency, math.ceil(rps * latency_s)))
+
+
+def build_plan(estimates: List[Dict[str, Any]], limiter: RateLimiter, history: LatencyHistory,
+               budget_minutes: Optional[float] = None, memory_budget_mb: Optional[float] = None,
+               max_concurrency: int = MAX_CONCURRENCY) -> Dict[str, Any]:
+    """
+    План выполнения: конкуренция, порядок групп, время, память, квоты
+
+    Время группы - по истории задержек (страницы и get_group_info), группы идут
+    параллельно по concurrency. Лимитер ограничивает вызовы: скорость из
+    текущего состояния (refill_rate после AIMD), первые capacity вызовов идут
+    без ожидания за счет запаса токенов.
+    """
+    rps = limiter.bucket.refill_rate
+    total_rpcs = sum(e['rpcs'] for e in estimates)
+    total_pages = sum(e['pages'] for e in estimates)
+    total_latency = sum(e['latency_s'] for e in estimates)
+
+    # Внутри группы страницы идут последовательно - параллельны только группы
+    concurrency = min(suggest_concurrency(rps, history.page_latency_s, max_concurrency), max(1, len(estimates)))
+    burst = min(total_rpcs, limiter.bucket.capacity)
+
+    def seconds_for(rpcs: float, latency: float) -> float:
+        """Время по задержкам групп и по скорости выдачи токенов - что дольше"""
+        tokens_s = max(0, rpcs - burst) / rps if rps > 0 else float('inf')
+        return max(latency / concurrency, tokens_s)
+
+    total_seconds = max(seconds_for(total_rpcs, total_latency),
+                        max((e['latency_s'] for e in estimates), default=0.0))
+    budget_seconds = budget_minutes * 60 if budget_minutes else None
+    fits = budget_seconds is None or total_seconds <= budget_seconds
+
+    # LPT если все укладывается, иначе сначала короткие группы
+    ordered = sorted(estimates, key=lambda e: e['latency_s'], reverse=fits)
+    scheduled, deferred = [], []
+    elapsed_rpcs, elapsed_latency = 0, 0.0
+    for e in ordered:
+        finish = max(seconds_for(elapsed_rpcs + e['rpcs'], elapsed_latency + e['latency_s']), e['latency_s'])
+        if budget_seconds is not None and finish > budget_seconds:
+            deferred.append(e)
+            continue
+        elapsed_rpcs += e['rpcs']
+        elapsed_latency += e['latency_s']
+        e['eta_s'] = round(finish, 1)
+        scheduled.append(e)
+
+    memory_mb = sum(e['memory_bytes'] for e in estimates) / 1024 / 1024
+    stats = limiter.get_stats()
+    warnings = []
+    unknown = [e['group_id'] for e in estimates if e['count_source'] == 'unknown']
+    if unknown:
+        warnings.append(f"нет participants_count для {len(unknown)} групп - оценка занижена")
+    if rps < limiter.rps:
+        warnings.append(f"скорость снижена после FLOOD_WAIT: {rps:.2f} из {limiter.rps} RPS")
+    if stats['flood_waits_last_hour']:
+        warnings.append(f"FLOOD_WAIT за последний час: {stats['flood_waits_last_hour']}")
+    if not history.page_count:
+        warnings.append("нет истории задержек - используются значения по умолчанию")
+    if memory_budget_mb is not None and memory_mb > memory_budget_mb:
+        warnings.append(f"память {memory_mb:.0f} MB больше бюджета {memory_budget_mb:.0f} MB - "
+                        f"будет выгрузка на диск")
+
+    return {
+        'rps': round(rps, 3),
+        'concurrency': concurrency,
+        'total_rpcs': total_rpcs,
+        'total_pages': total_pages,
+        'burst_tokens': burst,
+        'total_seconds': round(total_seconds, 1),
+        'budget_seconds': budget_seconds,
+        'memory_mb': round(memory_mb, 1),
+        'memory_budget_mb': memory_budget_mb,
+        'api_calls_today': stats['api_calls'],
+        'api_calls_after': stats['api_calls'] + total_rpcs,
+        'order': [e['group_id'] for e in scheduled],
+        'groups': scheduled,
+        'deferred': deferred,
+        'history': history.to_dict(),
+        'warnings': warnings,
+    }
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}ч {minutes:02d}м" if hours else f"{minutes}м {seconds:02d}с"
+
+
+def format_plan(plan: Dict[str, Any]) -> str:
+    """Текстовый план для консоли"""
+    history = plan['history']
+    lines = [
+        f"🧮 План выгрузки: {len(plan['groups'])} групп, {plan['total_rpcs']} RPC "
+        f"({plan['total_pages']} страниц участников), ~{_format_duration(plan['total_seconds'])}",
+        f"⚙️ Скорость {plan['rps']} RPS, конкуренция {plan['concurrency']}",
+        f"⏱️ Задержка страницы {history['page_latency_s']:.3f}s ({history['page_samples']} замеров), "
+        f"вызова {history['call_latency_s']:.3f}s",
+        f"💾 Память (без дедупликации): ~{plan['memory_mb']:.1f} MB",
+        f"📈 API вызовов сегодня: {plan['api_calls_today']} → ~{plan['api_calls_after']}",
+        "",
+        f"{'#':>3} {'Группа':<32} {'Участн.':>8} {'Стр.':>6} {'RPC':>4} {'Готово к':>10}",
+    ]
+    for i, e in enumerate(plan['groups'], 1):
+        count = e['participants_count'] if e['participants_count'] is not None else '?'
+        lines.append(f"{i:>3} {str(e['title'])[:32]:<32} {count:>8} {e['pages']:>6} {e['rpcs']:>4} "
+                     f"{_format_duration(e['eta_s']):>10}")
+    if plan['deferred']:
+        lines.append("")
+        lines.append(f"⏭️ Не укладываются в бюджет {_format_duration(plan['budget_seconds'])}: "
+                     + ', '.join(str(e['title']) for e in plan['deferred']))
+    for warning in plan['warnings']:
+        lines.append(f"⚠️ {warning}")
+    return '\n'.join(lines)
+
+
+def save_plan(plan: Dict[str, Any], path: str):
+    """Сохраняет план в JSON"""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(plan, f, ensure_ascii=False, indent=2)
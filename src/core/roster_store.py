@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Локальное хранилище ростеров групп
+
+Ростер группы - это последний известный список участников, который
+поддерживается в актуальном состоянии без полных выгрузок (события
+join/leave, периодическая сверка). Один JSON файл на группу:
+data/rosters/<group_id>.json
+"""
+
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from src.core.group_manager import PARTICIPANTS_LISTING_CAP
+
+logger = logging.getLogger(__name__)
+
+
+class Roster:
+    """Ростер одной группы"""
+
+    def __init__(self, group_id: int, members: Optional[Dict[int, Dict[str, Any]]] = None,
+                 expected_count: Optional[int] = None, synced_at: Optional[str] = None,
+                 updated_at: Optional[str] = None, capped: bool = False):
+        """
+        Args:
+            group_id: ID группы
+            members: Участники по user_id (без ботов, как в get_participants)
+            expected_count: Ожидаемый participants_count по данным Telegram
+                (последняя сверка + примененные события, включая ботов)
+            synced_at: Время последней полной сверки (ISO)
+            updated_at: Время последнего изменения (ISO)
+            capped: Группа больше PARTICIPANTS_LISTING_CAP - Telegram отдает
+                списком не всех, ростер заведомо неполный
+        """
+        self.group_id = group_id
+        self.members: Dict[int, Dict[str, Any]] = members or {}
+        self.expected_count = expected_count
+        self.synced_at = synced_at
+        self.updated_at = updated_at
+        self.capped = capped
+
+    def member_ids(self) -> Set[int]:
+        """Множество ID участников"""
+        return set(self.members)
+
+    def add(self, user_id: int, info: Optional[Dict[str, Any]] = None, is_bot: bool = False) -> bool:
+        """
+        Применяет вступление. Возвращает True если участник новый
+
+        Боты учитываются только в expected_count: participants_count их
+        включает, а полная выгрузка - нет.
+        """
+        is_new = user_id not in self.members
+        if is_new and self.expected_count is not None:
+            self.expected_count += 1
+        if not is_bot and (info is not None or is_new):
+            self.members[user_id] = info or {'id': user_id}
+        self._touch()
+        return is_new and not is_bot
+
+    def remove(self, user_id: int) -> bool:
+        """
+        Применяет выход. Возвращает True если участник был в ростере
+
+        expected_count уменьшается при любом выходе: в ростере большой группы
+        (capped) и без ботов есть не все участники, которых считает Telegram.
+        """
+        existed = self.members.pop(user_id, None) is not None
+        if self.expected_count is not None:
+            self.expected_count = max(0, self.expected_count - 1)
+        self._touch()
+        return existed
+
+    def replace(self, participants: Iterable[Dict[str, Any]], participants_count: Optional[int]) -> Dict[str, int]:
+        """
+        Заменяет ростер результатом полной выгрузки
+
+        Returns:
+            Словарь с количеством присоединившихся и ушедших
+        """
+        new_members = {p['id']: p for p in participants}
+        joined = len(new_members.keys() - self.members.keys())
+        left = len(self.members.keys() - new_members.keys())
+        self.members = new_members
+        self.expected_count = participants_count
+        self.capped = bool(participants_count and participants_count > PARTICIPANTS_LISTING_CAP)
+        self.synced_at = datetime.now().isoformat()
+        self._touch()
+        return {'joined': joined, 'left': left}
+
+    def _touch(self):
+        self.updated_at = datetime.now().isoformat()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'group_id': self.group_id,
+            'expected_count': self.expected_count,
+            'synced_at': self.synced_at,
+            'updated_at': self.updated_at,
+            'capped': self.capped,
+            'members': [self.members[user_id] for user_id in sorted(self.members)]
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Roster':
+        return cls(
+            group_id=int(data['group_id']),
+            members={int(m['id']): m for m in data.get('members', [])},
+            expected_count=data.get('expected_count'),
+            synced_at=data.get('synced_at'),
+            updated_at=data.get('updated_at'),
+            capped=data.get('capped', False)
+        )
+
+
+class RosterStore:
+    """Файловое хранилище ростеров (по JSON файлу на группу)"""
+
+    def __init__(self, data_dir: str = "data/rosters"):
+        self.data_dir = Path(data_dir)
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self._cache: Dict[int, Roster] = {}
+
+    def _path(self, group_id: int) -> Path:
+        return self.data_dir / f"{group_id}.json"
+
+    def has(self, group_id: int) -> bool:
+        """Есть ли сохраненный ростер группы"""
+        return group_id in self._cache or self._path(group_id).exists()
+
+    def load(self, group_id: int) -> Roster:
+        """Загружает ростер группы (пустой, если ростера еще нет)"""
+        if group_id in self._cache:
+            return self._cache[group_id]
+
+        roster = Roster(group_id)
+        path = self._path(group_id)
+        if path.exists():
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    roster = Roster.from_dict(json.load(f))
+            except Exception as e:
+                logger.warning(f"Не удалось прочитать ростер {path}: {e}, начинаем с пустого")
+
+        self._cache[group_id] = roster
+        return roster
+
+    def save(self, roster: Roster):
+        """Сохраняет ростер атомарно (через временный файл)"""
+        self._cache[roster.group_id] = roster
+        path = self._path(roster.group_id)
+        tmp_path = path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(roster.to_dict(), f, ensure_ascii=False)
+        tmp_path.replace(path)
+
+    def group_ids(self) -> List[int]:
+        """ID всех групп, для которых есть ростер"""
+        ids = set(self._cache)
+        for path in self.data_dir.glob('*.json'):
+            try:
+                ids.add(int(path.stem))
+            except ValueError:
+                continue
+        return sorted(ids)
@@ -7,7 +7,7 @@ S16 Project Configuration Manager
 """
 
 import os
-from typing import Optional
+from typing import List, Optional
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения
@@ -28,12 +28,25 @@ class S16Config:
         self.enable_cross_check: bool = self._get_bool('S16_ENABLE_CROSS_CHECK', True)
         self.mark_existing_members: bool = self._get_bool('S16_MARK_EXISTING_MEMBERS', True)
         self.export_comparison: bool = self._get_bool('S16_EXPORT_COMPARISON', True)
+        
+        # Группы, состав которых отслеживается по событиям (через запятую)
+        self.tracked_group_ids: List[int] = self._get_int_list(
+            'S16_TRACKED_GROUP_IDS', [self.space_group_id]
+        )
     
     def _get_bool(self, env_var: str, default: bool = False) -> bool:
         """Безопасное получение boolean значения из переменной окружения"""
         value = os.getenv(env_var, str(default)).lower()
         return value in ('true', '1', 'yes', 'on')
     
+    def _get_int_list(self, env_var: str, default: List[int]) -> List[int]:
+        """Безопасное получение списка int из переменной окружения (через запятую)"""
+        value = os.getenv(env_var, '')
+        items = [item.strip() for item in value.split(',') if item.strip()]
+        if not items:
+            return list(default)
+        return [int(item) for item in items]
+    
     def get_space_group_id(self) -> int:
         """Возвращает ID основной группы s16 space"""
         return self.space_group_id
@@ -54,13 +67,18 @@ class S16Config:
         """Проверяет нужно ли экспортировать результаты сравнения"""
         return self.export_comparison
     
+    def get_tracked_group_ids(self) -> List[int]:
+        """Возвращает ID групп для отслеживания состава по событиям"""
+        return list(self.tracked_group_ids)
+    
     def __str__(self) -> str:
         """Строковое представление конфигурации"""
         return f"""S16 Configuration:
 - Space Group: {self.space_group_name} (ID: {self.space_group_id})
 - Cross Check: {self.enable_cross_check}
 - Mark Existing: {self.mark_existing_members}
-- Export Comparison: {self.export_comparison}"""
+- Export Comparison: {self.export_comparison}
+- Tracked Groups: {len(self.tracked_group_ids)}"""
 
 
 # Глобальный экземпляр конфигурации
@@ -0,0 +1,119 @@
+"""
+Потоковое сжатие файлов экспорта
+================================
+
+Основные компоненты:
+- open_text: Открыть текстовый файл с прозрачным сжатием/распаковкой
+- detect_codec: Кодек по расширению (.gz - gzip, .zst - zstd)
+- with_codec_suffix / find_existing: Работа с именами сжатых файлов
+
+Кодеки:
+- gzip: всегда доступен (стандартная библиотека)
+- zstd: если установлен пакет zstandard (pip install zstandard)
+
+Чтение и запись идут потоком - файл целиком в память не загружается.
+"""
+
+import gzip
+from pathlib import Path
+from typing import IO, List, Optional, Union
+
+PathLike = Union[str, Path]
+
+# Кодек -> расширение файла
+CODEC_SUFFIXES = {
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+
+# Уровни сжатия по умолчанию: экспорт пишется один раз, читается много
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Для сжатия zstd установите zstandard: pip install zstandard") from None
+    return zstandard
+
+
+def available_codecs() -> List[str]:
+    """Кодеки, доступные в текущем окружении"""
+    codecs = ["gzip"]
+    try:
+        _import_zstandard()
+        codecs.append("zstd")
+    except ImportError:
+        pass
+    return codecs
+
+
+def detect_codec(path: PathLike) -> Optional[str]:
+    """Кодек по расширению файла (None - без сжатия)"""
+    name = str(path)
+    for codec, suffix in CODEC_SUFFIXES.items():
+        if name.endswith(suffix):
+            return codec
+    return None
+
+
+def strip_codec_suffix(path: PathLike) -> str:
+    """Имя файла без расширения кодека (data.csv.gz -> data.csv)"""
+    name = str(path)
+    codec = detect_codec(name)
+    return name[:-len(CODEC_SUFFIXES[codec])] if codec else name
+
+
+def with_codec_suffix(path: PathLike, codec: Optional[str]) -> str:
+    """Добавляет расширение кодека, если его еще нет"""
+    name = str(path)
+    if not codec or detect_codec(name) == codec:
+        return name
+    if codec not in CODEC_SUFFIXES:
+        raise ValueError(f"Неизвестный кодек: {codec} (доступны: {', '.join(CODEC_SUFFIXES)})")
+    return name + CODEC_SUFFIXES[codec]
+
+
+def find_existing(path: PathLike) -> Optional[Path]:
+    """Файл как есть или его сжатый вариант (.gz, .zst), если он существует"""
+    base = Path(path)
+    if base.exists():
+        return base
+    for suffix in CODEC_SUFFIXES.values():
+        candidate = base.with_name(base.name + suffix)
+        if candidate.exists():
+            return candidate
+    return None
+
+
+def open_text(path: PathLike, mode: str = "r", codec: Optional[str] = None,
+              newline: Optional[str] = None) -> IO[str]:
+    """
+    Открывает текстовый файл (UTF-8) с потоковым сжатием
+
+    Args:
+        path: Путь к файлу
+        mode: 'r', 'w' или 'a'
+        codec: gzip / zstd / None (по умолчанию - по расширению файла)
+        newline: Как в open() (для csv - '')
+    """
+    if mode not in ("r", "w", "a"):
+        raise ValueError(f"Неподдерживаемый режим: {mode}")
+    codec = codec or detect_codec(path)
+
+    if codec is None:
+        return open(path, mode, encoding="utf-8", newline=newline)
+
+    if codec == "gzip":
+        return gzip.open(path, mode + "t", compresslevel=GZIP_LEVEL, encoding="utf-8", newline=newline)
+
+    if codec == "zstd":
+        zstandard = _import_zstandard()
+        if mode == "r":
+            return zstandard.open(path, "rt", encoding="utf-8", newline=newline)
+        cctx = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        return zstandard.open(path, mode + "t", cctx=cctx, encoding="utf-8", newline=newline)
+
+    raise ValueError(f"Неизвестный кодек: {codec} (доступны: {', '.join(CODEC_SUFFIXES)})")
@@ -0,0 +1,297 @@
+"""
+Демон клиента: один подключенный TelegramClient для всех вызовов CLI
+=====================================================================
+
+Каждый запуск cli.py подключается, авторизуется и отключается заново, а
+RateLimiter каждый раз собирается с нуля. Демон (python src/cli.py daemon)
+держит подключенный клиент, кэш сущностей Telethon и RateLimiter и отдает
+операции GroupManager через локальный Unix сокет. cli.py сам использует
+демон, если он запущен (--no-daemon - подключиться напрямую).
+
+Протокол: NDJSON, одна строка - одно сообщение
+    запрос:  {"id": 1, "method": "get_participants", "args": [...], "kwargs": {...}}
+    ответ:   {"id": 1, "ok": true, "result": ...}
+             {"id": 1, "ok": false, "error": "...", "type": "ValueError"}
+
+datetime передается как {"__datetime__": "ISO"}. Доступны только методы из
+DAEMON_METHODS. Сокет создается с правами 600 - через него доступна сессия
+аккаунта.
+
+Путь сокета: data/daemon/s16.sock или переменная окружения DAEMON_SOCKET.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .limiter import get_rate_limiter, get_single_flight
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = "data/daemon/s16.sock"
+
+# Методы GroupManager, доступные через демон
+DAEMON_METHODS = frozenset({
+    'get_group_info',
+    'get_participants',
+    'find_participants',
+    'check_membership',
+    'search_participants',
+    'harvest_participants',
+    'export_participants_to_csv',
+    'get_group_creation_date',
+    'get_message_page',
+})
+
+# Ответ с полным списком участников - одна большая строка
+MAX_MESSAGE_BYTES = 512 * 1024 * 1024
+
+CONNECT_TIMEOUT = 1.0
+
+
+class DaemonError(Exception):
+    """Ошибка, возникшая в демоне при выполнении вызова"""
+
+    def __init__(self, message: str, error_type: str = "Exception"):
+        super().__init__(message)
+        self.error_type = error_type
+
+
+def get_socket_path() -> str:
+    """Путь сокета демона из DAEMON_SOCKET"""
+    return os.getenv("DAEMON_SOCKET", DEFAULT_SOCKET_PATH)
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1 and '__datetime__' in obj:
+        return datetime.fromisoformat(obj['__datetime__'])
+    return obj
+
+
+def dumps(message: Dict[str, Any]) -> bytes:
+    return json.dumps(message, ensure_ascii=False, default=_encode).encode('utf-8') + b'\n'
+
+
+def loads(line: bytes) -> Dict[str, Any]:
+    return json.loads(line, object_hook=_decode)
+
+
+class DaemonServer:
+    """Сервер операций GroupManager на Unix сокете"""
+
+    def __init__(self, manager: Any, socket_path: Optional[str] = None):
+        """
+        Args:
+            manager: GroupManager с подключенным клиентом
+            socket_path: Путь сокета (None - get_socket_path())
+        """
+        self.manager = manager
+        self.socket_path = Path(socket_path or get_socket_path())
+        self.started_at = time.time()
+        self.requests = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        """Открывает сокет (старый файл сокета от упавшего демона удаляется)"""
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.socket_path.exists():
+            if await is_daemon_running(str(self.socket_path)):
+                raise RuntimeError(f"Daemon is already running on {self.socket_path}")
+            self.socket_path.unlink()
+
+        old_umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(
+                self._handle_connection, path=str(self.socket_path), limit=MAX_MESSAGE_BYTES
+            )
+        finally:
+            os.umask(old_umask)
+        logger.info(f"[SAFE] Daemon listening on {self.socket_path}")
+
+    async def serve_forever(self):
+        """Работает до отмены (Ctrl+C)"""
+        if self._server is None:
+            await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+
+    def status(self) -> Dict[str, Any]:
+        """Состояние демона (метод ping)"""
+        return {
+            'pid': os.getpid(),
+            'uptime_s': round(time.time() - self.started_at, 1),
+            'requests': self.requests,
+            'rate_limiter': get_rate_limiter().get_stats(),
+            'coalescing': get_single_flight().get_stats(),
+        }
+
+    async def dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Выполняет один запрос"""
+        self.requests += 1
+        method = request.get('method')
+        try:
+            if method == 'ping':
+                result = self.status()
+            elif method in DAEMON_METHODS:
+                result = await getattr(self.manager, method)(*request.get('args', []), **request.get('kwargs', {}))
+            else:
+                raise ValueError(f"Method '{method}' is not available via daemon")
+            return {'id': request.get('id'), 'ok': True, 'result': result}
+        except Exception as e:
+            logger.error(f"[SAFE] Daemon call {method} failed: {e}")
+            return {'id': request.get('id'), 'ok': False, 'error': str(e), 'type': type(e).__name__}
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = loads(line)
+                except json.JSONDecodeError as e:
+                    response = {'id': None, 'ok': False, 'error': f"bad request: {e}", 'type': 'ValueError'}
+                else:
+                    response = await self.dispatch(request)
+                writer.write(dumps(response))
+                await writer.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+
+
+class RemoteGroupManager:
+    """
+    Прокси GroupManager: те же async методы, выполнение в демоне
+
+    Запросы одного прокси идут последовательно по одному соединению.
+    """
+
+    def __init__(self, socket_path: Optional[str] = None):
+        self.socket_path = socket_path or get_socket_path()
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._ids = itertools.count(1)
+        self._lock = asyncio.Lock()
+
+    async def connect(self, timeout: float = CONNECT_TIMEOUT):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_unix_connection(self.socket_path, limit=MAX_MESSAGE_BYTES), timeout
+        )
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except (ConnectionResetError, BrokenPipeError):
+                pass
+            self._writer = None
+            self._reader = None
+
+    async def call(self, method: str, *args, **kwargs) -> Any:
+        """Вызов метода в демоне (ошибка демона - DaemonError)"""
+        async with self._lock:
+            if self._writer is None:
+                await self.connect()
+            request_id = next(self._ids)
+            self._writer.write(dumps({'id': request_id, 'method': method, 'args': list(args), 'kwargs': kwargs}))
+            await self._writer.drain()
+            line = await self._reader.readline()
+        if not line:
+            await self.close()
+            raise ConnectionError("Daemon closed the connection")
+        response = loads(line)
+        if not response.get('ok'):
+            raise DaemonError(response.get('error', 'unknown error'), response.get('type', 'Exception'))
+        return response['result']
+
+    async def ping(self) -> Dict[str, Any]:
+        return await self.call('ping')
+
+    async def get_group_info(self, group_identifier):
+        return await self.call('get_group_info', group_identifier)
+
+    async def get_participants(self, group_identifier, limit=100, filter=None, query=''):
+        if filter is None:
+            return await self.call('get_participants', group_identifier, limit=limit)
+        return await self.call('get_participants', group_identifier, limit=limit, filter=filter, query=query)
+
+    async def find_participants(self, group_identifier, role=None, query='', contacts_only=False, limit=None):
+        return await self.call('find_participants', group_identifier, role=role, query=query,
+                               contacts_only=contacts_only, limit=limit)
+
+    async def check_membership(self, group_identifier, user_ids, strategy='auto', concurrency=4):
+        return await self.call('check_membership', group_identifier, list(user_ids),
+                               strategy=strategy, concurrency=concurrency)
+
+    async def search_participants(self, group_identifier, query, limit=50):
+        return await self.call('search_participants', group_identifier, query, limit=limit)
+
+    async def harvest_participants(self, group_identifier, concurrency=3, saturation=10000, max_depth=3):
+        return await self.call('harvest_participants', group_identifier, concurrency=concurrency,
+                               saturation=saturation, max_depth=max_depth)
+
+    async def export_participants_to_csv(self, group_identifier, filename, limit=1000):
+        # Файл пишет демон - путь должен не зависеть от его рабочего каталога
+        return await self.call('export_participants_to_csv', group_identifier,
+                               str(Path(filename).resolve()), limit=limit)
+
+    async def get_group_creation_date(self, group_identifier):
+        return await self.call('get_group_creation_date', group_identifier)
+
+    async def get_message_page(self, group_id, offset_id=0, min_id=0, reverse=False, limit=100):
+        return await self.call('get_message_page', group_id, offset_id=offset_id, min_id=min_id,
+                               reverse=reverse, limit=limit)
+
+
+async def is_daemon_running(socket_path: Optional[str] = None) -> bool:
+    """Отвечает ли демон на ping"""
+    remote = await connect_daemon(socket_path)
+    if remote is None:
+        return False
+    await remote.close()
+    return True
+
+
+async def connect_daemon(socket_path: Optional[str] = None) -> Optional[RemoteGroupManager]:
+    """
+    Подключение к демону, если он запущен
+
+    Returns:
+        RemoteGroupManager или None (сокета нет или демон не отвечает)
+    """
+    path = socket_path or get_socket_path()
+    if not Path(path).exists():
+        return None
+    remote = RemoteGroupManager(path)
+    try:
+        await asyncio.wait_for(remote.ping(), CONNECT_TIMEOUT)
+    except (OSError, ConnectionError, asyncio.TimeoutError, DaemonError) as e:
+        logger.debug(f"[SAFE] Daemon at {path} is not available: {e}")
+        await remote.close()
+        return None
+    return remote
@@ -0,0 +1,273 @@
+"""
+Персистентная очередь задач на SQLite
+=====================================
+
+Длинные операции (экспорт, сверка, даты создания групп) ставятся в очередь
+командой submit и выполняются воркером (src/core/jobs.py) в одном процессе с
+одним RateLimiter - скрипты больше не конкурируют за аккаунт, а работа не
+теряется при падении терминала.
+
+Жизненный цикл задачи:
+    queued -> running -> done
+                      -> queued (ошибка, повтор через run_after) -> ... -> failed
+    queued/running -> cancelled (running - по флагу cancel_requested на чекпоинте)
+
+Чекпоинт (JSON) сохраняется обработчиком по ходу работы; после повтора или
+перезапуска воркера задача продолжается с него. Задачи running без heartbeat
+дольше stale_after секунд (воркер умер) возвращаются в очередь, а если попытки
+исчерпаны - становятся failed (задача, убивающая воркер, не повторяется вечно).
+
+Файл базы: data/jobs/jobs.db или переменная окружения JOB_QUEUE_DB.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINAL_STATUSES = (DONE, FAILED, CANCELLED)
+
+DEFAULT_MAX_ATTEMPTS = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_after REAL NOT NULL,
+    checkpoint TEXT,
+    result TEXT,
+    error TEXT,
+    worker TEXT,
+    heartbeat REAL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_pick ON jobs (status, run_after, priority);
+"""
+
+_JSON_FIELDS = ("params", "checkpoint", "result")
+
+
+class JobQueue:
+    """Очередь задач в файле SQLite (безопасна для нескольких процессов)"""
+
+    def __init__(self, db_path: str = "data/jobs/jobs.db"):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Автокоммит, транзакции - явно через BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(str(self.db_path), isolation_level=None, timeout=30.0)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def _row_to_job(self, row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        for field in _JSON_FIELDS:
+            job[field] = json.loads(job[field]) if job[field] is not None else None
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        return job
+
+    def submit(self, kind: str, params: Dict[str, Any], max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+               priority: int = 0) -> int:
+        """
+        Ставит задачу в очередь
+
+        Args:
+            kind: Тип задачи (обработчик в src/core/jobs.py)
+            params: Параметры обработчика (JSON)
+            max_attempts: Сколько раз пытаться выполнить
+            priority: Больше - раньше
+
+        Returns:
+            ID задачи
+        """
+        now = time.time()
+        cursor = self._conn.execute(
+            "INSERT INTO jobs (kind, params, status, priority, max_attempts, run_after, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (kind, json.dumps(params, ensure_ascii=False), QUEUED, priority, max(1, max_attempts), now, now, now)
+        )
+        logger.info(f"[SAFE] Job #{cursor.lastrowid} queued: {kind}")
+        return cursor.lastrowid
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Задача по ID (None если нет)"""
+        row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row)
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Последние задачи (новые первыми)"""
+        if status:
+            rows = self._conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?",
+                                      (status, limit)).fetchall()
+        else:
+            rows = self._conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """
+        Забирает следующую готовую задачу (атомарно между процессами)
+
+        Returns:
+            Задача со статусом running или None, если готовых нет
+        """
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute(
+                "SELECT id FROM jobs WHERE status = ? AND run_after <= ? AND attempts < max_attempts "
+                "ORDER BY priority DESC, run_after, id LIMIT 1",
+                (QUEUED, now)
+            ).fetchone()
+            if row is None:
+                self._conn.execute("COMMIT")
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, worker = ?, heartbeat = ?, updated_at = ? "
+                "WHERE id = ?",
+                (RUNNING, worker, now, now, row['id'])
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return self.get(row['id'])
+
+    def heartbeat(self, job_id: int):
+        """Отметка, что воркер жив"""
+        self._conn.execute("UPDATE jobs SET heartbeat = ? WHERE id = ?", (time.time(), job_id))
+
+    def save_checkpoint(self, job_id: int, checkpoint: Dict[str, Any]):
+        """Сохраняет прогресс задачи"""
+        now = time.time()
+        self._conn.execute(
+            "UPDATE jobs SET checkpoint = ?, heartbeat = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(checkpoint, ensure_ascii=False, default=str), now, now, job_id)
+        )
+
+    def complete(self, job_id: int, result: Optional[Dict[str, Any]] = None):
+        """Задача выполнена"""
+        self._conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = NULL, updated_at = ? WHERE id = ?",
+            (DONE, json.dumps(result, ensure_ascii=False, default=str), time.time(), job_id)
+        )
+        logger.info(f"[SAFE] Job #{job_id} done")
+
+    def fail(self, job_id: int, error: str, retry_delay: float = 0.0) -> str:
+        """
+        Ошибка задачи: повтор через retry_delay секунд или failed после max_attempts
+
+        Returns:
+            Новый статус (queued, failed или cancelled, если отмена уже запрошена)
+        """
+        job = self.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        now = time.time()
+        if job['cancel_requested']:
+            status = CANCELLED
+        elif job['attempts'] < job['max_attempts']:
+            status = QUEUED
+        else:
+            status = FAILED
+        self._conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, run_after = ?, worker = NULL, updated_at = ? WHERE id = ?",
+            (status, error, now + retry_delay, now, job_id)
+        )
+        logger.warning(f"[SAFE] Job #{job_id} attempt {job['attempts']}/{job['max_attempts']} failed: {error} "
+                       f"-> {status}")
+        return status
+
+    def cancel(self, job_id: int) -> Optional[str]:
+        """
+        Отмена задачи: queued - сразу, running - по флагу на ближайшем чекпоинте
+
+        Returns:
+            Статус после отмены (None если задачи нет)
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        now = time.time()
+        if job['status'] == QUEUED:
+            self._conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                               (CANCELLED, now, job_id, QUEUED))
+        elif job['status'] == RUNNING:
+            self._conn.execute("UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE id = ?", (now, job_id))
+        return self.get(job_id)['status']
+
+    def mark_cancelled(self, job_id: int):
+        """Воркер остановил задачу по запросу отмены"""
+        self._conn.execute("UPDATE jobs SET status = ?, worker = NULL, updated_at = ? WHERE id = ?",
+                           (CANCELLED, time.time(), job_id))
+        logger.info(f"[SAFE] Job #{job_id} cancelled")
+
+    def is_cancel_requested(self, job_id: int) -> bool:
+        row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row['cancel_requested'])
+
+    def requeue_stale(self, stale_after: float) -> int:
+        """
+        Возвращает в очередь задачи running без heartbeat дольше stale_after секунд
+
+        Задачи, исчерпавшие max_attempts, становятся failed: попытка считается
+        при claim, и зависание воркера - такая же неудачная попытка, как ошибка.
+
+        Returns:
+            Сколько задач возвращено
+        """
+        now = time.time()
+        error = f"worker lost (no heartbeat for {stale_after:.0f}s)"
+        failed = self._conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, worker = NULL, updated_at = ? "
+            "WHERE status = ? AND heartbeat < ? AND attempts >= max_attempts",
+            (FAILED, error, now, RUNNING, now - stale_after)
+        ).rowcount
+        if failed:
+            logger.warning(f"[SAFE] {failed} stale jobs failed after max attempts ({error})")
+        cursor = self._conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, worker = NULL, run_after = ?, updated_at = ? "
+            "WHERE status = ? AND heartbeat < ?",
+            (QUEUED, error, now, now, RUNNING, now - stale_after)
+        )
+        if cursor.rowcount:
+            logger.warning(f"[SAFE] Requeued {cursor.rowcount} stale jobs ({error})")
+        return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        """Количество задач по статусам"""
+        rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+
+# Глобальный экземпляр очереди
+_job_queue: Optional[JobQueue] = None
+
+def get_job_queue() -> JobQueue:
+    """Получить глобальный экземпляр очереди (Singleton pattern)"""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(os.getenv("JOB_QUEUE_DB", "data/jobs/jobs.db"))
+    return _job_queue
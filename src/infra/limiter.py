@@ -6,7 +6,8 @@ Anti-Spam Rate Limiter для защиты от блокировок Telegram
 - TokenBucket: Алгоритм ограничения скорости запросов
 - RateLimiter: Основной класс управления лимитами
 - safe_call: Wrapper для безопасных API вызовов с retry
-- smart_pause: Интеллектуальные паузы для больших операций
+- SingleFlight: Объединение одинаковых одновременных запросов
+- smart_pause: Паузы для больших операций (расчет в pacing.Pacer)
 
 Принцип: "Не считай минуты — считай RPC-токены"
 Цель: 4 запроса/сек с автоматической обработкой FLOOD_WAIT
@@ -15,11 +16,15 @@ Anti-Spam Rate Limiter для защиты от блокировок Telegram
 import asyncio
 import time
 import logging
-from typing import Any, Callable, Dict, Optional, Union
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, Union
 from datetime import datetime, timedelta
-from telethon.errors import FloodWaitError
+from collections import deque
+from telethon.errors import FloodWaitError, FloodPremiumWaitError
 import os
 from pathlib import Path
+from .metrics import get_metrics
+from .tracing import span
+from .writer import get_writer
 
 # Настройка логирования с тегом SAFE
 logger = logging.getLogger(__name__)
@@ -84,6 +89,11 @@ class TokenBucket:
                 else:
                     return False
     
+    def peek_tokens(self) -> float:
+        """Текущее количество токенов с учетом пополнения (без изменения ведра)"""
+        time_passed = time.time() - self.last_refill
+        return min(self.capacity, self.tokens + time_passed * self.refill_rate)
+    
     def get_wait_time(self, tokens_needed: int = 1) -> float:
         """Получить время ожидания для токенов без их получения"""
         if self.tokens >= tokens_needed:
@@ -93,6 +103,15 @@ class TokenBucket:
         return tokens_to_wait / self.refill_rate
 
 
+def _write_daily_counters(counter_file: Path, counters: Dict[str, Any]):
+    """Запись счетчиков (выполняется в потоке записи)"""
+    try:
+        with open(counter_file, 'w') as f:
+            for key, value in counters.items():
+                f.write(f"{key}={value}\n")
+    except Exception as e:
+        logger.error(f"[SAFE] Failed to save counters: {e}")
+
 class RateLimiter:
     """
     Основной класс управления rate limiting для Telegram API
@@ -102,6 +121,7 @@ class RateLimiter:
     - Квоты по операциям (DM, join/leave)
     - Счетчики использования
     - Персистентное хранение статистики
+    - Адаптивная скорость (AIMD): снижение при FLOOD_WAIT, плавное восстановление
     """
     
     def __init__(self, 
@@ -109,7 +129,10 @@ class RateLimiter:
                  max_dm_per_day: int = 20,
                  max_joins_per_day: int = 20,
                  max_groups: int = 200,
-                 data_dir: str = "data/anti_spam"):
+                 data_dir: str = "data/anti_spam",
+                 min_rps: Optional[float] = None,
+                 flood_backoff: float = 0.5,
+                 recovery_step: Optional[float] = None):
         """
         Args:
             rps: Запросов в секунду
@@ -117,6 +140,9 @@ class RateLimiter:
             max_joins_per_day: Максимум join/leave в сутки
             max_groups: Максимум групп для аккаунта
             data_dir: Директория для хранения счетчиков
+            min_rps: Нижняя граница скорости при FLOOD_WAIT (по умолчанию rps/8)
+            flood_backoff: Множитель скорости при FLOOD_WAIT
+            recovery_step: Прибавка скорости после успешного вызова (по умолчанию rps/50)
         """
         self.rps = rps
         self.max_dm_per_day = max_dm_per_day
@@ -130,6 +156,15 @@ class RateLimiter:
         # Token bucket для общего rate limiting
         self.bucket = TokenBucket(capacity=int(rps * 2), refill_rate=rps)
         
+        # Адаптивная скорость: refill_rate бакета меняется между min_rps и rps
+        self.min_rps = min_rps if min_rps is not None else rps / 8
+        self.flood_backoff = flood_backoff
+        self.recovery_step = recovery_step if recovery_step is not None else rps / 50
+        
+        # История FLOOD_WAIT: (timestamp, method, seconds, source)
+        self.flood_history: deque = deque(maxlen=500)
+        self.flood_by_method: Dict[str, Dict[str, int]] = {}
+        
         # Счетчики операций
         self.daily_counters = self._load_daily_counters()
         
@@ -138,6 +173,8 @@ class RateLimiter:
     def _load_daily_counters(self) -> Dict[str, Any]:
         """Загружаем ежедневные счетчики из файла"""
         counter_file = self.data_dir / "daily_counters.txt"
+        # Счетчики пишутся в фоне - читаем после записи всего, что уже поставлено
+        get_writer().flush()
         today = datetime.now().strftime("%Y-%m-%d")
         
         default_counters = {
@@ -145,7 +182,8 @@ class RateLimiter:
             "dm_count": 0,
             "join_count": 0,
             "api_calls": 0,
-            "flood_waits": 0
+            "flood_waits": 0,
+            "flood_wait_seconds": 0
         }
         
         if not counter_file.exists():
@@ -178,14 +216,16 @@ class RateLimiter:
             return default_counters
     
     def _save_daily_counters(self, counters: Dict[str, Any]):
-        """Сохраняем ежедневные счетчики в файл"""
+        """
+        Сохраняем ежедневные счетчики в файл
+        
+        Запись идет в потоке записи (get_writer), не в event loop; несколько
+        сохранений подряд объединяются в одну запись последнего состояния.
+        """
         counter_file = self.data_dir / "daily_counters.txt"
-        try:
-            with open(counter_file, 'w') as f:
-                for key, value in counters.items():
-                    f.write(f"{key}={value}\n")
-        except Exception as e:
-            logger.error(f"[SAFE] Failed to save counters: {e}")
+        # Без ожидания места: экспорт может занять всю очередь, а event loop ждать не должен
+        get_writer().submit_nowait(_write_daily_counters, counter_file, dict(counters),
+                                   key=('daily_counters', str(counter_file)))
     
     async def check_dm_quota(self) -> bool:
         """Проверяем квоту на DM сообщения"""
@@ -215,16 +255,51 @@ class RateLimiter:
         if self.daily_counters["api_calls"] % 100 == 0:  # Логируем каждые 100 вызовов
             logger.info(f"[SAFE] API calls today: {self.daily_counters['api_calls']}")
     
-    async def increment_flood_counter(self, wait_time: int):
+    async def increment_flood_counter(self, wait_time: int, method: str = "unknown"):
         """Увеличиваем счетчик FLOOD_WAIT"""
+        self.record_flood_wait(wait_time, method=method, source="safe_call")
+    
+    def record_flood_wait(self, wait_time: int, method: str = "unknown", source: str = "safe_call"):
+        """
+        Регистрирует FLOOD_WAIT из любого источника и замедляет bucket
+        
+        Args:
+            wait_time: Время ожидания от Telegram в секундах
+            method: Метод/запрос, вызвавший FLOOD_WAIT
+            source: "safe_call" (ошибка дошла до wrapper) или "telethon" (авто-сон клиента)
+        """
         self.daily_counters["flood_waits"] = self.daily_counters.get("flood_waits", 0) + 1
+        self.daily_counters["flood_wait_seconds"] = self.daily_counters.get("flood_wait_seconds", 0) + int(wait_time)
         self._save_daily_counters(self.daily_counters)
-        logger.warning(f"[SAFE] FLOOD_WAIT #{self.daily_counters['flood_waits']} for {wait_time}s")
+        
+        self.flood_history.append((time.time(), method, int(wait_time), source))
+        per_method = self.flood_by_method.setdefault(method, {"count": 0, "seconds": 0})
+        per_method["count"] += 1
+        per_method["seconds"] += int(wait_time)
+        get_metrics().inc("flood_waits_total", method=method, source=source)
+        get_metrics().observe("flood_wait_seconds", float(wait_time), method=method, source=source)
+        
+        # Multiplicative decrease: следующие вызовы пойдут медленнее
+        old_rate = self.bucket.refill_rate
+        self.bucket.refill_rate = max(self.min_rps, old_rate * self.flood_backoff)
+        
+        logger.warning(f"[SAFE] FLOOD_WAIT #{self.daily_counters['flood_waits']} for {wait_time}s "
+                       f"on {method} ({source}), rate {old_rate:.2f} -> {self.bucket.refill_rate:.2f} RPS")
         
         # Алерт при критических значениях
         if wait_time > 600:  # Более 10 минут
             logger.error(f"[SAFE] CRITICAL: FLOOD_WAIT {wait_time}s - possible account risk!")
     
+    def record_success(self):
+        """Additive increase: после успешного вызова скорость плавно возвращается к rps"""
+        if self.bucket.refill_rate < self.rps:
+            self.bucket.refill_rate = min(self.rps, self.bucket.refill_rate + self.recovery_step)
+    
+    def recent_flood_waits(self, window: float = 3600.0) -> int:
+        """Количество FLOOD_WAIT за последние window секунд"""
+        since = time.time() - window
+        return sum(1 for ts, _, _, _ in self.flood_history if ts >= since)
+    
     def get_stats(self) -> Dict[str, Any]:
         """Получить текущую статистику"""
         return {
@@ -233,10 +308,128 @@ class RateLimiter:
             "join_usage": f"{self.daily_counters.get('join_count', 0)}/{self.max_joins_per_day}",
             "api_calls": self.daily_counters.get("api_calls", 0),
             "flood_waits": self.daily_counters.get("flood_waits", 0),
-            "current_rps": self.rps
+            "flood_wait_seconds": self.daily_counters.get("flood_wait_seconds", 0),
+            "flood_waits_last_hour": self.recent_flood_waits(),
+            "flood_by_method": {method: dict(v) for method, v in self.flood_by_method.items()},
+            "current_rps": self.rps,
+            "effective_rps": round(self.bucket.refill_rate, 3)
         }
 
 
+class _LeaderCancelled(Exception):
+    """Лидер SingleFlight отменен - ожидающий должен выполнить запрос сам"""
+
+
+class SingleFlight:
+    """
+    Single-flight объединение одинаковых одновременных запросов
+    
+    Принцип работы:
+    - Первый вызов с ключом становится "лидером" и выполняет запрос
+    - Одновременные вызовы с тем же ключом ждут результат лидера
+    - Все получают один результат (или одно исключение) и тратят один токен
+    - После завершения ключ удаляется: следующий вызов снова идет в API
+    - Если лидера отменили, запрос выполняет один из ожидающих (остальные
+      ждут уже его) - отмена одного вызова не отменяет чужие
+    """
+    
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self.requests = 0
+        self.coalesced = 0
+        self.takeovers = 0
+    
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Выполнить запрос или присоединиться к уже выполняющемуся
+        
+        Args:
+            key: Ключ запроса (метод + нормализованные аргументы)
+            factory: Функция без аргументов, возвращающая корутину запроса
+        """
+        self.requests += 1
+        
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            logger.debug(f"[SAFE] Coalesced in-flight call {key!r}")
+        while future is not None:
+            try:
+                # shield: отмена одного из ожидающих не должна отменять общий запрос
+                return await asyncio.shield(future)
+            except _LeaderCancelled:
+                # Лидер отменен - первый проснувшийся ожидающий выполняет запрос сам
+                future = self._in_flight.get(key)
+                if future is None:
+                    self.takeovers += 1
+                    logger.debug(f"[SAFE] Took over cancelled in-flight call {key!r}")
+        
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            # Ожидающие не отменялись: они получают _LeaderCancelled и повторяют запрос
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Помечаем исключение как полученное, если ожидающих не было
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._in_flight.pop(key, None)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика объединения запросов"""
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "takeovers": self.takeovers,
+            "in_flight": len(self._in_flight),
+            "hit_rate": self.coalesced / self.requests if self.requests else 0.0
+        }
+
+
+def _normalize_arg(value: Any) -> Hashable:
+    """Нормализует аргумент для ключа: '-100..' == -100.., '@Name' == 'name'"""
+    if isinstance(value, str):
+        stripped = value.strip()
+        if stripped.lstrip('-').isdigit():
+            return int(stripped)
+        return stripped.lstrip('@').lower()
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize_arg(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _normalize_arg(v)) for k, v in value.items()))
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+
+def normalize_call_key(func: Callable, args: Tuple = (), kwargs: Optional[Dict[str, Any]] = None) -> Tuple:
+    """
+    Ключ вызова для single-flight: владелец метода + имя + нормализованные аргументы
+    
+    Для замыканий (wrapper функций) ключ по имени не различает захваченные
+    переменные - для них нужно передавать явный coalesce_key.
+    """
+    owner = getattr(func, '__self__', None)
+    name = getattr(func, '__qualname__', None) or getattr(func, '__name__', None) or repr(func)
+    return (
+        id(owner) if owner is not None else None,
+        name,
+        _normalize_arg(tuple(args)),
+        _normalize_arg(kwargs or {})
+    )
+
+
 # Глобальный экземпляр rate limiter
 _rate_limiter: Optional[RateLimiter] = None
 
@@ -259,7 +452,26 @@ def get_rate_limiter() -> RateLimiter:
     return _rate_limiter
 
 
-async def safe_call(func: Callable, *args, max_retries: int = 3, operation_type: str = "api", **kwargs) -> Any:
+# Глобальный экземпляр single-flight
+_single_flight: Optional[SingleFlight] = None
+
+def get_single_flight() -> SingleFlight:
+    """Получить глобальный экземпляр SingleFlight (Singleton pattern)"""
+    global _single_flight
+    if _single_flight is None:
+        _single_flight = SingleFlight()
+    return _single_flight
+
+
+def _flood_method(error: Exception, fallback: str) -> str:
+    """Имя запроса Telegram из FloodWaitError (если есть), иначе имя wrapper функции"""
+    request = getattr(error, 'request', None)
+    return request.__class__.__name__ if request is not None else fallback
+
+
+async def safe_call(func: Callable, *args, max_retries: int = 3, operation_type: str = "api",
+                    coalesce: bool = False, coalesce_key: Optional[Hashable] = None,
+                    limiter: Optional[RateLimiter] = None, **kwargs) -> Any:
     """
     Безопасный wrapper для Telegram API вызовов с rate limiting и retry
     
@@ -268,6 +480,10 @@ async def safe_call(func: Callable, *args, max_retries: int = 3, operation_type:
         *args: Аргументы функции
         max_retries: Максимальное количество повторов
         operation_type: Тип операции ("api", "dm", "join") для квот
+        coalesce: Объединять одинаковые одновременные вызовы (ключ по func и аргументам)
+        coalesce_key: Явный ключ объединения (включает coalesce)
+        limiter: RateLimiter вызова (None - глобальный get_rate_limiter(); свой
+            лимитер, например, у takeout сессии)
         **kwargs: Keyword аргументы функции
     
     Returns:
@@ -277,7 +493,24 @@ async def safe_call(func: Callable, *args, max_retries: int = 3, operation_type:
         FloodWaitError: Если превышены все попытки retry
         Exception: Другие ошибки от функции
     """
-    limiter = get_rate_limiter()
+    if coalesce or coalesce_key is not None:
+        if operation_type != "api":
+            raise ValueError(f"[SAFE] Coalescing is only allowed for read-only 'api' calls, got '{operation_type}'")
+        key = coalesce_key if coalesce_key is not None else normalize_call_key(func, args, kwargs)
+        return await get_single_flight().run(
+            key,
+            lambda: _safe_call(func, *args, max_retries=max_retries, operation_type=operation_type,
+                               limiter=limiter, **kwargs)
+        )
+    
+    return await _safe_call(func, *args, max_retries=max_retries, operation_type=operation_type,
+                            limiter=limiter, **kwargs)
+
+
+async def _safe_call(func: Callable, *args, max_retries: int = 3, operation_type: str = "api",
+                     limiter: Optional[RateLimiter] = None, **kwargs) -> Any:
+    """Реализация safe_call: квоты, token bucket и retry при FLOOD_WAIT"""
+    limiter = limiter or get_rate_limiter()
     
     # Проверяем квоты перед выполнением
     if operation_type == "dm":
@@ -289,16 +522,28 @@ async def safe_call(func: Callable, *args, max_retries: int = 3, operation_type:
     
     retry_count = 0
     base_wait = 1.0  # Базовое время ожидания для exponential backoff
+    # Методы клиента takeout сессии - functools.partial без __name__
+    method = getattr(func, '__name__', None) or getattr(getattr(func, 'func', None), '__name__', 'call')
+    metrics = get_metrics()
     
     while retry_count <= max_retries:
+        rpc_started = None
         try:
             # Rate limiting перед каждым вызовом
-            await limiter.bucket.acquire(1)
+            wait_started = time.perf_counter()
+            with span('bucket_wait', cat='bucket_wait', method=method):
+                await limiter.bucket.acquire(1)
+            metrics.observe("rpc_queue_wait_seconds", time.perf_counter() - wait_started, method=method)
             await limiter.increment_api_counter()
             
             # Выполняем функцию
-            logger.debug(f"[SAFE] Calling {func.__name__} (attempt {retry_count + 1}/{max_retries + 1})")
-            result = await func(*args, **kwargs)
+            logger.debug(f"[SAFE] Calling {method} (attempt {retry_count + 1}/{max_retries + 1})")
+            rpc_started = time.perf_counter()
+            with span(method, cat='rpc', attempt=retry_count + 1):
+                result = await func(*args, **kwargs)
+            metrics.observe("rpc_duration_seconds", time.perf_counter() - rpc_started, method=method)
+            metrics.inc("rpc_calls_total", method=method, status="ok")
+            limiter.record_success()
             
             # Увеличиваем соответствующие счетчики при успехе
             if operation_type == "dm":
@@ -308,56 +553,76 @@ async def safe_call(func: Callable, *args, max_retries: int = 3, operation_type:
             
             return result
             
-        except FloodWaitError as e:
+        except (FloodWaitError, FloodPremiumWaitError) as e:
             retry_count += 1
             wait_time = e.seconds
             
-            await limiter.increment_flood_counter(wait_time)
+            if rpc_started is not None:
+                metrics.observe("rpc_duration_seconds", time.perf_counter() - rpc_started, method=method)
+            metrics.inc("rpc_calls_total", method=method, status="flood_wait")
+            await limiter.increment_flood_counter(wait_time, method=_flood_method(e, method))
             
             if retry_count > max_retries:
-                logger.error(f"[SAFE] Max retries exceeded for {func.__name__} after FLOOD_WAIT")
+                logger.error(f"[SAFE] Max retries exceeded for {method} after FLOOD_WAIT")
                 raise e
             
             # Exponential backoff + wait time from Telegram
             total_wait = wait_time + (base_wait * (2 ** (retry_count - 1)))
             logger.warning(f"[SAFE] FLOOD_WAIT {wait_time}s + backoff {total_wait - wait_time:.1f}s, retry {retry_count}/{max_retries}")
             
-            await asyncio.sleep(total_wait)
+            metrics.inc("rpc_retries_total", method=method)
+            metrics.observe("flood_sleep_seconds", total_wait, method=method)
+            with span('flood_sleep', cat='flood_sleep', method=method, seconds=total_wait):
+                await asyncio.sleep(total_wait)
             
         except Exception as e:
             # Для других ошибок не делаем retry
-            logger.error(f"[SAFE] Error in {func.__name__}: {e}")
+            if rpc_started is not None:
+                metrics.observe("rpc_duration_seconds", time.perf_counter() - rpc_started, method=method)
+            metrics.inc("rpc_calls_total", method=method, status="error")
+            logger.error(f"[SAFE] Error in {method}: {e}")
             raise e
     
     # Не должно сюда дойти
-    raise Exception(f"[SAFE] Unexpected end of retry loop for {func.__name__}")
+    raise Exception(f"[SAFE] Unexpected end of retry loop for {method}")
 
 
-async def smart_pause(operation_type: str, count: int = 1):
+async def smart_pause(operation_type: str, count: int = 1,
+                      limiter: Optional[RateLimiter] = None) -> float:
     """
-    Интеллектуальные паузы для больших операций
+    Пауза для больших операций по состоянию лимитера
+    
+    Длительность считает pacing.Pacer: заполненность token bucket, недавние
+    FLOOD_WAIT и политика операции (PACING_CONFIG). При запасе токенов и без
+    FLOOD_WAIT пауза нулевая, кроме операций с min_delay (DM, join/leave).
     
     Args:
-        operation_type: Тип операции ("participants", "dm_batch", "join_batch")
+        operation_type: Тип операции ("participants", "export", "messages", "dm_batch", "join_batch")
         count: Количество обработанных элементов
+        limiter: RateLimiter, через который идут вызовы операции (None - глобальный;
+            для takeout - get_takeout_limiter(), у него свое ведро и FLOOD_WAIT)
+    
+    Returns:
+        Длительность паузы в секундах (0 - без паузы)
     """
-    if operation_type == "participants":
-        # Каждые 5000 участников - пауза 1 секунда
-        if count > 0 and count % 5000 == 0:
-            logger.info(f"[SAFE] Smart pause: {count} participants processed, sleeping 1s")
-            await asyncio.sleep(1.0)
-    
-    elif operation_type == "dm_batch":
-        # После каждых 20 DM - пауза 60 секунд
-        if count > 0 and count % 20 == 0:
-            logger.info(f"[SAFE] Smart pause: {count} DMs sent, sleeping 60s")
-            await asyncio.sleep(60.0)
-    
-    elif operation_type == "join_batch":
-        # После каждого join/leave - пауза 3 секунды
-        if count > 0:
-            logger.info(f"[SAFE] Smart pause: join/leave operation, sleeping 3s")
-            await asyncio.sleep(3.0)
+    # pacing импортирует limiter, поэтому импорт внутри функции
+    from .pacing import Pacer, get_pacer
+    
+    pacer = get_pacer()
+    if limiter is not None:
+        pacer = Pacer(pacer.policies, limiter)
+    decision = pacer.explain(operation_type, count)
+    delay = decision['delay']
+    if delay <= 0:
+        return 0.0
+    
+    logger.info(f"[SAFE] Smart pause: {operation_type} x{count}, sleeping {delay:.2f}s "
+                f"(bucket {decision['bucket_deficit']:.2f}s, flood {decision['flood_penalty']:.2f}s, "
+                f"min {decision['min_delay']:.2f}s)")
+    get_metrics().observe("pacing_pause_seconds", delay, operation=operation_type)
+    with span('smart_pause', cat='pause', operation=operation_type, seconds=delay):
+        await asyncio.sleep(delay)
+    return delay
 
 
 def setup_safe_logging():
@@ -0,0 +1,292 @@
+"""
+Метрики Telegram API вызовов
+============================
+
+Основные компоненты:
+- Histogram: Гистограмма с фиксированными бакетами (Prometheus-совместимая)
+- MetricsRegistry: Счетчики и гистограммы с метками (method, status)
+- get_metrics: Глобальный реестр, в который пишет safe_call
+
+Что измеряется для каждого метода:
+- rpc_queue_wait_seconds: ожидание токена в TokenBucket
+- rpc_duration_seconds: время внутри Telegram (сам вызов)
+- flood_sleep_seconds: сон после FLOOD_WAIT (включая backoff)
+- flood_wait_seconds: длительности FLOOD_WAIT по запросу и источнику
+- pacing_pause_seconds: паузы smart_pause по типу операции
+- participants_page_seconds: задержка страницы участников (история для planner)
+- rpc_calls_total / rpc_retries_total / flood_waits_total: счетчики
+
+Экспорт: get_method_stats() в процессе, render_prometheus() в формате
+Prometheus text exposition, dump() в файл, start_http_server() - /metrics
+на локальном порту.
+"""
+
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Префикс имен метрик
+METRIC_PREFIX = "s16_"
+
+# Бакеты гистограмм в секундах: от миллисекунд (ожидание токена) до минут (FLOOD_WAIT)
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0
+)
+
+# Описания метрик для # HELP
+METRIC_HELP = {
+    "rpc_calls_total": "Telegram API calls by method and status",
+    "rpc_retries_total": "Retries after FLOOD_WAIT by method",
+    "flood_waits_total": "FLOOD_WAIT errors by Telegram request and source (safe_call or telethon auto-sleep)",
+    "flood_wait_seconds": "FLOOD_WAIT durations requested by Telegram",
+    "rpc_queue_wait_seconds": "Time spent waiting for a rate limiter token",
+    "rpc_duration_seconds": "Time spent inside the Telegram call",
+    "flood_sleep_seconds": "Time slept after FLOOD_WAIT including backoff",
+    "pacing_pause_seconds": "Pauses between bulk operations chosen by the pacer",
+    "participants_page_seconds": "Time per participants page request of iter_participants",
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    items = [f'{k}="{_escape(v)}"' for k, v in labels]
+    return "{" + ",".join(items) + "}" if items else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Histogram:
+    """Гистограмма с фиксированными верхними границами бакетов"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        """Добавить наблюдение"""
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """Кумулятивные счетчики (le, count), включая +Inf"""
+        result = []
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            result.append((bound, running))
+        result.append((float("inf"), self.count))
+        return result
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по бакетам (верхняя граница бакета)"""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        for bound, running in self.cumulative():
+            if running >= target:
+                return bound if bound != float("inf") else self.buckets[-1]
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """Реестр счетчиков и гистограмм с метками"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.started_at = time.time()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        # HTTP сервер читает метрики из другого потока
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        """Увеличить счетчик"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """Добавить наблюдение в гистограмму"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def get_counter(self, name: str, **labels) -> float:
+        """Значение счетчика (0 если не было)"""
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0.0)
+
+    def get_histogram(self, name: str, **labels) -> Optional[Histogram]:
+        """Гистограмма по имени и меткам"""
+        with self._lock:
+            return self._histograms.get(name, {}).get(_label_key(labels))
+
+    def reset(self):
+        """Сбросить все метрики"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started_at = time.time()
+
+    def get_method_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Сводка по методам для использования в процессе
+
+        Returns:
+            {method: {calls, errors, flood_waits, retries,
+                      queue_wait_s, rpc_time_s, flood_sleep_s, rpc_p50_s, rpc_p95_s}}
+        """
+        stats: Dict[str, Dict[str, Any]] = {}
+
+        def method_entry(labels: LabelKey) -> Dict[str, Any]:
+            method = dict(labels).get("method", "unknown")
+            return stats.setdefault(method, {
+                "calls": 0, "errors": 0, "flood_waits": 0, "retries": 0,
+                "queue_wait_s": 0.0, "rpc_time_s": 0.0, "flood_sleep_s": 0.0,
+                "rpc_p50_s": 0.0, "rpc_p95_s": 0.0,
+            })
+
+        with self._lock:
+            for labels, value in self._counters.get("rpc_calls_total", {}).items():
+                entry = method_entry(labels)
+                entry["calls"] += int(value)
+                if dict(labels).get("status") == "error":
+                    entry["errors"] += int(value)
+            for labels, value in self._counters.get("flood_waits_total", {}).items():
+                method_entry(labels)["flood_waits"] += int(value)
+            for labels, value in self._counters.get("rpc_retries_total", {}).items():
+                method_entry(labels)["retries"] += int(value)
+            for name, field in (("rpc_queue_wait_seconds", "queue_wait_s"),
+                                ("rpc_duration_seconds", "rpc_time_s"),
+                                ("flood_sleep_seconds", "flood_sleep_s")):
+                for labels, histogram in self._histograms.get(name, {}).items():
+                    method_entry(labels)[field] += histogram.sum
+            for labels, histogram in self._histograms.get("rpc_duration_seconds", {}).items():
+                entry = method_entry(labels)
+                entry["rpc_p50_s"] = max(entry["rpc_p50_s"], histogram.quantile(0.5))
+                entry["rpc_p95_s"] = max(entry["rpc_p95_s"], histogram.quantile(0.95))
+
+        return stats
+
+    def render_prometheus(self) -> str:
+        """Метрики в формате Prometheus text exposition"""
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self._counters):
+                full_name = METRIC_PREFIX + name
+                if name in METRIC_HELP:
+                    lines.append(f"# HELP {full_name} {METRIC_HELP[name]}")
+                lines.append(f"# TYPE {full_name} counter")
+                for labels, value in sorted(self._counters[name].items()):
+                    lines.append(f"{full_name}{_format_labels(labels)} {_format_value(value)}")
+
+            for name in sorted(self._histograms):
+                full_name = METRIC_PREFIX + name
+                if name in METRIC_HELP:
+                    lines.append(f"# HELP {full_name} {METRIC_HELP[name]}")
+                lines.append(f"# TYPE {full_name} histogram")
+                for labels, histogram in sorted(self._histograms[name].items()):
+                    for bound, running in histogram.cumulative():
+                        bucket_labels = labels + (("le", _format_value(bound)),)
+                        lines.append(f"{full_name}_bucket{_format_labels(bucket_labels)} {running}")
+                    lines.append(f"{full_name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+                    lines.append(f"{full_name}_count{_format_labels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        """Записать метрики в файл (атомарно, для node_exporter textfile collector)"""
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(target.name + ".tmp")
+        tmp_path.write_text(self.render_prometheus(), encoding="utf-8")
+        tmp_path.replace(target)
+        logger.info(f"[SAFE] Metrics dumped to {target}")
+
+    def start_http_server(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """
+        Запустить HTTP endpoint /metrics в фоновом потоке
+
+        Returns:
+            Сервер (остановка: server.shutdown())
+        """
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(f"[SAFE] metrics http: {format % args}")
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+        thread.start()
+        logger.info(f"[SAFE] Metrics endpoint: http://{host}:{server.server_address[1]}/metrics")
+        return server
+
+
+# Глобальный реестр метрик
+_metrics: Optional[MetricsRegistry] = None
+
+def get_metrics() -> MetricsRegistry:
+    """Получить глобальный реестр метрик (Singleton pattern)"""
+    global _metrics
+    if _metrics is None:
+        _metrics = MetricsRegistry()
+    return _metrics
+
+
+def start_metrics_from_env() -> Optional[ThreadingHTTPServer]:
+    """Запустить HTTP endpoint, если задан METRICS_HTTP_PORT"""
+    port = os.getenv("METRICS_HTTP_PORT")
+    if not port:
+        return None
+    return get_metrics().start_http_server(int(port))
+
+
+def dump_metrics_from_env(path: Optional[str] = None):
+    """Записать метрики в файл path или METRICS_FILE (если задан)"""
+    path = path or os.getenv("METRICS_FILE")
+    if path:
+        get_metrics().dump(path)
@@ -0,0 +1,159 @@
+"""
+Pacing: паузы между крупными операциями по живому состоянию лимитера
+====================================================================
+
+Вместо фиксированных пауз (1с на 5000 участников, 60с на 20 DM, 3с на join)
+задержка считается из трех сигналов:
+- заполненность token bucket: пока в ведре есть запас (fill >= target_fill),
+  пауза не нужна - safe_call и так ограничивает скорость
+- недостаток токенов: пауза до восполнения ведра до target_fill при текущей
+  (возможно сниженной AIMD) скорости refill_rate
+- недавние FLOOD_WAIT: штраф flood_factor * seconds, затухающий линейно за
+  flood_window секунд
+
+Политики по типам операций (PacePolicy) задаются в DEFAULT_POLICIES и
+переопределяются JSON-файлом из PACING_CONFIG:
+
+    {"participants": {"every": 2000, "max_delay": 10},
+     "dm_batch": {"min_delay": 90}}
+
+min_delay - нижняя граница для операций, где пауза нужна всегда (DM, join/leave:
+защита аккаунта, а не только скорости RPC). max_delay - верхняя граница.
+"""
+
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, fields, replace
+from typing import Any, Dict, Optional
+
+from .limiter import RateLimiter, get_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PacePolicy:
+    """Политика пауз для одного типа операций"""
+    every: int = 1               # Проверять паузу на каждом every-м элементе
+    min_delay: float = 0.0       # Пауза не меньше (0 - только по сигналам)
+    max_delay: float = 30.0      # Пауза не больше
+    target_fill: float = 0.5     # Желаемая доля токенов в ведре
+    flood_window: float = 600.0  # Сколько секунд учитывать FLOOD_WAIT
+    flood_factor: float = 0.5    # Доля секунд FLOOD_WAIT, добавляемая к паузе
+
+
+DEFAULT_POLICIES: Dict[str, PacePolicy] = {
+    "participants": PacePolicy(every=5000, max_delay=10.0),
+    "export": PacePolicy(every=1, max_delay=30.0),
+    "messages": PacePolicy(every=10, max_delay=10.0),
+    "dm_batch": PacePolicy(every=20, min_delay=60.0, max_delay=600.0, flood_factor=1.0),
+    "join_batch": PacePolicy(every=1, min_delay=3.0, max_delay=120.0, flood_factor=1.0),
+}
+
+# Для неизвестных типов операций
+DEFAULT_POLICY = PacePolicy()
+
+
+def load_policies(path: Optional[str] = None) -> Dict[str, PacePolicy]:
+    """
+    Политики по умолчанию с переопределениями из JSON-файла
+
+    Args:
+        path: Путь к JSON (None - переменная окружения PACING_CONFIG)
+    """
+    policies = dict(DEFAULT_POLICIES)
+    path = path or os.getenv("PACING_CONFIG")
+    if not path:
+        return policies
+
+    with open(path, "r", encoding="utf-8") as f:
+        overrides = json.load(f)
+
+    known = {field.name for field in fields(PacePolicy)}
+    for operation, values in overrides.items():
+        unknown = set(values) - known
+        if unknown:
+            raise ValueError(f"[SAFE] Unknown pacing options for '{operation}': {sorted(unknown)}")
+        policies[operation] = replace(policies.get(operation, DEFAULT_POLICY), **values)
+    logger.info(f"[SAFE] Pacing policies loaded from {path}: {sorted(overrides)}")
+    return policies
+
+
+class Pacer:
+    """Расчет пауз по политике операции и состоянию RateLimiter"""
+
+    def __init__(self, policies: Optional[Dict[str, PacePolicy]] = None,
+                 limiter: Optional[RateLimiter] = None):
+        """
+        Args:
+            policies: Политики по типам операций (None - DEFAULT_POLICIES)
+            limiter: RateLimiter (None - глобальный get_rate_limiter() на момент вызова)
+        """
+        self.policies = policies if policies is not None else dict(DEFAULT_POLICIES)
+        self._limiter = limiter
+
+    @property
+    def limiter(self) -> RateLimiter:
+        return self._limiter if self._limiter is not None else get_rate_limiter()
+
+    def policy(self, operation_type: str) -> PacePolicy:
+        return self.policies.get(operation_type, DEFAULT_POLICY)
+
+    def flood_penalty(self, policy: PacePolicy, now: Optional[float] = None) -> float:
+        """Штраф за недавние FLOOD_WAIT (линейно затухает за flood_window)"""
+        now = now if now is not None else time.time()
+        penalty = 0.0
+        for ts, _, seconds, _ in self.limiter.flood_history:
+            age = now - ts
+            if 0 <= age < policy.flood_window:
+                penalty += policy.flood_factor * seconds * (1 - age / policy.flood_window)
+        return penalty
+
+    def bucket_deficit(self, policy: PacePolicy) -> float:
+        """Секунды до восполнения ведра до target_fill (0 - запас есть)"""
+        bucket = self.limiter.bucket
+        target = policy.target_fill * bucket.capacity
+        tokens = bucket.peek_tokens()
+        if tokens >= target or bucket.refill_rate <= 0:
+            return 0.0
+        return (target - tokens) / bucket.refill_rate
+
+    def explain(self, operation_type: str, count: int = 1) -> Dict[str, Any]:
+        """Составляющие паузы (для логов и отладки)"""
+        policy = self.policy(operation_type)
+        checkpoint = count > 0 and (policy.every <= 1 or count % policy.every == 0)
+        if not checkpoint:
+            return {'operation': operation_type, 'checkpoint': False, 'delay': 0.0}
+
+        deficit = self.bucket_deficit(policy)
+        penalty = self.flood_penalty(policy)
+        delay = min(policy.max_delay, max(policy.min_delay, deficit + penalty))
+        return {
+            'operation': operation_type,
+            'checkpoint': True,
+            'bucket_deficit': round(deficit, 3),
+            'flood_penalty': round(penalty, 3),
+            'min_delay': policy.min_delay,
+            'delay': round(delay, 3),
+        }
+
+    def delay(self, operation_type: str, count: int = 1) -> float:
+        """Пауза в секундах после count обработанных элементов"""
+        return self.explain(operation_type, count)['delay']
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Действующие политики"""
+        return {operation: asdict(policy) for operation, policy in self.policies.items()}
+
+
+# Глобальный экземпляр pacer
+_pacer: Optional[Pacer] = None
+
+def get_pacer() -> Pacer:
+    """Получить глобальный экземпляр Pacer (Singleton pattern)"""
+    global _pacer
+    if _pacer is None:
+        _pacer = Pacer(load_policies())
+    return _pacer
@@ -0,0 +1,205 @@
+"""
+Сессия Telethon с отложенной записью сущностей
+==============================================
+
+SQLiteSession записывает в data/sessions/<SESSION_NAME>.session каждую
+сущность из каждого ответа Telegram: обход группы на 100 тысяч участников -
+это сотни executemany в SQLite прямо в event loop.
+
+WriteBehindSession держит сущности в памяти (поиск по id, username, телефону
+и имени - из памяти), а в SQLite пишет их фоновым потоком большими
+транзакциями: раз в flush_interval секунд или при накоплении batch_size
+записей. Ключ авторизации, DC и состояние обновлений пишутся как обычно.
+close() (вызывается при disconnect) дописывает все, что осталось.
+
+persist_participants=False: пользователи из ответов GetParticipantsRequest
+остаются только в памяти - в файл сессии попадают группы, собеседники и все
+остальное, но не весь ростер каждой выгруженной группы.
+
+Включается переменной окружения SESSION_BACKEND=write-behind (см. tele_client).
+Сравнение с SQLiteSession: scripts/benchmark_session.py
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from telethon.sessions import SQLiteSession
+from telethon.tl.types.channels import ChannelParticipants
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 5.0
+DEFAULT_BATCH_SIZE = 5000
+
+# (id, hash, username, phone, name, date) - как таблица entities
+EntityRow = Tuple[int, int, Optional[str], Optional[str], Optional[str], int]
+
+
+class WriteBehindSession(SQLiteSession):
+    """SQLiteSession с кэшем сущностей в памяти и фоновой пакетной записью"""
+
+    def __init__(self, session_id: str, flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 batch_size: int = DEFAULT_BATCH_SIZE, persist_participants: bool = True):
+        """
+        Args:
+            session_id: Путь сессии (как у SQLiteSession, без .session)
+            flush_interval: Период фоновой записи, секунд
+            batch_size: Записать раньше, если накопилось столько сущностей
+            persist_participants: Сохранять ли в файл пользователей из списков участников
+        """
+        super().__init__(session_id)
+        if self.filename == ':memory:':
+            raise ValueError("WriteBehindSession needs a session file")
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.persist_participants = persist_participants
+
+        self._entities: Dict[int, EntityRow] = {}
+        self._by_username: Dict[str, int] = {}
+        self._by_phone: Dict[str, int] = {}
+        self._by_name: Dict[str, int] = {}
+        self._pending: Dict[int, EntityRow] = {}
+        self._pending_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._writer_conn: Optional[sqlite3.Connection] = None
+        self.stats = {'flushes': 0, 'rows_written': 0, 'rows_skipped': 0, 'flush_errors': 0}
+
+        self._thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+        self._thread.start()
+
+    # --- Сущности -------------------------------------------------------
+
+    def process_entities(self, tlo):
+        """Сущности из ответа Telegram: сразу в память, в SQLite - фоновым потоком"""
+        if not self.save_entities:
+            return
+        rows = self._entities_to_rows(tlo)
+        if not rows:
+            return
+
+        skip_users = not self.persist_participants and isinstance(tlo, ChannelParticipants)
+        now = int(time.time())
+        pending = []
+        for row in rows:
+            entity = row + (now,)
+            self._remember(entity)
+            # Помеченный id пользователя положителен, групп и каналов - отрицателен
+            if skip_users and entity[0] > 0:
+                self.stats['rows_skipped'] += 1
+                continue
+            pending.append(entity)
+
+        if pending:
+            with self._pending_lock:
+                for entity in pending:
+                    self._pending[entity[0]] = entity
+                backlog = len(self._pending)
+            if backlog >= self.batch_size:
+                self._wakeup.set()
+
+    def _remember(self, entity: EntityRow):
+        entity_id, _, username, phone, name, _ = entity
+        self._entities[entity_id] = entity
+        if username:
+            self._by_username[username] = entity_id
+        if phone:
+            self._by_phone[str(phone)] = entity_id
+        if name:
+            self._by_name[name] = entity_id
+
+    def _lookup(self, index: Dict, key) -> Optional[Tuple[int, int]]:
+        entity_id = index.get(key)
+        if entity_id is None:
+            return None
+        entity = self._entities[entity_id]
+        return entity[0], entity[1]
+
+    def get_entity_rows_by_phone(self, phone):
+        return self._lookup(self._by_phone, str(phone)) or super().get_entity_rows_by_phone(phone)
+
+    def get_entity_rows_by_username(self, username):
+        return self._lookup(self._by_username, username) or super().get_entity_rows_by_username(username)
+
+    def get_entity_rows_by_name(self, name):
+        return self._lookup(self._by_name, name) or super().get_entity_rows_by_name(name)
+
+    def get_entity_rows_by_id(self, id, exact=True):
+        if exact:
+            candidates = (id,)
+        else:
+            # Немаркированный id: пользователь, группа или канал
+            candidates = (id, -id, -(1000000000000 + id))
+        for entity_id in candidates:
+            entity = self._entities.get(entity_id)
+            if entity is not None:
+                return entity[0], entity[1]
+        return super().get_entity_rows_by_id(id, exact)
+
+    # --- Запись ---------------------------------------------------------
+
+    def pending_count(self) -> int:
+        with self._pending_lock:
+            return len(self._pending)
+
+    def flush(self) -> int:
+        """
+        Записывает накопленные сущности одной транзакцией
+
+        Returns:
+            Количество записанных строк
+        """
+        with self._write_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            try:
+                if self._writer_conn is None:
+                    # Свое соединение: фоновая запись не пересекается с транзакциями Telethon
+                    self._writer_conn = sqlite3.connect(self.filename, timeout=30, check_same_thread=False)
+                    self._writer_conn.execute("pragma journal_mode=wal")
+                with self._writer_conn:
+                    self._writer_conn.executemany(
+                        'insert or replace into entities values (?,?,?,?,?,?)', batch.values()
+                    )
+            except Exception:
+                # Возвращаем пакет в очередь; более новые строки тех же сущностей остаются
+                with self._pending_lock:
+                    for entity_id, row in batch.items():
+                        self._pending.setdefault(entity_id, row)
+                self.stats['flush_errors'] += 1
+                raise
+            self.stats['flushes'] += 1
+            self.stats['rows_written'] += len(batch)
+            logger.debug(f"[SAFE] Session flush: {len(batch)} entities")
+            return len(batch)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # Сущности остаются в памяти; следующая попытка - через flush_interval
+                logger.warning(f"[SAFE] Session flush failed: {e}")
+
+    def close(self):
+        """Останавливает фоновую запись, дописывает остаток и закрывает сессию"""
+        if not self._stopped.is_set():
+            self._stopped.set()
+            self._wakeup.set()
+            self._thread.join()
+        self.flush()
+        if self._writer_conn is not None:
+            self._writer_conn.close()
+            self._writer_conn = None
+        super().close()
+
+    def get_stats(self):
+        return dict(self.stats, cached=len(self._entities), pending=self.pending_count())
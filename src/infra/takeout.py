@@ -0,0 +1,96 @@
+"""
+Takeout сессия для массовой выгрузки данных
+===========================================
+
+Takeout - режим Telegram для экспорта данных аккаунта: запросы оборачиваются
+в InvokeWithTakeoutRequest, и лимиты FLOOD_WAIT для них заметно мягче, чем для
+обычной сессии. Участники, диалоги и сообщения, запрошенные через клиент
+takeout, не расходуют бюджет RPC основной сессии.
+
+Особенности:
+- Первое открытие takeout Telegram может отложить (TakeoutInitDelayError):
+  экспорт нужно подтвердить в другом приложении или подождать. Тогда
+  open_takeout() отдает None, и выгрузка идет обычной сессией.
+- Takeout может стать недействительным посреди выгрузки (TakeoutInvalidError,
+  TakeoutRequiredError) - такие ошибки не глотаются GroupManager, их
+  обрабатывает вызывающий код (FallbackGroupManager).
+- У takeout свой RateLimiter (get_takeout_limiter()): TAKEOUT_RPS, отдельные
+  счетчики в data/anti_spam/takeout.
+"""
+
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from telethon.errors import TakeoutInitDelayError, TakeoutInvalidError, TakeoutRequiredError
+
+from .limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых выгрузка продолжается обычной сессией
+TAKEOUT_ERRORS = (TakeoutInitDelayError, TakeoutInvalidError, TakeoutRequiredError)
+
+DEFAULT_TAKEOUT_RPS = 10.0
+TAKEOUT_DATA_DIR = "data/anti_spam/takeout"
+
+
+# Глобальный экземпляр rate limiter takeout сессии
+_takeout_limiter: Optional[RateLimiter] = None
+
+def get_takeout_limiter() -> RateLimiter:
+    """Получить rate limiter takeout сессии (Singleton pattern)"""
+    global _takeout_limiter
+    if _takeout_limiter is None:
+        _takeout_limiter = RateLimiter(
+            rps=float(os.getenv("TAKEOUT_RPS", str(DEFAULT_TAKEOUT_RPS))),
+            data_dir=TAKEOUT_DATA_DIR
+        )
+    return _takeout_limiter
+
+
+@asynccontextmanager
+async def open_takeout(client) -> AsyncIterator[Optional[object]]:
+    """
+    Открывает takeout сессию на время выгрузки
+
+    Args:
+        client: Подключенный TelegramClient
+
+    Yields:
+        Клиент takeout (те же методы, что у TelegramClient) или None, если
+        Telegram отложил takeout - тогда выгружать обычной сессией
+    """
+    if client.session.takeout_id is not None:
+        # Takeout прошлого запуска не был закрыт - продолжаем его
+        takeout = client.takeout(finalize=True)
+    else:
+        takeout = client.takeout(finalize=True, users=True, chats=True, megagroups=True, channels=True)
+    try:
+        session = await takeout.__aenter__()
+    except TakeoutInitDelayError as e:
+        logger.warning(f"[SAFE] Takeout delayed by Telegram for {e.seconds}s "
+                       f"(confirm the export in another app); using the normal session")
+        yield None
+        return
+    except TAKEOUT_ERRORS as e:
+        logger.warning(f"[SAFE] Takeout is not available ({type(e).__name__}); using the normal session")
+        yield None
+        return
+
+    logger.info("[SAFE] Takeout session opened")
+    exc_info = (None, None, None)
+    try:
+        yield session
+    except BaseException as e:
+        exc_info = (type(e), e, e.__traceback__)
+        raise
+    finally:
+        try:
+            await takeout.__aexit__(*exc_info)
+            logger.info("[SAFE] Takeout session finished")
+        except Exception as e:
+            # Недействительный takeout закрыть нельзя - выгрузка от этого не страдает
+            logger.warning(f"[SAFE] Failed to finish takeout session: {e}")
+            client.session.takeout_id = None
@@ -1,11 +1,13 @@
 import os
 import asyncio
+import logging
 from pathlib import Path
 from telethon import TelegramClient
 from telethon.errors import SessionPasswordNeededError, PhoneCodeInvalidError
 from dotenv import load_dotenv
 from telethon.tl.types import User
 from .limiter import safe_call, get_rate_limiter
+from .session_store import WriteBehindSession
 
 load_dotenv()
 
@@ -18,16 +20,77 @@ api_hash = os.getenv("TG_API_HASH", "")
 session_name = os.getenv("SESSION_NAME", "s16_session")
 session_path = str(DATA_DIR / session_name)
 
+# FLOOD_WAIT короче порога Telethon отсыпает внутри клиента. Порог остается
+# стандартным (60с): iter_participants - один вызов safe_call на весь проход, и
+# FloodWaitError посреди прохода начал бы его заново с нулевого offset. Такие
+# ожидания не теряются - FloodSleepObserver передает их в rate limiter
+# (счетчики, метрики, снижение RPS); FLOOD_WAIT длиннее порога идут через safe_call
+DEFAULT_FLOOD_SLEEP_THRESHOLD = 60
+flood_sleep_threshold = int(os.getenv("FLOOD_SLEEP_THRESHOLD", str(DEFAULT_FLOOD_SLEEP_THRESHOLD)))
+
+# Хранилище сессии: sqlite - SQLiteSession Telethon, write-behind - сущности в
+# памяти с фоновой пакетной записью (см. session_store.py)
+session_backend = os.getenv("SESSION_BACKEND", "sqlite").strip().lower()
+session_flush_interval = float(os.getenv("SESSION_FLUSH_INTERVAL", "5"))
+session_persist_participants = os.getenv("SESSION_PERSIST_PARTICIPANTS", "true").lower() == "true"
+
 # Проверка конфигурации
 if not api_id or not api_hash:
     raise ValueError("❌ Необходимо указать TG_API_ID и TG_API_HASH в .env файле")
 
 _client = None
 
+# Логгер, в который Telethon пишет "Sleeping for Ns (...) on <Request> flood wait"
+TELETHON_FLOOD_LOGGER = "telethon.client.users"
+
+
+class FloodSleepObserver(logging.Filter):
+    """
+    Перехватывает авто-сон Telethon на FLOOD_WAIT (до FLOOD_SLEEP_THRESHOLD)
+    и передает его в rate limiter, чтобы такие ожидания тоже были видны
+    """
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        args = record.args if isinstance(record.args, tuple) else ()
+        if isinstance(record.msg, str) and record.msg.startswith('Sleeping') and len(args) == 4:
+            early, delay, _, request_name = args
+            if early:
+                # Досыпание уже учтенного FLOOD_WAIT перед повтором запроса
+                return True
+            try:
+                get_rate_limiter().record_flood_wait(int(delay), method=str(request_name), source="telethon")
+            except Exception:
+                # Наблюдатель не должен ломать логирование клиента
+                pass
+        return True
+
+
+_flood_observer = FloodSleepObserver()
+
+def install_flood_observer():
+    """Подключает FloodSleepObserver к логгеру Telethon (идемпотентно)"""
+    telethon_logger = logging.getLogger(TELETHON_FLOOD_LOGGER)
+    if _flood_observer not in telethon_logger.filters:
+        telethon_logger.addFilter(_flood_observer)
+    # Запись должна создаваться, иначе фильтр не вызовется
+    if not telethon_logger.isEnabledFor(logging.INFO):
+        telethon_logger.setLevel(logging.INFO)
+
+def make_session():
+    """Сессия для TelegramClient по SESSION_BACKEND"""
+    if session_backend == "sqlite":
+        return session_path
+    if session_backend == "write-behind":
+        return WriteBehindSession(session_path, flush_interval=session_flush_interval,
+                                  persist_participants=session_persist_participants)
+    raise ValueError(f"❌ Неизвестный SESSION_BACKEND: {session_backend} (sqlite | write-behind)")
+
 def get_client():
     global _client
     if _client is None:
-        _client = TelegramClient(session_path, api_id, api_hash)
+        _client = TelegramClient(make_session(), api_id, api_hash,
+                                 flood_sleep_threshold=flood_sleep_threshold)
+        install_flood_observer()
     return _client
 
 async def test_connection():
@@ -0,0 +1,326 @@
+"""
+Трассировка экспортных пайплайнов
+=================================
+
+Основные компоненты:
+- Tracer: Пишет спаны в JSONL (одна строка - одно Chrome trace event "X")
+- span: Контекстный менеджер для измерения этапа (no-op если трассировка выключена)
+- load_spans / build_report / format_report: Отчет по файлу трассировки
+- to_chrome_trace: Конвертация JSONL в формат chrome://tracing / Perfetto
+
+Категории этапов (cat):
+- bucket_wait: ожидание токена в TokenBucket
+- rpc: время внутри Telegram вызова
+- flood_sleep: сон после FLOOD_WAIT
+- pause: smart_pause
+- entity / participants: этапы GroupManager
+- serialize: сериализация и запись файлов
+- group / export: корневые спаны экспортеров
+
+Включение: enable_tracing(path) или переменная окружения TRACE_FILE.
+Родитель спана берется из contextvars, поэтому вложенность корректна и
+для параллельных asyncio задач.
+"""
+
+import asyncio
+import atexit
+import contextvars
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Текущий спан (для связи родитель-потомок)
+_current_span: contextvars.ContextVar[Optional['Span']] = contextvars.ContextVar('s16_current_span', default=None)
+
+
+class Span:
+    """Один измеряемый этап"""
+
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'span_id', 'parent_id', 'group',
+                 'start_wall', 'start_perf', '_token')
+
+    def __init__(self, tracer: 'Tracer', name: str, cat: str, args: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.span_id = next(tracer._ids)
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent is not None else None
+        # group наследуется от родителя, чтобы отчет мог разбить время по группам
+        self.group = args.get('group', parent.group if parent is not None else None)
+        self.start_wall = 0.0
+        self.start_perf = 0.0
+        self._token = None
+
+    def set(self, **args):
+        """Добавить атрибуты к спану (например, количество участников)"""
+        self.args.update(args)
+
+    def __enter__(self) -> 'Span':
+        self.start_wall = time.time()
+        self.start_perf = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start_perf
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer._record(self, duration)
+        return False
+
+
+class _NullSpan:
+    """Спан-заглушка, когда трассировка выключена"""
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self) -> '_NullSpan':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """Пишет завершенные спаны в JSONL файл"""
+
+    def __init__(self, path: str, buffer_size: int = 256):
+        """
+        Args:
+            path: Файл трассировки (JSONL, дописывается)
+            buffer_size: Сколько спанов держать в памяти до записи
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.buffer_size = buffer_size
+        self.pid = os.getpid()
+        self._ids = itertools.count(1)
+        self._buffer: List[str] = []
+        self._task_ids: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def span(self, name: str, cat: str = 'stage', **args) -> Span:
+        return Span(self, name, cat, args)
+
+    def _tid(self) -> int:
+        """Номер "потока" для визуализации: отдельная дорожка на каждую asyncio задачу"""
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = id(task) if task is not None else 0
+        return self._task_ids.setdefault(key, len(self._task_ids))
+
+    def _record(self, span: Span, duration: float):
+        event = {
+            'name': span.name,
+            'cat': span.cat,
+            'ph': 'X',
+            'ts': int(span.start_wall * 1_000_000),
+            'dur': int(duration * 1_000_000),
+            'pid': self.pid,
+            'tid': self._tid(),
+            'id': span.span_id,
+            'parent': span.parent_id,
+            'group': span.group,
+            'args': span.args,
+        }
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        with self._lock:
+            self._buffer.append(line)
+            if len(self._buffer) >= self.buffer_size:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(self._buffer) + '\n')
+        self._buffer.clear()
+
+    def flush(self):
+        """Записать накопленные спаны"""
+        with self._lock:
+            self._flush_locked()
+
+
+# Глобальный трассировщик (None - трассировка выключена)
+_tracer: Optional[Tracer] = None
+
+
+def enable_tracing(path: str) -> Tracer:
+    """Включить трассировку в файл path"""
+    global _tracer
+    if _tracer is not None:
+        _tracer.flush()
+    _tracer = Tracer(path)
+    logger.info(f"[SAFE] Tracing enabled: {path}")
+    return _tracer
+
+
+def disable_tracing():
+    """Выключить трассировку (с записью буфера)"""
+    global _tracer
+    if _tracer is not None:
+        _tracer.flush()
+    _tracer = None
+
+
+def get_tracer() -> Optional[Tracer]:
+    """Текущий трассировщик (TRACE_FILE включает трассировку при первом обращении)"""
+    global _tracer
+    if _tracer is None and os.getenv('TRACE_FILE'):
+        enable_tracing(os.getenv('TRACE_FILE'))
+    return _tracer
+
+
+def span(name: str, cat: str = 'stage', **args):
+    """
+    Контекстный менеджер этапа
+
+    Пример:
+        with span('get_participants', cat='participants', group=group_id) as s:
+            ...
+            s.set(count=len(participants))
+    """
+    tracer = _tracer if _tracer is not None else get_tracer()
+    if tracer is None:
+        return _NULL_SPAN
+    return tracer.span(name, cat, **args)
+
+
+@atexit.register
+def _flush_on_exit():
+    if _tracer is not None:
+        _tracer.flush()
+
+
+# ----------------------------------------------------------------------
+# Отчет
+# ----------------------------------------------------------------------
+
+def load_spans(path: str) -> List[Dict[str, Any]]:
+    """Прочитать спаны из JSONL файла (битые строки пропускаются)"""
+    spans = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                spans.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return spans
+
+
+def to_chrome_trace(spans: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Формат для chrome://tracing и ui.perfetto.dev"""
+    events = []
+    for s in spans:
+        event = {k: s[k] for k in ('name', 'cat', 'ph', 'ts', 'dur', 'pid', 'tid')}
+        event['args'] = dict(s.get('args') or {}, group=s.get('group'))
+        events.append(event)
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def _critical_path(span_id: int, by_id: Dict[int, Dict[str, Any]],
+                   children: Dict[int, List[int]]) -> List[Dict[str, Any]]:
+    """Цепочка спанов, определившая время завершения: на каждом уровне - потомок, закончившийся последним"""
+    path = []
+    current = span_id
+    while current is not None:
+        s = by_id[current]
+        path.append({'name': s['name'], 'cat': s['cat'], 'dur_s': s['dur'] / 1e6})
+        kids = children.get(current)
+        if not kids:
+            break
+        current = max(kids, key=lambda k: by_id[k]['ts'] + by_id[k]['dur'])
+    return path
+
+
+def build_report(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Разбивка времени по группам и этапам
+
+    Время этапа считается как собственное время спанов (длительность минус
+    длительность прямых потомков), поэтому суммы не дублируют вложенные этапы.
+
+    Returns:
+        {'total_s', 'stages': {cat: s}, 'groups': {group: {'wall_s', 'stages', 'critical_path'}}}
+    """
+    by_id = {s['id']: s for s in spans}
+    children: Dict[int, List[int]] = {}
+    for s in spans:
+        parent = s.get('parent')
+        if parent in by_id:
+            children.setdefault(parent, []).append(s['id'])
+
+    def self_time(s: Dict[str, Any]) -> float:
+        child_total = sum(by_id[c]['dur'] for c in children.get(s['id'], []))
+        return max(0, s['dur'] - child_total) / 1e6
+
+    stages: Dict[str, float] = {}
+    groups: Dict[str, Dict[str, Any]] = {}
+
+    for s in spans:
+        seconds = self_time(s)
+        stages[s['cat']] = stages.get(s['cat'], 0.0) + seconds
+        group = s.get('group')
+        if group is None:
+            continue
+        entry = groups.setdefault(str(group), {'wall_s': 0.0, 'stages': {}, 'critical_path': [], '_root': None})
+        entry['stages'][s['cat']] = entry['stages'].get(s['cat'], 0.0) + seconds
+        # Корень группы - самый внешний спан с этой группой
+        parent = by_id.get(s.get('parent'))
+        if parent is None or parent.get('group') != group:
+            if entry['_root'] is None or s['dur'] > by_id[entry['_root']]['dur']:
+                entry['_root'] = s['id']
+
+    for entry in groups.values():
+        root = entry.pop('_root')
+        if root is not None:
+            entry['wall_s'] = by_id[root]['dur'] / 1e6
+            entry['critical_path'] = _critical_path(root, by_id, children)
+
+    roots = [s for s in spans if s.get('parent') not in by_id]
+    if roots:
+        start = min(s['ts'] for s in roots)
+        end = max(s['ts'] + s['dur'] for s in roots)
+        total = (end - start) / 1e6
+    else:
+        total = 0.0
+
+    return {'total_s': total, 'stages': stages, 'groups': groups}
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Текстовый отчет для консоли"""
+    lines = [f"⏱️ Общее время: {report['total_s']:.1f}s", "", "📊 Время по этапам (собственное):"]
+    for cat, seconds in sorted(report['stages'].items(), key=lambda item: -item[1]):
+        share = seconds / report['total_s'] * 100 if report['total_s'] else 0.0
+        lines.append(f"   • {cat:<12} {seconds:9.2f}s  {share:5.1f}%")
+
+    for group, entry in sorted(report['groups'].items(), key=lambda item: -item[1]['wall_s']):
+        lines.append("")
+        lines.append(f"👥 Группа {group}: {entry['wall_s']:.2f}s")
+        for cat, seconds in sorted(entry['stages'].items(), key=lambda item: -item[1]):
+            lines.append(f"   • {cat:<12} {seconds:9.2f}s")
+        if entry['critical_path']:
+            path = ' → '.join(f"{step['name']} ({step['dur_s']:.2f}s)" for step in entry['critical_path'])
+            lines.append(f"   🔗 Критический путь: {path}")
+    return '\n'.join(lines)
@@ -0,0 +1,235 @@
+"""
+Фоновая запись на диск
+======================
+
+json.dump большого экспорта, csv.DictWriter, сжатие и запись счетчиков
+RateLimiter внутри корутины останавливают event loop: пока файл пишется, ни
+один RPC не уходит. BackgroundWriter выполняет такие операции в отдельном
+потоке записи:
+
+- один поток и FIFO очередь: операции выполняются строго по порядку, поэтому
+  объект, который меняют только операции записи (например, ExternalAggregator
+  экспорта), не нужно защищать блокировками;
+- очередь ограничена (WRITER_QUEUE_SIZE): если диск медленнее сети,
+  submit_async ждет свободного места, не блокируя event loop (backpressure);
+- key: операции с одинаковым ключом, еще не начатые, объединяются - выполнится
+  только последняя (счетчики пишутся один раз вместо каждого вызова);
+- submit_nowait никогда не ждет: при полной очереди операция откладывается
+  и выполняется потоком записи сразу после текущей (для мелких записей из
+  event loop, например счетчиков RateLimiter на каждом вызове API);
+- flush() ждет, пока очередь опустеет (перед чтением того, что записано).
+
+Пример:
+    writer = get_writer()
+    await writer.run(write_json, path, data)            # дождаться записи
+    future = await writer.submit_async(aggregate, rows)  # записать в фоне
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import json
+import logging
+import os
+import queue
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from .codecs import open_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 64
+
+# Как часто submit_async проверяет место в заполненной очереди, секунд
+BACKPRESSURE_POLL = 0.005
+
+_STOP = object()
+# Разбудить поток записи для отложенных операций
+_DRAIN = object()
+
+
+class BackgroundWriter:
+    """Поток записи с ограниченной FIFO очередью"""
+
+    def __init__(self, max_pending: int = DEFAULT_QUEUE_SIZE, name: str = "s16-writer"):
+        """
+        Args:
+            max_pending: Сколько операций может ждать в очереди
+            name: Имя потока (видно в трассировке и отладчике)
+        """
+        self.max_pending = max(1, max_pending)
+        self._queue: queue.Queue = queue.Queue(maxsize=self.max_pending)
+        self._keyed: Dict[Hashable, List[Any]] = {}
+        self._deferred: List[List[Any]] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'coalesced': 0, 'backpressure_waits': 0,
+                      'deferred': 0}
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _make_job(self, func: Callable, args, kwargs, key: Optional[Hashable]):
+        """Новая операция или None, если она объединена с ожидающей (тогда возвращается ее future)"""
+        if self._closed:
+            raise RuntimeError("BackgroundWriter is closed")
+        with self._lock:
+            self.stats['submitted'] += 1
+            if key is not None and key in self._keyed:
+                job = self._keyed[key]
+                job[1], job[2], job[3] = func, args, kwargs
+                self.stats['coalesced'] += 1
+                return None, job[0]
+            job = [concurrent.futures.Future(), func, args, kwargs, key]
+            if key is not None:
+                self._keyed[key] = job
+            return job, job[0]
+
+    def submit(self, func: Callable, *args, key: Optional[Hashable] = None,
+               **kwargs) -> concurrent.futures.Future:
+        """
+        Поставить операцию в очередь (из синхронного кода; блокируется, если очередь полна)
+
+        Returns:
+            Future с результатом func
+        """
+        if threading.current_thread() is self._thread:
+            # Операция из операции записи - выполняем сразу, иначе поток ждал бы сам себя
+            future = concurrent.futures.Future()
+            future.set_result(func(*args, **kwargs))
+            return future
+        job, future = self._make_job(func, args, kwargs, key)
+        if job is not None:
+            self._queue.put(job)
+        return future
+
+    def submit_nowait(self, func: Callable, *args, key: Optional[Hashable] = None,
+                      **kwargs) -> concurrent.futures.Future:
+        """
+        Поставить операцию без ожидания места в очереди (из event loop)
+
+        Если очередь полна, операция откладывается и выполняется потоком записи
+        после текущей - вне порядка очереди. Подходит для операций с key
+        (последняя запись состояния), где порядок важен только внутри ключа.
+        """
+        if threading.current_thread() is self._thread:
+            return self.submit(func, *args, key=key, **kwargs)
+        job, future = self._make_job(func, args, kwargs, key)
+        if job is None:
+            return future
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._deferred.append(job)
+                self.stats['deferred'] += 1
+            try:
+                self._queue.put_nowait(_DRAIN)
+            except queue.Full:
+                # Очередь не пуста - поток заберет отложенные после ближайшей операции
+                pass
+        return future
+
+    async def submit_async(self, func: Callable, *args, key: Optional[Hashable] = None,
+                           **kwargs) -> concurrent.futures.Future:
+        """
+        Поставить операцию в очередь из корутины
+
+        Пока очередь полна, ждет без блокировки event loop - так медленный диск
+        притормаживает выгрузку, а не копит данные в памяти.
+        """
+        job, future = self._make_job(func, args, kwargs, key)
+        if job is None:
+            return future
+        waited = False
+        while True:
+            try:
+                self._queue.put_nowait(job)
+                break
+            except queue.Full:
+                waited = True
+                await asyncio.sleep(BACKPRESSURE_POLL)
+        if waited:
+            self.stats['backpressure_waits'] += 1
+        return future
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Выполнить операцию в потоке записи и дождаться результата"""
+        future = await self.submit_async(func, *args, **kwargs)
+        return await asyncio.wrap_future(future)
+
+    def _execute(self, job: List[Any]):
+        future, _, _, _, key = job
+        with self._lock:
+            if key is not None and self._keyed.get(key) is job:
+                del self._keyed[key]
+            func, args, kwargs = job[1], job[2], job[3]
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func(*args, **kwargs))
+            self.stats['completed'] += 1
+        except BaseException as e:
+            self.stats['failed'] += 1
+            logger.error(f"[SAFE] Background write failed ({getattr(func, '__name__', func)}): {e}")
+            future.set_exception(e)
+
+    def _drain_deferred(self):
+        with self._lock:
+            jobs, self._deferred = self._deferred, []
+        for job in jobs:
+            self._execute(job)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is not _STOP and job is not _DRAIN:
+                    self._execute(job)
+                # До task_done: flush() дожидается и отложенных операций
+                self._drain_deferred()
+                if job is _STOP:
+                    return
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Дождаться выполнения всех поставленных операций"""
+        if threading.current_thread() is self._thread:
+            return
+        self._queue.join()
+
+    def pending(self) -> int:
+        with self._lock:
+            deferred = len(self._deferred)
+        return self._queue.qsize() + deferred
+
+    def close(self):
+        """Выполнить оставшиеся операции и остановить поток"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats, pending=self.pending(), max_pending=self.max_pending)
+
+
+def write_json(path: str, data: Any, indent: int = 2):
+    """Сохраняет JSON (.gz / .zst - со сжатием); для вызова через BackgroundWriter"""
+    with open_text(path, 'w') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent, default=str)
+
+
+# Глобальный экземпляр потока записи
+_writer: Optional[BackgroundWriter] = None
+
+def get_writer() -> BackgroundWriter:
+    """Получить глобальный поток записи (Singleton pattern)"""
+    global _writer
+    if _writer is None:
+        _writer = BackgroundWriter(int(os.getenv("WRITER_QUEUE_SIZE", str(DEFAULT_QUEUE_SIZE))))
+        # Счетчики и файлы, поставленные перед выходом, дописываются
+        atexit.register(_writer.close)
+    return _writer
@@ -0,0 +1,65 @@
+"""
+Тесты для агрегатов активности по сообщениям
+"""
+
+import pytest
+
+from src.core.activity import ActivityStore
+
+GROUP_A = -1002188344480
+GROUP_B = -1002540509234
+
+
+def message(message_id, sender_id, date, group_id=GROUP_A, service=False):
+    return {'group_id': group_id, 'id': message_id, 'date': date, 'sender_id': sender_id,
+            'text_len': 10, 'service': service}
+
+
+@pytest.fixture
+def store(tmp_path):
+    activity = ActivityStore(str(tmp_path / "activity.db"))
+    yield activity
+    activity.close()
+
+
+def test_incremental_pages_and_replay(store):
+    """Страницы копят агрегаты; повтор уже учтенной страницы ничего не меняет"""
+    newest = [
+        message(12, 7, '2025-08-03T10:00:00+00:00'),
+        message(11, 7, '2025-08-03T09:00:00+00:00'),
+        message(10, -1002188344480, '2025-08-02T09:00:00+00:00'),
+        message(9, 8, '2025-08-02T08:00:00+00:00', service=True),
+    ]
+    older = [
+        message(8, 7, '2025-08-01T23:59:00+00:00'),
+        message(7, 8, '2025-08-01T12:00:00+00:00'),
+    ]
+
+    assert store.process_page(GROUP_A, newest) == 2
+    assert store.process_page(GROUP_A, older) == 2
+    assert store.process_page(GROUP_A, older) == 0
+    assert store.coverage(GROUP_A) == {'min_id': 7, 'max_id': 12, 'messages': 4}
+
+    activity = store.user_activity(7)
+    assert activity == [{'group_id': GROUP_A, 'messages': 3, 'first_active': '2025-08-01T23:59:00+00:00',
+                         'last_active': '2025-08-03T10:00:00+00:00', 'active_days': 2}]
+
+    assert store.process_page(GROUP_A, [message(13, 7, '2025-08-03T11:00:00+00:00')]) == 1
+    assert store.user_activity(7)[0]['active_days'] == 2
+
+
+def test_top_users_excludes_members(store):
+    """Рейтинг по всем группам без участников референсной группы"""
+    store.process_page(GROUP_A, [message(i, 1, f'2025-08-0{i}T10:00:00+00:00') for i in range(1, 6)])
+    store.process_page(GROUP_A, [message(i, 2, '2025-08-01T10:00:00+00:00') for i in range(6, 9)])
+    store.process_page(GROUP_B, [message(i, 2, '2025-08-02T10:00:00+00:00', GROUP_B) for i in range(1, 4)])
+    store.process_page(GROUP_B, [message(4, 3, '2025-08-02T10:00:00+00:00', GROUP_B)])
+
+    top = store.top_users(limit=2)
+    assert [(u['user_id'], u['messages'], u['groups'], u['active_days']) for u in top] == [(2, 6, 2, 2), (1, 5, 1, 5)]
+
+    members = {2}
+    top = store.top_users(limit=10, exclude=lambda user_id: user_id in members)
+    assert [u['user_id'] for u in top] == [1, 3]
+    assert [u['user_id'] for u in store.top_users(group_ids=[GROUP_B])] == [2, 3]
+    assert store.get_stats() == {'groups': 2, 'messages': 12, 'user_groups': 4}
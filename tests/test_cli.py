@@ -65,6 +65,23 @@ async def test_cli_participants_command_text(mock_telegram_client, sample_partic
             # Проверяем вызов
             mock_group_manager.get_participants.assert_called_once_with("testgroup", 10)
 
+@pytest.mark.asyncio
+async def test_cli_participants_with_role(sample_participants, capsys):
+    """participants --role: фильтр выбирает планировщик, выводится выбранный фильтр"""
+    mock_group_manager = AsyncMock()
+    mock_group_manager.find_participants.return_value = {
+        'plan': {'filter': 'admins', 'query': '', 'client_query': 'test', 'client_contacts': False},
+        'participants': sample_participants[:1],
+    }
+    
+    await handle_participants(mock_group_manager, "testgroup", 10, "text", query="test", role="admin")
+    
+    mock_group_manager.find_participants.assert_called_once_with(
+        "testgroup", role="admin", query="test", contacts_only=False, limit=10
+    )
+    mock_group_manager.get_participants.assert_not_called()
+    assert "Фильтр: admins" in capsys.readouterr().out
+
 @pytest.mark.asyncio
 async def test_cli_search_command(mock_telegram_client, sample_participants):
     """Тест команды search"""
@@ -140,6 +157,8 @@ async def test_cli_main_function():
         mock_args.query = None
         mock_args.output = None
         mock_args.format = 'json'
+        mock_args.metrics_file = None
+        mock_args.trace = None
         mock_parser.parse_args.return_value = mock_args
         
         with patch('src.cli.get_client') as mock_get_client:
@@ -173,6 +192,8 @@ async def test_cli_main_function_with_search():
         mock_args.query = 'test'
         mock_args.output = None
         mock_args.format = 'json'
+        mock_args.metrics_file = None
+        mock_args.trace = None
         mock_parser.parse_args.return_value = mock_args
         
         with patch('src.cli.get_client') as mock_get_client:
@@ -218,7 +239,12 @@ async def test_cli_main_function_with_export():
         mock_args.limit = 100
         mock_args.query = None
         mock_args.output = 'test_export.json'
+        mock_args.harvest = False
+        mock_args.takeout = False
         mock_args.format = 'json'
+        mock_args.compress = None
+        mock_args.metrics_file = None
+        mock_args.trace = None
         mock_parser.parse_args.return_value = mock_args
         
         with patch('src.cli.get_client') as mock_get_client:
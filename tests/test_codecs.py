@@ -0,0 +1,104 @@
+"""
+Тесты для потокового сжатия файлов экспорта
+"""
+
+import gzip
+import json
+import pytest
+from unittest.mock import AsyncMock
+
+from src.infra.codecs import (
+    available_codecs, detect_codec, find_existing, open_text, strip_codec_suffix,
+    with_codec_suffix
+)
+from src.core.export_delta import compute_delta, load_latest_state, write_changes
+from src.core.export_diff import diff_exports, iter_json_array, summarize, write_record_array
+
+GROUP_ID = -1002188344480
+
+
+def test_codec_names():
+    """Тест определения кодека по расширению"""
+    assert detect_codec("members.json.gz") == "gzip"
+    assert detect_codec("members.json.zst") == "zstd"
+    assert detect_codec("members.json") is None
+    assert strip_codec_suffix("export.csv.gz") == "export.csv"
+    assert with_codec_suffix("export.csv", "gzip") == "export.csv.gz"
+    assert with_codec_suffix("export.csv.gz", "gzip") == "export.csv.gz"
+    assert with_codec_suffix("export.csv", None) == "export.csv"
+    with pytest.raises(ValueError):
+        with_codec_suffix("export.csv", "lz4")
+
+
+@pytest.mark.parametrize("codec", available_codecs())
+def test_roundtrip(tmp_path, codec):
+    """Запись и чтение через open_text"""
+    path = with_codec_suffix(tmp_path / "data.txt", codec)
+    with open_text(path, "w") as f:
+        f.write("строка\n" * 1000)
+
+    with open_text(path) as f:
+        assert f.read() == "строка\n" * 1000
+
+
+def test_gzip_file_is_standard_and_smaller(tmp_path):
+    """Файл читается обычным gzip и меньше исходного"""
+    path = tmp_path / "members.json.gz"
+    records = [{"user_id": i, "username": f"user_{i}"} for i in range(2000)]
+    write_record_array(str(path), "members", records)
+
+    raw = gzip.decompress(path.read_bytes())
+    assert json.loads(raw)["members"] == records
+    assert path.stat().st_size < len(raw) / 3
+    assert list(iter_json_array(str(path), "members", chunk_size=64)) == records
+
+
+def test_find_existing(tmp_path):
+    """Поиск файла или его сжатого варианта"""
+    (tmp_path / "members.json.gz").write_bytes(gzip.compress(b"{}"))
+
+    assert find_existing(tmp_path / "members.json") == tmp_path / "members.json.gz"
+    assert find_existing(tmp_path / "groups.json") is None
+
+
+def test_diff_and_delta_read_compressed_exports(tmp_path):
+    """diff и дельта-экспорт читают сжатые снимки"""
+    root = tmp_path / "export"
+    for name, users in (("s16_export_20250101_000000", [1]), ("s16_export_20250102_000000", [1, 2])):
+        export_dir = root / name
+        export_dir.mkdir(parents=True)
+        with open_text(export_dir / "groups.json.gz", "w") as f:
+            json.dump({"groups": []}, f)
+        write_record_array(str(export_dir / "members.json.gz"), "members", [{"user_id": u} for u in users])
+        write_record_array(str(export_dir / "group_members.json.gz"), "group_members",
+                           [{"group_id": GROUP_ID, "user_id": u} for u in users])
+
+    counts = summarize(diff_exports(str(root / "s16_export_20250101_000000"),
+                                    str(root / "s16_export_20250102_000000")))
+    assert counts["member_added"] == 1
+    assert counts["join"] == 1
+
+    state = load_latest_state(str(root))
+    delta_dir = root / "s16_delta_20250103_000000"
+    delta_dir.mkdir()
+    delta = compute_delta(state, [], {}, set())
+    changes_file = write_changes(delta_dir, delta, base=state.source, codec="gzip")
+
+    assert changes_file.endswith("changes.json.gz")
+    assert json.loads(gzip.decompress(open(changes_file, "rb").read()))["members_removed"] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_cli_export_compressed(sample_participants, tmp_path):
+    """Тест команды export с --compress"""
+    from src.cli import handle_export
+
+    group_manager = AsyncMock()
+    group_manager.get_participants.return_value = sample_participants
+    output = tmp_path / "export.json"
+
+    await handle_export(group_manager, "testgroup", str(output), 10, compress="gzip")
+
+    data = json.loads(gzip.decompress((tmp_path / "export.json.gz").read_bytes()))
+    assert [p["id"] for p in data] == sorted(p["id"] for p in sample_participants)
+    assert not output.exists()
@@ -0,0 +1,96 @@
+"""
+Тесты для колоночного формата связей
+"""
+
+import json
+import pytest
+
+from src.core.columnar import (
+    ColumnarFormatError, MembershipFile, find_edges_file, parquet_available,
+    read_edges, write_membership, write_parquet
+)
+from src.core.export_delta import load_snapshot
+from src.core.export_diff import diff_exports, summarize, write_record_array
+
+GROUP_A = -1002609724956
+GROUP_B = -1002188344480
+
+EDGES = [(GROUP_B, 30), (GROUP_A, 20), (GROUP_A, 10), (GROUP_B, 10), (GROUP_A, 10)]
+
+
+def test_roundtrip_and_zero_copy_reader(tmp_path):
+    """Запись и чтение через mmap"""
+    path = tmp_path / "group_members.s16m"
+    assert write_membership(str(path), EDGES) == 4  # дубль удален
+
+    with MembershipFile(str(path)) as memberships:
+        assert len(memberships) == 4
+        assert memberships.group_ids() == [GROUP_A, GROUP_B]
+
+        users = memberships.members(GROUP_A)
+        assert isinstance(users, memoryview)
+        assert users.format == "q"
+        assert list(users) == [10, 20]
+        del users
+
+        assert memberships.contains(GROUP_B, 30)
+        assert not memberships.contains(GROUP_B, 20)
+        assert not memberships.contains(-1, 10)
+        assert list(memberships.iter_edges()) == [(GROUP_A, 10), (GROUP_A, 20), (GROUP_B, 10), (GROUP_B, 30)]
+
+    # 32 байта заголовок + 2 * 24 индекс + 4 * 8 данные
+    assert path.stat().st_size == 32 + 48 + 32
+
+
+def test_empty_file(tmp_path):
+    """Экспорт без связей"""
+    path = tmp_path / "group_members.s16m"
+    write_membership(str(path), [])
+
+    with MembershipFile(str(path)) as memberships:
+        assert memberships.group_ids() == []
+        assert list(memberships.members(GROUP_A)) == []
+
+
+def test_invalid_file_is_rejected(tmp_path):
+    """Чужой файл дает ColumnarFormatError"""
+    path = tmp_path / "group_members.s16m"
+    path.write_bytes(b"{" * 64)
+
+    with pytest.raises(ColumnarFormatError):
+        MembershipFile(str(path))
+
+
+def test_much_smaller_than_json(tmp_path):
+    """Колоночный файл в разы меньше group_members.json"""
+    edges = [(GROUP_A - g, 100000000 + u) for g in range(5) for u in range(1000)]
+    json_path = tmp_path / "group_members.json"
+    write_record_array(str(json_path), "group_members", [{"group_id": g, "user_id": u} for g, u in edges])
+    columnar_path = tmp_path / "group_members.s16m"
+    write_membership(str(columnar_path), edges)
+
+    assert json_path.stat().st_size > 5 * columnar_path.stat().st_size
+    assert read_edges(str(columnar_path)) == sorted(edges)
+
+
+def test_snapshot_and_diff_accept_columnar(tmp_path):
+    """Дельта-экспорт и diff читают колоночные снимки"""
+    for name, edges in (("old", [(GROUP_A, 1)]), ("new", [(GROUP_A, 1), (GROUP_B, 2)])):
+        export_dir = tmp_path / name
+        export_dir.mkdir()
+        (export_dir / "groups.json").write_text(json.dumps({"groups": []}))
+        write_record_array(str(export_dir / "members.json"), "members", [])
+        write_membership(str(export_dir / "group_members.s16m"), edges)
+
+    assert find_edges_file(str(tmp_path / "new")).suffix == ".s16m"
+    assert load_snapshot(tmp_path / "new").edges == {(GROUP_A, 1), (GROUP_B, 2)}
+    counts = summarize(diff_exports(str(tmp_path / "old"), str(tmp_path / "new")))
+    assert counts["join"] == 1
+
+
+@pytest.mark.skipif(not parquet_available(), reason="pyarrow не установлен")
+def test_parquet_roundtrip(tmp_path):
+    """Parquet (если установлен pyarrow)"""
+    path = tmp_path / "group_members.parquet"
+    write_parquet(str(path), EDGES)
+    assert read_edges(str(path)) == [(GROUP_A, 10), (GROUP_A, 20), (GROUP_B, 10), (GROUP_B, 30)]
@@ -0,0 +1,155 @@
+"""
+Тесты для сверки многих групп с референсной
+"""
+
+import asyncio
+import csv
+import json
+import pytest
+from unittest.mock import AsyncMock
+
+from src.core.columnar import write_membership
+from src.core.crosscheck import CrossChecker, ReferenceRosterError, format_report, load_reference_file
+from src.core.roster_store import RosterStore
+
+SPACE_ID = -1002188344480
+TARGET_A = -1002609724956
+TARGET_B = -1001527724829
+
+
+def people(*ids):
+    return [{'id': i, 'username': f'user{i}', 'first_name': None, 'last_name': None} for i in ids]
+
+
+ROSTERS = {
+    SPACE_ID: people(1, 2, 3),
+    TARGET_A: people(1, 4, 5),
+    TARGET_B: people(2, 5, 6, 7),
+}
+
+
+def make_manager(delay=0.0):
+    manager = AsyncMock()
+    state = {'active': 0, 'max_active': 0}
+
+    async def get_participants(group_id, limit=100):
+        state['active'] += 1
+        state['max_active'] = max(state['max_active'], state['active'])
+        await asyncio.sleep(delay)
+        state['active'] -= 1
+        if group_id not in ROSTERS:
+            raise ValueError("group not found")
+        return ROSTERS[group_id]
+
+    async def get_group_info(group_id):
+        return {'id': group_id, 'title': f'Group {group_id}', 'participants_count': len(ROSTERS.get(group_id, []))}
+
+    manager.get_participants.side_effect = get_participants
+    manager.get_group_info.side_effect = get_group_info
+    manager.state = state
+    return manager
+
+
+@pytest.mark.asyncio
+async def test_reference_fetched_once_without_limit(tmp_path):
+    """Референсный ростер выгружается один раз и без limit"""
+    manager = make_manager()
+    checker = CrossChecker(manager, SPACE_ID, 's16 space', store=RosterStore(str(tmp_path)))
+
+    report = await checker.run([TARGET_A, TARGET_B, SPACE_ID])
+
+    reference_calls = [c for c in manager.get_participants.call_args_list if c.args[0] == SPACE_ID]
+    assert len(reference_calls) == 1
+    assert reference_calls[0].kwargs == {'limit': None}
+    assert all(c.kwargs == {'limit': None} for c in manager.get_participants.call_args_list)
+
+    by_id = {r['target_id']: r for r in report['targets']}
+    assert set(by_id) == {TARGET_A, TARGET_B}  # референсная группа не сверяется сама с собой
+    assert (by_id[TARGET_A]['existing_count'], by_id[TARGET_A]['new_count']) == (1, 2)
+    assert (by_id[TARGET_B]['existing_count'], by_id[TARGET_B]['new_count']) == (1, 3)
+    # Пользователь 5 состоит в обеих целевых группах
+    assert by_id[TARGET_A]['overlap_count'] == 1
+    assert by_id[TARGET_A]['overlap'] == {str(TARGET_B): 1}
+    assert report['summary'] == {
+        'targets': 2, 'failed': 0, 'unique_members': 6, 'existing_unique': 2, 'new_unique': 4
+    }
+
+    # Ростер сохранен для следующих запусков
+    assert RosterStore(str(tmp_path)).load(SPACE_ID).member_ids() == {1, 2, 3}
+
+
+@pytest.mark.asyncio
+async def test_failed_reference_fetch_aborts(tmp_path):
+    """Пустой референсный ростер при непустой группе - ошибка, а не «все новые»"""
+    manager = make_manager()
+    manager.get_participants.side_effect = None
+    manager.get_participants.return_value = []
+    store = RosterStore(str(tmp_path))
+    checker = CrossChecker(manager, SPACE_ID, 's16 space', store=store)
+
+    with pytest.raises(ReferenceRosterError):
+        await checker.run([TARGET_A])
+    assert checker.reference_ids is None
+    assert not store.has(SPACE_ID)
+
+
+@pytest.mark.asyncio
+async def test_reference_from_roster_skips_fetch(tmp_path):
+    """С --use-roster референсная группа не выгружается"""
+    store = RosterStore(str(tmp_path))
+    roster = store.load(SPACE_ID)
+    roster.replace(people(1, 2, 3), participants_count=3)
+    store.save(roster)
+
+    manager = make_manager()
+    checker = CrossChecker(manager, SPACE_ID, store=store)
+    report = await checker.run([TARGET_A], use_roster=True)
+
+    assert [c.args[0] for c in manager.get_participants.call_args_list] == [TARGET_A]
+    assert report['reference']['source'].startswith('roster:')
+
+
+@pytest.mark.asyncio
+async def test_targets_run_concurrently_and_errors_are_reported():
+    """Группы обрабатываются параллельно, ошибка одной не останавливает остальные"""
+    manager = make_manager(delay=0.01)
+    checker = CrossChecker(manager, SPACE_ID, concurrency=2)
+
+    report = await checker.run([TARGET_A, TARGET_B, -100404])
+
+    assert manager.state['max_active'] == 2
+    assert report['summary']['failed'] == 1
+    assert 'Group' in format_report(report)
+
+
+def test_load_reference_file_formats(tmp_path):
+    """Референсный ростер из файлов экспорта"""
+    json_file = tmp_path / 'space.json'
+    json_file.write_text(json.dumps(people(1, 2)))
+    assert load_reference_file(str(json_file), SPACE_ID) == {1, 2}
+
+    csv_file = tmp_path / 'space.csv'
+    with open(csv_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['id', 'username'])
+        writer.writeheader()
+        writer.writerow({'id': 3, 'username': 'x'})
+    assert load_reference_file(str(csv_file), SPACE_ID) == {3}
+
+    export_dir = tmp_path / 's16_export_20250101_000000'
+    export_dir.mkdir()
+    write_membership(str(export_dir / 'group_members.s16m'), [(SPACE_ID, 7), (TARGET_A, 8)])
+    assert load_reference_file(str(export_dir), SPACE_ID) == {7}
+
+
+@pytest.mark.asyncio
+async def test_cli_crosscheck_prints_report(tmp_path, capsys):
+    """Команда crosscheck печатает сводный отчет сверки"""
+    from unittest.mock import patch
+    from src.cli import handle_crosscheck
+
+    with patch('src.cli.RosterStore', lambda: RosterStore(str(tmp_path))):
+        await handle_crosscheck(make_manager(), f"{TARGET_A},{TARGET_B}", output=str(tmp_path / 'report.json'))
+
+    out = capsys.readouterr().out
+    assert 'Новых: 4' in out
+    assert json.loads((tmp_path / 'report.json').read_text())['summary']['new_unique'] == 4
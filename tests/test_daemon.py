@@ -0,0 +1,107 @@
+"""
+Тесты для демона клиента на Unix сокете
+"""
+
+import asyncio
+import os
+import stat
+import tempfile
+from datetime import datetime, timezone
+
+import pytest
+
+from src.infra.daemon import DaemonError, DaemonServer, RemoteGroupManager, connect_daemon, is_daemon_running
+
+
+class FakeManager:
+    """GroupManager без Telegram"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def get_group_info(self, group_identifier):
+        self.calls.append(('get_group_info', group_identifier))
+        return {'id': group_identifier, 'title': 'S16', 'participants_count': 3}
+
+    async def get_participants(self, group_identifier, limit=100):
+        self.calls.append(('get_participants', group_identifier, limit))
+        if group_identifier == 'broken':
+            raise ValueError("group not found")
+        return [{'id': i, 'username': f'user{i}'} for i in range(limit or 5000)]
+
+    async def get_group_creation_date(self, group_identifier):
+        return datetime(2019, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def socket_path():
+    # Путь Unix сокета ограничен ~100 символами - короткий каталог вместо tmp_path
+    directory = tempfile.mkdtemp(prefix='s16d')
+    yield os.path.join(directory, 's16.sock')
+    for name in os.listdir(directory):
+        os.unlink(os.path.join(directory, name))
+    os.rmdir(directory)
+
+
+@pytest.mark.asyncio
+async def test_remote_calls(socket_path):
+    """Вызовы через демон возвращают то же, что GroupManager"""
+    manager = FakeManager()
+    server = DaemonServer(manager, socket_path)
+    await server.start()
+    try:
+        assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+
+        remote = await connect_daemon(socket_path)
+        assert remote is not None
+        assert (await remote.get_group_info(-1002188344480))['title'] == 'S16'
+        # Большой ответ одной строкой
+        assert len(await remote.get_participants(-1002188344480, limit=None)) == 5000
+        assert await remote.get_group_creation_date('s16space') == datetime(2019, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+        with pytest.raises(DaemonError) as error:
+            await remote.get_participants('broken')
+        assert error.value.error_type == 'ValueError'
+        with pytest.raises(DaemonError):
+            await remote.call('__init__')
+
+        # Соединение продолжает работать после ошибок
+        assert (await remote.ping())['requests'] == 7
+        assert manager.calls[1] == ('get_participants', -1002188344480, None)
+        await remote.close()
+    finally:
+        await server.close()
+    assert not os.path.exists(socket_path)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_clients(socket_path):
+    """Несколько клиентов обслуживаются одновременно"""
+    server = DaemonServer(FakeManager(), socket_path)
+    await server.start()
+    try:
+        remotes = [RemoteGroupManager(socket_path) for _ in range(3)]
+        results = await asyncio.gather(*(r.get_participants(-100, limit=10) for r in remotes))
+        assert [len(r) for r in results] == [10, 10, 10]
+        for remote in remotes:
+            await remote.close()
+    finally:
+        await server.close()
+
+
+@pytest.mark.asyncio
+async def test_no_daemon(socket_path):
+    """Без демона CLI подключается напрямую; старый файл сокета не мешает запуску"""
+    assert await connect_daemon(socket_path) is None
+
+    open(socket_path, 'w').close()
+    assert not await is_daemon_running(socket_path)
+
+    server = DaemonServer(FakeManager(), socket_path)
+    await server.start()
+    try:
+        assert await is_daemon_running(socket_path)
+        with pytest.raises(RuntimeError):
+            await DaemonServer(FakeManager(), socket_path).start()
+    finally:
+        await server.close()
@@ -0,0 +1,160 @@
+"""
+Тесты для дельта-экспорта
+"""
+
+import json
+
+import export_3_jsons
+from src.core.export_delta import (
+    CHANGES_FILE, ExportState, apply_delta, carry_over_failed_groups, compute_delta,
+    find_export_chain, is_empty_delta, load_latest_state, should_write_full,
+    write_changes, write_manifest
+)
+from src.core.external_dedup import ExternalAggregator
+
+GROUP_A = -1002188344480
+GROUP_B = -1002609724956
+
+
+def member(user_id, username=None, **fields):
+    record = {
+        "user_id": user_id,
+        "username": username,
+        "first_name": f"User{user_id}",
+        "last_name": None,
+        "is_premium": False,
+        "is_verified": False
+    }
+    record.update(fields)
+    return record
+
+
+def write_snapshot(export_dir, groups, members, edges):
+    """Полный снимок в формате export_3_jsons.py"""
+    export_dir.mkdir(parents=True)
+    (export_dir / "groups.json").write_text(json.dumps({"groups": groups}))
+    (export_dir / "members.json").write_text(json.dumps({"members": members}))
+    (export_dir / "group_members.json").write_text(json.dumps({
+        "group_members": [{"group_id": g, "user_id": u} for g, u in edges]
+    }))
+
+
+def test_compute_delta_joins_leaves_and_profile_changes():
+    """Тест вычисления изменений"""
+    old = ExportState(
+        groups=[{"group_id": GROUP_A, "title": "s16 space"}],
+        members={1: member(1, "alice"), 2: member(2, "bob")},
+        edges={(GROUP_A, 1), (GROUP_A, 2)}
+    )
+    new_members = {1: member(1, "alice_new", is_premium=True), 3: member(3, "carol")}
+    new_edges = {(GROUP_A, 1), (GROUP_A, 3)}
+
+    delta = compute_delta(old, old.groups, new_members, new_edges)
+
+    assert delta["joins"] == [[GROUP_A, 3]]
+    assert delta["leaves"] == [[GROUP_A, 2]]
+    assert [m["user_id"] for m in delta["members_added"]] == [3]
+    assert delta["members_removed"] == [2]
+    assert delta["profile_changes"] == [{
+        "user_id": 1,
+        "changes": {"username": ["alice", "alice_new"], "is_premium": [False, True]}
+    }]
+
+    # Применение дельты к старому состоянию дает новое
+    apply_delta(old, delta)
+    assert old.edges == new_edges
+    assert old.members == new_members
+
+
+def test_unchanged_state_gives_empty_delta():
+    """Без изменений дельта пустая"""
+    state = ExportState(members={1: member(1)}, edges={(GROUP_A, 1)})
+    delta = compute_delta(state, [], {1: member(1)}, {(GROUP_A, 1)})
+    assert is_empty_delta(delta)
+
+
+def test_load_latest_state_applies_delta_chain(tmp_path):
+    """Состояние = последний полный снимок + дельты после него"""
+    root = tmp_path / "export"
+    # Старый экспорт без manifest.json считается полным снимком
+    write_snapshot(root / "s16_export_20250101_000000", [], [member(1)], [(GROUP_A, 1)])
+
+    base = load_latest_state(str(root))
+    assert base.source == "s16_export_20250101_000000"
+    assert base.chain_length == 0
+
+    delta_dir = root / "s16_delta_20250102_000000"
+    delta_dir.mkdir()
+    delta = compute_delta(base, [], {1: member(1), 2: member(2)}, {(GROUP_A, 1), (GROUP_B, 2)})
+    write_changes(delta_dir, delta, base=base.source)
+    write_manifest(delta_dir, "delta", base=base.source)
+
+    state = load_latest_state(str(root))
+    assert state.source == "s16_delta_20250102_000000"
+    assert state.chain_length == 1
+    assert state.edges == {(GROUP_A, 1), (GROUP_B, 2)}
+    assert set(state.members) == {1, 2}
+
+    # changes.json компактный
+    assert "\n" not in (delta_dir / CHANGES_FILE).read_text()
+
+
+def test_full_snapshot_resets_chain(tmp_path):
+    """Новый полный снимок - точка компакции"""
+    root = tmp_path / "export"
+    write_snapshot(root / "s16_export_20250101_000000", [], [member(1)], [(GROUP_A, 1)])
+    (root / "s16_delta_20250102_000000").mkdir()
+    write_manifest(root / "s16_delta_20250102_000000", "delta", base="s16_export_20250101_000000")
+    write_snapshot(root / "s16_export_20250103_000000", [], [member(2)], [(GROUP_A, 2)])
+
+    snapshot, deltas = find_export_chain(str(root))
+
+    assert snapshot.name == "s16_export_20250103_000000"
+    assert deltas == []
+    assert set(load_latest_state(str(root)).members) == {2}
+
+
+def test_should_write_full():
+    """Полный снимок: нет базы или цепочка дельт достигла full_every"""
+    assert should_write_full(None, 10)
+    assert not should_write_full(ExportState(chain_length=0), 10)
+    assert not should_write_full(ExportState(chain_length=8), 10)
+    assert should_write_full(ExportState(chain_length=9), 10)
+    assert should_write_full(ExportState(chain_length=0), 1)
+
+
+def test_failed_group_is_carried_over():
+    """Несобранная группа не превращается в массовый выход участников"""
+    previous = ExportState(
+        groups=[{"group_id": GROUP_A, "title": "A"}, {"group_id": GROUP_B, "title": "B"}],
+        members={1: member(1), 2: member(2)},
+        edges={(GROUP_A, 1), (GROUP_B, 2)}
+    )
+    groups = [{"group_id": GROUP_A, "title": "A"}]
+    members = {1: member(1)}
+    edges = {(GROUP_A, 1)}
+
+    carry_over_failed_groups(previous, [GROUP_B], groups, members, edges)
+
+    assert is_empty_delta(compute_delta(previous, groups, members, edges))
+    assert {g["group_id"] for g in groups} == {GROUP_A, GROUP_B}
+
+
+def test_unchanged_export_writes_no_delta(tmp_path, monkeypatch):
+    """Без изменений каталог дельты не создается и цепочка не растет"""
+    root = tmp_path / "export"
+    groups = [{"group_id": GROUP_A, "title": "s16 space"}]
+    write_snapshot(root / "s16_export_20250101_000000", groups, [member(1)], [(GROUP_A, 1)])
+    monkeypatch.setattr(export_3_jsons, "EXPORT_ROOT", str(root))
+
+    with ExternalAggregator(tmp_dir=str(tmp_path)) as aggregator:
+        aggregator.add_member(member(1))
+        aggregator.add_edge(GROUP_A, 1)
+        output_dir, member_count, edge_count = export_3_jsons.save_export(
+            list(groups), aggregator, [], delta=True, full_every=10, edge_format="json", compress=None
+        )
+
+    assert output_dir is None
+    assert (member_count, edge_count) == (1, 1)
+    assert sorted(p.name for p in root.iterdir()) == ["s16_export_20250101_000000"]
+    assert load_latest_state(str(root)).chain_length == 0
@@ -0,0 +1,98 @@
+"""
+Тесты для потокового diff экспортов
+"""
+
+import json
+import pytest
+
+from src.core.export_diff import (
+    UnsortedExportError, diff_exports, iter_json_array, merge_join, summarize,
+    write_record_array
+)
+
+GROUP_A = -1002609724956
+GROUP_B = -1002188344480
+
+
+def member(user_id, username=None, **fields):
+    record = {"user_id": user_id, "username": username, "first_name": None,
+              "last_name": None, "is_premium": False, "is_verified": False}
+    record.update(fields)
+    return record
+
+
+def write_export(export_dir, members, edges):
+    export_dir.mkdir()
+    write_record_array(str(export_dir / "members.json"), "members", members)
+    write_record_array(str(export_dir / "group_members.json"), "group_members",
+                       [{"group_id": g, "user_id": u} for g, u in edges])
+
+
+def test_write_record_array_is_valid_json(tmp_path):
+    """Файл читается json.load, одна запись на строку"""
+    path = tmp_path / "members.json"
+    write_record_array(str(path), "members", [member(1), member(2)])
+
+    assert [m["user_id"] for m in json.loads(path.read_text())["members"]] == [1, 2]
+    assert len(path.read_text().splitlines()) == 4
+
+    write_record_array(str(path), "members", [])
+    assert json.loads(path.read_text()) == {"members": []}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 16])
+def test_iter_json_array_streams_across_chunks(tmp_path, chunk_size):
+    """Элементы, разрезанные границей блока, декодируются корректно"""
+    records = [member(i, f"user_{i}", first_name="Имя { ] ,") for i in range(50)]
+    path = tmp_path / "members.json"
+    # Обычный json.dump с отступами тоже читается
+    path.write_text(json.dumps({"members": records}, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    assert list(iter_json_array(str(path), "members", chunk_size=chunk_size)) == records
+
+
+def test_merge_join():
+    """Тест линейного merge-join"""
+    result = list(merge_join([1, 3, 5], [2, 3, 6], key=lambda x: x))
+    assert result == [(1, 1, None), (2, None, 2), (3, 3, 3), (5, 5, None), (6, None, 6)]
+
+
+def test_diff_exports(tmp_path):
+    """Тест сравнения двух экспортов"""
+    write_export(tmp_path / "old", [member(1, "alice"), member(2), member(3)],
+                 [(GROUP_A, 1), (GROUP_A, 2), (GROUP_B, 3)])
+    write_export(tmp_path / "new", [member(1, "alice2"), member(3), member(4)],
+                 [(GROUP_A, 1), (GROUP_B, 3), (GROUP_B, 4)])
+
+    events = []
+    counts = summarize(diff_exports(str(tmp_path / "old"), str(tmp_path / "new"), chunk_size=16),
+                       sink=events.append)
+
+    assert counts == {"member_added": 1, "member_removed": 1, "member_changed": 1, "join": 1, "leave": 1}
+    assert {"type": "member_changed", "user_id": 1, "changes": {"username": ["alice", "alice2"]}} in events
+    assert {"type": "leave", "group_id": GROUP_A, "user_id": 2} in events
+    assert {"type": "join", "group_id": GROUP_B, "user_id": 4} in events
+
+
+def test_unsorted_export_is_rejected(tmp_path):
+    """Старый несортированный экспорт дает понятную ошибку"""
+    write_export(tmp_path / "old", [member(2), member(1)], [])
+    write_export(tmp_path / "new", [member(1), member(2)], [])
+
+    with pytest.raises(UnsortedExportError):
+        list(diff_exports(str(tmp_path / "old"), str(tmp_path / "new")))
+
+
+def test_cli_diff_writes_ndjson(tmp_path, capsys):
+    """Тест команды diff"""
+    from src.cli import handle_diff
+
+    write_export(tmp_path / "old", [member(1)], [(GROUP_A, 1)])
+    write_export(tmp_path / "new", [member(1), member(2)], [(GROUP_A, 1), (GROUP_A, 2)])
+    output = tmp_path / "changes.ndjson"
+
+    handle_diff(str(tmp_path / "old"), str(tmp_path / "new"), str(output))
+
+    lines = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [event["type"] for event in lines] == ["member_added", "join"]
+    assert "вступили 1" in capsys.readouterr().out
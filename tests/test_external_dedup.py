@@ -0,0 +1,63 @@
+"""
+Тесты для дедупликации с выгрузкой на диск
+"""
+
+import random
+
+from src.core.external_dedup import ExternalAggregator, MAX_MERGE_FAN_IN, MEMBER_RECORD_BYTES
+
+GROUP_A = -1002609724956
+GROUP_B = -1002188344480
+
+
+def member(user_id, username=None):
+    return {"user_id": user_id, "username": username}
+
+
+def test_in_memory_when_under_budget(tmp_path):
+    """Без превышения бюджета диск не используется"""
+    with ExternalAggregator(memory_budget_mb=10, tmp_dir=str(tmp_path)) as aggregator:
+        for user_id in (3, 1, 2, 1):
+            aggregator.add_member(member(user_id))
+            aggregator.add_edge(GROUP_A, user_id)
+
+        assert [m["user_id"] for m in aggregator.iter_members()] == [1, 2, 3]
+        assert list(aggregator.iter_edges()) == [(GROUP_A, 1), (GROUP_A, 2), (GROUP_A, 3)]
+        assert not aggregator.spilled
+        assert list(tmp_path.iterdir()) == []
+
+
+def test_spill_and_merge_matches_in_memory(tmp_path):
+    """Результат с выгрузкой на диск совпадает с дедупликацией в памяти"""
+    rng = random.Random(42)
+    edges = [(rng.choice((GROUP_A, GROUP_B)), rng.randrange(5000)) for _ in range(20000)]
+
+    # Бюджет примерно на 50 участников - прогонов больше MAX_MERGE_FAN_IN
+    budget_mb = 50 * MEMBER_RECORD_BYTES / 1024 / 1024
+    aggregator = ExternalAggregator(memory_budget_mb=budget_mb, tmp_dir=str(tmp_path))
+    expected_members = {}
+    for group_id, user_id in edges:
+        record = member(user_id, f"user_{user_id}_{group_id}")
+        expected_members.setdefault(user_id, record)
+        aggregator.add_member(record)
+        aggregator.add_edge(group_id, user_id)
+
+    assert aggregator.spills > 10
+    assert aggregator.get_stats()["member_runs"] <= MAX_MERGE_FAN_IN
+
+    members = list(aggregator.iter_members())
+    assert [m["user_id"] for m in members] == sorted(expected_members)
+    # При повторе остается первая увиденная запись, как в исходном экспорте
+    assert members == [expected_members[user_id] for user_id in sorted(expected_members)]
+    assert list(aggregator.iter_edges()) == sorted(set(edges))
+    assert aggregator.get_stats()["spilled_mb"] > 0
+
+    aggregator.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_memory_budget_from_env(monkeypatch, tmp_path):
+    """Бюджет по умолчанию берется из EXPORT_MEMORY_BUDGET_MB"""
+    monkeypatch.setenv("EXPORT_MEMORY_BUDGET_MB", "1")
+    aggregator = ExternalAggregator(tmp_dir=str(tmp_path))
+    assert aggregator.memory_budget_bytes == 1024 * 1024
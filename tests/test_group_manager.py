@@ -2,10 +2,14 @@
 Тесты для GroupManager
 """
 
+import asyncio
+import gzip
+
 import pytest
 from unittest.mock import AsyncMock, MagicMock
 from telethon.errors import ChatAdminRequiredError, FloodWaitError
 from src.core.group_manager import GroupManager
+from src.infra.metrics import get_metrics
 from telethon.tl.types import User
 
 @pytest.mark.asyncio
@@ -187,4 +191,278 @@ async def test_export_participants_to_csv_no_participants(mock_telegram_client,
     result = await group_manager.export_participants_to_csv("testgroup", str(csv_file))
     
     assert result == False
-    assert not csv_file.exists() 
\ No newline at end of file
+    assert not csv_file.exists()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_get_group_info_is_coalesced(mock_telegram_client, mock_channel):
+    """Одновременные запросы одной группы резолвят сущность один раз"""
+    
+    async def slow_get_entity(*args, **kwargs):
+        await asyncio.sleep(0.01)
+        return mock_channel
+    
+    mock_telegram_client.get_entity.side_effect = slow_get_entity
+    
+    group_manager = GroupManager(mock_telegram_client)
+    results = await asyncio.gather(
+        group_manager.get_group_info("testgroup"),
+        group_manager.get_group_info("@TestGroup"),
+    )
+    
+    assert all(r['id'] == mock_channel.id for r in results)
+    assert mock_telegram_client.get_entity.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_export_participants_to_csv_gzip(mock_telegram_client, mock_channel, sample_participants, tmp_path):
+    """Тест экспорта в сжатый CSV (кодек по расширению)"""
+    from tests.conftest import AsyncIteratorMock
+    
+    mock_users = []
+    for participant in sample_participants:
+        user = MagicMock(spec=User)
+        user.id = participant['id']
+        user.username = participant['username']
+        user.first_name = participant['first_name']
+        user.last_name = participant['last_name']
+        user.phone = participant['phone']
+        user.bot = participant['is_bot']
+        user.verified = participant['is_verified']
+        user.premium = participant['is_premium']
+        user.status = participant['status']
+        mock_users.append(user)
+    
+    mock_telegram_client.get_entity.return_value = mock_channel
+    mock_telegram_client.iter_participants.return_value = AsyncIteratorMock(mock_users)
+    
+    group_manager = GroupManager(mock_telegram_client)
+    csv_file = tmp_path / "test_participants.csv.gz"
+    
+    result = await group_manager.export_participants_to_csv("testgroup", str(csv_file), limit=10)
+    
+    assert result == True
+    content = gzip.decompress(csv_file.read_bytes()).decode('utf-8')
+    assert content.startswith("id,username,first_name,last_name,phone,is_verified,is_premium,status")
+    assert "user1" in content
+
+
+def _make_users(names):
+    users = []
+    for user_id, name in enumerate(names, 1):
+        user = MagicMock(spec=User)
+        user.id = user_id
+        user.username = None
+        user.first_name = name
+        user.last_name = None
+        user.phone = None
+        user.bot = False
+        user.verified = False
+        user.premium = False
+        user.status = None
+        users.append(user)
+    return users
+
+
+@pytest.mark.asyncio
+async def test_harvest_participants_sweeps_prefixes(mock_telegram_client, mock_channel):
+    """Обычный обход обрезан - перебор префиксов дособирает участников, насыщенные префиксы уточняются"""
+    from tests.conftest import AsyncIteratorMock
+    
+    names = ['anna', 'andrey', 'anton', 'boris', 'борис', 'вера', '42']
+    users = _make_users(names)
+    mock_channel.participants_count = len(users)
+    mock_telegram_client.get_entity.return_value = mock_channel
+    cap = 2
+    
+    def iter_participants(group_id, search=None, limit=None):
+        matched = [u for u in users if search is None or u.first_name.startswith(search)]
+        return AsyncIteratorMock(matched[:cap])
+    
+    mock_telegram_client.iter_participants.side_effect = iter_participants
+    
+    group_manager = GroupManager(mock_telegram_client)
+    result = await group_manager.harvest_participants("testgroup", concurrency=4, saturation=cap)
+    
+    assert [p['first_name'] for p in result['participants']] == names
+    coverage = result['coverage']
+    assert coverage['plain_walk'] == cap
+    assert coverage['found'] == len(users)
+    assert coverage['coverage'] == 1.0
+    assert coverage['complete'] is True
+    # "a" упирается в лимит и уточняется ("an" - тоже)
+    assert coverage['saturated_prefixes'][:2] == ['a', 'an']
+
+
+@pytest.mark.asyncio
+async def test_harvest_participants_skips_sweep_when_walk_is_complete(mock_telegram_client, mock_channel):
+    """Если обычный обход вернул всех, поисковых запросов нет"""
+    from tests.conftest import AsyncIteratorMock
+    
+    users = _make_users(['anna', 'boris'])
+    mock_channel.participants_count = 2
+    mock_telegram_client.get_entity.return_value = mock_channel
+    mock_telegram_client.iter_participants.return_value = AsyncIteratorMock(users)
+    
+    result = await GroupManager(mock_telegram_client).harvest_participants("testgroup")
+    
+    assert result['coverage']['queries'] == 1
+    assert len(result['participants']) == 2
+    mock_telegram_client.iter_participants.assert_called_once_with('@testgroup', limit=None)
+
+
+@pytest.mark.asyncio
+async def test_get_participants_records_page_latency(mock_telegram_client, mock_channel):
+    """История для планировщика: замер на каждую страницу участников, а не один на проход"""
+    from tests.conftest import AsyncIteratorMock
+    
+    def observed_pages():
+        pages = get_metrics().get_histogram("participants_page_seconds")
+        return pages.count if pages is not None else 0
+    
+    mock_telegram_client.get_entity.return_value = mock_channel
+    users = _make_users([f"user{i}" for i in range(450)])
+    mock_telegram_client.iter_participants.return_value = AsyncIteratorMock(users)
+    before = observed_pages()
+    
+    result = await GroupManager(mock_telegram_client).get_participants("testgroup", limit=None)
+    
+    assert len(result) == 450
+    assert observed_pages() - before == 3
+
+
+def test_plan_participants_filter_picks_narrowest():
+    """Роль уже, чем контакты, контакты уже поиска; условия без серверной поддержки - после выгрузки"""
+    from src.core.group_manager import plan_participants_filter
+    
+    assert plan_participants_filter()['filter'] == 'recent'
+    assert plan_participants_filter(query='dm') == {
+        'filter': 'search', 'query': 'dm', 'client_query': '', 'client_contacts': False
+    }
+    assert plan_participants_filter(query='dm', contacts_only=True)['filter'] == 'contacts'
+    # У admins нет q - имя проверяется после выгрузки
+    assert plan_participants_filter(role='admin', query='dm') == {
+        'filter': 'admins', 'query': '', 'client_query': 'dm', 'client_contacts': False
+    }
+    assert plan_participants_filter(role='kicked', query='dm')['query'] == 'dm'
+    with pytest.raises(ValueError):
+        plan_participants_filter(role='owner')
+
+
+@pytest.mark.asyncio
+async def test_get_participants_server_filter(mock_telegram_client, mock_channel):
+    """Фильтр уходит в iter_participants; с filter='bots' боты не отбрасываются"""
+    from tests.conftest import AsyncIteratorMock
+    from telethon.tl.types import ChannelParticipantsBots
+    
+    bot = _make_users(['helper'])[0]
+    bot.bot = True
+    mock_telegram_client.get_entity.return_value = mock_channel
+    mock_telegram_client.iter_participants.return_value = AsyncIteratorMock([bot])
+    
+    participants = await GroupManager(mock_telegram_client).get_participants("testgroup", None, filter='bots')
+    
+    assert [p['is_bot'] for p in participants] == [True]
+    _, kwargs = mock_telegram_client.iter_participants.call_args
+    assert isinstance(kwargs['filter'], ChannelParticipantsBots)
+
+
+@pytest.mark.asyncio
+async def test_find_participants_checks_name_after_admin_filter(mock_telegram_client, mock_channel):
+    """find_participants: серверный фильтр admins, имя проверяется на клиенте"""
+    from tests.conftest import AsyncIteratorMock
+    from telethon.tl.types import ChannelParticipantsAdmins
+    
+    mock_telegram_client.get_entity.return_value = mock_channel
+    mock_telegram_client.iter_participants.return_value = AsyncIteratorMock(_make_users(['Dmitry', 'Anna']))
+    
+    result = await GroupManager(mock_telegram_client).find_participants("testgroup", role='admin', query='dmi')
+    
+    assert result['plan']['filter'] == 'admins'
+    assert [p['first_name'] for p in result['participants']] == ['Dmitry']
+    _, kwargs = mock_telegram_client.iter_participants.call_args
+    assert isinstance(kwargs['filter'], ChannelParticipantsAdmins)
+
+
+def test_membership_check_cost():
+    """Несколько кандидатов в большой группе - проверки, много кандидатов в маленькой - ростер"""
+    from src.core.group_manager import membership_check_cost
+    
+    assert membership_check_cost(20, 5000)['strategy'] == 'probe'
+    assert membership_check_cost(300, 5000)['strategy'] == 'roster'
+    # Ростер группы больше лимита выдачи неполон
+    assert membership_check_cost(300, 50000)['strategy'] == 'probe'
+    assert membership_check_cost(3, 5000, can_probe=False)['strategy'] == 'roster'
+    assert membership_check_cost(3, None)['strategy'] == 'probe'
+
+
+@pytest.mark.asyncio
+async def test_check_membership_probes(mock_telegram_client, mock_channel):
+    """Поштучные проверки: участник, не участник, неизвестный сессии пользователь"""
+    from telethon.errors import UserNotParticipantError
+    from telethon.tl.types import ChannelParticipant, ChannelParticipantLeft
+    
+    mock_telegram_client.get_entity.return_value = mock_channel
+    
+    async def get_participant(request):
+        if request.participant == 1:
+            return MagicMock(participant=ChannelParticipant(user_id=1, date=None))
+        if request.participant == 2:
+            raise UserNotParticipantError(request=None)
+        if request.participant == 3:
+            return MagicMock(participant=ChannelParticipantLeft(peer=None))
+        raise ValueError("Could not find the input entity")
+    
+    mock_telegram_client.side_effect = get_participant
+    
+    result = await GroupManager(mock_telegram_client).check_membership("testgroup", [1, 2, 3, 4, 1])
+    
+    assert result['cost']['strategy'] == 'probe'
+    assert (result['members'], result['non_members'], result['unknown']) == ([1], [2, 3], [4])
+    mock_telegram_client.iter_participants.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_check_membership_roster(mock_telegram_client, mock_channel):
+    """Кандидатов больше, чем страниц ростера - один проход get_participants"""
+    from tests.conftest import AsyncIteratorMock
+    
+    mock_channel.participants_count = 2
+    mock_telegram_client.get_entity.return_value = mock_channel
+    mock_telegram_client.iter_participants.return_value = AsyncIteratorMock(_make_users(['anna', 'boris']))
+    
+    result = await GroupManager(mock_telegram_client).check_membership("testgroup", [2, 7])
+    
+    assert result['cost']['strategy'] == 'roster'
+    assert (result['members'], result['non_members']) == ([2], [7])
+    
+    # Ошибка выгрузки ростера - ответ неизвестен, а не "не состоят"
+    mock_telegram_client.iter_participants.side_effect = RuntimeError("network")
+    result = await GroupManager(mock_telegram_client).check_membership("testgroup", [2, 7])
+    assert (result['members'], result['non_members'], result['unknown']) == ([], [], [2, 7])
+
+
+@pytest.mark.asyncio
+async def test_get_message_page_records(mock_telegram_client):
+    """Страница истории: метаданные сообщений без текста; ошибка - None, а не конец истории"""
+    from datetime import datetime, timezone
+    from telethon.tl.types import Message, MessageFwdHeader, MessageReplyHeader, PeerChannel, PeerUser
+
+    date = datetime(2025, 8, 1, 12, 0, tzinfo=timezone.utc)
+    message = Message(id=42, peer_id=PeerChannel(2188344480), date=date, message='привет',
+                      from_id=PeerUser(7), reply_to=MessageReplyHeader(reply_to_msg_id=40),
+                      fwd_from=MessageFwdHeader(date=date, from_id=PeerChannel(555)))
+    mock_telegram_client.get_messages.return_value = [message]
+    manager = GroupManager(mock_telegram_client)
+
+    page = await manager.get_message_page(-1002188344480, offset_id=100)
+    assert page == [{
+        'group_id': -1002188344480, 'id': 42, 'date': date.isoformat(), 'sender_id': 7,
+        'reply_to': 40, 'reply_top': None, 'fwd_from': -1000000000555, 'fwd_date': date.isoformat(),
+        'text_len': 6, 'service': False,
+    }]
+    mock_telegram_client.get_messages.assert_called_once_with(
+        -1002188344480, limit=100, offset_id=100, min_id=0, reverse=False)
+
+    mock_telegram_client.get_messages.side_effect = FloodWaitError(request=None, capture=30)
+    assert await manager.get_message_page(-1002188344480) is None
@@ -0,0 +1,92 @@
+"""
+Тесты для персистентной очереди задач
+"""
+
+import time
+
+from src.infra.job_queue import CANCELLED, DONE, FAILED, QUEUED, RUNNING, JobQueue
+
+
+def test_submit_claim_complete(tmp_path):
+    """Задача проходит queued -> running -> done и переживает переоткрытие базы"""
+    db = str(tmp_path / "jobs.db")
+    queue = JobQueue(db)
+    low = queue.submit("export", {"group": "a"})
+    high = queue.submit("export", {"group": "b"}, priority=5)
+
+    job = queue.claim("worker-1")
+    assert job["id"] == high
+    assert (job["status"], job["attempts"], job["worker"]) == (RUNNING, 1, "worker-1")
+
+    queue.save_checkpoint(high, {"done": [1, 2]})
+    queue.complete(high, {"count": 2})
+    queue.close()
+
+    reopened = JobQueue(db)
+    assert reopened.get(high)["status"] == DONE
+    assert reopened.get(high)["checkpoint"] == {"done": [1, 2]}
+    assert reopened.get(high)["result"] == {"count": 2}
+    assert reopened.get(low)["status"] == QUEUED
+    assert reopened.counts() == {DONE: 1, QUEUED: 1}
+
+
+def test_retry_then_failed(tmp_path):
+    """Ошибка: повтор после задержки, после max_attempts - failed"""
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    job_id = queue.submit("crosscheck", {}, max_attempts=2)
+
+    queue.claim("w")
+    assert queue.fail(job_id, "boom", retry_delay=3600) == QUEUED
+    # Задача отложена - забрать ее пока нельзя
+    assert queue.claim("w") is None
+
+    queue._conn.execute("UPDATE jobs SET run_after = 0 WHERE id = ?", (job_id,))
+    assert queue.claim("w")["attempts"] == 2
+    assert queue.fail(job_id, "boom again") == FAILED
+    assert queue.get(job_id)["error"] == "boom again"
+
+
+def test_cancel_queued_and_running(tmp_path):
+    """Отмена: queued - сразу, running - флагом для воркера"""
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    queued = queue.submit("export", {})
+    running = queue.submit("export", {})
+    queue._conn.execute("UPDATE jobs SET priority = 1 WHERE id = ?", (running,))
+    queue.claim("w")
+
+    assert queue.cancel(queued) == CANCELLED
+    assert queue.cancel(running) == RUNNING
+    assert queue.is_cancel_requested(running)
+    assert queue.cancel(999) is None
+
+
+def test_requeue_stale(tmp_path):
+    """Задачи умершего воркера возвращаются в очередь"""
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    job_id = queue.submit("export", {})
+    queue.claim("dead-worker")
+    queue._conn.execute("UPDATE jobs SET heartbeat = ? WHERE id = ?", (time.time() - 3600, job_id))
+
+    assert queue.requeue_stale(stale_after=600) == 1
+    assert queue.get(job_id)["status"] == QUEUED
+    assert queue.claim("new-worker")["attempts"] == 2
+
+
+def test_stale_job_fails_after_max_attempts(tmp_path):
+    """Задача, на которой воркер умирает, не повторяется бесконечно"""
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    job_id = queue.submit("export", {}, max_attempts=2)
+
+    for attempt in (1, 2):
+        assert queue.claim(f"worker-{attempt}")["attempts"] == attempt
+        queue._conn.execute("UPDATE jobs SET heartbeat = ? WHERE id = ?", (time.time() - 3600, job_id))
+        queue.requeue_stale(stale_after=600)
+
+    job = queue.get(job_id)
+    assert job["status"] == FAILED
+    assert "no heartbeat" in job["error"]
+    assert queue.claim("worker-3") is None
+
+    # Попытки исчерпаны, но задача осталась queued (старая база) - не забирается
+    queue._conn.execute("UPDATE jobs SET status = ? WHERE id = ?", (QUEUED, job_id))
+    assert queue.claim("worker-3") is None
@@ -0,0 +1,141 @@
+"""
+Тесты для обработчиков задач и воркера
+"""
+
+import json
+from datetime import datetime, timezone
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from src.core.jobs import JOB_HANDLERS, Worker, job_handler, retry_delay
+from src.core.roster_store import RosterStore
+from src.infra.job_queue import CANCELLED, DONE, FAILED, QUEUED, JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"))
+
+
+@pytest.mark.asyncio
+async def test_export_job(queue, tmp_path, sample_participants):
+    """Задача export пишет отсортированный JSON"""
+    manager = AsyncMock()
+    manager.get_participants.return_value = sample_participants
+    output = tmp_path / "out" / "export.json"
+    job_id = queue.submit("export", {"group": "testgroup", "output": str(output), "limit": None})
+
+    assert await Worker(manager, queue).run_once() == DONE
+
+    manager.get_participants.assert_called_once_with("testgroup", None)
+    data = json.loads(output.read_text())
+    assert [p["id"] for p in data] == sorted(p["id"] for p in sample_participants)
+    assert queue.get(job_id)["result"]["count"] == len(sample_participants)
+    assert await Worker(manager, queue).run_once() is None
+
+
+@pytest.mark.asyncio
+async def test_retry_resumes_from_checkpoint(queue):
+    """После ошибки повтор продолжает с чекпоинта, уже сделанные группы не запрашиваются"""
+    created = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    manager = AsyncMock()
+    manager.get_group_creation_date.side_effect = [created, None, created]
+    job_id = queue.submit("creation-date", {"groups": [-1001, -1002]}, max_attempts=3)
+    worker = Worker(manager, queue, retry_base=0)
+
+    assert await worker.run_once() == QUEUED
+    assert queue.get(job_id)["checkpoint"] == {"dates": {"-1001": created.isoformat()}}
+
+    assert await worker.run_once() == DONE
+    assert [c.args[0] for c in manager.get_group_creation_date.call_args_list] == [-1001, -1002, -1002]
+    assert queue.get(job_id)["result"]["dates"] == {"-1001": created.isoformat(), "-1002": created.isoformat()}
+    assert worker.stats == {"done": 1, "failed": 0, "retried": 1, "cancelled": 0}
+
+
+@pytest.mark.asyncio
+async def test_crosscheck_checkpoint_keeps_only_summaries(queue, tmp_path):
+    """Чекпоинт сверки - сводки групп; списки участников - в файлах задачи, отчет собирается из них"""
+    reference = tmp_path / "reference.json"
+    reference.write_text(json.dumps([{"id": 1}, {"id": 2}]))
+    members = {-1001: [1, 3], -1002: [2, 3, 4]}
+    calls = []
+
+    async def get_participants(group_id, limit=None):
+        calls.append(group_id)
+        if calls == [-1001, -1002]:
+            raise ConnectionError("network down")
+        return [{"id": user_id, "username": None, "first_name": f"User{user_id}", "last_name": None,
+                 "is_premium": False} for user_id in members[group_id]]
+
+    manager = AsyncMock()
+    manager.get_group_info.side_effect = lambda group_id: {"title": str(group_id), "participants_count": None}
+    manager.get_participants.side_effect = get_participants
+    output = tmp_path / "report.json"
+    job_id = queue.submit("crosscheck", {"targets": [-1001, -1002], "reference_file": str(reference),
+                                         "output": str(output)})
+    worker = Worker(manager, queue, retry_base=0)
+
+    with patch("src.core.jobs.RosterStore", lambda: RosterStore(str(tmp_path / "rosters"))):
+        assert await worker.run_once() == QUEUED
+        checkpoint = queue.get(job_id)["checkpoint"]
+        assert list(checkpoint["summaries"]) == ["-1001"]
+        assert checkpoint["summaries"]["-1001"]["existing_count"] == 1
+        assert "existing_members" not in json.dumps(checkpoint)
+
+        assert await worker.run_once() == DONE
+
+    assert calls == [-1001, -1002, -1002]
+    report = json.loads(output.read_text())
+    assert [len(t["existing_members"] + t["new_members"]) for t in report["targets"]] == [2, 3]
+    assert report["summary"]["unique_members"] == 4
+    assert not (tmp_path / f"job_{job_id}").exists()
+
+
+@pytest.mark.asyncio
+async def test_failed_after_max_attempts(queue):
+    """Неизвестный тип задачи и исчерпанные попытки - failed"""
+    job_id = queue.submit("no-such-kind", {}, max_attempts=1)
+    assert await Worker(AsyncMock(), queue).run_once() == FAILED
+    assert "unknown job kind" in queue.get(job_id)["error"]
+
+
+@pytest.mark.asyncio
+async def test_cancel_running_job(queue):
+    """Отмена выполняемой задачи срабатывает на чекпоинте"""
+    async def steps(manager, ctx):
+        for step in range(3):
+            ctx.checkpoint["step"] = step
+            if step == 1:
+                queue.cancel(ctx.job_id)
+            ctx.save()
+        return {}
+
+    job_id = queue.submit("test-steps", {})
+    with patch.dict(JOB_HANDLERS):
+        job_handler("test-steps")(steps)
+        assert await Worker(AsyncMock(), queue).run_once() == CANCELLED
+    assert queue.get(job_id)["checkpoint"] == {"step": 1}
+
+
+def test_retry_delay_respects_flood_wait():
+    """Повтор не раньше FLOOD_WAIT"""
+    from telethon.errors import FloodWaitError
+    error = FloodWaitError(request=None, capture=900)
+    assert retry_delay(error, attempt=1, retry_base=60) == 900
+    assert retry_delay(RuntimeError(), attempt=3, retry_base=60) == 240
+
+
+def test_cli_submit_and_status(queue, capsys):
+    """Команды submit и status работают с очередью без Telegram"""
+    from src.cli import handle_status, handle_submit
+
+    with patch("src.cli.get_job_queue", return_value=queue):
+        assert handle_submit("nope", "-1001") is None
+        job_id = handle_submit("creation-date", "-1001,s16space")
+        handle_status()
+        handle_status(str(job_id))
+
+    assert queue.get(job_id)["params"] == {"groups": [-1001, "s16space"]}
+    out = capsys.readouterr().out
+    assert f"Задача #{job_id} (creation-date): queued" in out
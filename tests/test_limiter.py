@@ -7,6 +7,7 @@ Unit тесты для Anti-Spam Rate Limiter
 2. RateLimiter - управление квотами
 3. safe_call - wrapper с retry логикой
 4. smart_pause - интеллектуальные паузы
+5. SingleFlight - объединение одинаковых запросов
 
 Критический тест: 10 throttles @5rps → ≥2s runtime
 """
@@ -20,6 +21,8 @@ from pathlib import Path
 from unittest.mock import AsyncMock, MagicMock, patch
 from telethon.errors import FloodWaitError
 
+from src.infra.writer import get_writer
+
 # Импортируем наши модули
 from src.infra.limiter import (
     TokenBucket, 
@@ -27,7 +30,9 @@ from src.infra.limiter import (
     safe_call, 
     smart_pause,
     get_rate_limiter,
-    setup_safe_logging
+    setup_safe_logging,
+    SingleFlight,
+    normalize_call_key
 )
 
 
@@ -120,6 +125,8 @@ class TestRateLimiter:
     
     def teardown_method(self):
         """Очистка после каждого теста"""
+        # Счетчики пишутся в фоне - дождаться записи до удаления каталога
+        get_writer().flush()
         shutil.rmtree(self.temp_dir)
     
     @pytest.mark.asyncio
@@ -182,6 +189,48 @@ class TestRateLimiter:
         assert stats["current_rps"] == 4.0
 
 
+class TestAdaptiveRate:
+    """Тесты адаптивной скорости и учета FLOOD_WAIT"""
+    
+    def setup_method(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.limiter = RateLimiter(rps=4.0, data_dir=self.temp_dir)
+    
+    def teardown_method(self):
+        get_writer().flush()
+        shutil.rmtree(self.temp_dir)
+    
+    def test_flood_wait_slows_bucket_down(self):
+        """FLOOD_WAIT уменьшает скорость bucket, но не ниже min_rps"""
+        self.limiter.record_flood_wait(30, method="GetParticipantsRequest")
+        assert self.limiter.bucket.refill_rate == 2.0
+        
+        for _ in range(10):
+            self.limiter.record_flood_wait(5, method="GetParticipantsRequest")
+        assert self.limiter.bucket.refill_rate == self.limiter.min_rps
+    
+    def test_success_recovers_rate(self):
+        """Успешные вызовы постепенно возвращают скорость к rps"""
+        self.limiter.record_flood_wait(5)
+        for _ in range(200):
+            self.limiter.record_success()
+        assert self.limiter.bucket.refill_rate == 4.0
+    
+    def test_flood_stats_per_method_and_source(self):
+        """Статистика FLOOD_WAIT по методам, включая авто-сон Telethon"""
+        self.limiter.record_flood_wait(10, method="GetParticipantsRequest", source="safe_call")
+        self.limiter.record_flood_wait(3, method="GetParticipantsRequest", source="telethon")
+        self.limiter.record_flood_wait(7, method="GetFullChannelRequest", source="telethon")
+        
+        stats = self.limiter.get_stats()
+        assert stats["flood_waits"] == 3
+        assert stats["flood_wait_seconds"] == 20
+        assert stats["flood_waits_last_hour"] == 3
+        assert stats["flood_by_method"]["GetParticipantsRequest"] == {"count": 2, "seconds": 13}
+        assert stats["current_rps"] == 4.0
+        assert stats["effective_rps"] < 4.0
+
+
 class TestSafeCall:
     """Тесты для safe_call wrapper"""
     
@@ -196,6 +245,7 @@ class TestSafeCall:
     def teardown_method(self):
         """Очистка после каждого теста"""
         self.patcher.stop()
+        get_writer().flush()
         shutil.rmtree(self.temp_dir)
     
     @pytest.mark.asyncio
@@ -259,6 +309,26 @@ class TestSafeCall:
             with pytest.raises(FloodWaitError):
                 await safe_call(mock_func_always_flood, max_retries=2)
     
+    @pytest.mark.asyncio
+    async def test_safe_call_flood_premium_wait_retry(self):
+        """FLOOD_PREMIUM_WAIT обрабатывается так же, как FLOOD_WAIT"""
+        from telethon.errors import FloodPremiumWaitError
+        call_count = 0
+        
+        async def mock_func():
+            nonlocal call_count
+            call_count += 1
+            if call_count == 1:
+                error = FloodPremiumWaitError(request=None, capture=2)
+                raise error
+            return "ok"
+        
+        with patch('asyncio.sleep', new_callable=AsyncMock):
+            result = await safe_call(mock_func, max_retries=1)
+        
+        assert result == "ok"
+        assert get_rate_limiter().daily_counters["flood_waits"] == 1
+    
     @pytest.mark.asyncio
     async def test_safe_call_non_flood_error(self):
         """Тест обработки других ошибок (не FLOOD_WAIT)"""
@@ -271,20 +341,154 @@ class TestSafeCall:
         assert "Some other error" in str(exc_info.value)
 
 
+class TestSingleFlight:
+    """Тесты для SingleFlight объединения запросов"""
+    
+    def setup_method(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.patchers = [
+            patch('src.infra.limiter._rate_limiter', RateLimiter(rps=100.0, data_dir=self.temp_dir)),
+            patch('src.infra.limiter._single_flight', SingleFlight()),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+    
+    def teardown_method(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        get_writer().flush()
+        shutil.rmtree(self.temp_dir)
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_calls_share_one_request(self):
+        """Одинаковые одновременные вызовы выполняются один раз и тратят один токен"""
+        call_count = 0
+        
+        async def get_entity(entity_id):
+            nonlocal call_count
+            call_count += 1
+            await asyncio.sleep(0.01)
+            return {"id": entity_id}
+        
+        results = await asyncio.gather(
+            safe_call(get_entity, -1002188344480, coalesce=True),
+            safe_call(get_entity, "-1002188344480", coalesce=True),
+            safe_call(get_entity, -1002188344480, coalesce=True),
+        )
+        
+        assert call_count == 1
+        assert all(r == {"id": -1002188344480} for r in results)
+        assert get_rate_limiter().daily_counters["api_calls"] == 1
+        
+        from src.infra.limiter import get_single_flight
+        stats = get_single_flight().get_stats()
+        assert stats["requests"] == 3
+        assert stats["coalesced"] == 2
+        assert stats["in_flight"] == 0
+        assert abs(stats["hit_rate"] - 2 / 3) < 1e-9
+    
+    @pytest.mark.asyncio
+    async def test_sequential_calls_are_not_coalesced(self):
+        """После завершения запроса следующий вызов снова идет в API"""
+        call_count = 0
+        
+        async def get_entity(entity_id):
+            nonlocal call_count
+            call_count += 1
+            return entity_id
+        
+        await safe_call(get_entity, 1, coalesce=True)
+        await safe_call(get_entity, 1, coalesce=True)
+        
+        assert call_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_error_is_shared_by_all_waiters(self):
+        """Ошибка лидера получают все ожидающие"""
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+        
+        results = await asyncio.gather(
+            safe_call(failing, coalesce_key="k"),
+            safe_call(failing, coalesce_key="k"),
+            return_exceptions=True
+        )
+        
+        assert all(isinstance(r, ValueError) for r in results)
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_leader_hands_call_over(self):
+        """Отмена лидера не отменяет ожидающих: запрос выполняет один из них"""
+        calls = 0
+        
+        async def get_entity():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.02)
+            return calls
+        
+        flight = SingleFlight()
+        leader = asyncio.create_task(flight.run("k", get_entity))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(flight.run("k", get_entity)) for _ in range(2)]
+        await asyncio.sleep(0.005)
+        leader.cancel()
+        
+        assert await asyncio.gather(*waiters) == [2, 2]
+        assert leader.cancelled()
+        assert calls == 2
+        assert flight.get_stats()["takeovers"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_coalescing_rejected_for_dm(self):
+        """DM и join никогда не объединяются"""
+        async def send():
+            return "sent"
+        
+        with pytest.raises(ValueError):
+            await safe_call(send, operation_type="dm", coalesce=True)
+    
+    def test_normalize_call_key(self):
+        """Нормализация аргументов: строковый ID == int ID, username без @ и регистра"""
+        async def get_entity(x):
+            return x
+        
+        assert normalize_call_key(get_entity, ("-100123",)) == normalize_call_key(get_entity, (-100123,))
+        assert normalize_call_key(get_entity, ("@S16Space",)) == normalize_call_key(get_entity, ("s16space",))
+        assert normalize_call_key(get_entity, (1,)) != normalize_call_key(get_entity, (2,))
+
+
 class TestSmartPause:
     """Тесты для smart_pause функции"""
     
+    def setup_method(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.limiter = RateLimiter(rps=4.0, data_dir=self.temp_dir)
+        self.patcher = patch('src.infra.limiter._rate_limiter', self.limiter)
+        self.patcher.start()
+    
+    def teardown_method(self):
+        self.patcher.stop()
+        get_writer().flush()
+        shutil.rmtree(self.temp_dir)
+    
     @pytest.mark.asyncio
     async def test_smart_pause_participants(self):
-        """Тест паузы для participants"""
+        """Тест паузы для participants: только при нехватке токенов"""
         with patch('asyncio.sleep', new_callable=AsyncMock) as mock_sleep:
-            # Не должно быть паузы для count < 5000
-            await smart_pause("participants", 1000)
+            # Не контрольная точка
+            assert await smart_pause("participants", 1000) == 0.0
+            # Контрольная точка, но в ведре есть запас - без паузы
+            assert await smart_pause("participants", 5000) == 0.0
             mock_sleep.assert_not_called()
             
-            # Должна быть пауза для count = 5000
-            await smart_pause("participants", 5000)
-            mock_sleep.assert_called_once_with(1.0)
+            # Ведро пустое - пауза до восполнения половины (4 токена при 4 RPS)
+            self.limiter.bucket.tokens = 0.0
+            self.limiter.bucket.last_refill = time.time()
+            delay = await smart_pause("participants", 5000)
+            assert 0.9 < delay <= 1.0
+            mock_sleep.assert_called_once_with(delay)
     
     @pytest.mark.asyncio
     async def test_smart_pause_dm_batch(self):
@@ -305,6 +509,14 @@ class TestSmartPause:
             # Должна быть пауза для любого count > 0
             await smart_pause("join_batch", 1)
             mock_sleep.assert_called_once_with(3.0)
+    
+    @pytest.mark.asyncio
+    async def test_smart_pause_after_flood_wait(self):
+        """После FLOOD_WAIT пауза длиннее минимальной"""
+        self.limiter.record_flood_wait(20, method="GetParticipantsRequest")
+        with patch('asyncio.sleep', new_callable=AsyncMock):
+            delay = await smart_pause("join_batch", 1)
+        assert delay > 3.0
 
 
 class TestIntegration:
@@ -316,6 +528,8 @@ class TestIntegration:
     
     def teardown_method(self):
         """Очистка после каждого теста"""
+        # Счетчики пишутся в фоне - дождаться записи до удаления каталога
+        get_writer().flush()
         shutil.rmtree(self.temp_dir)
     
     @pytest.mark.asyncio
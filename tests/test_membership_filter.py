@@ -0,0 +1,92 @@
+"""
+Тесты для фильтра Блума участников референсной группы
+"""
+
+import json
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from src.core.membership_filter import (
+    FilterFormatError, FilterGroupMismatchError, build_filter, load_filter, screen
+)
+
+
+def test_roundtrip_no_false_negatives(tmp_path):
+    """Все участники находятся после сохранения и загрузки; ложных срабатываний - около заданной доли"""
+    members = range(1_000_000, 1_020_000)
+    membership = build_filter(members, group_id=-1002188344480, fp_rate=0.01)
+    path = membership.save(str(tmp_path / "space.s16b"))
+
+    loaded = load_filter(path)
+    assert loaded.group_id == -1002188344480
+    assert loaded.built_at == membership.built_at
+    assert loaded.item_count == 20_000
+    assert all(user_id in loaded for user_id in members)
+
+    false_positives = sum(1 for user_id in range(5_000_000, 5_020_000) if user_id in loaded)
+    assert false_positives / 20_000 < 0.02
+    # ~9.6 бита на участника при 1%
+    assert loaded.info()['size_bytes'] < 20_000 * 1.3
+
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / "roster.json"
+    path.write_text(json.dumps([{"id": 1}] * 20))
+    with pytest.raises(FilterFormatError):
+        load_filter(str(path))
+
+
+def test_check_group_accepts_marked_and_bare_ids():
+    """Группа фильтра сравнивается по ID без префикса -100; фильтр без группы подходит к любой"""
+    membership = build_filter([1], group_id=-1002188344480)
+    membership.check_group(2188344480)
+    membership.check_group(-1002188344480)
+    with pytest.raises(FilterGroupMismatchError):
+        membership.check_group(2609724956)
+    build_filter([1]).check_group(2609724956)
+
+
+def test_screen_confirms_positives():
+    """Точная проверка получает только возможных участников"""
+    membership = build_filter([1, 2, 3])
+    exact = MagicMock(return_value={1, 3})
+
+    result = screen(membership, [1, 2, 3, 10**12, 1], exact=exact)
+
+    exact.assert_called_once_with([1, 2, 3])
+    assert result == {'members': [1, 3], 'non_members': [2, 10**12], 'false_positives': [2]}
+
+
+@pytest.mark.asyncio
+async def test_cli_build_filter_and_membership(tmp_path, sample_participants, capsys):
+    """build-filter из файла экспорта; membership отправляет в Telegram только возможных участников"""
+    from src.cli import handle_build_filter, handle_membership
+
+    reference = tmp_path / "space.json"
+    reference.write_text(json.dumps(sample_participants))
+    output = str(tmp_path / "space.s16b")
+    manager = AsyncMock()
+
+    with patch("src.cli.RosterStore"):
+        await handle_build_filter(manager, "-1002188344480", output, str(reference))
+    assert load_filter(output).item_count == len(sample_participants)
+
+    member_id = sample_participants[0]['id']
+    manager.get_group_info.return_value = {'id': 2188344480, 'title': 'space'}
+    manager.check_membership.return_value = {
+        'members': [member_id], 'non_members': [], 'unknown': [],
+        'cost': {'strategy': 'probe', 'reason': 'test'},
+    }
+    await handle_membership(manager, "-1002188344480", f"{member_id},42", filter_file=output)
+
+    manager.check_membership.assert_called_once_with("-1002188344480", [member_id])
+    out = capsys.readouterr().out
+    assert "назад): 1 не состояли в группе на" in out
+    assert "(из них 1 - по фильтру от" in out
+
+    # Фильтр другой группы не используется
+    manager.get_group_info.return_value = {'id': 2609724956, 'title': 'other'}
+    await handle_membership(manager, "-1002609724956", "42", filter_file=output)
+    assert manager.check_membership.call_count == 1
+    assert "❌ фильтр собран для группы -1002188344480" in capsys.readouterr().out
@@ -0,0 +1,174 @@
+"""
+Тесты для MembershipTracker и RosterStore
+"""
+
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+from telethon.tl.types import User
+
+from src.core.membership_tracker import MembershipTracker, classify_chat_action
+from src.core.roster_store import RosterStore
+
+GROUP_ID = -1002188344480
+
+
+def make_event(chat_id=GROUP_ID, user_ids=(1,), **flags):
+    """Симулированное ChatAction событие"""
+    event = SimpleNamespace(
+        chat_id=chat_id,
+        user_ids=list(user_ids),
+        users=[],
+        user_joined=False,
+        user_added=False,
+        user_left=False,
+        user_kicked=False
+    )
+    for key, value in flags.items():
+        setattr(event, key, value)
+    return event
+
+
+@pytest.fixture
+def store(tmp_path):
+    return RosterStore(data_dir=str(tmp_path / "rosters"))
+
+
+@pytest.fixture
+def manager():
+    return AsyncMock()
+
+
+def test_classify_chat_action():
+    """Тест классификации событий"""
+    assert classify_chat_action(make_event(user_joined=True)) == 'join'
+    assert classify_chat_action(make_event(user_added=True)) == 'join'
+    assert classify_chat_action(make_event(user_left=True)) == 'leave'
+    assert classify_chat_action(make_event(user_kicked=True)) == 'leave'
+    assert classify_chat_action(make_event()) is None
+
+
+@pytest.mark.asyncio
+async def test_replay_applies_joins_and_leaves(store, manager):
+    """Тест применения симулированного потока событий"""
+    tracker = MembershipTracker(MagicMock(), [GROUP_ID], store=store, manager=manager)
+
+    stats = await tracker.replay([
+        make_event(user_ids=[1, 2], user_added=True),
+        make_event(user_ids=[3], user_joined=True),
+        make_event(user_ids=[2], user_left=True),
+        make_event(user_ids=[99], user_kicked=True),      # не был в ростере
+        make_event(chat_id=-100999, user_joined=True),     # чужая группа
+    ])
+
+    assert stats['joins'] == 3
+    assert stats['leaves'] == 1
+    assert stats['ignored'] == 1
+
+    # Ростер сохранен на диск и читается новым хранилищем
+    reloaded = RosterStore(data_dir=str(store.data_dir)).load(GROUP_ID)
+    assert reloaded.member_ids() == {1, 3}
+    manager.get_participants.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_replay_async_stream(store, manager):
+    """Тест применения асинхронного потока событий"""
+    from tests.conftest import AsyncIteratorMock
+
+    tracker = MembershipTracker(MagicMock(), [GROUP_ID], store=store, manager=manager)
+    await tracker.replay(AsyncIteratorMock([make_event(user_ids=[5], user_joined=True)]))
+
+    assert store.load(GROUP_ID).member_ids() == {5}
+
+
+@pytest.mark.asyncio
+async def test_reconcile_in_sync_skips_full_fetch(store, manager, sample_participants):
+    """Сверка без расхождений стоит один get_group_info"""
+    roster = store.load(GROUP_ID)
+    roster.replace(sample_participants, participants_count=2)
+    store.save(roster)
+
+    manager.get_group_info.return_value = {'id': GROUP_ID, 'participants_count': 3}
+    tracker = MembershipTracker(MagicMock(), [GROUP_ID], store=store, manager=manager)
+
+    # Событие join увеличивает ожидаемый размер до 3 - совпадает с Telegram
+    await tracker.handle_event(make_event(user_ids=[42], user_joined=True))
+    result = await tracker.reconcile(GROUP_ID)
+
+    assert result['status'] == 'in_sync'
+    manager.get_participants.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_reconcile_gap_triggers_diff_fetch(store, manager, sample_participants):
+    """Пропущенные события закрываются полной выгрузкой"""
+    roster = store.load(GROUP_ID)
+    roster.replace(sample_participants[:1], participants_count=1)
+    store.save(roster)
+
+    manager.get_group_info.return_value = {'id': GROUP_ID, 'participants_count': 2}
+    manager.get_participants.return_value = sample_participants[1:]
+    tracker = MembershipTracker(MagicMock(), [GROUP_ID], store=store, manager=manager)
+
+    result = await tracker.reconcile(GROUP_ID)
+
+    assert result['status'] == 'resynced'
+    assert result['joined'] == 1
+    assert result['left'] == 1
+    assert store.load(GROUP_ID).member_ids() == {sample_participants[1]['id']}
+    manager.get_participants.assert_called_once_with(GROUP_ID, limit=None)
+
+
+@pytest.mark.asyncio
+async def test_reconcile_unknown_group_fetches_roster(store, manager, sample_participants):
+    """Группа без ростера всегда выгружается полностью"""
+    manager.get_group_info.return_value = {'id': GROUP_ID, 'participants_count': 2}
+    manager.get_participants.return_value = sample_participants
+    tracker = MembershipTracker(MagicMock(), [GROUP_ID], store=store, manager=manager)
+
+    result = await tracker.reconcile(GROUP_ID)
+
+    assert result['status'] == 'resynced'
+    assert result['joined'] == 2
+
+
+@pytest.mark.asyncio
+async def test_capped_group_counts_every_event_without_refetch(store, manager, sample_participants):
+    """Группа больше лимита списка: выходы не из ростера и боты учитываются, сверка без полной выгрузки"""
+    roster = store.load(GROUP_ID)
+    roster.replace(sample_participants, participants_count=25000)
+    store.save(roster)
+    assert store.load(GROUP_ID).capped
+
+    tracker = MembershipTracker(MagicMock(), [GROUP_ID], store=store, manager=manager)
+    await tracker.handle_event(make_event(user_ids=[777], user_left=True))      # нет в ростере
+    bot = make_event(user_ids=[888], user_joined=True)
+    bot.users = [User(id=888, bot=True, first_name='Bot')]
+    await tracker.handle_event(bot)
+    tracker.flush()
+
+    reloaded = RosterStore(data_dir=str(store.data_dir)).load(GROUP_ID)
+    assert reloaded.expected_count == 25000
+    assert 888 not in reloaded.member_ids()
+
+    manager.get_group_info.return_value = {'id': GROUP_ID, 'participants_count': 24990}
+    result = await tracker.reconcile(GROUP_ID)
+
+    assert result['status'] == 'capped'
+    manager.get_participants.assert_not_called()
+    assert store.load(GROUP_ID).expected_count == 24990
+
+
+def test_start_registers_chat_action_handler(store, manager):
+    """Тест подписки на события клиента"""
+    client = MagicMock()
+    tracker = MembershipTracker(client, [GROUP_ID], store=store, manager=manager)
+
+    tracker.start()
+    tracker.start()  # повторный вызов не дублирует подписку
+    tracker.stop()
+
+    client.add_event_handler.assert_called_once()
+    client.remove_event_handler.assert_called_once_with(tracker.handle_event)
@@ -0,0 +1,115 @@
+"""
+Тесты для экспорта истории сообщений
+"""
+
+import json
+
+import pytest
+
+from src.core.message_export import MessageCheckpointStore, MessageExporter
+
+GROUP_ID = -1002188344480
+
+
+class FakeHistoryManager:
+    """GroupManager с историей из сообщений 1..N без Telegram"""
+
+    def __init__(self, count):
+        self.ids = list(range(1, count + 1))
+        self.calls = []
+        self.fail = False
+
+    async def get_group_info(self, group_identifier):
+        return {'id': 2188344480, 'title': 'S16', 'type': 'channel', 'participants_count': 10}
+
+    async def get_message_page(self, group_id, offset_id=0, min_id=0, reverse=False, limit=100):
+        self.calls.append((offset_id, reverse))
+        if self.fail:
+            return None
+        if reverse:
+            page = [i for i in self.ids if i > offset_id][:limit]
+        else:
+            page = [i for i in reversed(self.ids) if not offset_id or i < offset_id][:limit]
+        return [{'group_id': group_id, 'id': i, 'sender_id': i % 7, 'text_len': i} for i in page]
+
+
+def read_ids(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line)['id'] for line in f]
+
+
+@pytest.mark.asyncio
+async def test_resume_and_incremental_runs(tmp_path):
+    """Прерванный запуск продолжается с checkpoint, повторный забирает только новые сообщения"""
+    manager = FakeHistoryManager(250)
+    store = MessageCheckpointStore(str(tmp_path / "checkpoints"))
+    output = tmp_path / "messages"
+
+    first = await MessageExporter(manager, str(output), store=store, max_pages=1).export_group(GROUP_ID)
+    assert first['status'] == 'partial'
+    assert first['checkpoint']['min_id'] == 151 and first['checkpoint']['max_id'] == 250
+    assert not first['checkpoint']['history_complete']
+
+    pages = []
+    exporter = MessageExporter(manager, str(output), store=store,
+                               on_page=lambda group_id, page: pages.append((group_id, len(page))))
+    second = await exporter.export_group(GROUP_ID)
+    assert second['status'] == 'ok'
+    assert (second['new'], second['backfill']) == (0, 150)
+    assert second['checkpoint']['history_complete']
+    assert pages == [(GROUP_ID, 100), (GROUP_ID, 50)]
+
+    manager.ids.extend(range(251, 281))
+    manager.calls.clear()
+    third = await exporter.export_group(GROUP_ID)
+    assert (third['new'], third['backfill']) == (30, 0)
+    assert manager.calls == [(250, True)]
+
+    ids = read_ids(output / f"{GROUP_ID}.ndjson")
+    assert sorted(ids) == list(range(1, 281))
+    assert store.load(GROUP_ID)['exported'] == 280
+
+
+@pytest.mark.asyncio
+async def test_failed_page_keeps_checkpoint(tmp_path):
+    """Ошибка страницы не считается концом истории"""
+    manager = FakeHistoryManager(150)
+    store = MessageCheckpointStore(str(tmp_path / "checkpoints"))
+    exporter = MessageExporter(manager, str(tmp_path / "messages"), store=store)
+
+    await MessageExporter(manager, str(tmp_path / "messages"), store=store, max_pages=1).export_group(GROUP_ID)
+    manager.fail = True
+    report = await exporter.run([GROUP_ID])
+
+    assert report['failed'] == [GROUP_ID]
+    checkpoint = store.load(GROUP_ID)
+    assert checkpoint['min_id'] == 51 and not checkpoint['history_complete']
+
+    manager.fail = False
+    report = await exporter.run([GROUP_ID])
+    assert report['messages'] == 50 and report['failed'] == []
+
+
+@pytest.mark.asyncio
+async def test_failed_write_does_not_advance_checkpoint(tmp_path):
+    """Страница, запись которой упала, и полученные после нее выгрузятся при следующем запуске"""
+    manager = FakeHistoryManager(250)
+    store = MessageCheckpointStore(str(tmp_path / "checkpoints"))
+    output = tmp_path / "messages"
+    calls = []
+
+    def failing_on_second_page(group_id, page):
+        calls.append(len(page))
+        if len(calls) == 2:
+            raise OSError("disk full")
+
+    report = await MessageExporter(manager, str(output), store=store,
+                                   on_page=failing_on_second_page).run([GROUP_ID])
+    assert report['failed'] == [GROUP_ID]
+    checkpoint = store.load(GROUP_ID)
+    assert (checkpoint['min_id'], checkpoint['exported']) == (151, 100)
+    assert not checkpoint['history_complete']
+
+    second = await MessageExporter(manager, str(output), store=store).export_group(GROUP_ID)
+    assert second['status'] == 'ok' and second['backfill'] == 150
+    assert set(read_ids(output / f"{GROUP_ID}.ndjson")) == set(range(1, 251))
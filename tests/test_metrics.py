@@ -0,0 +1,137 @@
+"""
+Тесты для метрик API вызовов
+"""
+
+import pytest
+import shutil
+import tempfile
+import urllib.request
+from unittest.mock import AsyncMock, patch
+from telethon.errors import FloodWaitError
+
+from src.infra.limiter import RateLimiter, safe_call
+from src.infra.metrics import Histogram, MetricsRegistry
+from src.infra.writer import get_writer
+
+
+def test_histogram_buckets_and_quantile():
+    """Тест распределения наблюдений по бакетам"""
+    histogram = Histogram(buckets=(0.1, 1.0, 10.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value)
+
+    assert histogram.count == 4
+    assert histogram.sum == pytest.approx(6.05)
+    assert histogram.cumulative() == [(0.1, 1), (1.0, 3), (10.0, 4), (float("inf"), 4)]
+    assert histogram.quantile(0.5) == 1.0
+
+
+def test_render_prometheus_format():
+    """Тест формата Prometheus text exposition"""
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+    registry.inc("rpc_calls_total", method="get_entity", status="ok")
+    registry.observe("rpc_duration_seconds", 0.05, method="get_entity")
+
+    text = registry.render_prometheus()
+
+    assert "# TYPE s16_rpc_calls_total counter" in text
+    assert 's16_rpc_calls_total{method="get_entity",status="ok"} 1' in text
+    assert "# TYPE s16_rpc_duration_seconds histogram" in text
+    assert 's16_rpc_duration_seconds_bucket{method="get_entity",le="0.1"} 1' in text
+    assert 's16_rpc_duration_seconds_bucket{method="get_entity",le="+Inf"} 1' in text
+    assert 's16_rpc_duration_seconds_count{method="get_entity"} 1' in text
+
+
+def test_dump_to_file(tmp_path):
+    """Тест записи метрик в файл"""
+    registry = MetricsRegistry()
+    registry.inc("flood_waits_total", method="iter_participants")
+
+    target = tmp_path / "metrics" / "s16.prom"
+    registry.dump(str(target))
+
+    assert 's16_flood_waits_total{method="iter_participants"} 1' in target.read_text()
+
+
+def test_http_endpoint():
+    """Тест локального HTTP endpoint /metrics"""
+    registry = MetricsRegistry()
+    registry.inc("rpc_calls_total", method="get_me", status="ok")
+
+    server = registry.start_http_server(port=0)
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            body = response.read().decode("utf-8")
+    finally:
+        server.shutdown()
+
+    assert 's16_rpc_calls_total{method="get_me",status="ok"} 1' in body
+
+
+class TestSafeCallInstrumentation:
+    """Тесты метрик, которые пишет safe_call"""
+
+    def setup_method(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.registry = MetricsRegistry()
+        self.patchers = [
+            patch('src.infra.limiter._rate_limiter', RateLimiter(rps=100.0, data_dir=self.temp_dir)),
+            patch('src.infra.metrics._metrics', self.registry),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def teardown_method(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        get_writer().flush()
+        shutil.rmtree(self.temp_dir)
+
+    @pytest.mark.asyncio
+    async def test_success_records_latencies(self):
+        """Успешный вызов: ожидание токена, время вызова и счетчик"""
+        async def get_entity(entity_id):
+            return entity_id
+
+        await safe_call(get_entity, 1)
+
+        stats = self.registry.get_method_stats()["get_entity"]
+        assert stats["calls"] == 1
+        assert stats["errors"] == 0
+        assert self.registry.get_histogram("rpc_queue_wait_seconds", method="get_entity").count == 1
+        assert self.registry.get_histogram("rpc_duration_seconds", method="get_entity").count == 1
+
+    @pytest.mark.asyncio
+    async def test_flood_wait_records_retry_and_sleep(self):
+        """FLOOD_WAIT: счетчик, retry и время сна"""
+        call_count = 0
+
+        async def iter_page():
+            nonlocal call_count
+            call_count += 1
+            if call_count == 1:
+                error = FloodWaitError(request=None)
+                error.seconds = 5
+                raise error
+            return "page"
+
+        with patch('asyncio.sleep', new_callable=AsyncMock):
+            await safe_call(iter_page, max_retries=2)
+
+        stats = self.registry.get_method_stats()["iter_page"]
+        assert stats["flood_waits"] == 1
+        assert stats["retries"] == 1
+        assert stats["calls"] == 2
+        assert stats["flood_sleep_s"] == pytest.approx(6.0)  # 5s + backoff 1s
+
+    @pytest.mark.asyncio
+    async def test_error_is_counted(self):
+        """Ошибка вызова попадает в счетчик со статусом error"""
+        async def broken():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            await safe_call(broken)
+
+        assert self.registry.get_counter("rpc_calls_total", method="broken", status="error") == 1
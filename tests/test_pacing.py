@@ -0,0 +1,91 @@
+"""
+Тесты для расчета пауз по состоянию лимитера
+"""
+
+import json
+import time
+
+import pytest
+
+from src.infra.limiter import RateLimiter, smart_pause
+from src.infra.pacing import DEFAULT_POLICIES, Pacer, PacePolicy, load_policies
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    return RateLimiter(rps=4.0, data_dir=str(tmp_path))
+
+
+def drain(limiter, tokens=0.0):
+    limiter.bucket.tokens = tokens
+    limiter.bucket.last_refill = time.time()
+
+
+def test_no_pause_with_slack(limiter):
+    """При запасе токенов и без FLOOD_WAIT пауз нет"""
+    pacer = Pacer(limiter=limiter)
+    for count in (1, 2, 3, 10):
+        assert pacer.delay("export", count) == 0.0
+    assert pacer.delay("participants", 5000) == 0.0
+
+
+def test_pause_grows_with_bucket_deficit(limiter):
+    """Пауза до восполнения ведра до target_fill при текущей скорости"""
+    pacer = Pacer({"export": PacePolicy(target_fill=1.0)}, limiter=limiter)
+    drain(limiter, tokens=4.0)
+    half = pacer.delay("export")
+    drain(limiter, tokens=0.0)
+    empty = pacer.delay("export")
+    assert 0.9 < half <= 1.0
+    assert 1.9 < empty <= 2.0
+
+    # После FLOOD_WAIT скорость снижена (AIMD) - ведро восполняется дольше
+    limiter.record_flood_wait(1, method="GetParticipantsRequest")
+    drain(limiter, tokens=0.0)
+    assert pacer.delay("export") > empty
+
+
+def test_flood_penalty_decays(limiter):
+    """Штраф за FLOOD_WAIT затухает за flood_window"""
+    policy = PacePolicy(flood_window=100.0, flood_factor=1.0, max_delay=1000.0)
+    pacer = Pacer({"export": policy}, limiter=limiter)
+    now = time.time()
+    limiter.flood_history.append((now - 50, "GetHistoryRequest", 30, "safe_call"))
+    limiter.flood_history.append((now - 500, "GetHistoryRequest", 300, "safe_call"))
+
+    assert pacer.flood_penalty(policy, now=now) == pytest.approx(15.0)
+    assert pacer.flood_penalty(policy, now=now + 60) == 0.0
+
+
+def test_min_and_max_delay(limiter):
+    """min_delay применяется всегда, max_delay ограничивает сверху"""
+    pacer = Pacer(limiter=limiter)
+    assert pacer.delay("join_batch", 1) == DEFAULT_POLICIES["join_batch"].min_delay
+    assert pacer.delay("dm_batch", 19) == 0.0
+
+    limiter.record_flood_wait(3600, method="SendMessageRequest")
+    assert pacer.delay("dm_batch", 20) == DEFAULT_POLICIES["dm_batch"].max_delay
+
+
+@pytest.mark.asyncio
+async def test_smart_pause_uses_given_limiter(limiter):
+    """Пауза считается по лимитеру вызовов операции (например, takeout), а не глобальному"""
+    limiter.flood_history.append((time.time(), "GetParticipantsRequest", 0.2, "safe_call"))
+    paused = await smart_pause("export", 1, limiter=limiter)
+    assert paused == pytest.approx(0.1, abs=0.01)
+
+
+def test_load_policies_from_file(tmp_path, monkeypatch):
+    """Переопределение политик из PACING_CONFIG"""
+    config = tmp_path / "pacing.json"
+    config.write_text(json.dumps({"participants": {"every": 2000}, "harvest": {"min_delay": 1.5}}))
+    monkeypatch.setenv("PACING_CONFIG", str(config))
+
+    policies = load_policies()
+    assert policies["participants"].every == 2000
+    assert policies["participants"].max_delay == DEFAULT_POLICIES["participants"].max_delay
+    assert policies["harvest"].min_delay == 1.5
+
+    config.write_text(json.dumps({"export": {"sleep": 3}}))
+    with pytest.raises(ValueError):
+        load_policies()
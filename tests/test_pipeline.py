@@ -0,0 +1,79 @@
+"""
+Тесты для этапа обработки в пуле процессов
+"""
+
+import asyncio
+
+import pytest
+
+from src.core.pipeline import (
+    MEMBER_INFO_COLUMNS, PARTICIPANT_COLUMNS, ProcessStage, normalize_members, pack_ids, pack_records,
+    split_by_reference, unpack_batch
+)
+
+PARTICIPANTS = [
+    {'id': 30, 'username': 'c', 'first_name': 'C', 'last_name': None, 'is_premium': True, 'status': 'online'},
+    {'id': 10, 'username': 'a', 'first_name': 'A', 'last_name': 'Aa', 'is_verified': True},
+    {'id': 20, 'username': None, 'first_name': 'B', 'last_name': None},
+    {'id': 10, 'username': 'a2', 'first_name': 'A', 'last_name': 'Aa'},
+]
+
+
+def test_normalize_and_split():
+    """Нормализация с дедупликацией и разбиение по референсной группе"""
+    batch = pack_records(PARTICIPANTS, PARTICIPANT_COLUMNS)
+    assert len(batch) == 4
+    assert 'status' not in batch.columns
+
+    members = unpack_batch(normalize_members(batch))
+    assert [m['user_id'] for m in members] == [10, 20, 30]
+    assert members[0] == {'user_id': 10, 'username': 'a', 'first_name': 'A', 'last_name': 'Aa',
+                          'is_premium': False, 'is_verified': True}
+
+    existing, new = split_by_reference(batch, pack_ids({20, 30, 99}))
+    assert existing.columns == MEMBER_INFO_COLUMNS
+    assert [m['id'] for m in unpack_batch(existing)] == [30, 20]
+    assert unpack_batch(new)[0] == {'id': 10, 'username': 'a', 'first_name': 'A', 'last_name': 'Aa',
+                                    'is_premium': False}
+
+    empty_existing, _ = split_by_reference(batch, pack_ids(()))
+    assert len(empty_existing) == 0 and unpack_batch(empty_existing) == []
+
+
+@pytest.mark.asyncio
+async def test_stage_runs_batches_in_pool():
+    """Большие батчи уходят в процессы пула, маленькие выполняются сразу"""
+    stage = ProcessStage(workers=1, inline_below=3)
+    try:
+        small = pack_records(PARTICIPANTS[:2], PARTICIPANT_COLUMNS)
+        assert len(await stage.run(normalize_members, small)) == 2
+        assert stage.get_stats()['running'] is False
+
+        members = await stage.run(normalize_members, pack_records(PARTICIPANTS, PARTICIPANT_COLUMNS))
+        assert members.column('user_id') == [10, 20, 30]
+        stats = stage.get_stats()
+        assert (stats['inline'], stats['pooled'], stats['records']) == (1, 1, 6)
+    finally:
+        stage.close()
+
+
+def test_stage_is_reused_across_event_loops():
+    """Глобальный этап работает в нескольких event loop подряд: семафор - свой у каждого loop"""
+    stage = ProcessStage(workers=1, inline_below=0)
+    batch = pack_records(PARTICIPANTS, PARTICIPANT_COLUMNS)
+
+    async def run_batches():
+        # Больше батчей, чем слотов (2 на процесс) - третий ждет на семафоре
+        return await asyncio.gather(*(stage.run(normalize_members, batch) for _ in range(3)))
+
+    try:
+        for _ in range(2):
+            loop = asyncio.new_event_loop()
+            try:
+                results = loop.run_until_complete(run_batches())
+            finally:
+                loop.close()
+            assert [members.column('user_id') for members in results] == [[10, 20, 30]] * 3
+        assert stage.get_stats()['pooled'] == 6
+    finally:
+        stage.close()
@@ -0,0 +1,124 @@
+"""
+Тесты для планировщика экспорта
+"""
+
+import json
+
+import pytest
+from unittest.mock import AsyncMock
+
+from src.core.planner import (
+    DEFAULT_PAGE_LATENCY_S, LatencyHistory, build_plan, collect_estimates, estimate_group,
+    format_plan, load_latency_history, suggest_concurrency
+)
+from src.core.roster_store import RosterStore
+from src.infra.limiter import RateLimiter
+from src.infra.metrics import MetricsRegistry
+
+SPACE_ID = -1002188344480
+GROUP_A = -1002609724956
+GROUP_B = -1001527724829
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    return RateLimiter(rps=4.0, data_dir=str(tmp_path / "anti_spam"))
+
+
+def history_with(page_latency=0.5, call_latency=0.25):
+    history = LatencyHistory()
+    history.add_pages(page_latency * 10, 10)
+    history.add_calls(call_latency * 4, 4)
+    return history
+
+
+def test_latency_history_from_past_exports_and_traces(tmp_path):
+    """История задержек из metrics.prom экспортов и трассировок"""
+    registry = MetricsRegistry()
+    for value in (0.2, 0.4):
+        registry.observe("participants_page_seconds", value)
+    registry.observe("rpc_duration_seconds", 0.1, method="get_entity")
+    registry.observe("rpc_duration_seconds", 9.0, method="get_participants_safe")
+    export_dir = tmp_path / "export" / "s16_export_20250101_000000"
+    export_dir.mkdir(parents=True)
+    registry.dump(str(export_dir / "metrics.prom"))
+
+    trace = tmp_path / "trace.jsonl"
+    trace.write_text(json.dumps({
+        "id": 1, "parent": None, "name": "iter_participants", "cat": "participants",
+        "ts": 0, "dur": 3_000_000, "args": {"users": 1000}
+    }) + "\n")
+
+    history = load_latency_history(str(tmp_path / "export"), trace_files=[str(trace)])
+    # 2 страницы из метрик (0.6s) + 5 страниц из трассировки (3s)
+    assert history.page_count == 7
+    assert history.page_latency_s == pytest.approx(3.6 / 7)
+    assert history.call_latency_s == pytest.approx(0.1)
+    assert len(history.sources) == 2
+
+    assert load_latency_history(str(tmp_path / "missing")).page_latency_s == DEFAULT_PAGE_LATENCY_S
+
+
+def test_estimate_group():
+    """Оценка RPC, времени и памяти одной группы"""
+    estimate = estimate_group(GROUP_A, 1001, history_with())
+    assert estimate["pages"] == 6
+    assert estimate["rpcs"] == 3  # get_group_info + один проход (один токен лимитера)
+    assert estimate["latency_s"] == pytest.approx(6 * 0.5 + 2 * 0.25)
+    assert estimate["memory_bytes"] > 0
+
+
+def test_suggest_concurrency():
+    """Конкуренция ceil(rps x latency) в пределах [1, max]"""
+    assert suggest_concurrency(4.0, 0.5) == 2
+    assert suggest_concurrency(4.0, 0.01) == 1
+    assert suggest_concurrency(4.0, 10.0, max_concurrency=8) == 8
+
+
+def test_plan_order_and_budget(limiter):
+    """Порядок групп: LPT без бюджета, короткие сначала при нехватке времени"""
+    history = history_with()
+    estimates = [estimate_group(gid, count, history)
+                 for gid, count in ((SPACE_ID, 4000), (GROUP_A, 200), (GROUP_B, 20000))]
+
+    plan = build_plan(estimates, limiter, history)
+    assert plan["order"] == [GROUP_B, SPACE_ID, GROUP_A]
+    assert plan["concurrency"] == 2
+    assert plan["total_rpcs"] == sum(e["rpcs"] for e in estimates)
+    assert plan["deferred"] == []
+
+    plan = build_plan([dict(e) for e in estimates], limiter, history, budget_minutes=0.2)
+    assert plan["order"] == [GROUP_A, SPACE_ID]
+    assert [e["group_id"] for e in plan["deferred"]] == [GROUP_B]
+    assert "Не укладываются" in format_plan(plan)
+
+
+def test_plan_warnings(limiter):
+    """Предупреждения: сниженная скорость, память сверх бюджета, нет истории"""
+    limiter.record_flood_wait(30, method="GetParticipantsRequest")
+    history = LatencyHistory()
+    estimates = [estimate_group(GROUP_A, 1_000_000, history), estimate_group(GROUP_B, None, history, source="unknown")]
+
+    plan = build_plan(estimates, limiter, history, memory_budget_mb=64)
+    text = "\n".join(plan["warnings"])
+    assert "снижена" in text
+    assert "выгрузка на диск" in text
+    assert "нет истории" in text
+    assert "participants_count" in text
+
+
+@pytest.mark.asyncio
+async def test_collect_estimates_uses_rosters(tmp_path):
+    """С use_roster число участников берется из ростера без запросов"""
+    store = RosterStore(str(tmp_path))
+    roster = store.load(SPACE_ID)
+    roster.replace([{"id": i} for i in range(450)], participants_count=450)
+    store.save(roster)
+
+    manager = AsyncMock()
+    manager.get_group_info.return_value = {"id": GROUP_A, "title": "Заповедник", "participants_count": 90}
+
+    estimates = await collect_estimates(manager, [SPACE_ID, GROUP_A], LatencyHistory(), store, use_roster=True)
+
+    assert [c.args[0] for c in manager.get_group_info.call_args_list] == [GROUP_A]
+    assert [(e["count_source"], e["participants_count"]) for e in estimates] == [("roster", 450), ("telegram", 90)]
@@ -0,0 +1,102 @@
+"""
+Тесты для сессии с отложенной записью сущностей
+"""
+
+import sqlite3
+
+import pytest
+from telethon.tl import types
+
+from src.infra.session_store import WriteBehindSession
+
+
+def make_participants(user_ids, chat_id=None):
+    users = [types.User(id=u, access_hash=u * 10, username=f"user{u}", first_name=f"User {u}")
+             for u in user_ids]
+    chats = [types.Channel(id=chat_id, title="S16", photo=types.ChatPhotoEmpty(), date=None,
+                           access_hash=chat_id * 10, megagroup=True)] if chat_id else []
+    return types.channels.ChannelParticipants(
+        count=len(users), participants=[types.ChannelParticipant(user_id=u.id, date=None) for u in users],
+        chats=chats, users=users
+    )
+
+
+def saved_ids(session):
+    with sqlite3.connect(session.filename) as conn:
+        return {row[0] for row in conn.execute("select id from entities")}
+
+
+def test_entities_resolved_before_flush_and_saved_on_close(tmp_path):
+    """Сущности доступны сразу из памяти и попадают в файл одной пакетной записью"""
+    session = WriteBehindSession(str(tmp_path / "wb"), flush_interval=3600)
+    session.process_entities(make_participants([1, 2, 3]))
+
+    assert session.pending_count() == 3
+    assert saved_ids(session) == set()
+    assert session.get_input_entity(2).access_hash == 20
+    assert session.get_entity_rows_by_username("user3") == (3, 30)
+    session.close()
+
+    assert saved_ids(session) == {1, 2, 3}
+    assert session.get_stats()['flushes'] == 1
+
+    reopened = WriteBehindSession(str(tmp_path / "wb"))
+    assert reopened.get_input_entity(1).access_hash == 10
+    reopened.close()
+
+
+def test_batch_size_wakes_writer(tmp_path):
+    """Накопилось batch_size сущностей - фоновый поток пишет, не дожидаясь интервала"""
+    session = WriteBehindSession(str(tmp_path / "wb"), flush_interval=3600, batch_size=2)
+    session.process_entities(make_participants([1, 2]))
+    session._stopped.set()
+    session._wakeup.set()
+    session._thread.join(5)
+
+    assert saved_ids(session) == {1, 2}
+    session.close()
+
+
+def test_participants_not_persisted(tmp_path):
+    """persist_participants=False: пользователи из ростера только в памяти, группа - в файле"""
+    session = WriteBehindSession(str(tmp_path / "wb"), flush_interval=3600, persist_participants=False)
+    session.process_entities(make_participants([1, 2], chat_id=2188344480))
+    session.process_entities([types.User(id=5, access_hash=50)])
+
+    assert session.get_input_entity(1).access_hash == 10
+    assert session.flush() == 2
+    assert saved_ids(session) == {-1002188344480, 5}
+    assert session.get_stats()['rows_skipped'] == 2
+    session.close()
+
+
+class LockedConnection:
+    """Соединение, которое не может писать (база занята другим соединением)"""
+
+    def __enter__(self):
+        raise sqlite3.OperationalError("database is locked")
+
+    def __exit__(self, *exc):
+        return False
+
+    def close(self):
+        pass
+
+
+def test_failed_flush_keeps_batch(tmp_path):
+    """Ошибка записи возвращает пакет в очередь, не затирая более новые строки"""
+    session = WriteBehindSession(str(tmp_path / "wb"), flush_interval=3600)
+    session.process_entities(make_participants([1, 2]))
+    session._writer_conn = LockedConnection()
+    with pytest.raises(sqlite3.OperationalError):
+        session.flush()
+
+    session.process_entities([types.User(id=2, access_hash=99, username="renamed")])
+    assert session.pending_count() == 2
+    assert session.get_stats()['flush_errors'] == 1
+
+    session._writer_conn = None
+    assert session.flush() == 2
+    with sqlite3.connect(session.filename) as conn:
+        assert conn.execute("select hash, username from entities where id = 2").fetchone() == (99, "renamed")
+    session.close()
@@ -0,0 +1,92 @@
+"""
+Тесты для takeout режима выгрузки
+"""
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from telethon.errors import TakeoutInitDelayError, TakeoutInvalidError
+
+from src.core.group_manager import FallbackGroupManager, GroupManager, open_export_manager
+from src.infra.takeout import open_takeout
+
+
+class FakeTakeout:
+    """Контекст client.takeout(): __aenter__ отдает клиента или падает"""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.session = MagicMock(name="takeout_client")
+        self.exit_args = None
+
+    async def __aenter__(self):
+        if self.error:
+            raise self.error
+        return self.session
+
+    async def __aexit__(self, *exc_info):
+        self.exit_args = exc_info
+
+
+def make_client(takeout):
+    client = MagicMock()
+    client.session.takeout_id = None
+    client.takeout.return_value = takeout
+    return client
+
+
+@pytest.mark.asyncio
+async def test_open_takeout_delayed_falls_back():
+    """Telegram отложил takeout - open_takeout отдает None, выгрузка идет обычной сессией"""
+    client = make_client(FakeTakeout(TakeoutInitDelayError(request=None, capture=3600)))
+
+    async with open_takeout(client) as session:
+        assert session is None
+    async with open_export_manager(client, takeout=True) as manager:
+        assert type(manager) is GroupManager
+        assert manager.client is client
+
+
+@pytest.mark.asyncio
+async def test_open_export_manager_uses_takeout_limiter():
+    """Takeout открылся: вызовы через клиент takeout и его лимитер, сессия завершается"""
+    takeout = FakeTakeout()
+    client = make_client(takeout)
+    limiter = MagicMock(name="takeout_limiter")
+
+    with patch("src.core.group_manager.get_takeout_limiter", return_value=limiter):
+        async with open_export_manager(client, takeout=True) as manager:
+            assert isinstance(manager, FallbackGroupManager)
+            assert manager.active.client is takeout.session
+            assert manager.active.limiter is limiter
+            assert manager.fallback_manager.client is client
+
+    assert takeout.exit_args == (None, None, None)
+    client.takeout.assert_called_once_with(finalize=True, users=True, chats=True, megagroups=True, channels=True)
+
+
+@pytest.mark.asyncio
+async def test_fallback_after_takeout_invalidated():
+    """Takeout стал недействительным - вызов повторяется обычной сессией, дальше только она"""
+    takeout_manager = AsyncMock()
+    takeout_manager.get_participants.side_effect = TakeoutInvalidError(request=None)
+    fallback_manager = AsyncMock()
+    fallback_manager.get_participants.return_value = [{"id": 1}]
+    manager = FallbackGroupManager(takeout_manager, fallback_manager)
+
+    assert await manager.get_participants(-100, limit=None) == [{"id": 1}]
+    assert manager.uses_takeout is False
+    await manager.get_group_info(-100)
+
+    takeout_manager.get_group_info.assert_not_called()
+    fallback_manager.get_participants.assert_called_once_with(-100, limit=None)
+    fallback_manager.get_group_info.assert_called_once_with(-100)
+
+
+@pytest.mark.asyncio
+async def test_group_manager_propagates_takeout_errors(mock_telegram_client, mock_channel):
+    """GroupManager не превращает ошибки takeout в пустой результат"""
+    mock_telegram_client.get_entity.return_value = mock_channel
+    mock_telegram_client.iter_participants.side_effect = TakeoutInvalidError(request=None)
+
+    with pytest.raises(TakeoutInvalidError):
+        await GroupManager(mock_telegram_client).get_participants("testgroup")
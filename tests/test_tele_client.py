@@ -0,0 +1,42 @@
+"""
+Тесты для настройки Telegram клиента
+"""
+
+import logging
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from src.infra import tele_client
+from src.infra.limiter import RateLimiter
+from src.infra.writer import get_writer
+
+
+def test_client_keeps_telethon_flood_sleep(tmp_path):
+    """Короткие FLOOD_WAIT Telethon отсыпает сам: проход участников не начинается заново"""
+    with patch.object(tele_client, '_client', None), \
+         patch.object(tele_client, 'session_path', str(tmp_path / "test_session")):
+        client = tele_client.get_client()
+        assert client.flood_sleep_threshold == tele_client.DEFAULT_FLOOD_SLEEP_THRESHOLD
+        client.session.close()
+
+
+def test_flood_observer_reports_telethon_auto_sleep():
+    """Авто-сон Telethon (до FLOOD_SLEEP_THRESHOLD) попадает в rate limiter"""
+    temp_dir = tempfile.mkdtemp()
+    limiter = RateLimiter(data_dir=temp_dir)
+    try:
+        with patch('src.infra.tele_client.get_rate_limiter', return_value=limiter):
+            tele_client.install_flood_observer()
+            telethon_logger = logging.getLogger(tele_client.TELETHON_FLOOD_LOGGER)
+            telethon_logger.info('Sleeping%s for %ds (%s) on %s flood wait',
+                                 '', 12, '0:00:12', 'GetParticipantsRequest')
+            telethon_logger.info('Some unrelated message %s', 'x')
+        
+        stats = limiter.get_stats()
+        assert stats["flood_waits"] == 1
+        assert stats["flood_wait_seconds"] == 12
+        assert stats["flood_by_method"]["GetParticipantsRequest"]["count"] == 1
+    finally:
+        get_writer().flush()
+        shutil.rmtree(temp_dir)
@@ -0,0 +1,100 @@
+"""
+Тесты для трассировки этапов и отчета
+"""
+
+import asyncio
+import json
+import pytest
+from unittest.mock import patch
+
+from src.infra import tracing
+from src.infra.tracing import build_report, enable_tracing, disable_tracing, format_report, load_spans, span, to_chrome_trace
+
+
+@pytest.fixture
+def trace_file(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    enable_tracing(str(path))
+    yield path
+    disable_tracing()
+
+
+def test_span_is_noop_when_disabled():
+    """Без трассировки span ничего не пишет"""
+    disable_tracing()
+    with patch.dict('os.environ', {}, clear=False):
+        with span('anything', cat='rpc') as s:
+            s.set(count=1)
+    assert tracing._tracer is None
+
+
+def test_spans_are_nested_and_inherit_group(trace_file):
+    """Потомки получают parent и group от родителя"""
+    with span('group', cat='group', group=-100123):
+        with span('get_entity', cat='rpc'):
+            pass
+    disable_tracing()
+
+    spans = load_spans(str(trace_file))
+    by_name = {s['name']: s for s in spans}
+    assert by_name['get_entity']['parent'] == by_name['group']['id']
+    assert by_name['get_entity']['group'] == -100123
+    assert by_name['group']['parent'] is None
+
+
+@pytest.mark.asyncio
+async def test_concurrent_tasks_keep_their_parents(trace_file):
+    """Параллельные asyncio задачи не путают родителей"""
+    async def work(group_id):
+        with span('group', cat='group', group=group_id):
+            await asyncio.sleep(0.01)
+            with span('iter_participants', cat='rpc'):
+                await asyncio.sleep(0.01)
+
+    await asyncio.gather(work(1), work(2))
+    disable_tracing()
+
+    spans = load_spans(str(trace_file))
+    roots = {s['id']: s['group'] for s in spans if s['name'] == 'group'}
+    for s in spans:
+        if s['name'] == 'iter_participants':
+            assert roots[s['parent']] == s['group']
+
+
+def _event(span_id, name, cat, ts, dur, parent=None, group=None):
+    return {'id': span_id, 'name': name, 'cat': cat, 'ph': 'X', 'ts': ts, 'dur': dur,
+            'pid': 1, 'tid': 0, 'parent': parent, 'group': group, 'args': {}}
+
+
+def test_build_report_breakdown_and_critical_path():
+    """Собственное время этапов и критический путь по группе"""
+    spans = [
+        _event(1, 'group', 'group', 0, 10_000_000, group=-1),
+        _event(2, 'get_entity', 'rpc', 0, 1_000_000, parent=1, group=-1),
+        _event(3, 'iter_participants', 'participants', 1_000_000, 8_000_000, parent=1, group=-1),
+        _event(4, 'bucket_wait', 'bucket_wait', 1_000_000, 2_000_000, parent=3, group=-1),
+        _event(5, 'members.json', 'serialize', 10_000_000, 2_000_000),
+    ]
+
+    report = build_report(spans)
+
+    assert report['total_s'] == pytest.approx(12.0)
+    group = report['groups']['-1']
+    assert group['wall_s'] == pytest.approx(10.0)
+    assert group['stages']['group'] == pytest.approx(1.0)
+    assert group['stages']['participants'] == pytest.approx(6.0)
+    assert group['stages']['bucket_wait'] == pytest.approx(2.0)
+    assert [step['name'] for step in group['critical_path']] == ['group', 'iter_participants', 'bucket_wait']
+    assert report['stages']['serialize'] == pytest.approx(2.0)
+
+    text = format_report(report)
+    assert 'Группа -1' in text
+    assert 'Критический путь' in text
+
+
+def test_to_chrome_trace():
+    """Конвертация в формат chrome://tracing"""
+    chrome = to_chrome_trace([_event(1, 'group', 'group', 0, 5, group=-1)])
+    assert chrome['traceEvents'][0]['ph'] == 'X'
+    assert chrome['traceEvents'][0]['args']['group'] == -1
+    json.dumps(chrome)
@@ -0,0 +1,97 @@
+"""
+Тесты для фонового потока записи
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from src.infra.writer import BackgroundWriter
+
+
+@pytest.fixture
+def writer():
+    background = BackgroundWriter(max_pending=2, name="test-writer")
+    yield background
+    background.close()
+
+
+def test_fifo_order_and_coalescing(writer):
+    """Операции выполняются по порядку; ожидающие с одним ключом объединяются"""
+    gate = threading.Event()
+    done = []
+    writer.submit(gate.wait)
+    first = writer.submit(done.append, 'counters-1', key='counters')
+    second = writer.submit(done.append, 'counters-2', key='counters')
+    assert first is second
+    gate.set()
+
+    third = writer.submit(done.append, 'report')
+    writer.flush()
+    assert done == ['counters-2', 'report']
+    assert third.result() is None
+    assert writer.get_stats()['coalesced'] == 1
+
+
+@pytest.mark.asyncio
+async def test_backpressure_and_errors(writer):
+    """Полная очередь притормаживает submit_async, не блокируя event loop"""
+    started, gate = threading.Event(), threading.Event()
+
+    def slow_disk():
+        started.set()
+        gate.wait()
+
+    await writer.submit_async(slow_disk)
+    started.wait(1)
+    await writer.submit_async(lambda: None)
+    await writer.submit_async(lambda: None)
+
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while not gate.is_set():
+            ticks += 1
+            await asyncio.sleep(0.001)
+
+    tick_task = asyncio.create_task(ticker())
+    blocked = asyncio.create_task(writer.run(lambda: 'written'))
+    await asyncio.sleep(0.05)
+    assert not blocked.done()
+    assert ticks > 0
+
+    gate.set()
+    assert await blocked == 'written'
+    await tick_task
+    assert writer.get_stats()['backpressure_waits'] == 1
+
+    with pytest.raises(ZeroDivisionError):
+        await writer.run(lambda: 1 / 0)
+    assert writer.get_stats()['failed'] == 1
+
+
+def test_submit_nowait_never_blocks(writer):
+    """Полная очередь: submit_nowait откладывает операцию вместо ожидания места"""
+    started, gate = threading.Event(), threading.Event()
+    done = []
+
+    def slow_disk():
+        started.set()
+        gate.wait()
+
+    writer.submit(slow_disk)
+    started.wait(1)
+    writer.submit(done.append, 'export-1')
+    writer.submit(done.append, 'export-2')
+
+    writer.submit_nowait(done.append, 'counters-1', key='counters')
+    writer.submit_nowait(done.append, 'counters-2', key='counters')
+    assert writer.get_stats()['deferred'] == 1
+    assert writer.pending() == 3
+
+    gate.set()
+    writer.flush()
+    assert done == ['counters-2', 'export-1', 'export-2']
+    assert writer.pending() == 0